@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 18, 2026
+
+Read throughput of row-wise (pixel) and column-wise (spectral) access to a 2D dataset
+for the legacy 10 kB chunks and the chunks picked by hdf_utils.calc_chunks.
+
+Usage:
+    python bench_chunking.py [num_rows] [num_cols]
+"""
+
+from __future__ import division, print_function, absolute_import
+import os
+import sys
+import tempfile
+from time import time
+import numpy as np
+import h5py
+
+from pycroscopy.io.hdf_utils import calc_chunks, open_with_chunk_cache
+
+
+def write_dataset(file_path, shape, chunks, dtype=np.float32):
+    """
+    Writes a random 2D dataset with the given chunking
+    """
+    with h5py.File(file_path, 'w') as h5_f:
+        h5_dset = h5_f.create_dataset('Raw_Data', shape=shape, dtype=dtype, chunks=chunks)
+        rows_per_write = max(1, int(2 ** 26 // (shape[1] * np.dtype(dtype).itemsize)))
+        for start in range(0, shape[0], rows_per_write):
+            stop = min(shape[0], start + rows_per_write)
+            h5_dset[start:stop] = np.random.rand(stop - start, shape[1]).astype(dtype)
+
+
+def time_reads(file_path, axis, num_reads, access=None):
+    """
+    Reads `num_reads` evenly spaced rows (axis=0) or columns (axis=1) and returns the throughput in MB/s.
+    If `access` is provided, the dataset is opened with the chunk cache planned for that access pattern
+    """
+    with h5py.File(file_path, 'r') as h5_f:
+        if access is None:
+            h5_dset = h5_f['Raw_Data']
+        else:
+            h5_dset = open_with_chunk_cache(h5_f, 'Raw_Data', access=access)
+        inds = np.linspace(0, h5_dset.shape[axis] - 1, num_reads).astype(int)
+        num_bytes = 0
+        t_start = time()
+        for ind in inds:
+            if axis == 0:
+                data = h5_dset[ind]
+            else:
+                data = h5_dset[:, ind]
+            num_bytes += data.nbytes
+        t_tot = time() - t_start
+
+    return num_bytes / 1024 ** 2 / t_tot
+
+
+def main(num_rows=16384, num_cols=2048, num_reads=64):
+    shape = (num_rows, num_cols)
+    data_size = np.dtype(np.float32).itemsize
+
+    layouts = [('legacy 10 kB', calc_chunks(shape, data_size, max_chunk_mem=10240), None)]
+    for access in ['both', 'pixel', 'spectral']:
+        chunks = calc_chunks(shape, data_size, access=access)
+        layouts.append(('auto ' + access, chunks, access))
+
+    file_path = os.path.join(tempfile.mkdtemp(), 'bench_chunking.h5')
+
+    print('Dataset of shape {} ({:.1f} MB)'.format(shape, np.prod(shape) * data_size / 1024 ** 2))
+    print('{:<14}{:<16}{:>12}{:>12}{:>18}'.format('layout', 'chunks', 'rows MB/s', 'cols MB/s',
+                                                     'cached cols MB/s'))
+    for name, chunks, access in layouts:
+        write_dataset(file_path, shape, chunks)
+        row_rate = time_reads(file_path, 0, num_reads)
+        col_rate = time_reads(file_path, 1, num_reads)
+        cached_col_rate = time_reads(file_path, 1, num_reads, access='spectral')
+        print('{:<14}{:<16}{:>12.1f}{:>12.1f}{:>18.1f}'.format(name, str(chunks), row_rate, col_rate,
+                                                                 cached_col_rate))
+        os.remove(file_path)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 18, 2026
+
+Wall time and peak resident memory of ``import pycroscopy`` followed by access to ioHDF5, measured in fresh
+interpreters as a batch worker would experience them.  Also lists the heavy third party libraries that were loaded.
+The targets are 0.5 sec and 100 MB with none of the heavy libraries loaded.
+
+Usage:
+    python bench_import.py [num_repeats]
+"""
+
+from __future__ import division, print_function, absolute_import
+import json
+import subprocess
+import sys
+
+heavy_modules = ['matplotlib', 'sklearn', 'skimage', 'ipywidgets', 'IPython', 'scipy', 'igor', 'xlrd', 'PIL']
+
+target_time = 0.5
+target_mem = 100
+
+worker_code = """
+import json, sys, time
+t_start = time.time()
+import pycroscopy
+from pycroscopy import ioHDF5
+t_import = time.time() - t_start
+try:
+    import resource
+    mem = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if sys.platform == 'darwin':
+        mem /= 1024
+except ImportError:
+    import psutil
+    mem = psutil.Process().memory_info().rss / 1024 ** 2
+print(json.dumps({'time': t_import, 'mem': mem, 'heavy': [mod for mod in %r if mod in sys.modules]}))
+""" % heavy_modules
+
+
+def measure(num_repeats=5):
+    """
+    Imports pycroscopy in `num_repeats` fresh interpreters and returns the best time, the largest memory and the
+    heavy modules that were loaded
+    """
+    results = list()
+    for _ in range(num_repeats):
+        output = subprocess.check_output([sys.executable, '-c', worker_code])
+        results.append(json.loads(output.decode('utf-8').strip().split('\n')[-1]))
+
+    return {'time': min([res['time'] for res in results]),
+            'mem': max([res['mem'] for res in results]),
+            'heavy': sorted(set(sum([res['heavy'] for res in results], [])))}
+
+
+if __name__ == '__main__':
+    result = measure(*[int(arg) for arg in sys.argv[1:]])
+    print('import pycroscopy: {:.3f} sec (target {} sec), {:.1f} MB (target {} MB)'.format(result['time'],
+                                                                                         target_time,
+                                                                                         result['mem'],
+                                                                                         target_mem))
+    print('Heavy modules loaded: {}'.format(', '.join(result['heavy']) if result['heavy'] else 'none'))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 18, 2026
+
+Time taken by ioHDF5.writeData to write a results group holding many small ancillary datasets compared with writing
+the same tree one object and one attribute at a time through h5py, as the recursive writer used to.
+
+Usage:
+    python bench_write_data.py [num_groups] [dsets_per_group] [repeat]
+"""
+
+from __future__ import division, print_function, absolute_import
+import os
+import shutil
+import sys
+import tempfile
+from time import time
+import numpy as np
+import h5py
+
+from pycroscopy.io.io_hdf5 import ioHDF5
+from pycroscopy.io.microdata import MicroDataGroup, MicroDataset
+
+
+def build_tree(num_groups, dsets_per_group):
+    """
+    Results group with `num_groups` plot groups, each holding `dsets_per_group` labeled 64 point datasets
+    """
+    results = MicroDataGroup('Results_000', parent='/')
+    results.attrs = {'algorithm': 'benchmark', 'num_groups': num_groups}
+    for grp_ind in range(num_groups):
+        plot_grp = MicroDataGroup('Plot_Group_{:03d}'.format(grp_ind))
+        plot_grp.attrs = {'name': 'group {}'.format(grp_ind), 'num_bins': 64, 'freq': np.arange(4.0),
+                          'mode': 'in-field'}
+        for dset_ind in range(dsets_per_group):
+            ds_bins = MicroDataset('Bin_{}'.format(dset_ind), np.arange(64, dtype=np.float32) + dset_ind)
+            ds_bins.attrs = {'units': 'V', 'quantity': 'Amplitude', 'step': dset_ind,
+                             'labels': {'Bin': (slice(None),)}}
+            plot_grp.addChildren([ds_bins])
+        results.addChildren([plot_grp])
+    return results
+
+
+def write_one_by_one(h5_file, data):
+    """
+    Writes the tree recursively, creating one object and writing one attribute at a time
+    """
+    def __write(h5_parent, child):
+        if isinstance(child, MicroDataGroup):
+            h5_obj = h5_parent.create_group(child.name)
+            for grand_child in child.children:
+                __write(h5_obj, grand_child)
+        else:
+            h5_obj = h5_parent.create_dataset(child.name, data=child.data)
+        for key, val in child.attrs.items():
+            if key == 'labels':
+                ioHDF5.write_region_references(h5_obj, val)
+                h5_obj.attrs['labels'] = ioHDF5.clean_string_att(list(val.keys()))
+            else:
+                h5_obj.attrs[key] = ioHDF5.clean_string_att(val)
+
+    __write(h5_file, data)
+
+
+def time_write(folder, num_groups, dsets_per_group, batched):
+    """
+    Returns the time taken to write the tree into a new file
+    """
+    file_path = os.path.join(folder, 'write_data.h5')
+    if os.path.exists(file_path):
+        os.remove(file_path)
+    tree = build_tree(num_groups, dsets_per_group)
+    hdf = ioHDF5(file_path)
+    t_start = time()
+    if batched:
+        hdf.writeData(tree)
+    else:
+        write_one_by_one(hdf.file, tree)
+    t_tot = time() - t_start
+    hdf.close()
+    return t_tot
+
+
+def main(num_groups=100, dsets_per_group=3, repeat=5):
+    folder = tempfile.mkdtemp()
+    try:
+        print('Writing {} groups with {} datasets each'.format(num_groups, dsets_per_group))
+        times = dict()
+        for batched, label in [(False, 'one object at a time'), (True, 'ioHDF5.writeData')]:
+            times[batched] = min([time_write(folder, num_groups, dsets_per_group, batched) for _ in range(repeat)])
+            print('{:<24}{:>10.1f} ms'.format(label, times[batched] * 1E+3))
+        print('Speedup: {:.2f}x'.format(times[False] / times[True]))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 18, 2026
+
+Benchmark suite for the hot paths of pycroscopy.  Each benchmark builds its own synthetic data (see synthetic_data),
+is timed at several sizes and the results are written as JSON so that releases can be compared on the same hardware.
+
+Every repeat starts from a fresh copy of the input file, since most operations write their results into it.
+A failing benchmark is recorded along with its error instead of stopping the suite.
+
+Usage:
+    python run_benchmarks.py [--sizes small,medium] [--select sho,svd] [--repeat 3] [--cores 1]
+                             [--output results.json] [--compare previous.json]
+"""
+
+from __future__ import division, print_function, absolute_import
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import traceback
+from collections import OrderedDict
+from time import time, strftime
+
+import numpy as np
+import h5py
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic_data as sd
+
+# Parameters of each size for each kind of synthetic data
+sizes = OrderedDict([('small', {'beps_rows': 8, 'gmode_rows': 64, 'gmode_pts': 16384, 'image_rows': 128}),
+                     ('medium', {'beps_rows': 16, 'gmode_rows': 256, 'gmode_pts': 32768, 'image_rows': 256}),
+                     ('large', {'beps_rows': 32, 'gmode_rows': 1024, 'gmode_pts': 65536, 'image_rows': 512})])
+
+benchmarks = OrderedDict()
+
+
+def benchmark(name):
+    """
+    Registers a benchmark.  The decorated function receives a (temporary) working folder, the parameters of the
+    requested size and the number of cores.  It prepares its inputs and returns the function that is to be timed
+    """
+    def __register(func):
+        benchmarks[name] = func
+        return func
+    return __register
+
+
+class DataCache(object):
+    """
+    Builds each synthetic input file once per size and hands out fresh copies of it
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.files = dict()
+
+    def get_copy(self, kind, size_parms, dest_folder):
+        builders = {'beps': lambda path: sd.make_beps_file(path, size_parms['beps_rows']),
+                    'gmode': lambda path: sd.make_gmode_file(path, size_parms['gmode_rows'],
+                                                             size_parms['gmode_pts']),
+                    'image': lambda path: sd.make_image_file(path, size_parms['image_rows'])}
+        key = (kind, tuple(sorted(size_parms.items())))
+        if key not in self.files:
+            path = os.path.join(self.folder, '{}_{}.h5'.format(kind, len(self.files)))
+            self.files[key] = builders[kind](path)
+        dest = os.path.join(dest_folder, kind + '.h5')
+        shutil.copy(self.files[key], dest)
+        return dest
+
+
+_cache = None
+
+
+def _get_input(kind, size_parms, folder):
+    return _cache.get_copy(kind, size_parms, folder)
+
+
+'''
+Translation
+'''
+
+
+@benchmark('translate_fake_beps')
+def bench_translate_fake_beps(folder, size_parms, cores):
+    h5_path = os.path.join(folder, 'fake_beps.h5')
+    return lambda: sd.make_beps_file(h5_path, size_parms['beps_rows'])
+
+
+@benchmark('translate_numpy')
+def bench_translate_numpy(folder, size_parms, cores):
+    h5_path = os.path.join(folder, 'gmode.h5')
+    return lambda: sd.make_gmode_file(h5_path, size_parms['gmode_rows'], size_parms['gmode_pts'])
+
+
+'''
+BE SHO and loop guess and fit
+'''
+
+
+@benchmark('sho_guess')
+def bench_sho_guess(folder, size_parms, cores):
+    from pycroscopy.analysis import BESHOmodel
+
+    h5_file = sd.open_file(_get_input('beps', size_parms, folder))
+    model = BESHOmodel(sd.get_main(h5_file), parallel=cores != 1)
+    return lambda: model.do_guess(processors=cores, strategy='complex_gaussian')
+
+
+@benchmark('sho_fit')
+def bench_sho_fit(folder, size_parms, cores):
+    from pycroscopy.analysis import BESHOmodel
+
+    h5_file = sd.open_file(_get_input('beps', size_parms, folder))
+    model = BESHOmodel(sd.get_main(h5_file), parallel=cores != 1)
+    model.do_guess(processors=cores, strategy='complex_gaussian')
+    return lambda: model.do_fit(processors=cores)
+
+
+def _get_sho_fit(h5_file):
+    return [dset for dset in sd.getDataSet(h5_file, 'Fit') if dset.parent.name.endswith('SHO_Fit_000')][0]
+
+
+@benchmark('loop_projection_guess')
+def bench_loop_guess(folder, size_parms, cores):
+    from pycroscopy.analysis import BELoopModel
+
+    h5_file = sd.open_file(_get_input('beps', size_parms, folder))
+    model = BELoopModel(_get_sho_fit(h5_file), parallel=cores != 1)
+    return lambda: model.do_guess(processors=cores)
+
+
+@benchmark('loop_fit')
+def bench_loop_fit(folder, size_parms, cores):
+    from pycroscopy.analysis import BELoopModel
+
+    h5_file = sd.open_file(_get_input('beps', size_parms, folder))
+    model = BELoopModel(_get_sho_fit(h5_file), parallel=cores != 1)
+    model.do_guess(processors=cores)
+    return lambda: model.do_fit(processors=cores)
+
+
+'''
+Decomposition and clustering
+'''
+
+
+@benchmark('svd')
+def bench_svd(folder, size_parms, cores):
+    from pycroscopy.processing import doSVD
+
+    h5_file = sd.open_file(_get_input('gmode', size_parms, folder))
+    h5_main = sd.get_main(h5_file)
+    return lambda: doSVD(h5_main, num_comps=32)
+
+
+@benchmark('kmeans_cluster')
+def bench_cluster(folder, size_parms, cores):
+    from pycroscopy.processing import Cluster
+
+    h5_file = sd.open_file(_get_input('gmode', size_parms, folder))
+    cluster = Cluster(sd.get_main(h5_file), 'KMeans', n_clusters=4, random_state=0)
+    return cluster.do_cluster
+
+
+'''
+FFT filtering and image windowing
+'''
+
+
+@benchmark('fft_filter')
+def bench_fft_filter(folder, size_parms, cores):
+    from pycroscopy.processing.gmode_utils import fft_filter_dataset
+
+    h5_file = sd.open_file(_get_input('gmode', size_parms, folder))
+    h5_main = sd.get_main(h5_file)
+    filter_parms = {'samp_rate_[Hz]': 1E+6, 'LPF_cutOff_[Hz]': 100E+3, 'band_filt_[Hz]': [[60E+3], [10E+3]],
+                    'comb_[Hz]': [16E+3, 1E+3, 10], 'noise_threshold': 1E-4, 'num_pix': 1}
+    return lambda: fft_filter_dataset(h5_main, filter_parms, write_filtered=True, write_condensed=False,
+                                      num_cores=cores)
+
+
+@benchmark('image_windowing')
+def bench_windowing(folder, size_parms, cores):
+    from pycroscopy.processing import ImageWindow
+
+    h5_file = sd.open_file(_get_input('image', size_parms, folder))
+    windower = ImageWindow(sd.get_main(h5_file), cores=cores)
+    return lambda: windower.do_windowing(win_x=32, win_y=32, win_step_x=2, win_step_y=2, save_plots=False,
+                                         show_plots=False)
+
+
+def run(names, size_names, repeat=3, cores=None, verbose=True):
+    """
+    Runs the requested benchmarks at the requested sizes
+
+    Parameters
+    ----------
+    names : list of str
+        Names of the benchmarks to run
+    size_names : list of str
+        Names of the sizes to run each benchmark at. See `sizes`
+    repeat : uint, optional
+        Number of times each benchmark is timed. Default 3
+    cores : uint, optional
+        Number of cores passed to the benchmarks. Default None - left to pycroscopy
+    verbose : bool, optional
+        Whether or not to print the progress. Default True
+
+    Returns
+    -------
+    results : list of dict
+        Name, size, timings (in seconds) or error of each benchmark
+    """
+    global _cache
+
+    folder = tempfile.mkdtemp(prefix='px_bench_')
+    _cache = DataCache(folder)
+    results = list()
+    devnull = open(os.devnull, 'w')
+
+    try:
+        for name in names:
+            for size_name in size_names:
+                result = OrderedDict([('name', name), ('size', size_name), ('params', sizes[size_name])])
+                times = list()
+                try:
+                    for _ in range(repeat):
+                        run_folder = tempfile.mkdtemp(dir=folder)
+                        # pycroscopy prints its progress liberally
+                        stdout, sys.stdout = sys.stdout, devnull
+                        try:
+                            func = benchmarks[name](run_folder, sizes[size_name], cores)
+                            t_start = time()
+                            func()
+                            times.append(time() - t_start)
+                        finally:
+                            sys.stdout = stdout
+                            _close_files()
+                            shutil.rmtree(run_folder, ignore_errors=True)
+                    result['times'] = times
+                    result['min'] = min(times)
+                    result['median'] = float(np.median(times))
+                except Exception:
+                    result['error'] = traceback.format_exc().strip().split('\n')[-1]
+                results.append(result)
+                if verbose:
+                    if 'error' in result:
+                        print('{:<24}{:<8} failed: {}'.format(name, size_name, result['error']))
+                    else:
+                        print('{:<24}{:<8}{:>10.3f} s (median {:.3f} s)'.format(name, size_name, result['min'],
+                                                                                 result['median']))
+    finally:
+        devnull.close()
+        shutil.rmtree(folder, ignore_errors=True)
+
+    return results
+
+
+def _close_files():
+    """
+    Closes the files left open by the benchmarks
+    """
+    for obj_id in h5py.h5f.get_obj_ids(types=h5py.h5f.OBJ_FILE):
+        try:
+            h5py.File(obj_id).close()
+        except Exception:
+            pass
+
+
+def get_environment():
+    """
+    Versions and hardware that the results were recorded on
+    """
+    import pycroscopy
+    import scipy
+    import sklearn
+
+    return OrderedDict([('timestamp', strftime('%Y-%m-%dT%H:%M:%S')),
+                        ('pycroscopy', pycroscopy.__version__),
+                        ('python', platform.python_version()),
+                        ('numpy', np.__version__),
+                        ('scipy', scipy.__version__),
+                        ('sklearn', sklearn.__version__),
+                        ('h5py', h5py.version.version),
+                        ('hdf5', h5py.version.hdf5_version),
+                        ('platform', platform.platform()),
+                        ('processor', platform.processor() or platform.machine()),
+                        ('cpu_count', os.cpu_count() if hasattr(os, 'cpu_count') else None)])
+
+
+def compare(results, previous):
+    """
+    Prints the ratio of the new to the previous minimum time of every benchmark that ran in both
+    """
+    old_times = dict([((res['name'], res['size']), res['min']) for res in previous['results'] if 'min' in res])
+    print('\nComparison with {} ({}):'.format(previous['environment'].get('pycroscopy'),
+                                              previous['environment'].get('timestamp')))
+    for res in results:
+        key = (res['name'], res['size'])
+        if 'min' in res and key in old_times:
+            print('{:<24}{:<8}{:>8.2f}x'.format(res['name'], res['size'], res['min'] / old_times[key]))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Times the hot paths of pycroscopy on synthetic data')
+    parser.add_argument('--sizes', default='small,medium', help='Comma separated sizes: ' + ', '.join(sizes))
+    parser.add_argument('--select', default='', help='Comma separated substrings of the benchmarks to run')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timings per benchmark')
+    parser.add_argument('--cores', type=int, default=None, help='Number of cores passed to pycroscopy')
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='JSON file of a previous run to compare against')
+    parser.add_argument('--list', action='store_true', help='List the benchmarks and exit')
+    args = parser.parse_args(args)
+
+    if args.list:
+        print('\n'.join(benchmarks))
+        return
+
+    size_names = [size for size in args.sizes.split(',') if size]
+    for size in size_names:
+        if size not in sizes:
+            parser.error('Unknown size: {}'.format(size))
+    selection = [sel for sel in args.select.split(',') if sel]
+    names = [name for name in benchmarks if not selection or any([sel in name for sel in selection])]
+
+    results = run(names, size_names, repeat=args.repeat, cores=args.cores)
+
+    output = OrderedDict([('environment', get_environment()), ('cores', args.cores), ('repeat', args.repeat),
+                          ('results', results)])
+    with open(args.output, 'w') as json_file:
+        json.dump(output, json_file, indent=2)
+    print('Results written to {}'.format(args.output))
+
+    if args.compare is not None:
+        with open(args.compare) as json_file:
+            compare(results, json.load(json_file))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 18, 2026
+
+Synthetic BEPS, G-mode and image datasets for the benchmarks.  Everything is generated locally with a fixed seed so
+that the benchmarks run offline and give comparable results between runs and releases.
+"""
+
+from __future__ import division, print_function, absolute_import
+import os
+import numpy as np
+import h5py
+
+from pycroscopy.io.translators import FakeDataGenerator, NumpyTranslator
+from pycroscopy.io.hdf_utils import getDataSet
+
+# Size of the 128 x 128 images that FakeDataGenerator uses for its loop coefficients
+_fake_image_size = 128
+
+
+def make_beps_file(h5_path, num_rows, n_steps=16, n_bins=32, seed=0):
+    """
+    Writes a synthetic BEPS dataset with its SHO and loop guesses and fits using FakeDataGenerator
+
+    Parameters
+    ----------
+    h5_path : str
+        Path of the file to write
+    num_rows : uint
+        Number of rows (and columns) of positions. Must divide 128
+    n_steps : uint, optional
+        Number of DC steps per loop. Default 16
+    n_bins : uint, optional
+        Number of frequency bins per step. Default 32
+    seed : uint, optional
+        Seed of the random number generator used for the noise. Default 0
+
+    Returns
+    -------
+    h5_path : str
+        Path of the file that was written
+    """
+    if _fake_image_size % num_rows != 0:
+        raise ValueError('num_rows must divide {}'.format(_fake_image_size))
+
+    if os.path.exists(h5_path):
+        os.remove(h5_path)
+
+    # Every spectroscopic dimension must be longer than one for the ancillary datasets to be built
+    FakeDataGenerator().translate(h5_path, n_steps, n_bins, 200E+3, 400E+3, n_cycles=2, FORC_cycles=2,
+                                  FORC_repeats=2, bin_factor=_fake_image_size // num_rows, seed=seed)
+
+    return h5_path
+
+
+def make_gmode_file(h5_path, num_rows, pts_per_row, samp_rate=1E+6, seed=0):
+    """
+    Writes a synthetic G-mode dataset: a noisy multi-harmonic response of a 1 V, 16 kHz excitation in every row
+
+    Parameters
+    ----------
+    h5_path : str
+        Path of the file to write
+    num_rows : uint
+        Number of rows of data
+    pts_per_row : uint
+        Number of time points in each row
+    samp_rate : float, optional
+        Sampling rate in Hz. Default 1 MHz
+    seed : uint, optional
+        Seed of the random number generator. Default 0
+
+    Returns
+    -------
+    h5_path : str
+        Path of the file that was written
+    """
+    rand_gen = np.random.RandomState(seed)
+    if os.path.exists(h5_path):
+        os.remove(h5_path)
+
+    t_vec = np.arange(pts_per_row) / samp_rate
+    excit = 2 * np.pi * 16E+3 * t_vec
+    amps = 1 + 0.1 * rand_gen.randn(num_rows, 1)
+    data = amps * np.sin(excit) + 0.2 * amps ** 2 * np.sin(3 * excit) + 0.1 * rand_gen.randn(num_rows, pts_per_row)
+
+    NumpyTranslator().translate(h5_path, np.float32(data), num_rows, 1, qty_name='Deflection', data_unit='V',
+                                spec_name='Time', spec_val=np.float32(t_vec), spec_unit='s', data_type='GmodeData')
+
+    return h5_path
+
+
+def make_image_file(h5_path, num_rows, spacing=8, seed=0):
+    """
+    Writes a synthetic atomic lattice image: gaussian atoms on a square lattice with noise
+
+    Parameters
+    ----------
+    h5_path : str
+        Path of the file to write
+    num_rows : uint
+        Number of rows (and columns) of pixels
+    spacing : uint, optional
+        Lattice spacing in pixels. Default 8
+    seed : uint, optional
+        Seed of the random number generator. Default 0
+
+    Returns
+    -------
+    h5_path : str
+        Path of the file that was written
+    """
+    rand_gen = np.random.RandomState(seed)
+    if os.path.exists(h5_path):
+        os.remove(h5_path)
+
+    x_vec = np.arange(num_rows)
+    dist = np.abs((x_vec + spacing / 2) % spacing - spacing / 2)
+    profile = np.exp(-dist ** 2 / (2 * (spacing / 6) ** 2))
+    image = np.outer(profile, profile) + 0.05 * rand_gen.randn(num_rows, num_rows)
+
+    NumpyTranslator().translate(h5_path, np.float32(image.reshape(-1, 1)), num_rows, num_rows,
+                                qty_name='Intensity', data_unit='a. u.', spec_name='Intensity',
+                                data_type='ImageData')
+
+    return h5_path
+
+
+def get_main(h5_file, name='Raw_Data'):
+    """
+    Returns the first dataset named `name` in the open file
+    """
+    return getDataSet(h5_file, name)[0]
+
+
+def open_file(h5_path, mode='r+'):
+    """
+    Opens a benchmark file
+    """
+    return h5py.File(h5_path, mode)
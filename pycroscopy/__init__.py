@@ -1,18 +1,32 @@
-# Not supporting for __all__
-from . import analysis
-from .analysis import *
-from . import io
-from .io import *
-from . import processing
-from .processing import *
-from . import viz
-from .viz import *
-
+"""
+The submodules of pycroscopy and the objects they export are only imported when they are first accessed so that
+``import pycroscopy`` stays cheap for scripts that only need a small part of the package.  See lazy_imports
+"""
 from .__version__ import version as __version__
 from .__version__ import date as __date__
+from .lazy_imports import attach_lazy
+
+_io_exports = ['ioHDF5', 'MicroDataset', 'MicroDataGroup', 'Telemetry', 'be_hdf_utils', 'hdf_utils', 'io_utils',
+               'microdata', 'telemetry',
+               'Translator', 'BEodfTranslator', 'BEPSndfTranslator', 'BEodfRelaxationTranslator', 'GIVTranslator',
+               'GLineTranslator', 'GTuneTranslator', 'GDMTranslator', 'PtychographyTranslator', 'SporcTranslator',
+               'MovieTranslator', 'IgorIBWTranslator', 'NumpyTranslator', 'OneViewTranslator', 'ImageTranslator',
+               'NDataTranslator', 'FakeDataGenerator', 'LabViewH5Patcher']
+_processing_exports = ['Cluster', 'Decomposition', 'ImageWindow', 'doSVD', 'fft', 'gmode_utils', 'proc_utils',
+                       'svd_utils', 'giv_utils', 'rebuild_svd']
+_analysis_exports = ['GuessMethods', 'Model', 'BESHOmodel', 'BELoopModel', 'utils', 'Optimize', 'fit_methods',
+                     'be_sho', 'be_loop', 'tree', 'atom_finding', 'atom_finding_general_gaussian']
+_viz_exports = ['plot_utils', 'be_viz_utils']
+
+_exports = dict()
+for _subpackage, _names in [('viz', _viz_exports), ('analysis', _analysis_exports),
+                            ('processing', _processing_exports), ('io', _io_exports)]:
+    _exports.update([(_name, _subpackage) for _name in _names])
+
+__getattr__, __dir__ = attach_lazy(__name__, ['analysis', 'io', 'processing', 'viz'], _exports)
 
 __all__ = ['processing', 'analysis', 'io', 'viz', '__date__', '__version__']
-__all__ += io.__all__
-__all__ += processing.__all__
-__all__ += analysis.__all__
-__all__ += viz.__all__
+__all__ += _io_exports
+__all__ += _processing_exports
+__all__ += _analysis_exports
+__all__ += _viz_exports
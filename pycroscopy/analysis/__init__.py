@@ -1,15 +1,23 @@
-from . import utils
-from .utils import *
-from . import be_sho_model
-from .be_sho_model import BESHOmodel
-from . import be_loop_model
-from .be_loop_model import BELoopModel
-from . import guess_methods
-from .guess_methods import GuessMethods
-from . import model
-from .model import Model
-from .optimize import Optimize
-from . import fit_methods
-from .fit_methods import *
+"""
+The models, and scipy / sklearn which they rely upon, are only imported when first accessed
+"""
+from ..lazy_imports import attach_lazy
+
+_utils_exports = ['be_sho', 'be_loop', 'tree', 'atom_finding', 'atom_finding_general_gaussian']
+
+__getattr__, __dir__ = attach_lazy(__name__,
+                                   ['utils', 'be_sho_model', 'be_loop_model', 'guess_methods', 'model', 'optimize',
+                                    'fit_methods'],
+                                   dict([('BESHOmodel', 'be_sho_model'),
+                                         ('BELoopModel', 'be_loop_model'),
+                                         ('GuessMethods', 'guess_methods'),
+                                         ('Model', 'model'),
+                                         ('Optimize', 'optimize'),
+                                         ('Fit_Methods', 'fit_methods'),
+                                         ('BE_Fit_Methods', 'fit_methods'),
+                                         ('forc_iv_fit_methods', 'fit_methods'),
+                                         ('loop_fit_function', 'fit_methods')] +
+                                        [(name, 'utils') for name in _utils_exports]))
+
 __all__ = ['GuessMethods', 'Model', 'BESHOmodel', 'BELoopModel', 'utils', 'Optimize', 'fit_methods']
-__all__ += utils.__all__
+__all__ += _utils_exports
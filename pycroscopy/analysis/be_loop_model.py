@@ -26,6 +26,7 @@ from ..io.hdf_utils import getH5DsetRefs, getAuxData, copyRegionRefs, linkRefs,
     get_sort_order, get_dimensionality, reshape_to_Ndims, reshape_from_Ndims, create_empty_dataset, buildReducedSpec, \
     get_attr
 from ..io.microdata import MicroDataset, MicroDataGroup
+from ..io.telemetry import telemetry_stage
 
 '''
 Custom dtypes for the datasets created during fitting.
@@ -209,6 +210,7 @@ class BELoopModel(Model):
 
         self._get_sho_chunk_sizes(max_mem, verbose=verbose)
         self._create_guess_datasets()
+        self._start_telemetry('Guess')
 
         '''
         Get the first slice of the sho and loop metrics
@@ -221,8 +223,9 @@ class BELoopModel(Model):
         '''
         Get the dc_offset and data_chunk for the first slice
         '''
-        self._get_dc_offset(verbose=verbose)
-        self._get_data_chunk(verbose=verbose)
+        with telemetry_stage(self.telemetry, 'read'):
+            self._get_dc_offset(verbose=verbose)
+            self._get_data_chunk(verbose=verbose)
 
         '''
         Loop over positions
@@ -232,43 +235,50 @@ class BELoopModel(Model):
             print('Generating Guesses for FORC {}, and positions {}-{}'.format(self._current_forc,
                                                                                self._start_pos,
                                                                                self._end_pos))
-            '''
-            Reshape the sho data by loops
-            '''
-            if len(self._sho_all_but_forc_inds) == 1:
-                # Check for the special case where there is only one loop
-                loops_2d = np.transpose(self.data)
-                order_dc_offset_reverse = np.array([1, 0], dtype=np.uint8)
-                nd_mat_shape_dc_first = loops_2d.shape
-            else:
-                loops_2d, order_dc_offset_reverse, nd_mat_shape_dc_first = self._reshape_sho_matrix(self.data,
-                                                                                                    verbose=verbose)
+            with telemetry_stage(self.telemetry, 'compute'):
+                '''
+                Reshape the sho data by loops
+                '''
+                if len(self._sho_all_but_forc_inds) == 1:
+                    # Check for the special case where there is only one loop
+                    loops_2d = np.transpose(self.data)
+                    order_dc_offset_reverse = np.array([1, 0], dtype=np.uint8)
+                    nd_mat_shape_dc_first = loops_2d.shape
+                else:
+                    loops_2d, order_dc_offset_reverse, nd_mat_shape_dc_first = self._reshape_sho_matrix(self.data,
+                                                                                                        verbose=verbose)
+
+                '''
+                Do the projection and guess
+                '''
+                projected_loops_2d, loop_metrics_1d = self._project_loop_batch(self.dc_vec, np.transpose(loops_2d))
+                guessed_loops = self._guess_loops(self.dc_vec, projected_loops_2d)
+
+                # Reshape back
+                if len(self._sho_all_but_forc_inds) != 1:
+                    projected_loops_2d = self._reshape_projected_loops_for_h5(projected_loops_2d.T,
+                                                                              order_dc_offset_reverse,
+                                                                              nd_mat_shape_dc_first)
 
-            '''
-            Do the projection and guess
-            '''
-            projected_loops_2d, loop_metrics_1d = self._project_loop_batch(self.dc_vec, np.transpose(loops_2d))
-            guessed_loops = self._guess_loops(self.dc_vec, projected_loops_2d)
-
-            # Reshape back
-            if len(self._sho_all_but_forc_inds) != 1:
-                projected_loops_2d = self._reshape_projected_loops_for_h5(projected_loops_2d.T,
-                                                                          order_dc_offset_reverse,
-                                                                          nd_mat_shape_dc_first)
-
-            metrics_2d = self._reshape_results_for_h5(loop_metrics_1d, nd_mat_shape_dc_first)
-            guessed_loops_2 = self._reshape_results_for_h5(guessed_loops, nd_mat_shape_dc_first)
+                metrics_2d = self._reshape_results_for_h5(loop_metrics_1d, nd_mat_shape_dc_first)
+                guessed_loops_2 = self._reshape_results_for_h5(guessed_loops, nd_mat_shape_dc_first)
 
             # Store results
-            self.h5_projected_loops[self._start_pos:self._end_pos, self._current_sho_spec_slice] = projected_loops_2d
-            self.h5_loop_metrics[self._start_pos:self._end_pos, self._current_met_spec_slice] = metrics_2d
-            self.h5_guess[self._start_pos:self._end_pos, self._current_met_spec_slice] = guessed_loops_2
+            with telemetry_stage(self.telemetry, 'write'):
+                self.h5_projected_loops[self._start_pos:self._end_pos, self._current_sho_spec_slice] = \
+                    projected_loops_2d
+                self.h5_loop_metrics[self._start_pos:self._end_pos, self._current_met_spec_slice] = metrics_2d
+                self.h5_guess[self._start_pos:self._end_pos, self._current_met_spec_slice] = guessed_loops_2
 
             '''
             Change the starting position and get the next chunk of data
             '''
+            self._next_telemetry_chunk(self._end_pos - self._start_pos)
             self._start_pos = self._end_pos
-            self._get_data_chunk(verbose=verbose)
+            with telemetry_stage(self.telemetry, 'read'):
+                self._get_data_chunk(verbose=verbose)
+
+        self._stop_telemetry(self.h5_guess)
 
         if get_loop_parameters:
             self.h5_guess_parameters = self.extract_loop_parameters(self.h5_guess)
@@ -342,31 +352,34 @@ class BELoopModel(Model):
         '''
         Get the dc_vector and the data for the first loop
         '''
+        self._start_telemetry('Fit')
         self._start_pos = 0
         self._current_forc = 0
         self._current_sho_spec_slice = slice(self.sho_spec_inds_per_forc * self._current_forc,
                                              self.sho_spec_inds_per_forc * (self._current_forc + 1))
         self._current_met_spec_slice = slice(self.metrics_spec_inds_per_forc * self._current_forc,
                                              self.metrics_spec_inds_per_forc * (self._current_forc + 1))
-        self._get_dc_offset(verbose=verbose)
-        self._get_guess_chunk()
+        with telemetry_stage(self.telemetry, 'read'):
+            self._get_dc_offset(verbose=verbose)
+            self._get_guess_chunk()
 
-        '''
-        Reshape the sho data by loop
-        '''
-        if len(self._sho_all_but_forc_inds) == 1:
-            # Check for the special case of a single loop
-            loops_2d = np.transpose(self.data)
-            nd_mat_shape_dc_first = loops_2d.shape
-        else:
-            loops_2d, _, nd_mat_shape_dc_first = self._reshape_sho_matrix(self.data,
-                                                                          verbose=verbose)
+        with telemetry_stage(self.telemetry, 'compute'):
+            '''
+            Reshape the sho data by loop
+            '''
+            if len(self._sho_all_but_forc_inds) == 1:
+                # Check for the special case of a single loop
+                loops_2d = np.transpose(self.data)
+                nd_mat_shape_dc_first = loops_2d.shape
+            else:
+                loops_2d, _, nd_mat_shape_dc_first = self._reshape_sho_matrix(self.data,
+                                                                              verbose=verbose)
 
-        '''
-        Shift the loops and vdc vector
-        '''
-        shift_ind, vdc_shifted = self.shift_vdc(self.dc_vec)
-        loops_2d_shifted = np.roll(loops_2d, shift_ind, axis=0).T
+            '''
+            Shift the loops and vdc vector
+            '''
+            shift_ind, vdc_shifted = self.shift_vdc(self.dc_vec)
+            loops_2d_shifted = np.roll(loops_2d, shift_ind, axis=0).T
 
         '''
         Do the fit
@@ -380,18 +393,24 @@ class BELoopModel(Model):
             while self.data is not None:
                 opt = LoopOptimize(data=loops_2d_shifted, guess=self.guess, parallel=self._parallel)
                 temp = opt.computeFit(processors=processors, solver_type=solver_type, solver_options=solver_options,
-                                      obj_func={'class': 'BE_Fit_Methods', 'obj_func': 'BE_LOOP', 'xvals': vdc_shifted})
+                                      obj_func={'class': 'BE_Fit_Methods', 'obj_func': 'BE_LOOP', 'xvals': vdc_shifted},
+                                      telemetry=self.telemetry)
                 # TODO: need a different .reformatResults to process fitting results
-                temp = self._reformat_results(temp, obj_func['obj_func'])
-                temp = self._reshape_results_for_h5(temp, nd_mat_shape_dc_first)
+                with telemetry_stage(self.telemetry, 'compute'):
+                    temp = self._reformat_results(temp, obj_func['obj_func'])
+                    temp = self._reshape_results_for_h5(temp, nd_mat_shape_dc_first)
 
                 results.append(temp)
 
+                self._next_telemetry_chunk(self._end_pos - self._start_pos)
                 self._start_pos = self._end_pos
-                self._get_guess_chunk(verbose=verbose)
+                with telemetry_stage(self.telemetry, 'read'):
+                    self._get_guess_chunk(verbose=verbose)
 
             self.fit = np.hstack(tuple(results))
-            self._set_results()
+            with telemetry_stage(self.telemetry, 'write'):
+                self._set_results()
+            self._stop_telemetry(self.h5_fit)
 
         elif legit_obj_func:
             warn('Error: Solver "%s" does not exist!. For additional info see scipy.optimize\n' % solver_type)
@@ -526,10 +545,13 @@ class BELoopModel(Model):
         num_dc_steps = np.unique(self._sho_spec_inds[self._dc_spec_index, :]).size
         all_spec_dims = list(range(self._sho_spec_inds.shape[0]))
         all_spec_dims.remove(self._dc_spec_index)
+        # Repeats of the FORC cycles are treated as further FORC cycles. Both are the slowest dimensions
+        forc_labels = ['FORC', 'FORC_repeat']
         self._num_forcs = 1
-        if 'FORC' in get_attr(self._sho_spec_inds, 'labels'):
-            forc_pos = np.argwhere(get_attr(self._sho_spec_inds.attrs, 'labels') == 'FORC')[0][0]
-            self._num_forcs = np.unique(self._sho_spec_inds[forc_pos]).size
+        sho_forc_pos = [pos for pos, label in enumerate(get_attr(self._sho_spec_inds, 'labels'))
+                        if label in forc_labels]
+        for forc_pos in sho_forc_pos:
+            self._num_forcs *= np.unique(self._sho_spec_inds[forc_pos]).size
             all_spec_dims.remove(forc_pos)
         # calculate number of loops:
         loop_dims = get_dimensionality(self._sho_spec_inds, all_spec_dims)
@@ -551,12 +573,13 @@ class BELoopModel(Model):
         self.metrics_spec_inds_per_forc = int(self._met_spec_inds.shape[1] / self._num_forcs)
 
         # Step 3: Read allowed chunk
-        self._sho_all_but_forc_inds = range(self._sho_spec_inds.shape[0])
-        self._met_all_but_forc_inds = range(self._met_spec_inds.shape[0])
+        self._sho_all_but_forc_inds = list(range(self._sho_spec_inds.shape[0]))
+        self._met_all_but_forc_inds = list(range(self._met_spec_inds.shape[0]))
         if self._num_forcs > 1:
-            self._sho_all_but_forc_inds.remove(forc_pos)
-            met_forc_pos = np.argwhere(get_attr(self._met_spec_inds, 'labels') == 'FORC')[0][0]
-            self._met_all_but_forc_inds.remove(met_forc_pos)
+            self._sho_all_but_forc_inds = [pos for pos in self._sho_all_but_forc_inds if pos not in sho_forc_pos]
+            met_labels = get_attr(self._met_spec_inds, 'labels')
+            self._met_all_but_forc_inds = [pos for pos in self._met_all_but_forc_inds
+                                           if met_labels[pos] not in forc_labels]
 
         return
 
@@ -735,14 +758,17 @@ class BELoopModel(Model):
                                   [-1] + spec_dims[::-1])
         # This should result in a N+1 dimensional matrix where the first index contains the actual data
         # the other dimensions are present to easily slice the data
-        spec_labels_sorted = np.hstack(('Dim', get_attr(self._sho_spec_inds, 'labels')[spec_sort[::-1]]))
+        spec_labels = get_attr(self._sho_spec_inds, 'labels')[self._sho_all_but_forc_inds]
+        spec_labels_sorted = np.hstack(('Dim', spec_labels[spec_sort[::-1]]))
         if verbose:
             print('Spectroscopic dimensions sorted by rate of change:')
             print(spec_labels_sorted)
         # slice the N dimensional dataset such that we only get the DC offset for default values of other dims
         dc_pos = np.argwhere(spec_labels_sorted == 'DC_Offset')[0][0]
-        dc_slice = list()
-        for dim_ind in range(spec_labels_sorted.size):
+        # The first dimension holds the rows of the spectroscopic values, of which we want the DC offset
+        dc_row = np.argwhere(spec_labels == 'DC_Offset')[0][0]
+        dc_slice = [slice(dc_row, dc_row + 1)]
+        for dim_ind in range(1, spec_labels_sorted.size):
             if dim_ind == dc_pos:
                 dc_slice.append(slice(None))
             else:
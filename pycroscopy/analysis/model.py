@@ -14,6 +14,7 @@ from .fit_methods import Fit_Methods
 from ..io.hdf_utils import checkIfMain, getAuxData
 from ..io.io_hdf5 import ioHDF5
 from ..io.io_utils import getAvailableMem, recommendCores
+from ..io.telemetry import Telemetry, telemetry_stage
 from .optimize import Optimize
 
 
@@ -66,6 +67,57 @@ class Model(object):
         self.guess = None
         self.fit = None
 
+        self.telemetry = None
+
+    def enable_telemetry(self, enabled=True):
+        """
+        Turns the recording of the time spent reading, computing, communicating with workers and writing for each
+        chunk of positions on or off.  When on, the summary of each guess or fit is printed and written as attributes
+        of the results group along with a dataset of the per-chunk timings.  See pycroscopy.io.telemetry.Telemetry
+
+        Parameters
+        ----------
+        enabled : Boolean (Optional)
+            Whether or not to record the telemetry. Default True
+        """
+        self.telemetry = Telemetry() if enabled else None
+
+    def _start_telemetry(self, name):
+        """
+        Starts recording the telemetry of a guess or fit, if enabled
+
+        Parameters
+        ----------
+        name : str
+            Name of the computation - 'Guess' or 'Fit'
+        """
+        if self.telemetry is not None:
+            self.telemetry.name = name
+            self.telemetry.start()
+            self.telemetry.start_chunk()
+
+    def _next_telemetry_chunk(self, num_pixels):
+        """
+        Records the number of positions in the chunk that was just read and starts the next chunk, if enabled
+        """
+        if self.telemetry is not None:
+            self.telemetry.add_pixels(num_pixels)
+            self.telemetry.start_chunk()
+
+    def _stop_telemetry(self, h5_results):
+        """
+        Stops recording the telemetry and writes it next to the results, if enabled
+
+        Parameters
+        ----------
+        h5_results : h5py.Dataset
+            Guess or fit dataset
+        """
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry.report()
+            self.telemetry.write(h5_results.parent)
+
     def _set_memory_and_cores(self, verbose=False):
         """
         Checks hardware limitations such as memory, # cpus and sets the recommended datachunk sizes and the
@@ -280,23 +332,33 @@ class Model(object):
 
         processors = recommendCores(self._max_pos_per_read, processors)
 
-        self._get_data_chunk()
+        self._start_telemetry('Guess')
+        chunk_start = self._start_pos
+        with telemetry_stage(self.telemetry, 'read'):
+            self._get_data_chunk()
         gm = GuessMethods()
         results = list()
         if strategy in gm.methods:
             print("Using %s to find guesses...\n" % strategy)
             while self.data is not None:
                 opt = Optimize(data=self.data, parallel=self._parallel)
-                temp = opt.computeGuess(processors=processors, strategy=strategy, options=options)
-                results.append(self._reformat_results(temp, strategy))
-                self._get_data_chunk()
+                temp = opt.computeGuess(processors=processors, strategy=strategy, options=options,
+                                        telemetry=self.telemetry)
+                with telemetry_stage(self.telemetry, 'compute'):
+                    results.append(self._reformat_results(temp, strategy))
+                self._next_telemetry_chunk(self._end_pos - chunk_start)
+                chunk_start = self._start_pos
+                with telemetry_stage(self.telemetry, 'read'):
+                    self._get_data_chunk()
 
             # reorder to get one numpy array out
             self.guess = np.hstack(tuple(results))
             print('Completed computing guess. Writing to file.')
 
             # Write to file
-            self._set_results(is_guess=True)
+            with telemetry_stage(self.telemetry, 'write'):
+                self._set_results(is_guess=True)
+            self._stop_telemetry(self.h5_guess)
         else:
             raise KeyError('Error: %s is not implemented in pycroscopy.analysis.GuessMethods to find guesses' %
                            strategy)
@@ -362,8 +424,11 @@ class Model(object):
         processors = recommendCores(self._max_pos_per_read, processors)
 
         self._start_pos = 0
-        self._get_guess_chunk()
-        self._get_data_chunk()
+        self._start_telemetry('Fit')
+        chunk_start = self._start_pos
+        with telemetry_stage(self.telemetry, 'read'):
+            self._get_guess_chunk()
+            self._get_data_chunk()
         results = list()
         legit_solver = solver_type in scipy.optimize.__dict__.keys()
         legit_obj_func = obj_func['obj_func'] in Fit_Methods().methods
@@ -372,14 +437,20 @@ class Model(object):
             while self.data is not None:
                 opt = Optimize(data=self.data, guess=self.guess, parallel=self._parallel)
                 temp = opt.computeFit(processors=processors, solver_type=solver_type, solver_options=solver_options,
-                                      obj_func=obj_func)
+                                      obj_func=obj_func, telemetry=self.telemetry)
                 # TODO: need a different .reformatResults to process fitting results
-                results.append(self._reformat_results(temp, obj_func['obj_func']))
-                self._get_guess_chunk()
-                self._get_data_chunk()
+                with telemetry_stage(self.telemetry, 'compute'):
+                    results.append(self._reformat_results(temp, obj_func['obj_func']))
+                self._next_telemetry_chunk(self._end_pos - chunk_start)
+                chunk_start = self._start_pos
+                with telemetry_stage(self.telemetry, 'read'):
+                    self._get_guess_chunk()
+                    self._get_data_chunk()
 
             self.fit = np.hstack(tuple(results))
-            self._set_results()
+            with telemetry_stage(self.telemetry, 'write'):
+                self._set_results()
+            self._stop_telemetry(self.h5_fit)
 
         elif legit_obj_func:
             raise KeyError('Error: Solver "%s" does not exist!. For additional info see scipy.optimize\n' % solver_type)
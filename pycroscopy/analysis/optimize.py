@@ -7,10 +7,12 @@ from __future__ import division, print_function, absolute_import, unicode_litera
 from warnings import warn
 import numpy as np
 import sys
+from time import time
 import multiprocessing as mp
 from .guess_methods import GuessMethods
 from .fit_methods import Fit_Methods
 import scipy
+from ..io.telemetry import timed_call
 
 
 def targetFuncGuess(args, **kwargs):
@@ -67,7 +69,7 @@ class Optimize(object):
             warn('Error: %s is not implemented in pycroscopy.analysis.GuessMethods to find guesses' % self.strategy)
 
     def computeGuess(self, processors=1, strategy='wavelet_peaks',
-                     options={"peak_widths": np.array([10, 200]), "peak_step": 20}, **kwargs):
+                     options={"peak_widths": np.array([10, 200]), "peak_step": 20}, telemetry=None, **kwargs):
         """
         Computes the guess function using numerous cores
 
@@ -81,6 +83,8 @@ class Optimize(object):
         options: dict
             Default: Options for wavelet_peaks{"peaks_widths": np.array([10,200]), "peak_step":20}.
             Dictionary of options passed to strategy. For more info see GuessMethods documentation.
+        telemetry : pycroscopy.io.telemetry.Telemetry, optional
+            Records the time spent computing and communicating with the workers. Default None - not recorded
 
         kwargs:
             processors: int
@@ -100,14 +104,13 @@ class Optimize(object):
             if self._parallel:
                 # start pool of workers
                 print('Computing Jobs In parallel ... launching %i kernels...' % processors)
+                t_start = time()
                 pool = mp.Pool(processors)
                 # Vectorize tasks
                 tasks = [(vector, self) for vector in self.data]
                 chunk = int(self.data.shape[0] / processors)
                 # Map them across processors
-                jobs = pool.imap(targetFuncGuess, tasks, chunksize=chunk)
-                # get Results from different processes
-                results = [j for j in jobs]
+                results = self._map(pool, targetFuncGuess, tasks, chunk, telemetry, t_start, processors)
                 print('Extracted Results...')
                 # Finished reading the entire data set
                 print('closing %i kernels...' % processors)
@@ -116,7 +119,10 @@ class Optimize(object):
 
             else:
                 print("Computing Guesses In Serial ...")
+                t_start = time()
                 results = [targetFuncGuess((vector, self)) for vector in self.data]
+                if telemetry is not None:
+                    telemetry.add_serial(time() - t_start)
                 return results
         else:
             warn('Error: %s is not implemented in pycroscopy.analysis.GuessMethods to find guesses' % strategy)
@@ -130,7 +136,7 @@ class Optimize(object):
         return solver, self.solver_options, func
 
     def computeFit(self, processors=1, solver_type='least_squares', solver_options={},
-                   obj_func={'class': 'Fit_Methods', 'obj_func': 'SHO', 'xvals': np.array([])}):
+                   obj_func={'class': 'Fit_Methods', 'obj_func': 'SHO', 'xvals': np.array([])}, telemetry=None):
         """
 
         Parameters
@@ -146,6 +152,8 @@ class Optimize(object):
             Default is 'SHO'.
             Can be one of ['wavelet_peaks', 'relative_maximum', 'gaussian_processes'].
             For updated list, run GuessMethods.methods
+        telemetry : pycroscopy.io.telemetry.Telemetry, optional
+            Records the time spent computing and communicating with the workers. Default None - not recorded
 
         Returns
         -------
@@ -168,14 +176,13 @@ class Optimize(object):
         if self._parallel:
             # start pool of workers
             print('Computing Jobs In parallel ... launching %i kernels...' % processors)
+            t_start = time()
             pool = mp.Pool(processors)
             # Vectorize tasks
             tasks = [(vector, guess, self) for vector, guess in zip(self.data, self.guess)]
             chunk = int(self.data.shape[0] / processors)
             # Map them across processors
-            jobs = pool.imap(targetFuncFit, tasks, chunksize=chunk)
-            # get Results from different processes
-            results = [j for j in jobs]
+            results = self._map(pool, targetFuncFit, tasks, chunk, telemetry, t_start, processors)
             # Finished reading the entire data set
             print('closing %i kernels...' % processors)
             pool.close()
@@ -183,6 +190,47 @@ class Optimize(object):
 
         else:
             print("Computing Fits In Serial ...")
+            t_start = time()
             tasks = [(vector, guess, self) for vector, guess in zip(self.data, self.guess)]
             results = [targetFuncFit(task) for task in tasks]
+            if telemetry is not None:
+                telemetry.add_serial(time() - t_start)
             return results
+
+    @staticmethod
+    def _map(pool, func, tasks, chunk, telemetry, t_start, processors):
+        """
+        Maps the function over the tasks with the pool of workers and collects the results. If telemetry is enabled,
+        the time each task took in the worker is recorded as well
+
+        Parameters
+        ----------
+        pool : multiprocessing.Pool
+            Pool of workers
+        func : callable
+            Function to apply to each task
+        tasks : list
+            Arguments of each call to `func`
+        chunk : uint
+            Number of tasks sent to a worker at a time
+        telemetry : pycroscopy.io.telemetry.Telemetry or None
+            Records the time spent computing and communicating with the workers
+        t_start : float
+            Time at which the pool started being set up
+        processors : uint
+            Number of workers in the pool
+
+        Returns
+        -------
+        results : list
+            Value returned by `func` for each task
+        """
+        if telemetry is None:
+            jobs = pool.imap(func, tasks, chunksize=chunk)
+            # get Results from different processes
+            return [j for j in jobs]
+
+        jobs = pool.imap(timed_call, [(func, task) for task in tasks], chunksize=chunk)
+        results = [j for j in jobs]
+        telemetry.add_parallel(time() - t_start, [res[1] for res in results], processors)
+        return [res[0] for res in results]
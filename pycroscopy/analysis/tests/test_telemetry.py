@@ -0,0 +1,52 @@
+from __future__ import division, print_function, absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+
+from pycroscopy.analysis import BESHOmodel
+from pycroscopy.io.hdf_utils import getDataSet
+from pycroscopy.io.translators import FakeDataGenerator
+
+
+class TestGuessTelemetry(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        h5_path = os.path.join(self.folder, 'beps.h5')
+        # 4 x 4 positions from the 128 x 128 loop coefficient images
+        FakeDataGenerator().translate(h5_path, 8, 16, 200E+3, 400E+3, n_cycles=2, FORC_cycles=2, FORC_repeats=2,
+                                      bin_factor=32, seed=0)
+        self.h5_file = h5py.File(h5_path, 'r+')
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _guess(self, pos_per_read):
+        h5_main = getDataSet(self.h5_file, 'Raw_Data')[0]
+        model = BESHOmodel(h5_main, parallel=False)
+        model.enable_telemetry()
+        model._max_pos_per_read = pos_per_read
+        h5_guess = model.do_guess(processors=1, strategy='complex_gaussian')
+
+        num_chunks = h5_main.shape[0] // pos_per_read
+        h5_group = h5_guess.parent
+        self.assertEqual(h5_group.attrs['Guess_telemetry_num_pixels'], h5_main.shape[0])
+        self.assertEqual(h5_group.attrs['Guess_telemetry_num_chunks'], num_chunks)
+
+        chunk_mat = h5_group['Guess_Telemetry'][()]
+        self.assertEqual(chunk_mat.shape, (num_chunks, 5))
+        self.assertEqual(chunk_mat[:, 0].tolist(), [pos_per_read] * num_chunks)
+        self.assertTrue((chunk_mat >= 0).all())
+        # Every chunk keeps its own timings
+        self.assertEqual(len(np.unique(chunk_mat[:, 1:], axis=0)), num_chunks)
+
+    def test_single_chunk(self):
+        self._guess(16)
+
+    def test_several_chunks(self):
+        self._guess(4)
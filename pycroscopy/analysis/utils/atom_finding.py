@@ -8,7 +8,7 @@ Created on Mon Jan 23 11:13:22 2017
 from __future__ import division, print_function, absolute_import, unicode_literals
 import numpy as np
 from scipy.optimize import least_squares
-import itertools as itt
+from scipy.spatial import cKDTree
 import multiprocessing as mp
 import time as tm
 from _warnings import warn
@@ -53,18 +53,49 @@ def multi_gauss_surface_fit(coef_mat, s_mat):
     """
     x = s_mat[:, :, 0]
     y = s_mat[:, :, 1]
+    # All peaks are evaluated at once as [peak, row, column]
+    amp, x_val, y_val, sigma = [coef_mat[:, ind, None, None] for ind in range(4)]
+    gauss = amp * np.exp(-((x - x_val) ** 2 + (y - y_val) ** 2) / sigma ** 2)
+
+    return np.float32(np.sum(gauss, axis=0))
+
+
+def multi_gauss_surface_jacobian(coef_mat, s_mat):
+    """
+    Evaluates the partial derivatives of the N gaussian peaks generated by multi_gauss_surface_fit with respect to
+    each of their coefficients
+
+    Parameters
+    ----------
+    coef_mat : 2D numpy array
+        Coefficients arranged as [atom, parameter] where the parameters are:
+            height, row, column, sigma (width of the gaussian)
+    s_mat : 3D numpy array
+        Stack of the mesh grid
+
+    Returns
+    -------
+    jac_mat : 2D numpy array
+        Partial derivatives arranged as [raveled position in the 2D matrix, raveled coefficient]
+    """
+    x = s_mat[:, :, 0].ravel()
+    y = s_mat[:, :, 1].ravel()
     num_peaks = coef_mat.shape[0]
-    multi_gauss = np.zeros(shape=x.shape, dtype=np.float32)
+    # Arranged as [peak, position]
+    amp, x_val, y_val, sigma = [coef_mat[:, ind, None] for ind in range(4)]
+    x_diff = x - x_val
+    y_diff = y - y_val
+    dist_sq = x_diff ** 2 + y_diff ** 2
+    expo = np.exp(-dist_sq / sigma ** 2)
+    gauss = amp * expo
 
-    for peak_ind in range(num_peaks):
-        amp = coef_mat[peak_ind, 0]
-        x_val = coef_mat[peak_ind, 1]
-        y_val = coef_mat[peak_ind, 2]
-        sigma = coef_mat[peak_ind, 3]
-        gauss = amp * np.exp(-((x - x_val) ** 2 + (y - y_val) ** 2) / sigma ** 2)
-        multi_gauss += gauss
+    jac_mat = np.empty(shape=(num_peaks, 4, x.size))
+    jac_mat[:, 0] = expo
+    jac_mat[:, 1] = 2 * gauss * x_diff / sigma ** 2
+    jac_mat[:, 2] = 2 * gauss * y_diff / sigma ** 2
+    jac_mat[:, 3] = 2 * gauss * dist_sq / sigma ** 3
 
-    return multi_gauss
+    return jac_mat.reshape(num_peaks * 4, x.size).T
 
 
 def fit_atom_pos(single_parm):
@@ -198,11 +229,17 @@ def fit_atom_pos(single_parm):
             err = orig_data_mat - multi_gauss_surface_fit(parms_mat, x_data_mat)
             return err.ravel()
 
+        def gauss_2d_jacobian(parms_vec, orig_data_mat, x_data_mat):
+            """
+            Calculates the partial derivatives of the residual with respect to each of the parameters
+            """
+            return -multi_gauss_surface_jacobian(np.reshape(parms_vec, (-1, 4)), x_data_mat)
+
         plsq = least_squares(gauss_2d_residuals,
                              coef_guess_mat.ravel(),
                              args=(fit_region, s_mat),
                              bounds=(lb_mat.ravel(), ub_mat.ravel()),
-                             jac='2-point', max_nfev=max_function_evals)
+                             jac=gauss_2d_jacobian, max_nfev=max_function_evals)
         coef_fit_mat = np.reshape(plsq.x, (-1, 4))
 
     if verbose:
@@ -211,6 +248,55 @@ def fit_atom_pos(single_parm):
         return coef_guess_mat, coef_fit_mat
 
 
+def find_nearest_neighbors(atom_pos, num_neighbors):
+    """
+    Finds the nearest neighbors of every atom using a KD-tree so that the memory and time scale as N log N instead of
+    N^2 as with a full distance matrix
+
+    Parameters
+    ----------
+    atom_pos : 2D numpy array
+        Positions of the atoms arranged as [atom index, row(0) and column(1)]
+    num_neighbors : unsigned int
+        Number of nearest neighbors to find for each atom
+
+    Returns
+    -------
+    neighbors_mat : 2D numpy array
+        Indices of the neighbors of each atom sorted by distance, arranged as [atom index, neighbor]. The atom itself
+        is not included. Fewer neighbors are returned if there are not enough atoms
+    """
+    num_atoms = atom_pos.shape[0]
+    num_neighbors = min(int(num_neighbors), num_atoms - 1)
+    if num_neighbors < 1:
+        return np.zeros(shape=(num_atoms, 0), dtype=np.intp)
+
+    tree = cKDTree(atom_pos[:, :2])
+    # The closest atom to each atom is itself
+    _, neighbors_mat = tree.query(atom_pos[:, :2], k=num_neighbors + 1)
+
+    return neighbors_mat[:, 1:]
+
+
+# Data shared by all the atoms fitted by a worker of the pool. See _init_fit_worker
+_worker_state = dict()
+
+
+def _init_fit_worker(parm_dict, fitting_parms):
+    """
+    Stores the image, guesses, neighbors and fitting parameters in a worker of the pool
+    """
+    _worker_state['parm_dict'] = parm_dict
+    _worker_state['fitting_parms'] = fitting_parms
+
+
+def _fit_atom_ind(atom_ind):
+    """
+    Fits the position of a single atom using the data stored in this worker. See fit_atom_pos
+    """
+    return fit_atom_pos((atom_ind, _worker_state['parm_dict'], _worker_state['fitting_parms']))
+
+
 def fit_atom_positions_parallel(parm_dict, fitting_parms, num_cores=None):
     """
     Fits the positions of N atoms in parallel
@@ -231,18 +317,19 @@ def fit_atom_positions_parallel(parm_dict, fitting_parms, num_cores=None):
     """
     parm_dict['verbose'] = False
     all_atom_guesses = parm_dict['atom_pos_guess']
+    num_atoms = all_atom_guesses.shape[0]
     t_start = tm.time()
-    num_cores = recommendCores(all_atom_guesses.shape[0], requested_cores=num_cores, lengthy_computation=False)
+    num_cores = recommendCores(num_atoms, requested_cores=num_cores, lengthy_computation=False)
     if num_cores>1:
-        pool = mp.Pool(processes=num_cores)
-        parm_list = itt.izip(range(all_atom_guesses.shape[0]), itt.repeat(parm_dict), itt.repeat(fitting_parms))
-        chunk = int(all_atom_guesses.shape[0] / num_cores)
-        jobs = pool.imap(fit_atom_pos, parm_list, chunksize=chunk)
+        # The image, guesses and neighbors are sent to each worker only once. Tasks are just the atom indices
+        pool = mp.Pool(processes=num_cores, initializer=_init_fit_worker, initargs=(parm_dict, fitting_parms))
+        chunk = max(1, int(num_atoms / (4 * num_cores)))
+        jobs = pool.imap(_fit_atom_ind, range(num_atoms), chunksize=chunk)
         results = [j for j in jobs]
         pool.close()
+        pool.join()
     else:
-        parm_list = itt.izip(range(all_atom_guesses.shape[0]), itt.repeat(parm_dict), itt.repeat(fitting_parms))
-        results = [fit_atom_pos(parm) for parm in parm_list]
+        results = [fit_atom_pos((atom_ind, parm_dict, fitting_parms)) for atom_ind in range(num_atoms)]
 
     tot_time = np.round(tm.time() - t_start)
     print('Took {} sec to find {} atoms with {} cores'.format(tot_time, len(results), num_cores))
@@ -280,15 +367,6 @@ def fit_atom_positions_dset(h5_grp, fitting_parms=None, num_cores=None):
 
     num_atoms = all_atom_guesses.shape[0]  # number of atoms
 
-    # build distance matrix
-    pos_vec = all_atom_guesses[:, 0] + 1j * all_atom_guesses[:, 1]
-
-    pos_mat1 = np.tile(np.transpose(np.atleast_2d(pos_vec)), [1, num_atoms])
-    pos_mat2 = np.transpose(pos_mat1)
-    d_mat = np.abs(pos_mat2 - pos_mat1)  # matrix of distances between all atoms
-    # sort the distance matrix and keep only the atoms within the nearest neighbor limit
-    neighbor_dist_order = np.argsort(d_mat)
-
     if fitting_parms is None:
         num_nearest_neighbors = 6  # to consider when fitting
         fitting_parms = {'fit_region_size': win_size * 0.80,  # region to consider when fitting
@@ -305,8 +383,8 @@ def fit_atom_positions_dset(h5_grp, fitting_parms=None, num_cores=None):
 
     num_nearest_neighbors = fitting_parms['num_nearest_neighbors']
 
-    # neighbor dist order has the (indices of the) neighbors for each atom sorted by distance
-    closest_neighbors_mat = neighbor_dist_order[:, 1:num_nearest_neighbors + 1]
+    # indices of the neighbors for each atom sorted by distance
+    closest_neighbors_mat = find_nearest_neighbors(all_atom_guesses, num_nearest_neighbors)
 
     parm_dict = {'atom_pos_guess': all_atom_guesses,
                  'nearest_neighbors': closest_neighbors_mat,
@@ -378,7 +456,7 @@ def visualize_atom_fit(atom_rough_pos, all_atom_guesses, parm_dict, fitting_parm
     """
     temp_dist = np.abs(
         all_atom_guesses[:, 0] + 1j * all_atom_guesses[:, 1] - (atom_rough_pos[0] + 1j * atom_rough_pos[1]))
-    atom_ind = np.argsort(temp_dist)[0]
+    atom_ind = np.argmin(temp_dist)
 
     parm_dict['verbose'] = True
     coef_guess_mat, lb_mat, ub_mat, coef_fit_mat, fit_region, s_mat, plsq = fit_atom_pos((atom_ind, parm_dict, fitting_parms))
@@ -468,20 +546,14 @@ def remove_duplicate_labels(atom_labels, psf_width, double_cropped_image, distan
         atom_families.append(np.ones(shape=family.shape[0], dtype=np.uint32) * family_ind)
     atom_families = np.hstack(atom_families)
 
-    # build distance matrix
-    pos_vec = all_atom_pos[:, 0] + 1j * all_atom_pos[:, 1]
-
-    pos_mat1 = np.tile(np.transpose(np.atleast_2d(pos_vec)), [1, all_atom_pos.shape[0]])
-    pos_mat2 = np.transpose(pos_mat1)
-    d_mat = np.abs(pos_mat2 - pos_mat1)  # matrix of distances between all atoms
-
-    # replace the diagonal with zeros and then by some large number:
-    d_mat = np.tril(d_mat, -1)
-    d_mat[d_mat == 0] = 100 * psf_width
-
     # Now find the atoms which are too close to each other:
-    culprits = np.vstack(np.where(d_mat <= distance_multiplier * psf_width)).T
-    # the culprits should be arranged as pairs in a N,2 matrix
+    tree = cKDTree(all_atom_pos)
+    culprits = tree.query_pairs(distance_multiplier * psf_width, output_type='ndarray')
+    # atoms at exactly the same position are not considered culprits
+    pair_dists = np.linalg.norm(all_atom_pos[culprits[:, 0]] - all_atom_pos[culprits[:, 1]], axis=1)
+    culprits = culprits[pair_dists > 0]
+    # the culprits should be arranged as pairs in a N,2 matrix, the later atom first
+    culprits = culprits[np.lexsort((culprits[:, 0], culprits[:, 1]))][:, ::-1]
 
     if culprits.size == 0:
         # nothing to remove
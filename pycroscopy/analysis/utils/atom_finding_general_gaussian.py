@@ -7,7 +7,7 @@ from __future__ import division, print_function, absolute_import, unicode_litera
 import os
 import numpy as np
 from scipy.optimize import least_squares
-import itertools as itt
+from scipy.spatial import cKDTree
 import multiprocessing as mp
 import time as tm
 from _warnings import warn
@@ -23,6 +23,7 @@ from ...io.microdata import MicroDataset, MicroDataGroup
 from ...io.io_hdf5 import ioHDF5
 from ...viz import plot_utils
 from ..model import Model
+from .atom_finding import find_nearest_neighbors
 
 def do_fit(single_parm):
     parms = single_parm[0]
@@ -39,7 +40,7 @@ def do_fit(single_parm):
                          args=(fit_region.ravel(), s1.T, s2.T),
                          kwargs=kwargs,
                          bounds=(lb_mat.ravel(), ub_mat.ravel()),
-                         jac='2-point', max_nfev=max_function_evals)
+                         jac=gauss_2d_residuals_jacobian, max_nfev=max_function_evals)
 
     coef_fit_mat = np.reshape(plsq.x, (-1, 7))
 
@@ -78,6 +79,30 @@ def gauss_2d_residuals(parms_vec, orig_data_mat, x_data, y_data, **kwargs):
     return err
 
 
+def gauss_2d_residuals_jacobian(parms_vec, orig_data_mat, x_data, y_data, **kwargs):
+    """
+    Calculates the partial derivatives of the residual with respect to each of the parameters
+
+    Parameters
+    ----------
+    parms_vec : 1D numpy.ndarray
+        Raveled version of the parameters matrix
+    orig_data_mat : 2D numpy array
+        Section of the image being fitted
+    x_data : numpy.ndarray
+
+    y_data : numpy.ndarray
+
+    Returns
+    -------
+    jac_mat : 2D numpy.ndarray
+        Partial derivatives arranged as [raveled position, raveled parameters]
+    """
+    parms_mat = np.reshape(parms_vec, (-1, 7))
+
+    return -gauss2d_jacobian(x_data, y_data, *parms_mat, **kwargs)
+
+
 def gauss2d(X, Y, *parms, **kwargs):
     """
     Calculates a general 2d elliptic gaussian
@@ -103,31 +128,308 @@ def gauss2d(X, Y, *parms, **kwargs):
 
     Returns a width x height matrix of values representing the call to the gaussian function at each position. 
     """
+    X = np.asarray(X, dtype=np.float64)
+    Y = np.asarray(Y, dtype=np.float64)
+    coef_mat = np.atleast_2d(np.array(parms, dtype=np.float64))
+    # each gaussian has a background associated with it but we only use the center atom background
+    background_value = coef_mat[0, -1]  # we can only have one background value for the fit region
+
+    gauss = _gauss2d_terms(X.ravel(), Y.ravel(), coef_mat, kwargs['symmetric'])[0]
+    # The background is added once per gaussian
+    Z = np.sum(gauss, axis=0) + coef_mat.shape[0] * background_value
+    return Z.reshape(X.shape)
+
+
+def gauss2d_jacobian(X, Y, *parms, **kwargs):
+    """
+    Calculates the partial derivatives of gauss2d with respect to each of the parameters of each gaussian
+
+    Parameters
+    ----------
+    X, Y : numpy.ndarray
+        The x and y matrix values. See gauss2d
+    params: List of 7 parameters defining each gaussian. See gauss2d
+
+    Returns
+    -------
+    jac_mat : 2D numpy.ndarray
+        Partial derivatives arranged as [raveled position in X, raveled parameters]
+    """
     symmetric = kwargs['symmetric']
-    background = kwargs['background']
-    Z = np.zeros(np.shape(X))
-    background_value = parms[0][-1]  # we can only have one background value for the fit region
-    for guess in parms:
-        # each gaussian has a background associated with it but we only use the center atom background
-        A, x0, y0, sigma_x, sigma_y, theta, background_unused = guess
-
-        # determine which type of gaussian we want
-        if symmetric:
-            sigma_y = sigma_x
-            if not background:
-                background = 0
+    x_vec = np.asarray(X, dtype=np.float64).ravel()
+    y_vec = np.asarray(Y, dtype=np.float64).ravel()
+    coef_mat = np.atleast_2d(np.array(parms, dtype=np.float64))
+    num_peaks = coef_mat.shape[0]
+
+    gauss, expo, x_diff, y_diff = _gauss2d_terms(x_vec, y_vec, coef_mat, symmetric)
+    sigma_x, theta = [coef_mat[:, ind, None] for ind in [3, 5]]
+    sigma_y = sigma_x if symmetric else coef_mat[:, 4, None]
+    cos_sq = np.cos(theta) ** 2
+    sin_sq = np.sin(theta) ** 2
+    sin_2t = np.sin(2 * theta)
+    cos_2t = np.cos(2 * theta)
+
+    def __d_quad(d_a, d_b, d_c):
+        # Derivative of the gaussian given the derivatives of the coefficients of its quadratic form
+        return -gauss * (d_a * x_diff ** 2 - 2 * d_b * x_diff * y_diff + d_c * y_diff ** 2)
+
+    jac_mat = np.zeros(shape=(num_peaks, 7, x_vec.size))
+    jac_mat[:, 0] = expo
+    a, b, c = _gauss2d_quad_coefs(sigma_x, sigma_y, theta)
+    jac_mat[:, 1] = 2 * gauss * (a * x_diff - b * y_diff)
+    jac_mat[:, 2] = 2 * gauss * (c * y_diff - b * x_diff)
+    d_sigma_x = __d_quad(-cos_sq / sigma_x ** 3, sin_2t / (2 * sigma_x ** 3), -sin_sq / sigma_x ** 3)
+    d_sigma_y = __d_quad(-sin_sq / sigma_y ** 3, -sin_2t / (2 * sigma_y ** 3), -cos_sq / sigma_y ** 3)
+    if symmetric:
+        # sigma_y is replaced by sigma_x
+        jac_mat[:, 3] = d_sigma_x + d_sigma_y
+    else:
+        jac_mat[:, 3] = d_sigma_x
+        jac_mat[:, 4] = d_sigma_y
+    inv_diff = 1 / sigma_y ** 2 - 1 / sigma_x ** 2
+    jac_mat[:, 5] = __d_quad(sin_2t * inv_diff / 2, cos_2t * inv_diff / 2, -sin_2t * inv_diff / 2)
+    jac_mat[0, 6] = num_peaks
+
+    return jac_mat.reshape(num_peaks * 7, x_vec.size).T
+
+
+def _gauss2d_quad_coefs(sigma_x, sigma_y, theta):
+    """
+    Coefficients of the quadratic form in the exponent of the general 2D gaussian
+    """
+    a = np.cos(theta) ** 2 / (2 * sigma_x ** 2) + np.sin(theta) ** 2 / (2 * sigma_y ** 2)
+    b = -np.sin(2 * theta) / (4 * sigma_x ** 2) + np.sin(2 * theta) / (4 * sigma_y ** 2)
+    c = np.sin(theta) ** 2 / (2 * sigma_x ** 2) + np.cos(theta) ** 2 / (2 * sigma_y ** 2)
+    return a, b, c
+
+
+def _gauss2d_terms(x_vec, y_vec, coef_mat, symmetric):
+    """
+    Evaluates all gaussians at once, arranged as [gaussian, position], without the background
+
+    Returns
+    -------
+    gauss, expo, x_diff, y_diff : 2D numpy.ndarray
+        Gaussians, gaussians of unit amplitude and distances from the centers along x and y
+    """
+    amp, x0, y0, sigma_x, sigma_y, theta = [coef_mat[:, ind, None] for ind in range(6)]
+    # determine which type of gaussian we want
+    if symmetric:
+        sigma_y = sigma_x
+    a, b, c = _gauss2d_quad_coefs(sigma_x, sigma_y, theta)
+    x_diff = x_vec - x0
+    y_diff = y_vec - y0
+    expo = np.exp(- (a * x_diff ** 2 - 2 * b * x_diff * y_diff + c * y_diff ** 2))
+    return amp * expo, expo, x_diff, y_diff
+
+
+def guess_atom(atom_ind, atom_guesses, closest_neighbors_mat, cropped_clean_image, fitting_parms,
+               motif_converged_parms=None, initial_motifs=False):
+    """
+    Generates the guess parameters and bounds for fitting a single atom and its nearest neighbors.  Module level so
+    that the workers can build the guesses for the atoms they fit
+
+    Parameters
+    ----------
+    atom_ind : int
+        The index of the atom to generate guess parameters for
+    atom_guesses : 2D numpy array
+        Guess positions of all atoms arranged as [atom index, x(0), y(1) and type(2)]
+    closest_neighbors_mat : 2D numpy array
+        Indices of the nearest neighbors of each atom
+    cropped_clean_image : 2D numpy array
+        The image being fitted
+    fitting_parms : dict
+        Parameters used for the fitting. See Gauss_Fit
+    motif_converged_parms : list of 2D numpy arrays, optional
+        Fits of each motif, relative to the motif center. Required unless initial_motifs is True
+    initial_motifs : optional boolean (default is False)
+        Specifies whether we are generating guesses for the initial motifs. Subsequent guesses
+        have the advantage of the fits from the motifs and will be much better starting values.
+
+    Returns
+    -------
+    atom_ind : int
+        The index of the atom to generate guess parameters for
+
+    coef_guess_mat : 2D numpy array
+        Initial guess parameters for all the gaussians.
+
+    fit_region : 2D numpy array
+        The fit region cropped from the image
+
+    s1 and s2 : 2D numpy arrays
+        The required input for the X and Y parameters of gauss2d
+
+    lb_mat and ub_mat : 2D numpy arrays
+        The lower and upper bounds for the fitting.
+    """
+    num_nearest_neighbors = closest_neighbors_mat.shape[1]
+    fit_region_size = fitting_parms['fit_region_size']
+    movement_allowance = fitting_parms['movement_allowance']
+    position_range = fitting_parms['position_range']
+
+    # start writing down initial guesses
+    x_center_atom = atom_guesses[atom_ind, 0]
+    y_center_atom = atom_guesses[atom_ind, 1]
+    x_neighbor_atoms = atom_guesses[closest_neighbors_mat[atom_ind], 0]
+    y_neighbor_atoms = atom_guesses[closest_neighbors_mat[atom_ind], 1]
+
+    # select the window we're going to be fitting
+    x_range = slice(max(int(np.round(x_center_atom - fit_region_size)), 0),
+                    min(int(np.round(x_center_atom + fit_region_size)),
+                        cropped_clean_image.shape[0]))
+    y_range = slice(max(int(np.round(y_center_atom - fit_region_size)), 0),
+                    min(int(np.round(y_center_atom + fit_region_size)),
+                        cropped_clean_image.shape[1]))
+    fit_region = cropped_clean_image[x_range, y_range]
+
+    # define x and y fitting range
+    s1, s2 = np.meshgrid(range(x_range.start, x_range.stop),
+                         range(y_range.start, y_range.stop))
+
+    # guesses are different if we're fitting the initial windows
+    if initial_motifs:
+        # If true, we need to generate more crude guesses
+        # for the initial motif window fitting.
+        # Once these have been fit properly they will act
+        # as the starting point for future guesses.
+
+        # put the initial guesses into the proper form
+        x_guess = np.hstack((x_center_atom, x_neighbor_atoms))
+        y_guess = np.hstack((y_center_atom, y_neighbor_atoms))
+        sigma_x_center_atom = fitting_parms['sigma_guess']
+        sigma_y_center_atom = fitting_parms['sigma_guess']
+        sigma_x_neighbor_atoms = [fitting_parms['sigma_guess'] for i in
+                                  range(num_nearest_neighbors)]
+        sigma_y_neighbor_atoms = [fitting_parms['sigma_guess'] for i in
+                                  range(num_nearest_neighbors)]
+        theta_center_atom = 0
+        theta_neighbor_atoms = np.zeros(num_nearest_neighbors)
+        background_center_atom = np.min(fit_region)
+
+        # The existence of a background messes up a straight forward gaussian amplitude guess,
+        # so we add/subtract the background value from the straight forward guess depending
+        # on if the background is positive or negative.
+        if np.min(fit_region) < 0:
+            a_guess = cropped_clean_image[
+                          np.rint(x_guess).astype(int), np.rint(y_guess).astype(int)] - background_center_atom
+        else:
+            a_guess = cropped_clean_image[
+                          np.rint(x_guess).astype(int), np.rint(y_guess).astype(int)] + background_center_atom
+
+        sigma_x_guess = np.hstack((sigma_x_center_atom, sigma_x_neighbor_atoms))
+        sigma_y_guess = np.hstack((sigma_y_center_atom, sigma_y_neighbor_atoms))
+        theta_guess = np.hstack((theta_center_atom, theta_neighbor_atoms))
+        background_guess = np.hstack([background_center_atom for num in range(
+            num_nearest_neighbors + 1)])  # we will only need one background
+        coef_guess_mat = np.transpose(np.vstack((a_guess, x_guess, y_guess, sigma_x_guess, sigma_y_guess,
+                                                 theta_guess, background_guess)))
+    else:
+        # otherwise better guesses are assumed to exist
+        motif_type = int(atom_guesses[atom_ind, 2])
+        coef_guess_mat = np.copy(motif_converged_parms[motif_type])
+        coef_guess_mat[:, 1] = atom_guesses[atom_ind, 0] + coef_guess_mat[:, 1]
+        coef_guess_mat[:, 2] = atom_guesses[atom_ind, 1] + coef_guess_mat[:, 2]
+
+    # Choose upper and lower bounds for the fitting
+    #
+    # Address negatives first
+    lb_a = []
+    ub_a = []
+    for item in coef_guess_mat[:, 0]:  # amplitudes
+
+        if item < 0:
+            lb_a.append(item + item * movement_allowance)
+            ub_a.append(item - item * movement_allowance)
         else:
-            if not background:
-                background = 0
+            lb_a.append(item - item * movement_allowance)
+            ub_a.append(item + item * movement_allowance)
+
+    lb_background = []
+    ub_background = []
+    for item in coef_guess_mat[:, 6]:  # background
+        if item < 0:
+            lb_background.append(item + item * movement_allowance)
+            ub_background.append(item - item * movement_allowance)
+        else:
+            lb_background.append(item - item * movement_allowance)
+            ub_background.append(item + item * movement_allowance)
+
+    # Set up upper and lower bounds:
+    lb_mat = [lb_a,                                                              # amplitude
+              coef_guess_mat[:, 1] - position_range,                             # x position
+              coef_guess_mat[:, 2] - position_range,                             # y position
+              [np.max([0, value - value * movement_allowance]) for value in coef_guess_mat[:, 3]],  # sigma x
+              [np.max([0, value - value * movement_allowance]) for value in coef_guess_mat[:, 4]],  # sigma y
+              coef_guess_mat[:, 5] - 2 * 3.14159,                                # theta
+              lb_background]                                                     # background
+
+    ub_mat = [ub_a,                                                              # amplitude
+              coef_guess_mat[:, 1] + position_range,                             # x position
+              coef_guess_mat[:, 2] + position_range,                             # y position
+              coef_guess_mat[:, 3] + coef_guess_mat[:, 3] * movement_allowance,  # sigma x
+              coef_guess_mat[:, 4] + coef_guess_mat[:, 4] * movement_allowance,  # sigma y
+              coef_guess_mat[:, 5] + 2 * 3.14159,                                # theta
+              ub_background]                                                     # background
+
+    lb_mat = np.transpose(lb_mat)
+    ub_mat = np.transpose(ub_mat)
+
+    check_bounds = False
+    coeff_names = ['amplitude', 'x', 'y', 'sigma_x', 'sigma_y', 'theta', 'background']
+    if check_bounds:
+        for i, item in enumerate(coef_guess_mat):
+            for j, value in enumerate(item):
+                if lb_mat[i][j] > value or ub_mat[i][j] < value:
+                    print('Atom number: {}'.format(atom_ind))
+                    print('Guess: {}'.format(item))
+                    print('Lower bound: {}'.format(lb_mat[i]))
+                    print('Upper bound: {}'.format(ub_mat[i]))
+                    print('dtypes: {}'.format(coeff_names))
+                    raise ValueError('{} guess is out of bounds'.format(coeff_names[j]))
+
+    return atom_ind, coef_guess_mat, fit_region, s1, s2, lb_mat, ub_mat
+
+
+# Data shared by all the atoms fitted by a worker of the pool. See _init_fit_worker
+_worker_state = dict()
+
+
+def _init_fit_worker(state):
+    """
+    Stores the image, guesses, neighbors and parameters in a worker of the pool so that each task only needs the
+    index of an atom
+    """
+    _worker_state.clear()
+    _worker_state.update(state)
+
 
-        # define some variables
-        a = np.cos(theta) ** 2 / (2 * sigma_x ** 2) + np.sin(theta) ** 2 / (2 * sigma_y ** 2)
-        b = -np.sin(2 * theta) / (4 * sigma_x ** 2) + np.sin(2 * theta) / (4 * sigma_y ** 2)
-        c = np.sin(theta) ** 2 / (2 * sigma_x ** 2) + np.cos(theta) ** 2 / (2 * sigma_y ** 2)
+def _guess_and_fit_atom(atom_ind, state=None):
+    """
+    Builds the guess for a single atom and its neighbors and fits it
 
-        # calculate the final value
-        Z += A * np.exp(- (a * (X - x0) ** 2 - 2 * b * (X - x0) * (Y - y0) + c * (Y - y0) ** 2)) + background_value
-    return Z
+    Parameters
+    ----------
+    atom_ind : int
+        The index of the atom to fit
+    state : dict, optional
+        Image, guesses, neighbors and parameters. Default - the state of this worker. See _init_fit_worker
+
+    Returns
+    -------
+    guess_parms : tuple
+        Guess of the atom and its neighbors as returned by guess_atom
+    coef_fit_mat : 2D numpy array
+        Fit parameters for all the gaussians
+    """
+    if state is None:
+        state = _worker_state
+    guess_parms = guess_atom(atom_ind, state['atom_guesses'], state['closest_neighbors_mat'],
+                             state['cropped_clean_image'], state['fitting_parms'],
+                             motif_converged_parms=state['motif_converged_parms'])
+
+    return guess_parms, do_fit([guess_parms, state['fitting_parms']])
 
 
 class Gauss_Fit(object):
@@ -199,25 +501,17 @@ class Gauss_Fit(object):
 
         self.num_atoms = self.all_atom_guesses.shape[0]  # number of atoms
 
-        # build distance matrix
-        pos_vec = self.all_atom_guesses[:, 0] + 1j * self.all_atom_guesses[:, 1]
-
-        pos_mat1 = np.tile(np.transpose(np.atleast_2d(pos_vec)), [1, self.num_atoms])
-        pos_mat2 = np.transpose(pos_mat1)
-        d_mat = np.abs(pos_mat2 - pos_mat1)  # matrix of distances between all atoms
-        # sort the distance matrix and keep only the atoms within the nearest neighbor limit
-        neighbor_dist_order = np.argsort(d_mat)
-
         self.num_nearest_neighbors = self.fitting_parms['num_nearest_neighbors']
 
-        # neighbor dist order has the (indices of the) neighbors for each atom sorted by distance
-        self.closest_neighbors_mat = neighbor_dist_order[:, 1:self.num_nearest_neighbors + 1]
+        # indices of the neighbors for each atom sorted by distance
+        self.closest_neighbors_mat = find_nearest_neighbors(self.all_atom_guesses, self.num_nearest_neighbors)
 
         # find which atoms are at the centers of the motifs
-        self.center_atom_vec = (self.motif_centers[:, 0]) + (1j * self.motif_centers[:, 1])
-        self.center_atom_dists = [np.abs(pos_vec - item) for item in self.center_atom_vec]
-        self.center_atom_sorted = np.argsort(self.center_atom_dists)
-        self.center_atom_indices = self.center_atom_sorted[:, 0]
+        tree = cKDTree(self.all_atom_guesses[:, :2])
+        _, self.center_atom_indices = tree.query(self.motif_centers[:, :2], k=1)
+
+        # set by fit_motif
+        self.motif_converged_parms = None
 
     def fit_atom_positions_parallel(self, plot_results=True, num_cores=None):
         """
@@ -245,37 +539,43 @@ class Gauss_Fit(object):
         if num_cores is None:
             num_cores = recommendCores(self.num_atoms, requested_cores=num_cores, lengthy_computation=False)
 
-        print('Setting up guesses')
-        self.guess_parms = []
-        for i in range(self.num_atoms):
-            self.guess_parms.append(self.do_guess(i))
+        if self.motif_converged_parms is None:
+            raise ValueError('The motifs must be fit using fit_motif before fitting the atom positions')
+
+        # Sent to each worker only once. The workers build the guesses for the atoms they are given
+        state = {'atom_guesses': self.all_atom_guesses,
+                 'closest_neighbors_mat': self.closest_neighbors_mat,
+                 'cropped_clean_image': self.cropped_clean_image,
+                 'fitting_parms': self.fitting_parms,
+                 'motif_converged_parms': self.motif_converged_parms}
 
         print('Fitting...')
         if num_cores > 1:
-            pool = mp.Pool(processes=num_cores)
-            parm_list = itt.izip(self.guess_parms, itt.repeat(self.fitting_parms))
-            chunk = int(self.num_atoms / num_cores)
-            jobs = pool.imap(do_fit, parm_list, chunksize=chunk)
-            self.fitting_results = [j for j in jobs]
+            pool = mp.Pool(processes=num_cores, initializer=_init_fit_worker, initargs=(state,))
+            chunk = max(1, int(self.num_atoms / (4 * num_cores)))
+            jobs = pool.imap(_guess_and_fit_atom, range(self.num_atoms), chunksize=chunk)
+            results = [j for j in jobs]
             pool.close()
+            pool.join()
         else:
-            parm_list = itt.izip(self.guess_parms, itt.repeat(self.fitting_parms))
-            self.fitting_results = [do_fit(parm) for parm in parm_list]
+            results = [_guess_and_fit_atom(atom_ind, state=state) for atom_ind in range(self.num_atoms)]
 
         print ('Finalizing datasets...')
-        self.guess_dataset = np.zeros(shape=(self.num_atoms, self.num_nearest_neighbors + 1), dtype=self.atom_coeff_dtype)
-        self.fit_dataset = np.zeros(shape=self.guess_dataset.shape, dtype=self.guess_dataset.dtype)
+        self.guess_parms = [res[0] for res in results]
+        self.fitting_results = [res[1] for res in results]
 
-        for atom_ind, single_atom_results in enumerate(self.fitting_results):
-            types = np.hstack((self.h5_guess['type'][atom_ind], [self.h5_guess['type'][neighbor] for neighbor in self.closest_neighbors_mat[atom_ind]]))
-            atom_data = np.hstack((np.vstack(types), single_atom_results))
-            atom_data = [tuple(element) for element in atom_data]
-            self.fit_dataset[atom_ind] = atom_data
+        self.guess_dataset = np.zeros(shape=(self.num_atoms, self.closest_neighbors_mat.shape[1] + 1),
+                                      dtype=self.atom_coeff_dtype)
+        self.fit_dataset = np.zeros(shape=self.guess_dataset.shape, dtype=self.guess_dataset.dtype)
 
-            single_atom_guess = self.guess_parms[atom_ind]
-            atom_guess_data = np.hstack((np.vstack(types), single_atom_guess[1]))
-            atom_guess_data = [tuple(element) for element in atom_guess_data]
-            self.guess_dataset[atom_ind] = atom_guess_data
+        # types of each atom followed by those of its neighbors
+        atom_inds = np.hstack((np.arange(self.num_atoms)[:, None], self.closest_neighbors_mat))
+        guess_coefs = [single_atom_guess[1] for single_atom_guess in self.guess_parms]
+        for dset, coefs in [(self.guess_dataset, guess_coefs), (self.fit_dataset, self.fitting_results)]:
+            coefs = np.array(coefs)
+            dset['type'] = self.all_atom_guesses[atom_inds, 2]
+            for coef_ind, name in enumerate(self.motif_coeff_dtype.names):
+                dset[name] = coefs[:, :, coef_ind]
 
         tot_time = np.round(tm.time() - t_start)
         print('Took {} sec to find {} atoms with {} cores'.format(tot_time, len(self.fitting_results), num_cores))
@@ -324,132 +624,9 @@ class Gauss_Fit(object):
             The lower and upper bounds for the fitting.
         """
 
-        fit_region_size = self.fitting_parms['fit_region_size']
-        movement_allowance = self.fitting_parms['movement_allowance']
-        position_range = self.fitting_parms['position_range']
-
-        # start writing down initial guesses
-        x_center_atom = self.h5_guess['x'][atom_ind]
-        y_center_atom = self.h5_guess['y'][atom_ind]
-        x_neighbor_atoms = [self.h5_guess['x'][self.closest_neighbors_mat[atom_ind][i]] for i in
-                            range(self.num_nearest_neighbors)]
-        y_neighbor_atoms = [self.h5_guess['y'][self.closest_neighbors_mat[atom_ind][i]] for i in
-                            range(self.num_nearest_neighbors)]
-
-        # select the window we're going to be fitting
-        x_range = slice(max(int(np.round(x_center_atom - fit_region_size)), 0),
-                        min(int(np.round(x_center_atom + fit_region_size)),
-                            self.cropped_clean_image.shape[0]))
-        y_range = slice(max(int(np.round(y_center_atom - fit_region_size)), 0),
-                        min(int(np.round(y_center_atom + fit_region_size)),
-                            self.cropped_clean_image.shape[1]))
-        fit_region = self.cropped_clean_image[x_range, y_range]
-
-        # define x and y fitting range
-        s1, s2 = np.meshgrid(range(x_range.start, x_range.stop),
-                             range(y_range.start, y_range.stop))
-
-        # guesses are different if we're fitting the initial windows
-        if initial_motifs:
-            # If true, we need to generate more crude guesses
-            # for the initial motif window fitting.
-            # Once these have been fit properly they will act
-            # as the starting point for future guesses.
-
-            # put the initial guesses into the proper form
-            x_guess = np.hstack((x_center_atom, x_neighbor_atoms))
-            y_guess = np.hstack((y_center_atom, y_neighbor_atoms))
-            sigma_x_center_atom = self.fitting_parms['sigma_guess']
-            sigma_y_center_atom = self.fitting_parms['sigma_guess']
-            sigma_x_neighbor_atoms = [self.fitting_parms['sigma_guess'] for i in
-                                      range(self.num_nearest_neighbors)]
-            sigma_y_neighbor_atoms = [self.fitting_parms['sigma_guess'] for i in
-                                      range(self.num_nearest_neighbors)]
-            theta_center_atom = 0
-            theta_neighbor_atoms = np.zeros(self.num_nearest_neighbors)
-            background_center_atom = np.min(fit_region)
-
-            # The existence of a background messes up a straight forward gaussian amplitude guess,
-            # so we add/subtract the background value from the straight forward guess depending
-            # on if the background is positive or negative.
-            if np.min(fit_region) < 0:
-                a_guess = self.cropped_clean_image[
-                              np.rint(x_guess).astype(int), np.rint(y_guess).astype(int)] - background_center_atom
-            else:
-                a_guess = self.cropped_clean_image[
-                              np.rint(x_guess).astype(int), np.rint(y_guess).astype(int)] + background_center_atom
-
-            sigma_x_guess = np.hstack((sigma_x_center_atom, sigma_x_neighbor_atoms))
-            sigma_y_guess = np.hstack((sigma_y_center_atom, sigma_y_neighbor_atoms))
-            theta_guess = np.hstack((theta_center_atom, theta_neighbor_atoms))
-            background_guess = np.hstack([background_center_atom for num in range(
-                self.num_nearest_neighbors + 1)])  # we will only need one background
-            coef_guess_mat = np.transpose(np.vstack((a_guess, x_guess, y_guess, sigma_x_guess, sigma_y_guess,
-                                                     theta_guess, background_guess)))
-        else:
-            # otherwise better guesses are assumed to exist
-            motif_type = self.h5_guess['type'][atom_ind]
-            coef_guess_mat = np.copy(self.motif_converged_parms[motif_type])
-            coef_guess_mat[:, 1] = self.h5_guess['x'][atom_ind] + coef_guess_mat[:, 1]
-            coef_guess_mat[:, 2] = self.h5_guess['y'][atom_ind] + coef_guess_mat[:, 2]
-
-        # Choose upper and lower bounds for the fitting
-        #
-        # Address negatives first
-        lb_a = []
-        ub_a = []
-        for item in coef_guess_mat[:, 0]:  # amplitudes
-
-            if item < 0:
-                lb_a.append(item + item * movement_allowance)
-                ub_a.append(item - item * movement_allowance)
-            else:
-                lb_a.append(item - item * movement_allowance)
-                ub_a.append(item + item * movement_allowance)
-
-        lb_background = []
-        ub_background = []
-        for item in coef_guess_mat[:, 6]:  # background
-            if item < 0:
-                lb_background.append(item + item * movement_allowance)
-                ub_background.append(item - item * movement_allowance)
-            else:
-                lb_background.append(item - item * movement_allowance)
-                ub_background.append(item + item * movement_allowance)
-
-        # Set up upper and lower bounds:
-        lb_mat = [lb_a,                                                              # amplitude
-                  coef_guess_mat[:, 1] - position_range,                             # x position
-                  coef_guess_mat[:, 2] - position_range,                             # y position
-                  [np.max([0, value - value * movement_allowance]) for value in coef_guess_mat[:, 3]],  # sigma x
-                  [np.max([0, value - value * movement_allowance]) for value in coef_guess_mat[:, 4]],  # sigma y
-                  coef_guess_mat[:, 5] - 2 * 3.14159,                                # theta
-                  lb_background]                                                     # background
-
-        ub_mat = [ub_a,                                                              # amplitude
-                  coef_guess_mat[:, 1] + position_range,                             # x position
-                  coef_guess_mat[:, 2] + position_range,                             # y position
-                  coef_guess_mat[:, 3] + coef_guess_mat[:, 3] * movement_allowance,  # sigma x
-                  coef_guess_mat[:, 4] + coef_guess_mat[:, 4] * movement_allowance,  # sigma y
-                  coef_guess_mat[:, 5] + 2 * 3.14159,                                # theta
-                  ub_background]                                                     # background
-
-        lb_mat = np.transpose(lb_mat)
-        ub_mat = np.transpose(ub_mat)
-
-        check_bounds = False
-        if check_bounds:
-            for i, item in enumerate(coef_guess_mat):
-                for j, value in enumerate(item):
-                    if lb_mat[i][j] > value or ub_mat[i][j] < value:
-                        print('Atom number: {}'.format(atom_ind))
-                        print('Guess: {}'.format(item))
-                        print('Lower bound: {}'.format(lb_mat[i]))
-                        print('Upper bound: {}'.format(ub_mat[i]))
-                        print('dtypes: {}'.format(self.atom_coeff_dtype.names))
-                        raise ValueError('{} guess is out of bounds'.format(self.atom_coeff_dtype.names[j]))
-
-        return atom_ind, coef_guess_mat, fit_region, s1, s2, lb_mat, ub_mat
+        return guess_atom(atom_ind, self.all_atom_guesses, self.closest_neighbors_mat, self.cropped_clean_image,
+                          self.fitting_parms, motif_converged_parms=self.motif_converged_parms,
+                          initial_motifs=initial_motifs)
 
     def check_data(self, atom_grp):
         # some data checks here
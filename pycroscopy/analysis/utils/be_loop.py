@@ -250,32 +250,33 @@ def loop_fit_function(vdc, coef_vec):
     -----------
     vdc : 1D numpy array or list
         DC voltages
-    coef_vec : 1D numpy array or list
-        9 parameter coefficient vector
+    coef_vec : 1D or 2D numpy array or list
+        9 parameter coefficient vector or a stack of such vectors arranged as [loop, coefficient]
         
     Returns
     ---------
-    loop_eval : 1D numpy array
-        Loop values
+    loop_eval : 1D or 2D numpy array
+        Loop values, arranged as [loop, voltage] if a stack of coefficient vectors was provided
     """
 
-    a = coef_vec[:5]
-    b = coef_vec[5:]
+    coef_vec = np.asarray(coef_vec)
+    a = coef_vec[..., :5, None]
+    b = coef_vec[..., 5:, None]
     d = 1000
     
     v1 = np.asarray(vdc[:int(len(vdc) / 2)])
     v2 = np.asarray(vdc[int(len(vdc) / 2):])
     
-    g1 = (b[1]-b[0])/2*(erf((v1-a[2])*d)+1)+b[0]
-    g2 = (b[3]-b[2])/2*(erf((v2-a[3])*d)+1)+b[2]
+    g1 = (b[..., 1, :]-b[..., 0, :])/2*(erf((v1-a[..., 2, :])*d)+1)+b[..., 0, :]
+    g2 = (b[..., 3, :]-b[..., 2, :])/2*(erf((v2-a[..., 3, :])*d)+1)+b[..., 2, :]
 
-    y1 = (g1 * erf((v1-a[2])/g1) + b[0])/(b[0]+b[1])
-    y2 = (g2 * erf((v2-a[3])/g2) + b[2])/(b[2]+b[3])
+    y1 = (g1 * erf((v1-a[..., 2, :])/g1) + b[..., 0, :])/(b[..., 0, :]+b[..., 1, :])
+    y2 = (g2 * erf((v2-a[..., 3, :])/g2) + b[..., 2, :])/(b[..., 2, :]+b[..., 3, :])
 
-    f1 = a[0] + a[1]*y1 + a[4]*v1
-    f2 = a[0] + a[1]*y2 + a[4]*v2
+    f1 = a[..., 0, :] + a[..., 1, :]*y1 + a[..., 4, :]*v1
+    f2 = a[..., 0, :] + a[..., 1, :]*y2 + a[..., 4, :]*v2
     
-    loop_eval = np.hstack((f1, f2))
+    loop_eval = np.concatenate((f1, f2), axis=-1)
     return loop_eval
 
 
@@ -710,6 +711,8 @@ def fit_loop(vdc_shifted, pr_shifted, guess):
 
     x_data = vdc_shifted.ravel()
     y_data = pr_shifted.ravel()
+    # Guesses taken from float32 fits of parent clusters may round to just outside the bounds
+    guess = np.clip(np.asarray(guess, dtype=np.float64), lb, ub)
 
     '''Do the fitting. Least Squares fit. Using more accurate determination of
     Jacobian. This is slower, but will be necessary initially for generating the
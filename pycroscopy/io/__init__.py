@@ -1,13 +1,27 @@
+"""
+The translators, and the third party libraries they rely upon, are only imported when first accessed
+"""
 from . import be_hdf_utils
 from . import hdf_utils
 from . import io_hdf5
 from . import io_utils
 from . import microdata
-from . import translators
+from . import telemetry
 from .io_hdf5 import ioHDF5
 from .io_utils import *
 from .microdata import MicroDataset, MicroDataGroup
-from .translators import *
+from .telemetry import Telemetry
+from ..lazy_imports import attach_lazy
 
-__all__ = ['ioHDF5', 'MicroDataset', 'MicroDataGroup', 'be_hdf_utils', 'hdf_utils', 'io_utils', 'microdata']
-__all__ += translators.__all__
+_translator_exports = ['Translator', 'BEodfTranslator', 'BEPSndfTranslator', 'BEodfRelaxationTranslator',
+                       'GIVTranslator', 'GLineTranslator', 'GTuneTranslator', 'GDMTranslator',
+                       'PtychographyTranslator', 'SporcTranslator', 'MovieTranslator', 'IgorIBWTranslator',
+                       'NumpyTranslator', 'OneViewTranslator', 'ImageTranslator', 'NDataTranslator',
+                       'FakeDataGenerator', 'LabViewH5Patcher']
+
+__getattr__, __dir__ = attach_lazy(__name__, ['translators'],
+                                   dict([(name, 'translators') for name in _translator_exports]))
+
+__all__ = ['ioHDF5', 'MicroDataset', 'MicroDataGroup', 'Telemetry', 'be_hdf_utils', 'hdf_utils', 'io_utils',
+           'microdata', 'telemetry']
+__all__ += _translator_exports
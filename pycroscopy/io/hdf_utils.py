@@ -8,6 +8,7 @@ Created on Tue Nov  3 21:14:25 2015
 from __future__ import division, print_function, absolute_import, unicode_literals
 import os
 import sys
+import hashlib
 import h5py
 from warnings import warn
 import numpy as np
@@ -16,7 +17,9 @@ from .microdata import MicroDataset
 __all__ = ['get_attr', 'getDataSet', 'getH5DsetRefs', 'getH5RegRefIndices', 'get_dimensionality', 'get_sort_order',
            'getAuxData', 'get_attributes', 'getH5GroupRefs', 'checkIfMain', 'checkAndLinkAncillary',
            'createRefFromIndices', 'copyAttributes', 'reshape_to_Ndims', 'linkRefs', 'linkRefAsAlias',
-           'findH5group', 'get_formatted_labels', 'reshape_from_Ndims', 'findDataset', 'print_tree', 'get_all_main']
+           'findH5group', 'get_formatted_labels', 'reshape_from_Ndims', 'findDataset', 'print_tree', 'get_all_main',
+           'NdimsView', 'calc_chunks', 'calc_chunk_mem', 'calc_chunk_cache', 'get_chunk_cache_kwargs',
+           'open_with_chunk_cache', 'get_metadata_index', 'clear_metadata_cache']
 
 if sys.version_info.major == 3:
     unicode = str
@@ -58,6 +61,20 @@ def get_all_main(parent, verbose=False):
         The datasets found in the file that meet the 'Main Data' criteria.
 
     """
+    if not verbose:
+        '''
+        Serve the request from the metadata index of the file after checking that no 2D dataset has gained or lost
+        attributes since the index was built
+        '''
+        index = _get_linked_index(parent)
+        h5_file = parent.file
+        for path, _ in _get_group_paths(index['two_d'], parent):
+            if _get_num_attrs(h5_file, path) != index['num_attrs'][path]:
+                clear_metadata_cache(parent)
+                index = get_metadata_index(parent)
+                break
+        return [h5_file[path] for path, _ in _get_group_paths(index['main'], parent)]
+
     main_list = list()
 
     def __check(name, obj):
@@ -93,14 +110,10 @@ def getDataSet(h5_parent, data_name):
     list of h5py.Reference of the dataset.
     """
     if isinstance(h5_parent, h5py.File) or isinstance(h5_parent, h5py.Group):
-        data_list = []
-
-        def findData(name, obj):
-            if name.endswith(data_name) and isinstance(obj, h5py.Dataset):
-                data_list.append(obj)
-
-        h5_parent.visititems(findData)
-        return data_list
+        index = _get_linked_index(h5_parent)
+        h5_file = h5_parent.file
+        return [h5_file[path] for path, name in _get_group_paths(index['datasets'], h5_parent)
+                if name.endswith(data_name)]
     else:
         print('%s is not an hdf5 File or Group' % h5_parent)
 
@@ -120,10 +133,36 @@ def getAuxData(parent_data, auxDataName=None):
     -------
     list of h5py.Reference of auxiliary dataset objects.
     """
+    if auxDataName is not None and type(auxDataName) not in [list, tuple, set]:
+        auxDataName = [auxDataName]  # typically a single string
+
+    index = _get_current_index(parent_data)
+    if index is not None:
+        '''
+        The referenced datasets are looked up in the metadata index of the file
+        '''
+        file_ref = parent_data.file
+        refs = index['refs'][parent_data.name]
+        if not _paths_are_current(file_ref, index, [path for _, path in refs]):
+            # A referenced dataset was moved or deleted since the index was built
+            clear_metadata_cache(file_ref)
+            index = get_metadata_index(file_ref)
+            refs = index['refs'][parent_data.name]
+        if auxDataName is None:
+            return [file_ref[path] for _, path in refs]
+        refs = dict(refs)
+        data_list = []
+        for auxName in auxDataName:
+            if auxName in refs:
+                data_list.append(file_ref[refs[auxName]])
+            elif auxName not in parent_data.attrs:
+                warn('%s is not an attribute of %s'
+                     % (str(auxName), parent_data.name))
+                break
+        return data_list
+
     if auxDataName is None:
         auxDataName = parent_data.attrs.keys()
-    elif type(auxDataName) not in [list, tuple, set]:
-        auxDataName = [auxDataName]  # typically a single string
     try:
         data_list = []
         file_ref = parent_data.file
@@ -259,16 +298,11 @@ def findDataset(h5_group, ds_name):
     Uses visit() to find all datasets with the desired name
     """
     # print 'Finding all instances of', ds_name
-    ds = []
-
-    def __find_name(name, obj):
-        if ds_name in name.split('/')[-1] and isinstance(obj, h5py.Dataset):
-            ds.append([name, obj])
-        return
+    index = _get_linked_index(h5_group)
+    h5_file = h5_group.file
 
-    h5_group.visititems(__find_name)
-
-    return ds
+    return [[name, h5_file[path]] for path, name in _get_group_paths(index['datasets'], h5_group)
+            if ds_name in name.split('/')[-1]]
 
 
 def findH5group(h5_main, tool_name):
@@ -552,7 +586,7 @@ def get_formatted_labels(h5_dset):
         warn('labels attribute was missing')
         return None
 
-def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False):
+def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False, lazy=False):
     """
     Reshape the input 2D matrix to be N-dimensions based on the
     position and spectroscopic datasets.
@@ -567,10 +601,12 @@ def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False):
         Spectroscopic indices corresponding to columns in `h5_main`
     get_labels : bool
         Should the labels be returned.  Default False
+    lazy : bool
+        Should an NdimsView be returned instead of reading the dataset into memory.  Default False
 
     Returns
     -------
-    ds_Nd : N-D numpy array
+    ds_Nd : N-D numpy array or NdimsView
         N dimensional numpy array arranged as [positions slowest to fastest, spectroscopic slowest to fastest]
     success : boolean or string
         True if full reshape was successful
@@ -597,7 +633,7 @@ def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False):
         if isinstance(h5_main, h5py.Dataset):
             try:
                 h5_pos = h5_main.file[h5_main.attrs['Position_Indices']]
-                ds_pos = h5_pos[()]
+                ds_pos = h5_pos
             except KeyError:
                 print('No position datasets found as attributes of {}'.format(h5_main.name))
                 if len(h5_main.shape) > 1:
@@ -612,7 +648,7 @@ def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False):
         """
     Position Indices dataset was provided
         """
-        ds_pos = h5_pos[()]
+        ds_pos = h5_pos
     elif isinstance(h5_pos, np.ndarray):
         ds_pos = h5_pos
     else:
@@ -627,7 +663,7 @@ def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False):
         if isinstance(h5_main, h5py.Dataset):
             try:
                 h5_spec = h5_main.file[h5_main.attrs['Spectroscopic_Indices']]
-                ds_spec = h5_spec[()]
+                ds_spec = h5_spec
             except KeyError:
                 print('No spectroscopic datasets found as attributes of {}'.format(h5_main.name))
                 if len(h5_main.shape) > 1:
@@ -643,7 +679,7 @@ def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False):
         """
     Spectroscopic Indices dataset was provided
         """
-        ds_spec = h5_spec[()]
+        ds_spec = h5_spec
 
     elif isinstance(h5_spec, np.ndarray):
         ds_spec = h5_spec
@@ -651,46 +687,50 @@ def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False):
         raise TypeError('Spectroscopic Indices must be either h5py.Dataset or None')
 
     '''
-    Sort the indices from fastest to slowest
+    Sort the indices from fastest to slowest and get the size of each dimension in the sorted order.
+    Index datasets are only read if their layout has not been cached already
     '''
-    pos_sort = get_sort_order(np.transpose(ds_pos))
-    spec_sort = get_sort_order(ds_spec)
-
-    '''
-    Get the size of each dimension in the sorted order
-    '''
-    pos_dims = get_dimensionality(np.transpose(ds_pos), pos_sort)
-    spec_dims = get_dimensionality(ds_spec, spec_sort)
-
-    ds_main = h5_main[()]
+    pos_sort, pos_dims = _get_index_layout(ds_pos, transpose=True)
+    spec_sort, spec_dims = _get_index_layout(ds_spec)
 
     """
-    Now we reshape the dataset based on those dimensions
-    We must use the spectroscopic dimensions in reverse order
+    The spectroscopic dimensions are reshaped in reverse order. The resulting axes are then transposed so that
+    they are in the same order as in the index array
     """
-    try:
-        ds_Nd = np.reshape(ds_main, pos_dims + spec_dims[::-1])
-    except ValueError:
-        warn('Could not reshape dataset to full N-dimensional form.  Attempting reshape based on position only.')
+    swap_axes = np.append(np.argsort(pos_sort),
+                          spec_sort.size - spec_sort - 1 + len(pos_dims))
+
+    if lazy:
+        if len(h5_main.shape) == 2 and np.prod(pos_dims) == h5_main.shape[0] and \
+                np.prod(spec_dims) == h5_main.shape[1]:
+            ds_Nd2 = NdimsView(h5_main, pos_dims + spec_dims[::-1], len(pos_dims), swap_axes)
+        else:
+            warn('Dimensions of the indices do not match the shape of {}. Reading it into memory '
+                 'instead.'.format(getattr(h5_main, 'name', 'the dataset')))
+            lazy = False
+
+    if not lazy:
+        ds_main = h5_main[()]
+
+        """
+        Now we reshape the dataset based on those dimensions
+        """
         try:
-            ds_Nd = np.reshape(ds_main, pos_dims[-1])
-            return ds_Nd, 'Positions'
+            ds_Nd = np.reshape(ds_main, pos_dims + spec_dims[::-1])
         except ValueError:
-            warn('Reshape by position only also failed.  Will keep dataset in 2d form.')
-            return ds_main, False
+            warn('Could not reshape dataset to full N-dimensional form.  Attempting reshape based on position only.')
+            try:
+                ds_Nd = np.reshape(ds_main, pos_dims[-1])
+                return ds_Nd, 'Positions'
+            except ValueError:
+                warn('Reshape by position only also failed.  Will keep dataset in 2d form.')
+                return ds_main, False
+            except:
+                raise
         except:
             raise
-    except:
-        raise
-
-    """
-    Now we transpose the axes associated with the spectroscopic dimensions
-    so that they are in the same order as in the index array
-    """
-    swap_axes = np.append(np.argsort(pos_sort),
-                          spec_sort.size - spec_sort - 1 + len(pos_dims))
 
-    ds_Nd2 = np.transpose(ds_Nd, swap_axes)
+        ds_Nd2 = np.transpose(ds_Nd, swap_axes)
 
     if get_labels:
         '''
@@ -713,6 +753,159 @@ def reshape_to_Ndims(h5_main, h5_pos=None, h5_spec=None, get_labels=False):
 
     return results
 
+class NdimsView(object):
+    """
+    Lazy N dimensional view of a 2D Main dataset as produced by reshape_to_Ndims.
+
+    Slicing the view reads only the rows (positions) and columns (spectroscopic steps) of the 2D dataset that
+    are needed, as strided hyperslabs where possible. Slices of datasets much larger than the available memory
+    can therefore be extracted.  Integers, slices, Ellipsis and 1D integer or boolean arrays are supported
+    along each dimension.  Arrays given for several dimensions select independently along each of them.
+    """
+
+    def __init__(self, h5_main, full_shape, num_pos_dims, axes):
+        """
+        Parameters
+        ----------
+        h5_main : HDF5 Dataset or 2D array
+            2D data arranged as [position, spectroscopic]
+        full_shape : list of unsigned ints
+            Shape that the 2D data takes when reshaped in C order.  The first `num_pos_dims` dimensions split
+            the rows and the rest split the columns
+        num_pos_dims : unsigned int
+            Number of position dimensions
+        axes : list of unsigned ints
+            Order in which the dimensions of `full_shape` are presented by this view
+        """
+        self.h5_main = h5_main
+        self._full_shape = tuple(int(dim) for dim in full_shape)
+        self._num_pos_dims = int(num_pos_dims)
+        self._axes = tuple(int(axis) for axis in axes)
+
+    @property
+    def shape(self):
+        return tuple(self._full_shape[axis] for axis in self._axes)
+
+    @property
+    def ndim(self):
+        return len(self._axes)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def dtype(self):
+        return self.h5_main.dtype
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return '<NdimsView of {} with shape {}>'.format(getattr(self.h5_main, 'name', 'array'), self.shape)
+
+    def __array__(self, dtype=None, copy=None):
+        data = self[...]
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+    def transpose(self, *axes):
+        """
+        Returns a view with the dimensions permuted without reading any data
+
+        Parameters
+        ----------
+        axes : unsigned ints or tuple of unsigned ints, optional
+            New order of the current dimensions.  The dimensions are reversed if not provided
+
+        Returns
+        -------
+        view : NdimsView
+        """
+        if len(axes) == 1 and not np.isscalar(axes[0]):
+            axes = axes[0]
+        if axes is None or len(axes) == 0:
+            axes = range(self.ndim)[::-1]
+        axes = [int(axis) for axis in axes]
+        if sorted(axes) != list(range(self.ndim)):
+            raise ValueError('axes do not match the {} dimensions of the view'.format(self.ndim))
+        return NdimsView(self.h5_main, self._full_shape, self._num_pos_dims, [self._axes[axis] for axis in axes])
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        ellipses = [ind for ind, item in enumerate(key) if item is Ellipsis]
+        if len(ellipses) > 1:
+            raise IndexError('an index can only have a single ellipsis')
+        if len(ellipses) == 1:
+            ind = ellipses[0]
+            key = key[:ind] + (slice(None),) * (self.ndim - len(key) + 1) + key[ind + 1:]
+        if len(key) > self.ndim:
+            raise IndexError('too many indices for a view with {} dimensions'.format(self.ndim))
+        key = key + (slice(None),) * (self.ndim - len(key))
+
+        """
+        Translate the key into indices along each dimension of the C ordered reshape
+        """
+        full_inds = [None for _ in self._full_shape]
+        dropped = list()
+        for view_axis, item in enumerate(key):
+            full_axis = self._axes[view_axis]
+            inds = np.arange(self._full_shape[full_axis])[item]
+            if np.ndim(inds) == 0:
+                dropped.append(view_axis)
+            elif np.ndim(inds) > 1:
+                raise IndexError('only integers, slices and 1D arrays are valid indices')
+            full_inds[full_axis] = np.atleast_1d(inds)
+
+        rows = _ravel_grid(full_inds[:self._num_pos_dims], self._full_shape[:self._num_pos_dims])
+        cols = _ravel_grid(full_inds[self._num_pos_dims:], self._full_shape[self._num_pos_dims:])
+
+        data = _read_rows_cols(self.h5_main, rows, cols)
+        data = np.transpose(data.reshape([len(inds) for inds in full_inds]), self._axes)
+
+        return data.reshape([dim for axis, dim in enumerate(data.shape) if axis not in dropped])
+
+
+def _ravel_grid(inds_list, dims):
+    """
+    Flat C ordered indices of every combination of the provided indices along each dimension
+    """
+    grid = np.meshgrid(*inds_list, indexing='ij')
+    return np.ravel_multi_index([np.ravel(mat) for mat in grid], dims)
+
+
+def _hyperslab(inds):
+    """
+    Smallest selection covering the given indices: a (strided) slice if possible, else the sorted unique indices.
+    Also returns the position of each index within the selection
+    """
+    uniq = np.unique(inds)
+    if uniq.size == 0:
+        return slice(0, 0), np.zeros(0, dtype=np.intp)
+    if uniq.size == 1:
+        return slice(int(uniq[0]), int(uniq[0]) + 1), np.zeros(len(inds), dtype=np.intp)
+    steps = np.diff(uniq)
+    if np.all(steps == steps[0]):
+        return slice(int(uniq[0]), int(uniq[-1]) + 1, int(steps[0])), (inds - uniq[0]) // steps[0]
+    return uniq, np.searchsorted(uniq, inds)
+
+
+def _read_rows_cols(h5_main, rows, cols):
+    """
+    Reads the given rows and columns, in the given order, of a 2D dataset.  HDF5 only allows one axis to be
+    selected with a list, so the columns are read as a bounding slice if neither axis forms a strided slice
+    """
+    row_sel, row_pos = _hyperslab(rows)
+    col_sel, col_pos = _hyperslab(cols)
+    if not isinstance(row_sel, slice) and not isinstance(col_sel, slice):
+        col_sel = slice(int(col_sel[0]), int(col_sel[-1]) + 1)
+        col_pos = cols - col_sel.start
+    block = h5_main[row_sel, col_sel]
+    return block[np.ix_(row_pos, col_pos)]
+
+
 def reshape_from_Ndims(ds_Nd, h5_pos=None, h5_spec=None):
     """
     Reshape the input 2D matrix to be N-dimensions based on the
@@ -827,10 +1020,15 @@ def get_dimensionality(ds_index, index_sort=None):
     sorted_dims : list of unsigned integers
         Dimensionality of each row in ds_index.  If index_sort is supplied, it will be in the sorted order
     """
+    if isinstance(ds_index, h5py.Dataset):
+        row_dims = _get_cached_layout(ds_index)[1]
+    else:
+        row_dims = _count_unique_per_row(np.array(ds_index, ndmin=2))
+
     if index_sort is None:
-        index_sort = np.arange(ds_index.shape[0])
+        index_sort = np.arange(len(row_dims))
 
-    sorted_dims = [len(np.unique(col)) for col in np.array(ds_index, ndmin=2)[index_sort]]
+    sorted_dims = [int(dim) for dim in np.array(row_dims)[index_sort]]
 
     return sorted_dims
 
@@ -850,13 +1048,317 @@ def get_sort_order(ds_spec):
     change_sort : List of unsigned integers
         Order of rows sorted from fastest changing to slowest
     """
-    change_count = [len(np.where([row[i] != row[i - 1] for i in range(len(row))])[0]) for row in ds_spec]
-    change_sort = np.argsort(change_count)[::-1]
+    if isinstance(ds_spec, h5py.Dataset):
+        return _get_cached_layout(ds_spec)[0].copy()
+
+    return _get_change_sort(np.array(ds_spec, ndmin=2))
+
+
+def _get_change_sort(ds_index):
+    """
+    Order of the rows of a 2D index matrix from fastest changing to slowest.  A row's rate of change is the
+    number of positions where it differs from the preceding value, with the first value compared to the last
+    """
+    change_count = np.count_nonzero(ds_index != np.roll(ds_index, 1, axis=1), axis=1)
+    return np.argsort(change_count)[::-1]
+
+
+def _count_unique_per_row(ds_index):
+    """
+    Number of unique values in each row of a 2D index matrix.  Integer indices spanning a range no longer than
+    the rows are counted in linear time with a single bincount over all rows
+    """
+    num_rows, num_cols = ds_index.shape
+    if num_cols == 0:
+        return np.zeros(num_rows, dtype=np.int64)
+
+    if np.issubdtype(ds_index.dtype, np.integer):
+        ds_index = ds_index.astype(np.int64, copy=False)
+        mins = np.min(ds_index, axis=1)
+        span = int(np.max(np.max(ds_index, axis=1) - mins)) + 1
+        if span <= num_cols:
+            offsets = ds_index - mins[:, np.newaxis] + (np.arange(num_rows, dtype=np.int64) * span)[:, np.newaxis]
+            counts = np.bincount(offsets.ravel(), minlength=num_rows * span)
+            return np.count_nonzero(counts.reshape(num_rows, span), axis=1)
+
+    sorted_index = np.sort(ds_index, axis=1)
+    return 1 + np.count_nonzero(sorted_index[:, 1:] != sorted_index[:, :-1], axis=1)
+
+
+"""
+Metadata index of each file, keyed on the name of the file
+"""
+_metadata_cache = dict()
+_max_cached_files = 16
+
+
+def get_metadata_index(h5_obj):
+    """
+    Returns an index of the datasets, Main datasets and dataset references in the file containing the provided
+    object.  The index is built with a single walk of the file and is reused by getDataSet, findDataset,
+    getAuxData, checkIfMain and get_all_main until the file changes.
+
+    The index is discarded whenever objects are added to or removed from the file (detected through the size and
+    free space of the file) and whenever pycroscopy writes references.  Lookups by name also compare the links in
+    the file with those in the index, and lookups of references check that the paths they return still lead to the
+    same objects, so that moved, renamed and deleted objects are detected.  References written directly through
+    h5py to datasets that already carry the same number of attributes cannot be detected. Call
+    `clear_metadata_cache` after doing so.
+
+    Parameters
+    ----------
+    h5_obj : h5py.File, h5py.Group or h5py.Dataset
+        Any object in the file of interest
+
+    Returns
+    -------
+    index : dict
+        'datasets' - list of the paths of all datasets in the order in which they are visited
+        'main' - list of the paths of all Main datasets
+        'two_d' - list of the paths of all 2D datasets
+        'refs' - dictionary of the (attribute name, path of the referenced dataset) pairs of each dataset
+        'num_attrs' - dictionary of the number of attributes of each dataset
+        'addrs' - dictionary of the address of the object at each path
+        'links' - paths and addresses of all objects in the file, see `_get_link_state`
+        'token' - state of the file when the index was built
+    """
+    h5_file = h5_obj.file
+    token = (h5_file.id.get_filesize(), h5_file.id.get_freespace())
+
+    index = _metadata_cache.get(h5_file.filename)
+    if index is not None and index['token'] == token:
+        return index
+
+    index = _build_metadata_index(h5_file)
+    index['token'] = token
+
+    if len(_metadata_cache) >= _max_cached_files:
+        _metadata_cache.clear()
+    _metadata_cache[h5_file.filename] = index
+
+    return index
+
+
+def clear_metadata_cache(h5_obj=None):
+    """
+    Discards the metadata index of the file containing the provided object, or of all files
+
+    Parameters
+    ----------
+    h5_obj : h5py.File, h5py.Group or h5py.Dataset, optional
+        Any object in the file whose index needs to be discarded. Default None - all indices are discarded
+    """
+    if h5_obj is None:
+        _metadata_cache.clear()
+    else:
+        _metadata_cache.pop(h5_obj.file.filename, None)
+
+
+def _build_metadata_index(h5_file):
+    """
+    Walks the file once to collect all datasets and the datasets referenced by their attributes.
+    Finding the path of a referenced object is expensive in HDF5 so the references are matched to the datasets
+    through their addresses instead
+    """
+    main_names = ['Position_Indices', 'Position_Values', 'Spectroscopic_Indices', 'Spectroscopic_Values']
+    index = {'datasets': list(), 'main': list(), 'two_d': list(), 'refs': dict(), 'num_attrs': dict(),
+             'addrs': dict(), 'links': _get_link_state(h5_file)}
+    addr_paths = dict()
+    ref_addrs = dict()
+
+    def __index(name, obj):
+        if not isinstance(obj, h5py.Dataset):
+            return
+        path = obj.name
+        obj_info = h5py.h5o.get_info(obj.id)
+        addr_paths.setdefault(obj_info.addr, path)
+
+        refs = list()
+        for att_name in obj.attrs.keys():
+            '''
+            Only attributes holding references are read
+            '''
+            if h5py.check_dtype(ref=obj.attrs.get_id(att_name).dtype) is None:
+                continue
+            ref = obj.attrs[att_name]
+            if not isinstance(ref, h5py.Reference) or not ref:
+                continue
+            try:
+                if h5py.h5r.get_obj_type(ref, h5_file.id) != h5py.h5o.TYPE_DATASET:
+                    continue
+                addr = h5py.h5o.get_info(h5py.h5r.dereference(ref, h5_file.id)).addr
+            except (KeyError, ValueError, RuntimeError):
+                # Reference to an object that no longer exists
+                continue
+            ref_addrs[addr] = ref
+            refs.append((att_name, addr))
+
+        index['datasets'].append(path)
+        index['refs'][path] = refs
+        index['num_attrs'][path] = obj_info.num_attrs
+        index['addrs'][path] = obj_info.addr
+        if len(obj.shape) == 2:
+            index['two_d'].append(path)
+
+    h5_file.visititems(__index)
+
+    '''
+    Replace the addresses by paths. Datasets outside the visited tree are looked up the slow way
+    '''
+    for addr, ref in ref_addrs.items():
+        if addr not in addr_paths:
+            target = h5py.h5r.get_name(ref, h5_file.id)
+            if isinstance(target, bytes):
+                target = target.decode('utf-8')
+            addr_paths[addr] = target
+            index['addrs'][target] = addr
+
+    two_d = set(index['two_d'])
+    for path in index['datasets']:
+        refs = [(att_name, addr_paths[addr]) for att_name, addr in index['refs'][path]]
+        index['refs'][path] = refs
+        if path in two_d and set(main_names).issubset([att_name for att_name, _ in refs]):
+            index['main'].append(path)
+
+    return index
+
+
+def _get_num_attrs(h5_file, path):
+    """
+    Number of attributes of an object, without opening it
+    """
+    return h5py.h5o.get_info(h5_file.id, path.encode('utf-8')).num_attrs
+
+
+def _get_link_state(h5_file):
+    """
+    Paths and addresses of all objects in the file.  Unlike the size of the file, these change when objects are
+    moved, renamed or deleted.  Collected without opening any object
+    """
+    links = list()
+
+    def __add(name, obj_info):
+        links.append((name, obj_info.addr))
+
+    h5py.h5o.visit(h5_file.id, __add, info=True)
+
+    return links
+
+
+def _get_linked_index(h5_obj):
+    """
+    Returns the metadata index of the file containing the object after making sure that no object has been moved,
+    renamed or deleted since the index was built
+    """
+    index = get_metadata_index(h5_obj)
+    if index['links'] != _get_link_state(h5_obj.file):
+        clear_metadata_cache(h5_obj)
+        index = get_metadata_index(h5_obj)
+
+    return index
+
+
+def _paths_are_current(h5_file, index, paths):
+    """
+    Whether or not the provided paths from the index still lead to the objects they led to when it was built
+    """
+    for path in paths:
+        try:
+            if h5py.h5o.get_info(h5_file.id, path.encode('utf-8')).addr != index['addrs'].get(path):
+                return False
+        except (KeyError, ValueError, RuntimeError):
+            return False
+
+    return True
+
+
+def _get_current_index(h5_dset):
+    """
+    Returns the metadata index of the file of the dataset after making sure that the dataset has not been moved and
+    its attributes have not changed since the index was built, or None if the dataset cannot be found in the index
+    """
+    if not isinstance(h5_dset, h5py.Dataset) or h5_dset.name is None:
+        return None
+
+    index = get_metadata_index(h5_dset)
+    obj_info = h5py.h5o.get_info(h5_dset.id)
+    if index['num_attrs'].get(h5_dset.name) != obj_info.num_attrs or \
+            index['addrs'].get(h5_dset.name) != obj_info.addr:
+        clear_metadata_cache(h5_dset)
+        index = get_metadata_index(h5_dset)
+        if index['num_attrs'].get(h5_dset.name) != obj_info.num_attrs:
+            return None
+
+    return index
+
+
+def _get_group_paths(paths, h5_group):
+    """
+    Paths in the index that lie within the provided group, along with their paths relative to the group
+    """
+    prefix = h5_group.name.rstrip('/') + '/'
+    return [(path, path[len(prefix):]) for path in paths if path.startswith(prefix)]
+
+
+_index_layout_cache = dict()
+_max_cached_layouts = 64
+
+
+def _get_cached_layout(h5_index, transpose=False):
+    """
+    Sort order and per-row dimensionality of an index dataset, cached so that the same indices are only analyzed
+    once.  The cache is keyed on the contents of the (small) index dataset so that it remains valid when the
+    dataset is rewritten in place
+
+    Parameters
+    ----------
+    h5_index : HDF5 Dataset
+        Index dataset
+    transpose : bool, optional
+        Whether the dimensions are arranged along the columns (as in Position_Indices) instead of the rows.
+        Default False
+
+    Returns
+    -------
+    change_sort : numpy array of unsigned ints
+        Order of the dimensions sorted from fastest changing to slowest
+    row_dims : numpy array of unsigned ints
+        Size of each dimension in the original order
+    """
+    ds_index = np.array(h5_index[()], ndmin=2)
+    key = (ds_index.shape, ds_index.dtype.str, bool(transpose), hashlib.sha1(ds_index.tobytes()).hexdigest())
+
+    if key in _index_layout_cache:
+        return _index_layout_cache[key]
+
+    if transpose:
+        ds_index = np.transpose(ds_index)
+    layout = (_get_change_sort(ds_index), _count_unique_per_row(ds_index))
+
+    if len(_index_layout_cache) >= _max_cached_layouts:
+        _index_layout_cache.clear()
+    _index_layout_cache[key] = layout
+
+    return layout
+
+
+def _get_index_layout(ds_index, transpose=False):
+    """
+    Sort order of the dimensions of an index matrix (HDF5 dataset or numpy array) and their sizes in that order
+    """
+    if isinstance(ds_index, h5py.Dataset):
+        change_sort, row_dims = _get_cached_layout(ds_index, transpose=transpose)
+    else:
+        ds_index = np.array(ds_index, ndmin=2)
+        if transpose:
+            ds_index = np.transpose(ds_index)
+        change_sort = _get_change_sort(ds_index)
+        row_dims = _count_unique_per_row(ds_index)
 
-    return change_sort
+    return change_sort.copy(), [int(dim) for dim in row_dims[change_sort]]
 
 
-def create_empty_dataset(source_dset, dtype, dset_name, new_attrs=dict(), skip_refs=False):
+def create_empty_dataset(source_dset, dtype, dset_name, new_attrs=dict(), skip_refs=False, access=None):
     """
     Creates an empty dataset in the h5 file based in the same group as the provided dataset
 
@@ -873,6 +1375,9 @@ def create_empty_dataset(source_dset, dtype, dset_name, new_attrs=dict(), skip_r
     skip_refs : boolean, optional
         Should ObjectReferences and RegionReferences be skipped when copying attributes from the
         `source_dset`
+    access : str, optional
+        Expected way in which the new dataset will be read.  See `calc_chunks`.  If provided, the chunks are
+        calculated for the new dataset instead of being copied from `source_dset`.  Default None
 
     Returns
     -------
@@ -880,6 +1385,12 @@ def create_empty_dataset(source_dset, dtype, dset_name, new_attrs=dict(), skip_r
         Newly created dataset
     """
     h5_group = source_dset.parent
+
+    chunks = source_dset.chunks
+    if access is not None:
+        chunks = calc_chunks(source_dset.shape, np.dtype(dtype).itemsize, access=access,
+                             compression=source_dset.compression)
+    cache_kwargs = get_chunk_cache_kwargs(chunks, source_dset.shape, np.dtype(dtype).itemsize, access=access)
     try:
         # Check if the dataset already exists
         h5_new_dset = h5_group[dset_name]
@@ -887,11 +1398,12 @@ def create_empty_dataset(source_dset, dtype, dset_name, new_attrs=dict(), skip_r
         if any((source_dset.shape != h5_new_dset.shape, source_dset.dtype != h5_new_dset.dtype)):
             del h5_new_dset, h5_group[dset_name]
             h5_new_dset = h5_group.create_dataset(dset_name, shape=source_dset.shape, dtype=dtype,
-                                                  compression=source_dset.compression, chunks=source_dset.chunks)
+                                                  compression=source_dset.compression, chunks=chunks,
+                                                  **cache_kwargs)
 
     except KeyError:
         h5_new_dset = h5_group.create_dataset(dset_name, shape=source_dset.shape, dtype=dtype,
-                                              compression=source_dset.compression, chunks=source_dset.chunks)
+                                              compression=source_dset.compression, chunks=chunks, **cache_kwargs)
 
     except:
         raise
@@ -944,6 +1456,7 @@ def copyAttributes(source, dest, skip_refs=True):
             copyRegionRefs(source, dest)
         except:
             print('Could not create new region reference for {} in {}.'.format(attr, source.name))
+    clear_metadata_cache(dest)
 
     return dest
 
@@ -978,6 +1491,11 @@ def checkIfMain(h5_main, verbose=False):
             print('{} is not an HDF5 Dataset object.'.format(h5_main))
         return success
 
+    if not verbose:
+        index = _get_current_index(h5_main)
+        if index is not None:
+            return h5_main.name in index['main']
+
     h5_name = h5_main.name.split('/')[-1]
 
     # Check dimensionality
@@ -1022,6 +1540,7 @@ def linkRefs(src, trg):
     """
     for itm in trg:
         src.attrs[itm.name.split('/')[-1]] = itm.ref
+    clear_metadata_cache(src)
 
 
 def linkRefAsAlias(src, trg, trg_name):
@@ -1040,6 +1559,7 @@ def linkRefAsAlias(src, trg, trg_name):
         Alias / alternate name for trg
     """
     src.attrs[trg_name] = trg.ref
+    clear_metadata_cache(src)
 
 
 def copyRegionRefs(h5_source, h5_target):
@@ -1097,6 +1617,7 @@ def copyRegionRefs(h5_source, h5_target):
         h5_spec_inds.attrs[key] = spec_inds_ref
         spec_vals_ref = createRefFromIndices(h5_spec_vals, ref_inds)
         h5_spec_vals.attrs[key] = spec_vals_ref
+    clear_metadata_cache(h5_target)
 
 
 def reducingRefCopy(h5_source, h5_target, h5_source_inds, h5_target_inds, key):
@@ -1260,7 +1781,7 @@ def buildReducedSpec(h5_spec_inds, h5_spec_vals, keep_dim, step_starts, basename
     return ds_inds, ds_vals
 
 
-def calc_chunks(dimensions, data_size, unit_chunks=None, max_chunk_mem=10240):
+def calc_chunks(dimensions, data_size, unit_chunks=None, max_chunk_mem=None, access=None, compression=None):
     """
     Calculate the chunk size for the HDF5 dataset based on the dimensions and the
     maximum chunk size in memory
@@ -1276,7 +1797,18 @@ def calc_chunks(dimensions, data_size, unit_chunks=None, max_chunk_mem=10240):
         the shape of `ds_main`.  Default None, `unit_chunks` is set to 1 in all
         dimensions
     max_chunk_mem : int, optional
-        Maximum size of the chunk in memory in bytes.  Default 10240b or 10kb
+        Maximum size of the chunk in memory in bytes.  Default None, the size is picked
+        based on the size of the dataset and the compression.  See `calc_chunk_mem`
+    access : str, optional
+        Expected way in which the dataset will be read.  Default None, which is the same as 'both'.
+        'pixel' - entire rows (eg- all spectroscopic steps of a pixel for fitting) are read at once so the
+        chunks are grown along the last dimension first.
+        'spectral' - entire columns (eg - one spectroscopic step of all pixels for visualization) are read at
+        once so the chunks are grown along the first dimension first.
+        'both' - the chunks are grown in proportion to the dimensions
+    compression : str, optional
+        Compression that will be applied to the dataset.  Compressed chunks are kept smaller since every
+        chunk that is touched needs to be decompressed in its entirety.  Default None
 
     Returns
     -------
@@ -1300,41 +1832,196 @@ def calc_chunks(dimensions, data_size, unit_chunks=None, max_chunk_mem=10240):
     if unit_chunks.shape != dimensions.shape:
         raise ValueError('Unit chunk size must have the same shape as the input dataset.')
 
+    if max_chunk_mem is None:
+        max_chunk_mem = calc_chunk_mem(dimensions, data_size, compression=compression)
+
     '''
-    Save the original size of unit_chunks to use for incrementing the chunk size during
-     loop
+    Save the original size of unit_chunks.  Chunks are always whole multiples of these
     '''
-    base_chunks = unit_chunks
+    base_chunks = unit_chunks.copy()
 
     '''
-    Loop until chunk_size is greater than the maximum chunk_mem or the chunk_size is equal to
-    that of dimensions
+    Grow the chunks along the dimension that is read in its entirety first
     '''
-    while np.prod(unit_chunks)*data_size <= max_chunk_mem:
-        '''
-        Check if all chunk dimensions are greater or equal to the
-        actual dimensions.  Exit the loop if true.
-        '''
-        if np.all(unit_chunks >= dimensions):
-            break
+    if access in ['pixel', 'spectral'] and dimensions.size > 1:
+        iaxis = dimensions.size - 1 if access == 'pixel' else 0
+        other_mem = np.prod(np.delete(unit_chunks, iaxis)) * data_size
+        num_units = max(1, int(max_chunk_mem // (other_mem * base_chunks[iaxis])))
+        max_units = int(np.ceil(dimensions[iaxis] / base_chunks[iaxis]))
+        unit_chunks[iaxis] = base_chunks[iaxis] * min(num_units, max_units)
+    elif access not in [None, 'both', 'pixel', 'spectral']:
+        raise ValueError("access must be one of None, 'both', 'pixel' or 'spectral'")
 
-        '''
-        Find the index of the next chunk to be increased and increment it by the base_chunk
-        size
-        '''
-        ichunk = np.argmax(dimensions/unit_chunks)
-        unit_chunks[ichunk] += base_chunks[ichunk]
+    '''
+    Loop until the chunk cannot grow without exceeding the maximum chunk_mem or the chunk_size is equal to
+    that of dimensions.  The dimension with the most chunks is doubled first.
+    '''
+    while not np.all(unit_chunks >= dimensions):
+        grown = False
+        for ichunk in np.argsort(unit_chunks / dimensions.astype(np.float64), kind='mergesort'):
+            if unit_chunks[ichunk] >= dimensions[ichunk]:
+                continue
+            new_chunks = unit_chunks.copy()
+            max_units = int(np.ceil(dimensions[ichunk] / base_chunks[ichunk]))
+            new_chunks[ichunk] = base_chunks[ichunk] * min(max_units, 2 * (unit_chunks[ichunk] // base_chunks[ichunk]))
+            if np.prod(new_chunks) * data_size <= max_chunk_mem:
+                unit_chunks = new_chunks
+                grown = True
+                break
+        if not grown:
+            break
 
     '''
     Ensure that the size of the chunks is between one and the dimension size.
     '''
     unit_chunks = np.clip(unit_chunks, np.ones_like(unit_chunks), dimensions)
 
-    chunking = tuple(unit_chunks)
+    chunking = tuple(int(chunk) for chunk in unit_chunks)
 
     return chunking
 
 
+def calc_chunk_mem(dimensions, data_size, compression=None, max_chunks=4096):
+    """
+    Picks a target size for each chunk of a dataset.  Small chunks make for enormous B-trees and many small
+    reads on large datasets while large chunks waste reads (and decompression) on small selections.
+    The target is chosen such that the dataset is split into no more than `max_chunks` chunks, while staying
+    between 64 kB and 1 MB (256 kB for compressed datasets) so that the chunks fit in the default chunk cache
+
+    Parameters
+    ----------
+    dimensions : array_like of int
+        Shape of the dataset
+    data_size : int
+        Size of an entry in the data in bytes
+    compression : str, optional
+        Compression that will be applied to the dataset.  Default None
+    max_chunks : unsigned int, optional
+        Preferred maximum number of chunks in the dataset.  Default 4096
+
+    Returns
+    -------
+    chunk_mem : int
+        Target size of a chunk in bytes
+    """
+    min_mem = 64 * 1024
+    max_mem = 1024 ** 2
+    if compression is not None:
+        max_mem = 256 * 1024
+
+    tot_mem = np.prod(np.asarray(dimensions, dtype=np.float64)) * data_size
+
+    return int(np.clip(tot_mem / max_chunks, min_mem, max_mem))
+
+
+def calc_chunk_cache(chunks, dimensions, data_size, access=None):
+    """
+    Size of the chunk cache (rdcc_nbytes) needed to read an entire row ('pixel' access), an entire column
+    ('spectral' access) or either ('both' / None) of a dataset without evicting chunks that will be needed again.
+    See `get_chunk_cache_kwargs` to give a dataset this cache when it is created or opened
+
+    Parameters
+    ----------
+    chunks : tuple of int
+        Chunking of the dataset
+    dimensions : array_like of int
+        Shape of the dataset
+    data_size : int
+        Size of an entry in the data in bytes
+    access : str, optional
+        Expected way in which the dataset will be read.  See `calc_chunks`.  Default None
+
+    Returns
+    -------
+    cache_mem : int
+        Size of the chunk cache in bytes.  Never smaller than the HDF5 default of 1 MB
+    """
+    chunks = np.asarray(chunks, dtype=np.float64)
+    dimensions = np.asarray(dimensions, dtype=np.float64)
+    chunk_mem = np.prod(chunks) * data_size
+
+    chunks_per_row = np.prod(np.ceil(dimensions[1:] / chunks[1:]))
+    chunks_per_col = np.ceil(dimensions[0] / chunks[0])
+
+    if access == 'pixel':
+        num_chunks = chunks_per_row
+    elif access == 'spectral':
+        num_chunks = chunks_per_col
+    else:
+        num_chunks = max(chunks_per_row, chunks_per_col)
+
+    return int(max(1024 ** 2, num_chunks * chunk_mem))
+
+
+def get_chunk_cache_kwargs(chunks, dimensions, data_size, access=None):
+    """
+    Chunk cache settings of a dataset as keyword arguments of h5py's create_dataset.  The cache is sized by
+    `calc_chunk_cache` and gets about 100 hash table slots per chunk that fits in it, as recommended by HDF5.
+    No settings are returned if the default chunk cache of the HDF5 library is already large enough
+
+    Parameters
+    ----------
+    chunks : tuple of int or None
+        Chunking of the dataset
+    dimensions : array_like of int
+        Shape of the dataset
+    data_size : int
+        Size of an entry in the data in bytes
+    access : str, optional
+        Expected way in which the dataset will be read.  See `calc_chunks`.  Default None
+
+    Returns
+    -------
+    cache_kwargs : dict
+        rdcc_nbytes and rdcc_nslots of the dataset. Empty for contiguous datasets, which have no chunk cache
+    """
+    if chunks is None or len(chunks) != len(dimensions) or 0 in dimensions:
+        return dict()
+
+    cache_mem = calc_chunk_cache(chunks, dimensions, data_size, access=access)
+    default_mem = h5py.h5p.create(h5py.h5p.FILE_ACCESS).get_cache()[2]
+    if cache_mem <= default_mem:
+        return dict()
+    num_chunks = max(1, cache_mem // int(np.prod(chunks) * data_size))
+    # Odd number of slots, never fewer than the HDF5 default
+    num_slots = max(521, 100 * num_chunks) | 1
+
+    return {'rdcc_nbytes': cache_mem, 'rdcc_nslots': int(num_slots)}
+
+
+def open_with_chunk_cache(h5_group, dset_name, access=None):
+    """
+    Opens a dataset with a chunk cache large enough to read an entire row, column or either of it.
+    HDF5 shares the cache among all open handles of a dataset, so the cache only takes effect if no other handle of
+    the dataset is open. Typically used right after opening a file
+
+    Parameters
+    ----------
+    h5_group : h5py.Group or h5py.File
+        Group containing the dataset
+    dset_name : str
+        Name or path of the dataset relative to `h5_group`
+    access : str, optional
+        Expected way in which the dataset will be read.  See `calc_chunks`.  Default None
+
+    Returns
+    -------
+    h5_dset : h5py.Dataset
+        The dataset, opened with the chunk cache if it is chunked
+    """
+    h5_dset = h5_group[dset_name]
+    cache_kwargs = get_chunk_cache_kwargs(h5_dset.chunks, h5_dset.shape, h5_dset.dtype.itemsize, access=access)
+    if len(cache_kwargs) == 0:
+        return h5_dset
+    dset_path = h5_dset.name
+    # Release the handle used to look up the layout so that the cache below applies
+    del h5_dset
+
+    dapl = h5py.h5p.create(h5py.h5p.DATASET_ACCESS)
+    dapl.set_chunk_cache(cache_kwargs['rdcc_nslots'], cache_kwargs['rdcc_nbytes'], 0.75)
+    return h5py.Dataset(h5py.h5d.open(h5_group.file.id, dset_path.encode('utf-8'), dapl=dapl))
+
+
 def link_as_main(h5_main, h5_pos_inds, h5_pos_vals, h5_spec_inds, h5_spec_vals, anc_dsets=[]):
     """
     Links the object references to the four position and spectrosocpic datasets as
@@ -7,16 +7,20 @@ Main Class in charge of writing/reading to/from hdf5 file.
 
 # cannot import unicode_literals since it is not compatible with h5py just yet
 from __future__ import division, print_function, absolute_import, unicode_literals
+import itertools
 import os
-import subprocess
 import sys
+import zlib
 from collections import Iterable
-from time import time, sleep
+from multiprocessing import Pool
+from time import time
 from warnings import warn
 
 import h5py
 import numpy as np
 
+from .hdf_utils import calc_chunks, clear_metadata_cache, get_chunk_cache_kwargs
+from .io_utils import getAvailableMem, recommendCores
 from .microdata import MicroDataGroup
 from ..__version__ import version
 
@@ -26,6 +30,13 @@ if sys.version_info.major == 3:
 
 class ioHDF5(object):
 
+    # Keyword arguments to h5py's create_dataset for each of the compression policies that repack can apply
+    filter_policies = {'none': {'compression': None, 'shuffle': False},
+                       'lzf': {'compression': 'lzf', 'shuffle': False},
+                       'shuffle+lzf': {'compression': 'lzf', 'shuffle': True},
+                       'gzip': {'compression': 'gzip', 'compression_opts': 4, 'shuffle': False},
+                       'shuffle+gzip': {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True}}
+
     def __init__(self, file_handle, cachemult=1):
         """
         Handles:
@@ -37,7 +48,8 @@ class ioHDF5(object):
         file_handle : Object - String or Unicode or open hdf5 file
             Absolute path to the h5 file or an open hdf5 file
         cachemult : unsigned int (Optional. default = 1)
-            Cache multiplier
+            Cache multiplier.  Scales the chunk cache of each dataset (1 MB by default in HDF5) when the file is
+            opened from a path
         """
         if type(file_handle) in [str, unicode]:
             # file handle is actually a file path
@@ -55,10 +67,13 @@ class ioHDF5(object):
             #     self.file = h5py.File(fid, mode = 'w')
             # except:
             #     raise
+            file_kwargs = dict()
+            if cachemult != 1:
+                file_kwargs['rdcc_nbytes'] = int(cachemult * 1024 ** 2)
             try:
-                self.file = h5py.File(file_handle, 'r+')
+                self.file = h5py.File(file_handle, 'r+', **file_kwargs)
             except IOError:
-                self.file = h5py.File(file_handle, 'w')
+                self.file = h5py.File(file_handle, 'w', **file_kwargs)
             except:
                 raise
             
@@ -76,40 +91,70 @@ class ioHDF5(object):
         Clear h5.file of all contents
 
         file.clear() only removes the contents, it does not free up previously allocated space.
-        To do so, it's necessary to use the h5repack command after clearing.
+        To do so, the file is repacked after clearing.
         Because the file must be closed and reopened, it is best to call this
         function immediately after the creation of the ioHDF5 object.
         """
         self.file.clear()
         self.repack()
 
-    def repack(self):
+    def repack(self, compression=None, rechunk=False, max_mem=None, cores=None, print_log=False):
         """
-        Uses the h5repack command to recover cleared space in an hdf5 file.
-        h5repack can also be used to change chunking and compression, but these options have
-        not yet been implemented here.
+        Copies every object in the file into a new file to recover space that was freed by deleting or clearing
+        objects.  The datasets can also be recompressed and rechunked along the way.  Object and region
+        references stored in attributes are re-pointed to the copies so that links between datasets are preserved.
+
+        The file is copied in-process with h5py.  Datasets are read and written in large blocks and, when gzip is
+        requested, their chunks are compressed in parallel by `cores` processes.
+
+        Parameters
+        ----------
+        compression : str, optional
+            Compression policy for the datasets. Default None - the datasets keep their current filters.
+            'none' removes all compression, including the (lossy) scale-offset filter, which the other policies
+            keep. Fletcher32 checksums are always kept.  'lzf' and 'shuffle+lzf' are much faster to read and write than
+            'gzip' and 'shuffle+gzip' at the cost of a lower compression ratio. See `filter_policies`
+        rechunk : bool, optional
+            Whether or not to recalculate the chunking of the chunked datasets using hdf_utils.calc_chunks.
+            Default False - the current chunking is kept
+        max_mem : unsigned int, optional
+            Maximum memory in bytes used to copy each block of a dataset.  Default None - a quarter of the
+            available memory, upto 1 GB
+        cores : unsigned int, optional
+            Number of processes used to compress chunks with gzip.  Default None - picked by io_utils.recommendCores
+        print_log : bool, optional
+            Whether or not to print the status of the copy. Default False
         """
-        self.close()
-        tmpfile = self.path+'.tmp'
+        if compression is not None and compression not in self.filter_policies:
+            raise ValueError('compression must be None or one of {}'.format(list(self.filter_policies.keys())))
+
+        if max_mem is None:
+            max_mem = min(1024 ** 3, getAvailableMem() // 4)
+
+        tmpfile = self.path + '.tmp'
+        self.file.flush()
+        # The repacked file is reopened with the chunk cache and library version bounds of the original
+        file_kwargs = _get_file_kwargs(self.file)
 
         '''
-        Repack the opened hdf5 file into a temporary file
+        Copy the opened hdf5 file into a temporary file
         '''
+        t_start = time()
         try:
-            repack_line = ' '.join(['h5repack', '"'+self.path+'"', '"'+tmpfile+'"'])
-            subprocess.check_output(repack_line,
-                                    stderr=subprocess.STDOUT,
-                                    shell=True)
-            # Check that the file is done being modified
-            sleep(0.5)
-            while time()-os.stat(tmpfile).st_mtime <= 1:
-                sleep(0.5)
-        except subprocess.CalledProcessError as err:
-            print('Could not repack hdf5 file')
-            raise Exception(err.output)
+            with h5py.File(tmpfile, 'w', libver=self.file.libver) as h5_new:
+                _repack_file(self.file, h5_new, compression, rechunk, max_mem, cores, print_log)
         except:
+            print('Could not repack hdf5 file')
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
             raise
 
+        if print_log:
+            print('Repacked {} in {} sec'.format(self.path, round(time() - t_start, 2)))
+
+        clear_metadata_cache(self.file)
+        self.close()
+
         '''
         Delete the original file and move the temporary file to the originals path
         '''
@@ -126,7 +171,7 @@ class ioHDF5(object):
         '''
         Open the repacked file
         '''
-        self.file = h5py.File(self.path, mode='r+')
+        self.file = h5py.File(self.path, mode='r+', **file_kwargs)
 
     def close(self):
         """
@@ -138,6 +183,7 @@ class ioHDF5(object):
         """
         Delete h5.file
         """
+        clear_metadata_cache(self.file)
         self.close()
         os.remove(self.path)
         self.file = h5py.File(self.path, 'w')
@@ -154,6 +200,12 @@ class ioHDF5(object):
         Writes data into the hdf5 file and assigns data attributes such as region references.
         The tree structure is inferred from the AFMData Object.
 
+        The whole tree is planned before anything is written: the paths of all groups and datasets (including the
+        indices of indexed groups) are resolved first and all objects are then created in a single pass. All the
+        attributes of each object, including the region references of datasets, are written in one batch and chunked
+        datasets are given a chunk cache suited to their chunks. If anything fails, the objects created by this call
+        are removed and the attributes it overwrote are restored before the error is raised.
+
         Parameters
         ----------
         data : Instance of MicroData
@@ -169,210 +221,146 @@ class ioHDF5(object):
 
         h5_file = self.file
 
-        h5_file.attrs['Pycroscopy version'] = version
-
         # Checking if the data is an MicroDataGroup object
         if not isinstance(data, MicroDataGroup):
             warn('Input of type: {} \n'.format(type(data)))
             sys.exit("Input not of type MicroDataGroup.\n We're done here! \n")
 
-        # Figuring out if the first item in AFMData tree is file or group
-        if data.name == '' and data.parent == '/':
-            # For file we just write the attributes
+        # Names of the existing and planned children of each group, used to index groups whose names end with '_'
+        child_names = dict()
+        # Names of the objects that were present in each group before this call
+        existing = dict()
+        # Objects created by this call, in order of creation, in case they need to be removed
+        created = list()
+        # Previous values of the attributes overwritten in objects that existed before this call
+        saved_attrs = list()
+        # HDF5 data types of the attributes, built once per numpy data type
+        htypes = dict()
+
+        def __existing(parent):
+            if parent not in existing:
+                existing[parent] = set(self.__existing_names(parent))
+            return existing[parent]
 
-            for key, val in data.attrs.items():
-                h5_file.attrs[key] = self.clean_string_att(val)
-            if print_log:
-                print('Wrote attributes of file {} \n'.format(h5_file.name))
-            root = h5_file.name
-        else:
-            # For a group we write it and its attributes
-            if data.indexed:
-                ''' If the name of the requested group ends in a '_', the user expects
-                the suffix index to be appended automatically. Here, we check to
-                ensure that the chosen index is new.
-                '''
-                previous = list()
-                for key in h5_file[data.parent].keys():
-                    if data.name in key:
-                        previous.append(key)
-                if len(previous) == 0:
-                    index = 0
-                else:
-                    # assuming that the last element of previous contains the highest index
-                    last = h5_file[data.parent][previous[-1]].name
-                    index = int(last.split('_')[-1])+1
-                data.name += '{:03d}'.format(index)
-            try:
-                g = h5_file[data.parent].create_group(data.name)
-                if print_log:
-                    print('Created group {}'.format(g.name))
-            except ValueError:
-                g = h5_file[data.parent][data.name]
+        try:
+            self.__write_attributes(h5_file, {'Pycroscopy version': version}, saved=saved_attrs, htypes=htypes)
+
+            # Figuring out if the first item in AFMData tree is file or group
+            if data.name == '' and data.parent == '/':
+                # For file we just write the attributes
+                self.__write_attributes(h5_file, data.attrs, saved=saved_attrs, htypes=htypes,
+                                        print_log=print_log)
                 if print_log:
-                    print('Group already exists: {}'.format(g.name))
-            except:
-                h5_file.flush()
-                h5_file.close()
-                raise
-            for key, val in data.attrs.items():
-                if val is None:
-                    continue
+                    print('Wrote attributes of file {} \n'.format(h5_file.name))
+                root = h5_file.name
+                g = h5_file
+            else:
+                # For a group we write it and its attributes
+                if data.indexed:
+                    ''' If the name of the requested group ends in a '_', the user expects
+                    the suffix index to be appended automatically. Here, we check to
+                    ensure that the chosen index is new.
+                    '''
+                    data.name += '{:03d}'.format(self.__next_index(data.name, data.parent, child_names))
+                g, is_new = self.__create_group(h5_file[data.parent], data.name, print_log=print_log)
+                if is_new:
+                    created.append(g.name)
+                    existing[g.name] = set()
+                self.__write_attributes(g, data.attrs, is_new=is_new, saved=saved_attrs, htypes=htypes,
+                                        print_log=print_log)
                 if print_log:
-                    print('Writing attribute: {} with value: {}'.format(key, val))
-                g.attrs[key] = self.clean_string_att(val)
-            if print_log:
-                print('Wrote attributes to group: {} \n'.format(data.name))
-            root = g.name
+                    print('Wrote attributes to group: {} \n'.format(data.name))
+                root = g.name
+
+            """
+            Plan the tree: resolve the path of every object in the order in which the recursive writer used to visit
+            them. Groups are listed twice: once to be created and once more after their children so that the
+            returned references keep their original order
+            """
+            plan = list()
+
+            def __plan(child, parent):
+                # Update the parent attribute with the true path
+                child.parent = parent
+
+                if isinstance(child, MicroDataGroup):
+                    if child.indexed:
+                        child.name += '{:03d}'.format(self.__next_index(child.name, parent, child_names))
+                    exists = child.name in __existing(parent)
+                    if parent not in child_names:
+                        child_names[parent] = list(__existing(parent))
+                    child_names[parent].append(child.name)
+                    if not exists:
+                        # Nothing needs to be looked up in groups that are yet to be created
+                        existing[parent + '/' + child.name] = set()
+                    plan.append(('group', child, parent, exists))
+                    for ch in child.children:
+                        __plan(ch, parent + '/' + child.name)
+                    plan.append(('ref', child, parent, exists))
+                else:
+                    plan.append(('dataset', child, parent, child.name in __existing(parent)))
 
-        # Populating the tree structure recursively
-        ref_list = []
-        # Recursive function
+            for child in data.children:
+                __plan(child, root)
 
-        def __populate(child, parent):
             """
-            Recursive function to build the tree from the top down.
+            Create all groups and datasets in one pass, writing all the attributes of each object (including the
+            region references of datasets) in a single batch. Group handles are kept so that paths are only
+            resolved once
+            """
+            groups = {root: g}
+            items = dict()
+            ref_list = []
 
-            Parameters
-            ----------
-            child
-            parent
+            for action, child, parent, exists in plan:
+                if parent not in groups:
+                    groups[parent] = h5_file[parent]
+                h5_parent = groups[parent]
 
-            Returns
-            -------
+                if action == 'ref':
+                    ref_list.append(items[id(child)])
+                    continue
 
-            """
-            # Update the parent attribute with the true path
-            child.parent = parent
-
-            if isinstance(child, MicroDataGroup):
-                if child.indexed:
-                    previous = np.where([child.name in key for key in h5_file[parent].keys()])[0]
-                    if len(previous) == 0:
-                        index = 0
-                    else:
-                        last = h5_file[parent].keys()[previous[-1]]
-                        index = int(last.split('_')[-1])+1
-                    child.name += '{:03d}'.format(index)
-                try:
-                    itm = h5_file[parent].create_group(child.name)
-                    if print_log:
-                        print('Created Group {}'.format(itm.name))
-                except ValueError:
-                    itm = h5_file[parent][child.name]
-                    print('Found Group already exists {}'.format(itm.name))
-                except:
-                    h5_file.flush()
-                    h5_file.close()
-                    raise
-                for key, val in child.attrs.items():
-                    if val is None:
-                        continue
+                if action == 'group':
+                    itm, is_new = self.__create_group(h5_parent, child.name, exists=exists, print_log=print_log)
+                    groups[itm.name] = itm
+                    items[id(child)] = itm
+                    if is_new:
+                        created.append(itm.name)
+                    self.__write_attributes(itm, child.attrs, is_new=is_new, saved=saved_attrs, htypes=htypes,
+                                            print_log=print_log)
                     if print_log:
-                        print('Writing attribute: {} with value: {}'.format(key, val))
-                    itm.attrs[key] = self.clean_string_att(val)
-                if print_log:
-                    print('Wrote attributes to group {}\n'.format(itm.name))
-                # here we do the recursive function call
-                for ch in child.children:
-                    __populate(ch, parent+'/'+child.name)
-            else:
-                if not child.resizable:
-                    if not bool(child.maxshape):
-                        # finite sized dataset and maxshape is not provided
-                        # Typically for small / ancilliary datasets
-                        try:
-                            itm = h5_file[parent].create_dataset(child.name,
-                                                                 data=child.data,
-                                                                 compression=child.compression,
-                                                                 dtype=child.data.dtype,
-                                                                 chunks=child.chunking)
-                        except RuntimeError:
-                            itm = h5_file[parent][child.name]
-                            warn('Found Dataset already exists {}'.format(itm.name))
-                        except:
-                            h5_file.flush()
-                            h5_file.close()
-                            raise
-                    else:
-                        # In many cases, we DON'T need resizable datasets but we know the max-size
-                        # Here, we only allocate the space. The provided data is ignored
-                        # print child.name
-                        try:
-                            itm = h5_file[parent].create_dataset(child.name, child.maxshape,
-                                                                 compression=child.compression,
-                                                                 dtype=child.dtype,
-                                                                 chunks=child.chunking)
-                        except RuntimeError:
-                            itm = h5_file[parent][child.name]
-                            warn('Found Dataset already exists {}'.format(itm.name))
-                        except:
-                            h5_file.flush()
-                            h5_file.close()
-                            raise
+                        print('Wrote attributes to group {}\n'.format(itm.name))
                 else:
-                    # Resizable but the written files are significantly larger
-                    max_shape = tuple([None for _ in range(len(child.data.shape))])
-                    try:
-                        itm = h5_file[parent].create_dataset(child.name,
-                                                             data=child.data,
-                                                             compression=child.compression,
-                                                             dtype=child.data.dtype,
-                                                             chunks=child.chunking,
-                                                             maxshape=max_shape)
-                    except RuntimeError:
-                        itm = h5_file[parent][child.name]
-                        warn('Found Dataset already exists {}'.format(itm.name))
-                    except:
-                        h5_file.flush()
-                        h5_file.close()
-                        raise
+                    itm, is_new = self.__create_dataset(h5_parent, child, exists=exists)
+                    if is_new:
+                        created.append(itm.name)
+                    if print_log:
+                        print('Created Dataset {}'.format(itm.name))
+                    attrs = dict(child.attrs)
+                    labels = attrs.pop('labels', None)
+                    if labels is not None:
+                        attrs.update(self.__get_label_attributes(itm, labels, print_log=print_log))
+                    self.__write_attributes(itm, attrs, is_new=is_new, saved=saved_attrs, htypes=htypes,
+                                            print_log=print_log)
+                    if print_log:
+                        print('Wrote Attributes of Dataset %s \n' % (itm.name.split('/')[-1]))
+                    ref_list.append(itm)
+        except:
+            # Remove everything this call created, newest first, and restore the attributes it overwrote so that
+            # the file is left as it was found
+            for obj_path in created[::-1]:
+                try:
+                    del h5_file[obj_path]
+                except KeyError:
+                    pass
+            _restore_attributes(saved_attrs)
+            clear_metadata_cache(h5_file)
+            h5_file.flush()
+            h5_file.close()
+            raise
 
-                if print_log:
-                    print('Created Dataset {}'.format(itm.name))
-                for key, val in child.attrs.items():
-                    # print('Found some region references')
-                    # writing region reference
-                    if key == 'labels':
-                        # print('Found some region references')
-                        labels = child.attrs[key]  # labels here is a dictionary
-                        self.write_region_references(itm, labels, print_log=print_log)
-                        '''
-                        Now make an attribute called 'labels' that is a list of strings 
-                        First ascertain the dimension of the slicing:
-                        '''
-                        found_dim = False
-                        for dimen, slobj in enumerate(list(labels.values())[0]):
-                            # We make the assumption that checking the start is sufficient
-                            if slobj.start is not None:
-                                found_dim = True
-                                break
-                        if found_dim:
-                            headers = [None]*len(labels)  # The list that will hold all the names
-                            for col_name in labels.keys():
-                                headers[labels[col_name][dimen].start] = col_name
-                            if print_log:
-                                print('Writing header attributes: {}'.format(key))
-                            # Now write the list of col / row names as an attribute:
-                            itm.attrs[key] = self.clean_string_att(headers)
-                        else:
-                            warn('Unable to write region labels for %s' % (itm.name.split('/')[-1]))
-
-                        if print_log:
-                            print('Wrote Region References of Dataset %s' % (itm.name.split('/')[-1]))
-                    else:
-                        if print_log:
-                            print('Writing attribute: {} with value: {}'.format(key, val))
-                        itm.attrs[key] = self.clean_string_att(child.attrs[key])
-                        if print_log:
-                            print('Wrote Attributes of Dataset %s \n' % (itm.name.split('/')[-1]))
-                        # Make a dictionary of references
-            ref_list.append(itm)
-            return ref_list
-
-        # Recursive function is called at each stage beginning at the root
-        for child in data.children:
-            __populate(child, root)
+        clear_metadata_cache(h5_file)
 
         if print_log:
             print('Finished writing to h5 file.\n' +
@@ -380,6 +368,145 @@ class ioHDF5(object):
                   'Make sure you do some reference linking to take advantage of the full power of HDF5.')
         return ref_list
 
+    def __existing_names(self, parent):
+        """
+        Names of the objects already present in the group at the given path
+        """
+        if parent in self.file:
+            return list(self.file[parent].keys())
+        return list()
+
+    def __next_index(self, name, parent, child_names):
+        """
+        Index to be appended to an indexed group name (ending with '_') such that it does not clash with
+        objects already present or planned in the parent group
+        """
+        if parent in child_names:
+            names = sorted(child_names[parent])
+        else:
+            names = sorted(self.__existing_names(parent))
+        previous = [key for key in names if name in key]
+        if len(previous) == 0:
+            return 0
+        # assuming that the last element of previous contains the highest index
+        return int(previous[-1].split('_')[-1]) + 1
+
+    @staticmethod
+    def __create_group(h5_parent, name, exists=None, print_log=False):
+        """
+        Creates the group or returns the existing one along with whether or not it was created. `exists` may be
+        provided when it is already known whether the group is present in the parent
+        """
+        if exists is None:
+            exists = name in h5_parent
+        if exists:
+            itm = h5_parent[name]
+            print('Found Group already exists {}'.format(itm.name))
+            return itm, False
+        itm = h5_parent.create_group(name)
+        if print_log:
+            print('Created Group {}'.format(itm.name))
+        return itm, True
+
+    @staticmethod
+    def __create_dataset(h5_parent, child, exists=None):
+        """
+        Creates the dataset described by the MicroDataset (or returns the existing one) along with whether or not it
+        was created. `exists` may be provided when it is already known whether the dataset is present in the parent
+        """
+        if exists is None:
+            exists = child.name in h5_parent
+        if exists:
+            itm = h5_parent[child.name]
+            warn('Found Dataset already exists {}'.format(itm.name))
+            return itm, False
+
+        if not child.resizable:
+            if not bool(child.maxshape):
+                # finite sized dataset and maxshape is not provided
+                # Typically for small / ancilliary datasets
+                itm = h5_parent.create_dataset(child.name,
+                                               data=child.data,
+                                               compression=child.compression,
+                                               dtype=child.data.dtype,
+                                               chunks=child.chunking,
+                                               **get_chunk_cache_kwargs(child.chunking, child.data.shape,
+                                                                        child.data.dtype.itemsize,
+                                                                        access=child.access))
+            else:
+                # In many cases, we DON'T need resizable datasets but we know the max-size
+                # Here, we only allocate the space. The provided data is ignored
+                itm = h5_parent.create_dataset(child.name, child.maxshape,
+                                               compression=child.compression,
+                                               dtype=child.dtype,
+                                               chunks=child.chunking,
+                                               **get_chunk_cache_kwargs(child.chunking, child.maxshape,
+                                                                        np.dtype(child.dtype).itemsize,
+                                                                        access=child.access))
+        else:
+            # Resizable but the written files are significantly larger
+            max_shape = tuple([None for _ in range(len(child.data.shape))])
+            itm = h5_parent.create_dataset(child.name,
+                                           data=child.data,
+                                           compression=child.compression,
+                                           dtype=child.data.dtype,
+                                           chunks=child.chunking,
+                                           maxshape=max_shape,
+                                           **get_chunk_cache_kwargs(child.chunking, child.data.shape,
+                                                                    child.data.dtype.itemsize, access=child.access))
+        return itm, True
+
+    def __write_attributes(self, h5_obj, attrs, is_new=False, saved=None, htypes=None, print_log=False):
+        """
+        Writes all attributes (other than None) to the provided group, dataset or file in a single batch. The
+        previous values of the attributes of objects that are not new are appended to `saved` if provided and the
+        HDF5 data types are cached in `htypes`
+        """
+        items = list()
+        for key, val in attrs.items():
+            if val is None:
+                continue
+            if print_log:
+                print('Writing attribute: {} with value: {}'.format(key, val))
+            items.append((key, self.clean_string_att(val)))
+        _write_attributes(h5_obj, items, is_new=is_new, saved=saved, htypes=htypes)
+
+    def __get_label_attributes(self, itm, labels, print_log=False):
+        """
+        Region references of a dataset along with the list of their names as the 'labels' attribute
+        """
+        if print_log:
+            print('Starting to write Region References to Dataset', itm.name, 'of shape:', itm.shape)
+        label_attrs = dict()
+        for sl in labels.keys():
+            if len(labels[sl]) == len(itm.shape):
+                # Slices provided as lists would be taken by h5py as a (fancy) index of the first dimension
+                label_attrs[sl] = itm.regionref[tuple(labels[sl])]
+            else:
+                warn('Region reference %s could not be written since the object size was not equal to the dimensions of'
+                     ' the dataset' % sl)
+                raise ValueError
+        '''
+        Now make an attribute called 'labels' that is a list of strings 
+        First ascertain the dimension of the slicing:
+        '''
+        found_dim = False
+        for dimen, slobj in enumerate(list(labels.values())[0]):
+            # We make the assumption that checking the start is sufficient
+            if slobj.start is not None:
+                found_dim = True
+                break
+        if found_dim:
+            headers = [None]*len(labels)  # The list that will hold all the names
+            for col_name in labels.keys():
+                headers[labels[col_name][dimen].start] = col_name
+            # Now write the list of col / row names as an attribute:
+            label_attrs['labels'] = headers
+        else:
+            warn('Unable to write region labels for %s' % (itm.name.split('/')[-1]))
+
+        return label_attrs
+
     @staticmethod
     def clean_string_att(att_val):
         """
@@ -397,8 +524,11 @@ class ioHDF5(object):
             Attribute object
         """
         try:
+            if isinstance(att_val, np.ndarray) and att_val.dtype != np.object_:
+                # Numeric and fixed length string arrays are written as they are
+                return att_val
             if isinstance(att_val, Iterable):
-                if np.any([type(x) in [str, bytes] for x in att_val]):
+                if any([type(x) in [str, bytes] for x in att_val]):
                     return np.array(att_val, dtype='S')
             if type(att_val) == np.str_:
                 return str(att_val)
@@ -427,10 +557,314 @@ class ioHDF5(object):
             if print_log:
                 print('About to write region reference:', sl, ':', slices[sl])
             if len(slices[sl]) == len(dataset.shape):
-                dataset.attrs[sl] = dataset.regionref[slices[sl]]
+                dataset.attrs[sl] = dataset.regionref[tuple(slices[sl])]
                 if print_log:
                     print('Wrote Region Reference:%s' % sl)
             else:
                 warn('Region reference %s could not be written since the object size was not equal to the dimensions of'
                      ' the dataset' % sl)
                 raise ValueError
+
+
+# Marks attributes that did not exist before they were written
+_missing_attr = object()
+
+
+def _get_attribute_array(val):
+    """
+    Array that h5py would write for the given (cleaned) attribute value or None if the value needs to be left to h5py
+    """
+    if isinstance(val, h5py.RegionReference):
+        return np.array(val, dtype=h5py.regionref_dtype)
+    if isinstance(val, h5py.Reference):
+        return np.array(val, dtype=h5py.ref_dtype)
+    if isinstance(val, (str, unicode)):
+        return np.array(val, dtype=h5py.string_dtype())
+    try:
+        data = np.asarray(val)
+    except (TypeError, ValueError):
+        return None
+    if data.dtype.kind in 'biufcS':
+        return data
+    return None
+
+
+def _write_attributes(h5_obj, items, is_new=False, saved=None, htypes=None):
+    """
+    Writes attributes to a group, dataset or file through the low level API of h5py.  Unlike writing them one by
+    one through h5_obj.attrs, the names of the existing attributes are only looked up once per object (never for
+    new objects) and the HDF5 data types are only built once per numpy data type when `htypes` is shared between
+    calls.
+
+    Parameters
+    ----------
+    h5_obj : h5py.File, h5py.Group or h5py.Dataset
+        Object to write the attributes to
+    items : list of (str, object) tuples
+        Names and values of the attributes
+    is_new : bool, optional
+        Whether or not the object was just created and therefore has no attributes yet. Default False
+    saved : list, optional
+        If provided, the object, name, previous value and data type of every attribute overwritten (or added) in an
+        object that is not new are appended to this list so that they can be restored by _restore_attributes
+    htypes : dict, optional
+        Cache of the HDF5 data types built for each numpy data type
+    """
+    obj_id = h5_obj.id
+    existing = set() if is_new else set(h5_obj.attrs.keys())
+    if htypes is None:
+        htypes = dict()
+
+    for key, val in items:
+        if saved is not None and not is_new:
+            if key in existing:
+                saved.append((h5_obj, key, h5_obj.attrs[key], h5_obj.attrs.get_id(key).dtype))
+            else:
+                saved.append((h5_obj, key, _missing_attr, None))
+
+        data = _get_attribute_array(val)
+        if data is None:
+            h5_obj.attrs[key] = val
+            existing.add(key)
+            continue
+
+        name = key.encode('utf-8') if isinstance(key, unicode) else key
+        if key in existing:
+            h5py.h5a.delete(obj_id, name)
+        existing.add(key)
+
+        # Variable length strings and references share the object dtype and only differ in their metadata, which
+        # numpy ignores when comparing dtypes
+        dtype_key = (data.dtype, h5py.check_dtype(vlen=data.dtype), h5py.check_dtype(ref=data.dtype))
+        if dtype_key not in htypes:
+            htypes[dtype_key] = (h5py.h5t.py_create(data.dtype, logical=True), h5py.h5t.py_create(data.dtype))
+        htype, mtype = htypes[dtype_key]
+
+        attr = h5py.h5a.create(obj_id, name, htype, h5py.h5s.create_simple(data.shape))
+        try:
+            attr.write(np.ascontiguousarray(data), mtype=mtype)
+        except:
+            attr.close()
+            h5py.h5a.delete(obj_id, name)
+            raise
+        attr.close()
+
+
+def _restore_attributes(saved):
+    """
+    Restores the attributes recorded by _write_attributes, latest first, removing those that did not exist before
+    """
+    for h5_obj, key, val, dtype in saved[::-1]:
+        try:
+            if val is _missing_attr:
+                if key in h5_obj.attrs:
+                    del h5_obj.attrs[key]
+            else:
+                h5_obj.attrs.create(key, val, dtype=dtype)
+        except (KeyError, ValueError, TypeError):
+            warn('Could not restore attribute {} of {}'.format(key, h5_obj.name))
+
+
+def _repack_file(h5_src, h5_dst, compression, rechunk, max_mem, cores, print_log):
+    """
+    Copies all groups, datasets, links and attributes from one open file to another.  Attributes holding
+    references are written once all the objects they could point to exist.
+    """
+    copied = dict()  # address of each copied object in the source file -> its path in the destination file
+    ref_attrs = list()
+
+    def __copy_attrs(h5_from, h5_to):
+        for key in h5_from.attrs.keys():
+            val = h5_from.attrs[key]
+            if _is_ref_att(val):
+                ref_attrs.append((h5_from, h5_to, key, val))
+            else:
+                h5_to.attrs.create(key, val, dtype=h5_from.attrs.get_id(key).dtype)
+
+    def __copy_group(grp_from, grp_to):
+        for name in grp_from.keys():
+            link = grp_from.get(name, getlink=True)
+            if isinstance(link, h5py.SoftLink):
+                grp_to[name] = h5py.SoftLink(link.path)
+                continue
+            elif isinstance(link, h5py.ExternalLink):
+                grp_to[name] = h5py.ExternalLink(link.filename, link.path)
+                continue
+
+            obj = grp_from[name]
+            addr = h5py.h5o.get_info(obj.id).addr
+            if addr in copied:
+                # Hard link to an object that has already been copied
+                grp_to[name] = h5_dst[copied[addr]]
+                continue
+
+            if isinstance(obj, h5py.Group):
+                new_obj = grp_to.create_group(name)
+                __copy_group(obj, new_obj)
+            elif isinstance(obj, h5py.Dataset):
+                new_obj = _copy_dataset(obj, grp_to, compression, rechunk, max_mem, cores, print_log)
+            else:
+                # Named datatypes
+                h5_src.copy(obj, grp_to, name=name, without_attrs=True)
+                new_obj = grp_to[name]
+            copied[addr] = new_obj.name
+            __copy_attrs(obj, new_obj)
+
+    __copy_attrs(h5_src, h5_dst)
+    __copy_group(h5_src, h5_dst)
+
+    '''
+    Now that all objects exist, re-point the references at the copies
+    '''
+    for h5_from, h5_to, key, val in ref_attrs:
+        dtype = h5_from.attrs.get_id(key).dtype
+        if isinstance(val, np.ndarray):
+            new_val = np.empty(val.shape, dtype=val.dtype)
+            for ind, ref in np.ndenumerate(val):
+                new_val[ind] = _copy_ref(ref, h5_src, h5_dst)
+            h5_to.attrs.create(key, new_val, dtype=dtype)
+        else:
+            h5_to.attrs[key] = _copy_ref(val, h5_src, h5_dst)
+
+
+def _is_ref_att(val):
+    """
+    Whether or not the attribute value is an object / region reference or an array of references
+    """
+    if isinstance(val, h5py.Reference):
+        return True
+    if isinstance(val, np.ndarray) and val.dtype == np.object_ and val.size > 0:
+        return isinstance(val.flat[0], h5py.Reference)
+    return False
+
+
+def _copy_ref(ref, h5_src, h5_dst):
+    """
+    Creates a reference in the destination file that points to the same path (and region) as the provided
+    reference to the source file
+    """
+    if not ref:
+        return ref
+    name = h5py.h5r.get_name(ref, h5_src.id)
+    if isinstance(ref, h5py.RegionReference):
+        space = h5py.h5r.get_region(ref, h5_src.id)
+        return h5py.h5r.create(h5_dst.id, name, h5py.h5r.DATASET_REGION, space)
+    return h5py.h5r.create(h5_dst.id, name, h5py.h5r.OBJECT)
+
+
+def _get_file_kwargs(h5_file):
+    """
+    Keyword arguments to h5py.File that reproduce the chunk cache and library version bounds of an open file
+    """
+    _, nslots, nbytes, w0 = h5_file.id.get_access_plist().get_cache()
+    return {'rdcc_nslots': nslots, 'rdcc_nbytes': nbytes, 'rdcc_w0': w0, 'libver': h5_file.libver}
+
+
+def _copy_dataset(h5_dset, h5_parent, compression, rechunk, max_mem, cores, print_log):
+    """
+    Copies a dataset (without its attributes) into the destination group, applying the compression policy
+    """
+    name = h5_dset.name.split('/')[-1]
+    small = h5_dset.chunks is None and h5_dset.nbytes < 1024 ** 2
+    # Numbers, fixed length strings and compound types of these can be copied a block at a time
+    plain_dtype = h5_dset.dtype.kind in 'biufcSV' and not h5_dset.dtype.hasobject
+
+    if (compression is None and not rechunk) or not plain_dtype or h5_dset.ndim == 0 or small:
+        '''
+        Nothing to change.  Let HDF5 copy the dataset as it is
+        '''
+        if compression is not None and not plain_dtype and h5_dset.ndim > 0 and not small:
+            warn('Copying {} without applying the "{}" compression policy since its data type ({}) holds '
+                 'references or variable length data'.format(h5_dset.name, compression, h5_dset.dtype))
+        h5_dset.file.copy(h5_dset, h5_parent, name=name, without_attrs=True)
+        return h5_parent[name]
+
+    kwargs = {'chunks': h5_dset.chunks, 'maxshape': h5_dset.maxshape, 'fletcher32': h5_dset.fletcher32}
+    if compression is None:
+        kwargs.update({'compression': h5_dset.compression, 'compression_opts': h5_dset.compression_opts,
+                       'shuffle': h5_dset.shuffle, 'scaleoffset': h5_dset.scaleoffset})
+    else:
+        kwargs.update(ioHDF5.filter_policies[compression])
+        if compression != 'none':
+            kwargs['scaleoffset'] = h5_dset.scaleoffset
+    if h5_dset.fillvalue is not None:
+        kwargs['fillvalue'] = h5_dset.fillvalue
+
+    if rechunk or (kwargs['chunks'] is None and (kwargs.get('compression') is not None or kwargs['fletcher32'] or
+                                                 kwargs.get('scaleoffset') is not None)):
+        kwargs['chunks'] = calc_chunks(h5_dset.shape, h5_dset.dtype.itemsize, compression=kwargs.get('compression'))
+
+    h5_new = h5_parent.create_dataset(name, shape=h5_dset.shape, dtype=h5_dset.dtype, **kwargs)
+
+    if h5_dset.size == 0:
+        return h5_new
+
+    '''
+    Copy the data in blocks of whole chunks along the first dimension
+    '''
+    row_bytes = h5_dset.nbytes // h5_dset.shape[0]
+    chunk_rows = 1 if h5_new.chunks is None else h5_new.chunks[0]
+    block_rows = max(1, int(max_mem // (row_bytes * chunk_rows))) * chunk_rows
+
+    pool = None
+    # Chunks can only be compressed here when deflate (and shuffle) are the only filters
+    if h5_new.compression == 'gzip' and not h5_new.fletcher32 and h5_new.scaleoffset is None and \
+            hasattr(h5_new.id, 'write_direct_chunk'):
+        num_chunks = np.prod(np.ceil(np.array(h5_new.shape, dtype=np.float64) / h5_new.chunks))
+        cores = recommendCores(int(num_chunks), requested_cores=cores, lengthy_computation=False)
+        if cores > 1:
+            pool = Pool(processes=cores)
+
+    if print_log:
+        print('Copying {} using {} block(s) of {} rows'.format(h5_dset.name, int(np.ceil(h5_dset.shape[0] / block_rows)),
+                                                              block_rows))
+    try:
+        for start in range(0, h5_dset.shape[0], block_rows):
+            stop = min(start + block_rows, h5_dset.shape[0])
+            block = h5_dset[start:stop]
+            if pool is None:
+                h5_new[start:stop] = block
+            else:
+                _write_gzip_chunks(h5_new, block, start, pool)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    return h5_new
+
+
+def _write_gzip_chunks(h5_dset, block, start, pool):
+    """
+    Compresses the chunks covering a block of rows in parallel and writes them directly into the dataset.
+    The block must start at the beginning of a chunk along the first dimension
+    """
+    chunks = h5_dset.chunks
+    fill_value = np.zeros(1, dtype=block.dtype)[0] if h5_dset.fillvalue is None else h5_dset.fillvalue
+    offsets = list(itertools.product(*[range(0, dim, chunk) for dim, chunk in zip(block.shape, chunks)]))
+
+    def __chunk_data(offset):
+        chunk_slice = tuple(slice(off, off + chunk) for off, chunk in zip(offset, chunks))
+        data = block[chunk_slice]
+        if data.shape != chunks:
+            # Chunks along the edges are stored padded with the fill value
+            padded = np.empty(chunks, dtype=block.dtype)
+            padded[...] = fill_value
+            padded[tuple(slice(0, dim) for dim in data.shape)] = data
+            data = padded
+        return np.ascontiguousarray(data, dtype=h5_dset.dtype)
+
+    args = ((__chunk_data(offset), h5_dset.shuffle, h5_dset.compression_opts) for offset in offsets)
+    for offset, compressed in zip(offsets, pool.imap(_gzip_chunk, args)):
+        h5_dset.id.write_direct_chunk((start + offset[0],) + offset[1:], compressed)
+
+
+def _gzip_chunk(args):
+    """
+    Applies the HDF5 shuffle (optional) and deflate filters to the contents of a chunk
+    """
+    data, shuffle, level = args
+    raw = data.view(np.uint8).reshape(data.size, data.dtype.itemsize)
+    if shuffle:
+        raw = raw.T
+    return zlib.compress(np.ascontiguousarray(raw).tobytes(), 4 if level is None else level)
@@ -9,6 +9,7 @@ Created on Wed Dec 16 10:42:03 2015
 from __future__ import division, print_function, absolute_import, unicode_literals
 import socket
 from warnings import warn
+import numpy as np
 
 from .io_utils import getTimeStamp
 
@@ -115,7 +116,7 @@ class MicroDataset(MicroData):
     """
     
     def __init__(self, name, data, dtype=None, compression=None, chunking=None, parent=None, resizable=False,
-                 maxshape=None):
+                 maxshape=None, access=None):
         """
         Parameters
         ----------
@@ -127,9 +128,11 @@ class MicroDataset(MicroData):
             typically a datatype of a numpy array =None
         compression : (Optional) String
             See h5py compression. Leave as 'gzip' as a default mode of compression
-        chunking : (Optional) tuple of ints
+        chunking : (Optional) tuple of ints or 'auto'
             Chunking in each dimension of the dataset. If not provided, 
-            default chunking is used by h5py when writing this dataset
+            default chunking is used by h5py when writing this dataset.
+            If 'auto', the chunking is calculated by hdf_utils.calc_chunks from the
+            shape, dtype, compression and `access` of the dataset
         parent : (Optional) String
                 HDF5 path to the parent of this object. This value is overwritten
                 when this dataset is made the child of a datagroup.
@@ -140,6 +143,10 @@ class MicroDataset(MicroData):
             Maximum size in each axis this dataset is expected to be
             if this parameter is provided, io will ONLY allocate space. 
             Make sure to specify the dtype appropriately. The provided data will be ignored
+        access : (Optional) String
+            Expected way in which the dataset will be read - 'pixel', 'spectral' or 'both'.
+            Used to calculate the chunking when `chunking` is 'auto' and to size the chunk cache of chunked
+            datasets. See hdf_utils.calc_chunks and hdf_utils.calc_chunk_cache
             
         Examples
         --------   
@@ -159,6 +166,10 @@ class MicroDataset(MicroData):
         4. Intializing large datasets whose size is unknown in one or more dimensions:
         
         >>> ds_raw_data = MicroDataset('Raw_Data', np.zeros(shape=(1,16384), dtype=np.complex64), chunking=(1,16384), resizable=True,compression='gzip')
+
+        5. Large primary datasets chunked for reading one pixel at a time :
+
+        >>> ds_raw_data = MicroDataset('Raw_Data', data=[], maxshape=(1024,16384), dtype=np.float16, chunking='auto', access='pixel')
         """
 
         def _make_iterable(item):
@@ -168,11 +179,14 @@ class MicroDataset(MicroData):
             return item
 
         super(MicroDataset, self).__init__(name, parent)
+        if np.isscalar(chunking) and str(chunking) == 'auto':
+            chunking = self.__auto_chunks(data, dtype, compression, maxshape, access)
         self.data = data
         self.dtype = dtype
         self.compression = compression
         self.chunking = _make_iterable(chunking)
         self.resizable = resizable
+        self.access = access
         self.maxshape = _make_iterable(maxshape)
         if resizable is True:
             self.maxshape = None  # Overridden
@@ -182,5 +196,22 @@ class MicroDataset(MicroData):
         else:
             self.shape = self.data.shape
 
+    @staticmethod
+    def __auto_chunks(data, dtype, compression, maxshape, access):
+        """
+        Chunking picked by hdf_utils.calc_chunks for the given shape, dtype and access pattern
+        """
+        from .hdf_utils import calc_chunks  # hdf_utils imports this module
+
+        if maxshape is not None:
+            shape = maxshape
+        else:
+            shape = np.shape(data)
+        if dtype is None:
+            dtype = np.asarray(data).dtype
+        shape = [1 if dim is None else dim for dim in np.atleast_1d(shape)]
+
+        return calc_chunks(shape, np.dtype(dtype).itemsize, access=access, compression=compression)
+
     def __getitem__(self, item):
         return self.data[item]
\ No newline at end of file
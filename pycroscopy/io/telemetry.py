@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 18, 2026
+
+Opt-in timing of the chunked computations performed by Model and Process
+"""
+
+from __future__ import division, print_function, absolute_import, unicode_literals
+from contextlib import contextmanager
+from time import time
+
+import numpy as np
+import psutil
+
+from .hdf_utils import clear_metadata_cache
+
+__all__ = ['Telemetry', 'timed_call', 'telemetry_stage']
+
+
+def timed_call(func_and_args):
+    """
+    Calls a function and also returns the time it took.  Mapped over a pool of workers to measure how long the
+    workers spend computing as opposed to waiting for or exchanging data with the parent process
+
+    Parameters
+    ----------
+    func_and_args : tuple
+        Function followed by the single argument it is to be called with
+
+    Returns
+    -------
+    result : object
+        Value returned by the function
+    elapsed : float
+        Time in seconds spent in the function
+    """
+    func, args = func_and_args
+    t_start = time()
+    result = func(args)
+    return result, time() - t_start
+
+
+class _NullStage(object):
+    """
+    Context manager that does nothing, used when telemetry is disabled
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+def telemetry_stage(telemetry, stage):
+    """
+    Times a stage of the current chunk if telemetry is enabled
+
+    Parameters
+    ----------
+    telemetry : Telemetry or None
+        Telemetry of the computation.  Nothing is recorded if None
+    stage : str
+        One of Telemetry.stages
+
+    Returns
+    -------
+    context : context manager
+    """
+    if telemetry is None:
+        return _null_stage
+    return telemetry.stage(stage)
+
+
+class Telemetry(object):
+    """
+    Records the time spent reading, computing, exchanging data with workers (pickling and inter-process
+    communication) and writing for every chunk of a computation along with the throughput, peak memory and
+    utilization of the workers.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the computation, for example 'Guess' or 'Fit'.  Used to label the results when written to file
+
+    Examples
+    --------
+    >>> telemetry = Telemetry('Guess')
+    >>> telemetry.start()
+    >>> telemetry.start_chunk(num_pixels)
+    >>> with telemetry_stage(telemetry, 'read'):
+    ...     data = h5_main[start:end]
+    >>> telemetry.stop()
+    >>> telemetry.write(h5_results_group)
+    """
+
+    stages = ['read', 'compute', 'ipc', 'write']
+
+    def __init__(self, name='Telemetry'):
+        self.name = name
+        self._reset()
+
+    def _reset(self):
+        self.chunk_pixels = list()
+        self.chunk_times = list()
+        self.busy_time = 0.0
+        self.capacity_time = 0.0
+        self.peak_rss = 0
+        self.total_time = 0.0
+        self._t_start = None
+
+    def start(self):
+        """
+        Clears previous records and starts the clock of the whole computation
+        """
+        self._reset()
+        self._t_start = time()
+        self._sample_rss()
+
+    def stop(self):
+        """
+        Stops the clock of the whole computation
+        """
+        if self._t_start is not None:
+            self.total_time = time() - self._t_start
+            self._t_start = None
+        self._sample_rss()
+
+        # The final read that finds no more data does not make a chunk of its own
+        if len(self.chunk_pixels) > 1 and self.chunk_pixels[-1] == 0:
+            extra = self.chunk_times.pop()
+            self.chunk_times[-1] += extra
+            self.chunk_pixels.pop()
+
+    def start_chunk(self, num_pixels=0):
+        """
+        Starts recording a new chunk of positions
+
+        Parameters
+        ----------
+        num_pixels : uint, optional
+            Number of positions in the chunk, if already known.  See `add_pixels`
+        """
+        if len(self.chunk_times) > 0:
+            self._sample_rss()
+        self.chunk_pixels.append(int(num_pixels))
+        self.chunk_times.append(np.zeros(len(self.stages)))
+
+    def add_pixels(self, num_pixels):
+        """
+        Adds positions to the current chunk
+
+        Parameters
+        ----------
+        num_pixels : uint
+            Number of positions
+        """
+        if len(self.chunk_times) == 0:
+            self.start_chunk()
+        self.chunk_pixels[-1] += int(num_pixels)
+
+    def add(self, stage, seconds):
+        """
+        Adds time to a stage of the current chunk
+
+        Parameters
+        ----------
+        stage : str
+            One of `stages`
+        seconds : float
+            Time spent in the stage
+        """
+        if len(self.chunk_times) == 0:
+            self.start_chunk(0)
+        self.chunk_times[-1][self.stages.index(stage)] += seconds
+
+    @contextmanager
+    def stage(self, stage):
+        """
+        Context manager that adds the time spent within it to a stage of the current chunk
+
+        Parameters
+        ----------
+        stage : str
+            One of `stages`
+        """
+        t_start = time()
+        try:
+            yield
+        finally:
+            self.add(stage, time() - t_start)
+
+    def add_parallel(self, wall_time, busy_times, num_workers):
+        """
+        Records a computation that was distributed over a pool of workers.  The time the workers spent computing,
+        averaged over the workers, is counted as computation and the rest of the wall time as communication
+
+        Parameters
+        ----------
+        wall_time : float
+            Time in seconds from submitting the tasks to having collected all results
+        busy_times : list of float
+            Time spent by the workers on each task. See `timed_call`
+        num_workers : uint
+            Number of workers in the pool
+        """
+        busy_time = float(np.sum(busy_times))
+        compute_time = min(wall_time, busy_time / max(1, num_workers))
+        self.add('compute', compute_time)
+        self.add('ipc', wall_time - compute_time)
+        self.busy_time += busy_time
+        self.capacity_time += wall_time * max(1, num_workers)
+
+    def add_serial(self, wall_time):
+        """
+        Records a computation performed in this process
+        """
+        self.add('compute', wall_time)
+        self.busy_time += wall_time
+        self.capacity_time += wall_time
+
+    def _sample_rss(self):
+        """
+        Updates the peak resident memory of this process and its workers.  Sampled at the start and end of the
+        computation and between chunks
+        """
+        try:
+            proc = psutil.Process()
+            rss = proc.memory_info().rss
+            for child in proc.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+        except psutil.Error:
+            return
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def summary(self):
+        """
+        Totals of the recorded computation
+
+        Returns
+        -------
+        summary : dict
+            Number of chunks and pixels, total time and time per stage in seconds, pixels per second, peak resident
+            memory in MB and the fraction of the workers' time spent computing
+        """
+        totals = np.sum(self.chunk_times, axis=0) if len(self.chunk_times) > 0 else np.zeros(len(self.stages))
+        total_time = self.total_time if self.total_time > 0 else float(np.sum(totals))
+        num_pixels = int(np.sum(self.chunk_pixels))
+        summary = {'num_chunks': len(self.chunk_times),
+                   'num_pixels': num_pixels,
+                   'total_time_[s]': total_time,
+                   'pixels_per_sec': num_pixels / total_time if total_time > 0 else 0.0,
+                   'peak_rss_[MB]': self.peak_rss / 1024 ** 2,
+                   'worker_utilization': self.busy_time / self.capacity_time if self.capacity_time > 0 else 1.0}
+        for stage, stage_time in zip(self.stages, totals):
+            summary[stage + '_time_[s]'] = float(stage_time)
+
+        return summary
+
+    def report(self):
+        """
+        Prints the summary of the recorded computation
+        """
+        summary = self.summary()
+        total_time = summary['total_time_[s]']
+        print('{}: {} pixels in {} chunks took {:.3f} sec ({:.1f} pixels / sec), peak memory {:.1f} MB, '
+              'worker utilization {:.1%}'.format(self.name, summary['num_pixels'], summary['num_chunks'],
+                                                 total_time, summary['pixels_per_sec'], summary['peak_rss_[MB]'],
+                                                 summary['worker_utilization']))
+        for stage in self.stages:
+            stage_time = summary[stage + '_time_[s]']
+            print('\t{:<8}{:>10.3f} sec ({:.1%})'.format(stage, stage_time,
+                                                         stage_time / total_time if total_time > 0 else 0))
+
+    def write(self, h5_group):
+        """
+        Writes the summary as attributes of the group and the per-chunk timings as a dataset named
+        '<name>_Telemetry' in the group.  Results of a previous run with the same name are replaced
+
+        Parameters
+        ----------
+        h5_group : h5py.Group
+            Group containing the results of the computation
+
+        Returns
+        -------
+        h5_telemetry : h5py.Dataset
+            Per-chunk timings arranged as [chunk, pixels + stages]
+        """
+        for key, val in self.summary().items():
+            h5_group.attrs['_'.join([self.name, 'telemetry', key])] = val
+
+        dset_name = self.name + '_Telemetry'
+        if dset_name in h5_group:
+            del h5_group[dset_name]
+        chunk_mat = np.zeros(shape=(len(self.chunk_times), len(self.stages) + 1), dtype=np.float32)
+        if len(self.chunk_times) > 0:
+            chunk_mat[:, 0] = self.chunk_pixels
+            chunk_mat[:, 1:] = self.chunk_times
+        h5_telemetry = h5_group.create_dataset(dset_name, data=chunk_mat)
+        h5_telemetry.attrs['labels'] = np.array(['pixels'] + [stage + '_[s]' for stage in self.stages], dtype='S')
+        clear_metadata_cache(h5_group)
+
+        return h5_telemetry
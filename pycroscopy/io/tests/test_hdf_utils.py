@@ -0,0 +1,136 @@
+from __future__ import division, print_function, absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+
+from pycroscopy.io.hdf_utils import get_all_main, getDataSet, getAuxData, checkIfMain, findDataset, reshape_to_Ndims, \
+    calc_chunk_cache, create_empty_dataset, open_with_chunk_cache
+from pycroscopy.io.io_hdf5 import ioHDF5
+from pycroscopy.io.microdata import MicroDataGroup, MicroDataset
+from pycroscopy.io.translators import NumpyTranslator
+
+
+class TestMetadataIndex(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.h5_file = h5py.File(os.path.join(self.folder, 'index.h5'), 'w')
+        h5_group = self.h5_file.create_group('Measurement_000/Channel_000')
+        h5_main = h5_group.create_dataset('Raw_Data', data=np.zeros((4, 3)))
+        for name in ['Position_Indices', 'Position_Values']:
+            h5_anc = h5_group.create_dataset(name, data=np.zeros((4, 1)))
+            h5_main.attrs[name] = h5_anc.ref
+        for name in ['Spectroscopic_Indices', 'Spectroscopic_Values']:
+            h5_anc = h5_group.create_dataset(name, data=np.zeros((1, 3)))
+            h5_main.attrs[name] = h5_anc.ref
+
+        # Build the index before the links change
+        self.assertEqual([dset.name for dset in get_all_main(self.h5_file)],
+                         ['/Measurement_000/Channel_000/Raw_Data'])
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_move(self):
+        self.h5_file.create_group('Measurement_001')
+        self.h5_file.move('Measurement_000/Channel_000/Raw_Data', 'Measurement_001/Raw_Data')
+
+        self.assertEqual([dset.name for dset in get_all_main(self.h5_file)], ['/Measurement_001/Raw_Data'])
+        self.assertEqual([dset.name for dset in getDataSet(self.h5_file['Measurement_000'], 'Raw_Data')], [])
+        self.assertTrue(checkIfMain(self.h5_file['Measurement_001/Raw_Data']))
+
+    def test_rename(self):
+        self.h5_file.move('Measurement_000/Channel_000/Raw_Data', 'Measurement_000/Channel_000/Raw2')
+        self.h5_file.move('Measurement_000/Channel_000/Position_Indices',
+                          'Measurement_000/Channel_000/Pos_Inds')
+        h5_main = self.h5_file['Measurement_000/Channel_000/Raw2']
+
+        self.assertEqual([dset.name for dset in get_all_main(self.h5_file)], [h5_main.name])
+        self.assertEqual([dset.name for dset in getDataSet(self.h5_file, 'Raw2')], [h5_main.name])
+        self.assertEqual(getDataSet(self.h5_file, 'Raw_Data'), [])
+        self.assertEqual([name for name, _ in findDataset(self.h5_file, 'Pos_Inds')],
+                         ['Measurement_000/Channel_000/Pos_Inds'])
+        self.assertEqual([dset.name for dset in getAuxData(h5_main, 'Position_Indices')],
+                         ['/Measurement_000/Channel_000/Pos_Inds'])
+
+    def test_delete(self):
+        del self.h5_file['Measurement_000/Channel_000/Raw_Data']
+
+        self.assertEqual(get_all_main(self.h5_file), [])
+        self.assertEqual(getDataSet(self.h5_file, 'Raw_Data'), [])
+        self.assertEqual(len(getDataSet(self.h5_file, 'Position_Indices')), 1)
+
+
+class TestNdimsView(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        h5_path = os.path.join(self.folder, 'ndims.h5')
+        data = np.float32(np.random.RandomState(0).rand(12, 5))
+        NumpyTranslator().translate(h5_path, data, 3, 4, spec_val=np.arange(5))
+        self.h5_file = h5py.File(h5_path, 'r')
+        h5_main = getDataSet(self.h5_file, 'Raw_Data')[0]
+        self.view = reshape_to_Ndims(h5_main, lazy=True)[0]
+        self.data = reshape_to_Ndims(h5_main)[0]
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_slices(self):
+        self.assertTrue(np.allclose(self.view[1:, ::2, [4, 0]], self.data[1:, ::2, [4, 0]]))
+        self.assertTrue(np.allclose(self.view[2], self.data[2]))
+
+    def test_empty_selection(self):
+        for key in [slice(0, 0), (slice(None), []), (1, slice(None), slice(3, 3))]:
+            self.assertEqual(self.view[key].shape, self.data[key].shape)
+
+
+class TestChunkCache(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.h5_path = os.path.join(self.folder, 'cache.h5')
+        self.h5_file = h5py.File(self.h5_path, 'w')
+        # Reading a column takes 512 chunks of 64 kB, more than the default cache holds
+        self.shape = (16384, 2048)
+        self.chunks = (32, 512)
+        self.cache_mem = calc_chunk_cache(self.chunks, self.shape, 4, access='spectral')
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _get_cache_mem(self, h5_dset):
+        return h5_dset.id.get_access_plist().get_chunk_cache()[1]
+
+    def test_create_empty_dataset(self):
+        h5_source = self.h5_file.create_dataset('Source', shape=self.shape, dtype=np.float32, chunks=self.chunks)
+        # The chunks of the source are kept if no access pattern is given
+        h5_new = create_empty_dataset(h5_source, np.float32, 'New', skip_refs=True)
+
+        self.assertEqual(h5_new.chunks, self.chunks)
+        self.assertEqual(self._get_cache_mem(h5_new), calc_chunk_cache(self.chunks, self.shape, 4))
+
+    def test_write_data(self):
+        ds_main = MicroDataset('Raw_Data', data=[], maxshape=self.shape, dtype=np.float32, chunking=self.chunks,
+                               access='spectral')
+        grp = MicroDataGroup('Measurement_')
+        grp.addChildren([ds_main])
+        h5_main = ioHDF5(self.h5_file).writeData(grp)[0]
+
+        self.assertEqual(self._get_cache_mem(h5_main), self.cache_mem)
+
+    def test_open(self):
+        self.h5_file.create_dataset('Raw_Data', shape=self.shape, dtype=np.float32, chunks=self.chunks)
+        self.h5_file.close()
+        self.h5_file = h5py.File(self.h5_path, 'r')
+
+        h5_main = open_with_chunk_cache(self.h5_file, 'Raw_Data', access='spectral')
+        self.assertEqual(self._get_cache_mem(h5_main), self.cache_mem)
+        self.assertEqual(h5_main.shape, self.shape)
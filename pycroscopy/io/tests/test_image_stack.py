@@ -0,0 +1,55 @@
+from __future__ import division, print_function, absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+from skimage.measure import block_reduce
+
+from pycroscopy.io.translators.df_utils.image_stack import FrameReader, VirtualImageStack, build_frame_index
+
+
+def block_range(block, axis=None):
+    return np.max(block, axis=axis) - np.min(block, axis=axis)
+
+
+class TestVirtualImageStack(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.frames = np.float32(np.random.RandomState(0).rand(6, 8, 8))
+        self.raw_path = os.path.join(self.folder, 'frames.raw')
+        self.frames.tofile(self.raw_path)
+        self.h5_file = h5py.File(os.path.join(self.folder, 'stack.h5'), 'w')
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write_index(self, bin_func):
+        frame_reader = FrameReader(bin_factor=(2, 2), bin_func=bin_func)
+        ds_index = build_frame_index([self.raw_path], frame_reader, (4, 4), source_shape=self.frames.shape,
+                                     source_dtype=self.frames.dtype)
+        h5_index = self.h5_file.create_dataset(ds_index.name, data=ds_index.data)
+        for key, val in ds_index.attrs.items():
+            h5_index.attrs[key] = val
+        return h5_index
+
+    def test_custom_bin_func(self):
+        h5_virt = VirtualImageStack(self._write_index(block_range))
+
+        self.assertIs(h5_virt.frame_reader.bin_func, block_range)
+        self.assertTrue(np.allclose(h5_virt[3], block_reduce(self.frames[3], (2, 2), block_range).ravel()))
+
+    def test_unimportable_bin_func(self):
+        with self.assertRaises(ValueError):
+            self._write_index(lambda block, axis=None: np.mean(block, axis=axis))
+
+    def test_no_cache(self):
+        h5_virt = VirtualImageStack(self._write_index(np.mean), cache_size=0)
+
+        self.assertEqual(h5_virt[1:4].shape, (3, 16))
+        self.assertTrue(np.allclose(h5_virt[2], block_reduce(self.frames[2], (2, 2), np.mean).ravel()))
+        self.assertEqual(len(h5_virt._cache), 0)
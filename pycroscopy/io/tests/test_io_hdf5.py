@@ -0,0 +1,121 @@
+from __future__ import division, print_function, absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+
+from pycroscopy.io.io_hdf5 import ioHDF5
+from pycroscopy.io.microdata import MicroDataGroup, MicroDataset
+
+
+class TestWriteData(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.h5_path = os.path.join(self.folder, 'write.h5')
+        self.h5_file = h5py.File(self.h5_path, 'w')
+        h5_group = self.h5_file.create_group('Measurement_000')
+        h5_group.attrs['num_pos'] = 4
+        h5_group.attrs['mode'] = 'DC'
+
+    def tearDown(self):
+        if self.h5_file.id:
+            self.h5_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_attributes(self):
+        attrs = {'units': 'V', 'names': ['Bias', 'Cycle'], 'step': 3, 'freq': np.arange(4.0), 'flag': True,
+                 'empty': None}
+        ds_main = MicroDataset('Bins', np.arange(6, dtype=np.float32).reshape(3, 2))
+        ds_main.attrs = dict(attrs)
+        ds_main.attrs['labels'] = {'Low': (slice(None), slice(0, 1)), 'High': (slice(None), slice(1, 2))}
+        grp = MicroDataGroup('Plot_Group_', parent='/Measurement_000')
+        grp.attrs = dict(attrs)
+        grp.addChildren([ds_main])
+        h5_main = ioHDF5(self.h5_file).writeData(grp)[0]
+
+        # The same attributes as written one by one through h5py
+        h5_expected = self.h5_file.create_group('Expected')
+        for key, val in attrs.items():
+            if val is not None:
+                h5_expected.attrs[key] = ioHDF5.clean_string_att(val)
+
+        for h5_obj in [h5_main, h5_main.parent]:
+            self.assertNotIn('empty', h5_obj.attrs)
+            for key in h5_expected.attrs.keys():
+                self.assertEqual(h5_obj.attrs.get_id(key).dtype, h5_expected.attrs.get_id(key).dtype)
+                self.assertTrue(np.all(h5_obj.attrs[key] == h5_expected.attrs[key]))
+
+        self.assertEqual(h5_main.parent.name, '/Measurement_000/Plot_Group_000')
+        self.assertEqual(h5_main.attrs['labels'].tolist(), [b'Low', b'High'])
+        self.assertTrue(np.allclose(h5_main[h5_main.attrs['High']].ravel(), [1, 3, 5]))
+
+    def test_list_labels(self):
+        ds_main = MicroDataset('S', np.arange(4, dtype=np.float32))
+        ds_main.attrs['labels'] = {'Principal Component': [slice(0, None)]}
+        grp = MicroDataGroup('SVD_', parent='/Measurement_000')
+        grp.addChildren([ds_main])
+        h5_main = ioHDF5(self.h5_file).writeData(grp)[0]
+
+        self.assertTrue(np.allclose(h5_main[h5_main.attrs['Principal Component']], np.arange(4)))
+
+    def test_rollback(self):
+        ds_main = MicroDataset('Bins', np.arange(6, dtype=np.float32))
+        # Region references need one slice per dimension of the dataset
+        ds_main.attrs['labels'] = {'Low': (slice(0, 3), slice(None))}
+        grp = MicroDataGroup('Measurement_000', parent='/')
+        grp.attrs = {'num_pos': 16, 'num_spec': 2}
+        grp.addChildren([MicroDataset('Spectroscopic_Values', np.arange(2)), ds_main])
+
+        with self.assertRaises(ValueError):
+            ioHDF5(self.h5_file).writeData(grp)
+
+        with h5py.File(self.h5_path, 'r') as h5_file:
+            self.assertNotIn('Pycroscopy version', h5_file.attrs)
+            h5_group = h5_file['Measurement_000']
+            self.assertEqual(len(h5_group), 0)
+            self.assertEqual(sorted(h5_group.attrs.keys()), ['mode', 'num_pos'])
+            self.assertEqual(h5_group.attrs['num_pos'], 4)
+            self.assertEqual(h5_group.attrs['mode'], 'DC')
+
+
+class TestRepack(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.h5_path = os.path.join(self.folder, 'repack.h5')
+        self.data = np.float32(np.random.RandomState(0).rand(64, 32))
+        self.hdf = ioHDF5(self.h5_path, cachemult=16)
+        self.hdf.file.create_dataset('Checked', data=self.data, chunks=(8, 32), fletcher32=True)
+        self.hdf.file.create_dataset('Scaled', data=self.data, chunks=(8, 32), scaleoffset=3)
+
+    def tearDown(self):
+        self.hdf.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _repack(self, **kwargs):
+        self.hdf.repack(**kwargs)
+        self.assertEqual(self.hdf.file.id.get_access_plist().get_cache()[2], 16 * 1024 ** 2)
+        h5_checked = self.hdf.file['Checked']
+        h5_scaled = self.hdf.file['Scaled']
+        self.assertTrue(h5_checked.fletcher32)
+        self.assertTrue(np.allclose(h5_checked[()], self.data))
+        self.assertTrue(np.allclose(h5_scaled[()], self.data, atol=1E-3))
+        return h5_checked, h5_scaled
+
+    def test_keep_filters(self):
+        h5_checked, h5_scaled = self._repack(rechunk=True)
+        self.assertEqual(h5_scaled.scaleoffset, 3)
+
+    def test_gzip(self):
+        h5_checked, h5_scaled = self._repack(compression='gzip', cores=1)
+        self.assertEqual(h5_checked.compression, 'gzip')
+        self.assertEqual(h5_scaled.compression, 'gzip')
+        self.assertEqual(h5_scaled.scaleoffset, 3)
+
+    def test_no_compression(self):
+        h5_checked, h5_scaled = self._repack(compression='none')
+        self.assertIsNone(h5_scaled.scaleoffset)
@@ -1,43 +1,33 @@
-from . import be_odf
-from . import be_odf_relaxation
-from . import beps_ndf
-from . import general_dynamic_mode
-from . import gmode_iv
-from . import gmode_line
-from . import gmode_tune
-from . import image
-from . import ndata_translator
-from . import numpy_translator
-from . import trKPFM_translator
-from . import igor_ibw
-from . import oneview
-from . import ptychography
-from . import sporc
-from . import time_series
-from . import translator
-from . import utils
-from . import df_utils
-from . import beps_data_generator
+"""
+Each translator module is only imported when it, or the translator it defines, is first accessed
+"""
+from ...lazy_imports import attach_lazy
 
-from .be_odf import BEodfTranslator
-from .be_odf_relaxation import BEodfRelaxationTranslator
-from .beps_ndf import BEPSndfTranslator
-from .general_dynamic_mode import GDMTranslator
-from .gmode_iv import GIVTranslator
-from .gmode_line import GLineTranslator
-from .gmode_tune import GTuneTranslator
-from .igor_ibw import IgorIBWTranslator
-from .image import ImageTranslator
-from .ndata_translator import NDataTranslator
-from .numpy_translator import NumpyTranslator
-from .trKPFM_translator import TRKPFMTranslator
-from .oneview import OneViewTranslator
-from .ptychography import PtychographyTranslator
-from .sporc import SporcTranslator
-from .time_series import MovieTranslator
-from .translator import Translator
-from .beps_data_generator import FakeDataGenerator
-from .labview_h5_patcher import LabViewH5Patcher
+__getattr__, __dir__ = attach_lazy(__name__,
+                                   ['be_odf', 'be_odf_relaxation', 'beps_ndf', 'general_dynamic_mode', 'gmode_iv',
+                                    'gmode_line', 'gmode_tune', 'image', 'ndata_translator', 'numpy_translator',
+                                    'trKPFM_translator', 'igor_ibw', 'oneview', 'ptychography', 'sporc',
+                                    'time_series', 'translator', 'utils', 'df_utils', 'beps_data_generator',
+                                    'labview_h5_patcher'],
+                                   {'BEodfTranslator': 'be_odf',
+                                    'BEodfRelaxationTranslator': 'be_odf_relaxation',
+                                    'BEPSndfTranslator': 'beps_ndf',
+                                    'GDMTranslator': 'general_dynamic_mode',
+                                    'GIVTranslator': 'gmode_iv',
+                                    'GLineTranslator': 'gmode_line',
+                                    'GTuneTranslator': 'gmode_tune',
+                                    'IgorIBWTranslator': 'igor_ibw',
+                                    'ImageTranslator': 'image',
+                                    'NDataTranslator': 'ndata_translator',
+                                    'NumpyTranslator': 'numpy_translator',
+                                    'TRKPFMTranslator': 'trKPFM_translator',
+                                    'OneViewTranslator': 'oneview',
+                                    'PtychographyTranslator': 'ptychography',
+                                    'SporcTranslator': 'sporc',
+                                    'MovieTranslator': 'time_series',
+                                    'Translator': 'translator',
+                                    'FakeDataGenerator': 'beps_data_generator',
+                                    'LabViewH5Patcher': 'labview_h5_patcher'})
 
 __all__ = ['Translator', 'BEodfTranslator', 'BEPSndfTranslator', 'BEodfRelaxationTranslator',
            'GIVTranslator', 'GLineTranslator', 'GTuneTranslator', 'GDMTranslator', 'PtychographyTranslator',
@@ -276,7 +276,8 @@ class BEodfTranslator(Translator):
         """
         BEPS_chunks = calc_chunks([num_pix, tot_bins],
                                   np.complex64(0).itemsize,
-                                  unit_chunks=(1, bins_per_step))
+                                  unit_chunks=(1, bins_per_step),
+                                  access='pixel')
         ds_main_data = MicroDataset('Raw_Data', data=[],
                                     maxshape=(num_pix, tot_bins),
                                     dtype=np.complex64,
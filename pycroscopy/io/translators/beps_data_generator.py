@@ -62,7 +62,8 @@ class FakeDataGenerator(Translator):
 
         """
 
-        file_list = self._parse_file_path(folder, self.image_ext)
+        # The images provide the coefficients in the order of their numbered names
+        file_list = sorted(self._parse_file_path(folder, self.image_ext), key=self.__image_number)
 
         images = list()
 
@@ -77,6 +78,14 @@ class FakeDataGenerator(Translator):
 
         return images
 
+    @staticmethod
+    def __image_number(image_path):
+        """
+        Sort key of the coefficient images named '1.tif', '2.tif', ..., '11.tif'
+        """
+        name = os.path.splitext(os.path.basename(image_path))[0]
+        return (int(name), name) if name.isdigit() else (np.inf, name)
+
     @staticmethod
     def _parse_file_path(path, ftype='all'):
         """
@@ -127,7 +136,7 @@ class FakeDataGenerator(Translator):
                   data_type='BEPSData', mode='DC modulation mode', field_mode='in and out-of-field',
                   n_cycles=1, FORC_cycles=1, FORC_repeats=1, loop_a=1, loop_b=4,
                   cycle_frac='full', image_folder=beps_image_folder, bin_factor=None,
-                  bin_func=np.mean, image_type='.tif'):
+                  bin_func=np.mean, image_type='.tif', seed=None):
         """
 
         Parameters
@@ -184,6 +193,8 @@ class FakeDataGenerator(Translator):
             numpy.mean.
         image_type : str
             File extension of images to be read.  Default '.tif'
+        seed : uint, optional
+            Seed for the random number generator that produces the noise in the guesses.  Default None - unseeded
 
         Returns
         -------
@@ -215,6 +226,7 @@ class FakeDataGenerator(Translator):
         self.n_spec_bins = n_bins*self.n_sho_bins
         self.h5_path = h5_path
         self.image_ext = image_type
+        self._rand_gen = np.random.RandomState(seed)
 
         '''
         Check if a bin_factor is given.  Set up binning objects if it is.
@@ -266,8 +278,8 @@ class FakeDataGenerator(Translator):
         self.h5_loop_fit[:] = np.tile(realToCompound(coef_mat, loop_fit32),
                                       [1, int(self.n_loops / self.n_fields)])
 
-        self.h5_loop_guess[:] = np.tile(realToCompound(coef_mat * get_noise_vec(coef_mat.shape, 0.1),
-                                                       loop_fit32),
+        loop_noise = get_noise_vec(coef_mat.shape, 0.1, rand_gen=self._rand_gen)
+        self.h5_loop_guess[:] = np.tile(realToCompound(coef_mat * loop_noise, loop_fit32),
                                         [1, int(self.n_loops / self.n_fields)])
 
         self._calc_raw()
@@ -399,7 +411,8 @@ class FakeDataGenerator(Translator):
         raw_chunking = calc_chunks([self.n_pixels,
                                     self.n_spec_bins],
                                    np.complex64(0).itemsize,
-                                   unit_chunks=[1, self.n_bins])
+                                   unit_chunks=[1, self.n_bins],
+                                   access='pixel')
 
         ds_raw_data = MicroDataset('Raw_Data', data=[],
                                    maxshape=[self.n_pixels, self.n_spec_bins],
@@ -449,7 +462,8 @@ class FakeDataGenerator(Translator):
         sho_chunking = calc_chunks([self.n_pixels,
                                     self.n_sho_bins],
                                    sho32.itemsize,
-                                   unit_chunks=[1, 1])
+                                   unit_chunks=[1, 1],
+                                   access='pixel')
         ds_sho_fit = MicroDataset('Fit', data=[],
                                   maxshape=[self.n_pixels, self.n_sho_bins],
                                   dtype=sho32,
@@ -497,7 +511,8 @@ class FakeDataGenerator(Translator):
         # Create the loop fit and guess MicroDatasets
         loop_chunking = calc_chunks([self.n_pixels, self.n_loops],
                                     loop_fit32.itemsize,
-                                    unit_chunks=[1, 1])
+                                    unit_chunks=[1, 1],
+                                    access='pixel')
         ds_loop_fit = MicroDataset('Fit', data=[],
                                    maxshape=[self.n_pixels, self.n_loops],
                                    dtype=loop_fit32,
@@ -613,66 +628,95 @@ class FakeDataGenerator(Translator):
         field = self.h5_sho_spec_vals[self.h5_sho_spec_vals.attrs['Field']].squeeze()
         of_inds = field == 0
         if_inds = field == 1
-        # determine how many pixels can be read at once
-        mem_per_pix = vdc_vec.size*np.float32(0).itemsize
-        free_mem = self.max_ram-vdc_vec.size*vdc_vec.dtype.itemsize*6
-        batch_size = int(free_mem/mem_per_pix)
-        batches = gen_batches(self.n_pixels, batch_size)
+        noise_coefs = np.array([amp_noise, resp_noise, q_noise, phase_noise])[:, None, None]
+
+        # The loops, SHO parameters and noise of a pixel take about a dozen double precision values per SHO bin
+        batches = self._get_batches(self.n_sho_bins * np.float64(0).itemsize * 12, self.h5_sho_fit)
 
         for pix_batch in batches:
-            R_OF = np.array([loop_fit_function(vdc_vec[of_inds], coef) for coef in coef_OF_mat[pix_batch]])
-            R_IF = np.array([loop_fit_function(vdc_vec[if_inds], coef) for coef in coef_IF_mat[pix_batch]])
+            # Evaluate the loops of every pixel in the batch at once
+            R_OF = loop_fit_function(vdc_vec[of_inds], coef_OF_mat[pix_batch, :9])
+            R_IF = loop_fit_function(vdc_vec[if_inds], coef_IF_mat[pix_batch, :9])
             R_mat = np.stack([R_IF, R_OF], axis=2).reshape(-1, self.n_sho_bins)
 
             del R_OF, R_IF
 
-            amp = np.abs(R_mat)
-            resp = coef_OF_mat[pix_batch, 9, None] * np.ones_like(R_mat)
-            q_val = coef_OF_mat[pix_batch, 10, None] * np.ones_like(R_mat)
-            phase = np.sign(R_mat) * np.pi / 2
+            sho_parms = np.empty((4,) + R_mat.shape)
+            sho_parms[0] = np.abs(R_mat)
+            sho_parms[1] = coef_OF_mat[pix_batch, 9, None]
+            sho_parms[2] = coef_OF_mat[pix_batch, 10, None]
+            sho_parms[3] = np.sign(R_mat) * np.pi / 2
 
-            self.h5_sho_fit[pix_batch, :] = realToCompound(np.hstack([amp,
-                                                                      resp,
-                                                                      q_val,
-                                                                      phase,
-                                                                      np.ones_like(R_mat)]),
-                                                           sho32)
+            del R_mat
 
-            self.h5_sho_guess[pix_batch, :] = realToCompound(np.hstack([amp*get_noise_vec(self.n_sho_bins, amp_noise),
-                                                                        resp*get_noise_vec(self.n_sho_bins, resp_noise),
-                                                                        q_val*get_noise_vec(self.n_sho_bins, q_noise),
-                                                                        phase*get_noise_vec(self.n_sho_bins, phase_noise),
-                                                                        np.ones_like(R_mat)]),
-                                                             sho32)
+            self.h5_sho_fit[pix_batch, :] = self.__sho_to_compound(sho_parms)
 
-            self.h5_file.flush()
+            sho_parms *= get_noise_vec(sho_parms.shape, noise_coefs, rand_gen=self._rand_gen)
+            self.h5_sho_guess[pix_batch, :] = self.__sho_to_compound(sho_parms)
 
         return
 
+    @staticmethod
+    def __sho_to_compound(sho_parms):
+        """
+        Packs the amplitude, frequency, quality factor and phase arranged as [parameter, pixel, step] into a sho32
+        array with a unit R2 criterion
+        """
+        sho_mat = np.empty(sho_parms.shape[1:], dtype=sho32)
+        for name, parm_mat in zip(sho32.names, sho_parms):
+            sho_mat[name] = parm_mat
+        sho_mat[sho32.names[-1]] = 1
+
+        return sho_mat
+
     def _calc_raw(self):
         """
+        Build the raw data from the SHO fit by evaluating the SHO response of every step of every pixel in a batch
 
         Returns
         -------
+        None
 
         """
-        mem_per_pix = self.n_sho_bins*self.h5_sho_fit.dtype.itemsize+self.n_spec_bins*self.h5_raw.dtype.itemsize
-        free_mem = self.max_ram
-        batch_size = int(free_mem/mem_per_pix)
-        batches = gen_batches(self.n_pixels, batch_size)
+        # The double precision complex response is built before it is cast to the dataset type
+        mem_per_pix = self.n_sho_bins * self.h5_sho_fit.dtype.itemsize + \
+            self.n_spec_bins * (np.complex128(0).itemsize * 2 + self.h5_raw.dtype.itemsize)
+        batches = self._get_batches(mem_per_pix, self.h5_raw)
 
         w_vec = self.h5_spec_vals[get_attr(self.h5_spec_vals, 'Frequency')].squeeze()
         w_vec = w_vec[:self.n_bins]
 
         for pix_batch in batches:
-            sho_chunk = self.h5_sho_fit[pix_batch, :].flatten()
+            sho_chunk = self.h5_sho_fit[pix_batch, :]
 
-            raw_data = np.zeros([sho_chunk.shape[0], self.n_bins], dtype=np.complex64)
-            for iparm, sho_parms in enumerate(sho_chunk):
-                raw_data[iparm, :] = SHOfunc(sho_parms, w_vec)
+            # SHOfunc broadcasts the parameters of shape [pixel, step, 1] against the frequencies
+            raw_data = SHOfunc([sho_chunk[name][:, :, None] for name in sho32.names[:4]], w_vec)
 
-            self.h5_raw[pix_batch, :] = raw_data.reshape([-1, self.n_spec_bins])
+            self.h5_raw[pix_batch, :] = raw_data.reshape([-1, self.n_spec_bins]).astype(self.h5_raw.dtype)
 
-            self.h5_file.flush()
+        return
+
+    def _get_batches(self, mem_per_pix, h5_dset):
+        """
+        Splits the pixels into batches that fit in the available memory and that are aligned with the chunks of the
+        dataset being written, so that every chunk is compressed and written exactly once
+
+        Parameters
+        ----------
+        mem_per_pix : uint
+            Memory, in bytes, needed to compute a single pixel
+        h5_dset : HDF5 Dataset
+            Dataset that the batches will be written to
+
+        Returns
+        -------
+        batches : generator of slices
+            Pixels in each batch
+        """
+        batch_size = int(self.max_ram / mem_per_pix)
+        if h5_dset.chunks is not None:
+            chunk_rows = h5_dset.chunks[0]
+            batch_size = max(chunk_rows, batch_size - batch_size % chunk_rows)
+        batch_size = max(1, min(batch_size, self.n_pixels))
 
-        return
\ No newline at end of file
+        return gen_batches(self.n_pixels, batch_size)
@@ -452,7 +452,8 @@ class BEPSndfTranslator(Translator):
 
         beps_chunks = calc_chunks([num_pix, tot_pts],
                                   np.complex64(0).itemsize,
-                                  unit_chunks=(1, max_bins_per_pixel))
+                                  unit_chunks=(1, max_bins_per_pixel),
+                                  access='pixel')
         ds_main_data = MicroDataset('Raw_Data',
                                     np.zeros(shape=(1, tot_pts), dtype=np.complex64),
                                     chunking=beps_chunks,
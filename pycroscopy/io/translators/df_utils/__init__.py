@@ -2,4 +2,5 @@ from . import be_utils
 from . import gmode_utils
 from . import dm4reader
 from . import parse_dm3
-from . import beps_gen_utils
\ No newline at end of file
+from . import beps_gen_utils
+from . import image_stack
@@ -6,6 +6,7 @@ Created on Tue Jan 05 07:55:56 2016
 """
 
 from __future__ import division, print_function, absolute_import, unicode_literals
+from multiprocessing import Pool
 from os import path
 from warnings import warn
 
@@ -20,7 +21,6 @@ from ...io_hdf5 import ioHDF5
 from ...io_utils import getAvailableMem, recommendCores
 from ...microdata import MicroDataset, MicroDataGroup
 from ....analysis.optimize import Optimize
-from ....processing.proc_utils import buildHistogram
 from ....viz.plot_utils import plot_1d_spectrum, plot_2d_spectrogram, plot_histgrams
 
 
@@ -368,17 +368,41 @@ def generatePlotGroups(h5_main, hdf, mean_resp, folder_path, basename, max_resp=
 #     col_names = [col for col in col_names if col not in std_cols + ignore_plot_groups]
     
     freq_inds = spec_inds[spec_inds.attrs['Frequency']].flatten()
-    
+    freq_vals = h5_freq[()]
+
+    """
+    Group the spectroscopic columns by UDVS step once with a stable sort so that the columns of any set of steps
+    can be found without scanning the UDVS indices for every step
+    """
+    udvs_ind_vec = np.squeeze(UDVS_inds[()])
+    col_order = np.argsort(udvs_ind_vec, kind='mergesort')
+    sorted_steps = udvs_ind_vec[col_order]
+
+    plot_groups = list()
     for col_name in col_names:
         ref = UDVS.attrs[col_name]
 #         Make sure we're actually dealing with a reference of some type
         if not isinstance(ref, h5py.RegionReference):
             continue
         # 4. Access that column of the data through region reference
-        steps = np.where(np.isfinite(UDVS[ref]))[0]
-        step_inds = np.array([np.where(UDVS_inds.value == step)[0] for step in steps]).flatten()
-        """selected_UDVS_steps = UDVS[ref]
-        selected_UDVS_steps = selected_UDVS_steps[np.isfinite(selected_UDVS_steps)]"""
+        udvs_col = UDVS[ref]
+        steps = np.where(np.isfinite(udvs_col))[0]
+        starts = np.searchsorted(sorted_steps, steps, side='left')
+        ends = np.searchsorted(sorted_steps, steps, side='right')
+        step_inds = np.concatenate([col_order[start:end] for start, end in zip(starts, ends)] +
+                                   [np.zeros(0, dtype=col_order.dtype)])
+        plot_groups.append((col_name, udvs_col, step_inds))
+
+    if do_histogram:
+        """
+        Build the histograms for all plot groups in a single pass through the main dataset
+        """
+        hist = BEHistogram()
+        group_hists = hist.buildPlotGroupHists(h5_main, [step_inds for _, _, step_inds in plot_groups],
+                                               max_response=max_resp, min_response=min_resp,
+                                               max_mem_mb=max_mem_mb, debug=debug)
+
+    for pg_ind, (col_name, udvs_col, step_inds) in enumerate(plot_groups):
 
         (step_averaged_vec, mean_spec) = reshape_mean_data(spec_inds, step_inds, mean_resp)
             
@@ -388,10 +412,10 @@ def generatePlotGroups(h5_main, hdf, mean_resp, folder_path, basename, max_resp=
         We are assuming that there is only one excitation waveform per plot group
         """
         freq_slice = np.unique(freq_inds[step_inds])
-        freq_vec = h5_freq.value[freq_slice]
+        freq_vec = freq_vals[freq_slice]
         
         num_bins = len(freq_slice)  # int(len(freq_inds)/len(UDVS[ref]))
-        pg_data = np.repeat(UDVS[ref], num_bins)
+        pg_data = np.repeat(udvs_col, num_bins)
             
         ds_mean_spec = MicroDataset('Mean_Spectrogram', mean_spec, dtype=np.complex64)
         ds_step_avg = MicroDataset('Step_Averaged_Response', step_averaged_vec, dtype=np.complex64)
@@ -432,12 +456,9 @@ def generatePlotGroups(h5_main, hdf, mean_resp, folder_path, basename, max_resp=
         
         if do_histogram:
             """
-            Build the histograms for the current plot group
+            Write the histograms for the current plot group
             """
-            hist = BEHistogram()
-            hist_mat, hist_labels, hist_indices, hist_indices_labels = \
-                hist.buildPlotGroupHist(h5_main, step_inds, max_response=max_resp,
-                                        min_response=min_resp, max_mem_mb=max_mem_mb, debug=debug)
+            hist_mat, hist_labels, hist_indices, hist_indices_labels = group_hists[pg_ind]
             ds_hist = MicroDataset('Histograms', hist_mat, dtype=np.int32,
                                    chunking=(1, hist_mat.shape[1]),compression='gzip')
             hist_slice_dict = dict()
@@ -1232,9 +1253,52 @@ def createSpecVals(udvs_mat, spec_inds, bin_freqs, bin_wfm_type, parm_dict,
 """
 BEHistogram Class and Functions
 """
+def _bin_hist_chunk(data_mat, col_map, col_targets, num_freqs, num_y_bins, min_list, max_list):
+    """
+    Bins a chunk of pixels into the amplitude, phase, real and imaginary histograms in one pass
+
+    Parameters
+    ----------
+    data_mat : 2D complex numpy array
+        Pixels x columns read from the dataset
+    col_map : 1D numpy int array or None
+        Column of `data_mat` for each entry in `col_targets`.  None if they correspond one to one
+    col_targets : 1D numpy int array
+        Frequency row of the histogram that each column is binned into.  Negative for columns that are not binned
+    num_freqs : unsigned int
+        Number of frequency rows in the histograms
+    num_y_bins : unsigned int
+        Number of bins along the response axis
+    min_list : list of float
+        Lower limit of binning for each of the four components
+    max_list : list of float
+        Upper limit of binning for each of the four components
+
+    Returns
+    -------
+    chunk_hist : 3D numpy int32 array
+        The 4 histograms (component x frequency x response bin) of this chunk
+    """
+    if col_map is not None:
+        data_mat = data_mat[:, col_map]
+    valid = np.logical_and(col_targets >= 0, col_targets < num_freqs)
+    data_mat = data_mat[:, valid]
+    row_offsets = col_targets[valid] * num_y_bins
+
+    chunk_hist = np.zeros((4, num_freqs, num_y_bins), dtype=np.int32)
+    for ifunc, func in enumerate([np.abs, np.angle, np.real, np.imag]):
+        min_resp = min_list[ifunc]
+        max_resp = max_list[ifunc]
+        y_bins = np.clip(func(data_mat), min_resp, max_resp)
+        y_bins = np.rint((y_bins - min_resp) * (1.0 / (max_resp - min_resp)) * (num_y_bins - 1))
+        flat_bins = (y_bins.astype(np.int64) + row_offsets).ravel()
+        chunk_hist[ifunc] = np.bincount(flat_bins, minlength=num_freqs * num_y_bins).reshape(num_freqs, num_y_bins)
+
+    return chunk_hist
+
+
 class BEHistogram():
     # TODO: Turn into proper class
-    # TODO: Parallelize Histogram generation
     """
     Class just functions as a container so we can have shared objects
     Chris Smith -- csmith55@utk.edu
@@ -1330,7 +1394,8 @@ class BEHistogram():
         hdf.close()
 
 
-    def buildBEHist(self,h5_main, max_response=[], min_response=[],max_mem_mb=1024, max_bins=256, debug=False):
+    def buildBEHist(self,h5_main, max_response=[], min_response=[],max_mem_mb=1024, max_bins=256, debug=False,
+                    cores=1):
         """
         Creates Histograms from dataset
 
@@ -1388,13 +1453,13 @@ class BEHistogram():
 #         self.N_y_bins = np.min( (max_bins, np.rint(2*(self.N_pixels*self.N_spectral_steps)**(1.0/3.0))))
         # print('{} bins will be used'.format(self.N_y_bins))
 
-        ds_hist = self.__datasetHist(h5_main, active_udvs_steps, x_hist, debug)
+        ds_hist = self.__datasetHist(h5_main, [active_udvs_steps], x_hist, debug, cores=cores)[0]
 
         return ds_hist
 
     def buildPlotGroupHist(self, h5_main, active_spec_steps, max_response=[],
                            min_response=[], max_mem_mb=1024, max_bins=256,
-                           std_mult=3, debug=False):
+                           std_mult=3, debug=False, cores=1):
         """
         Creates Histograms for a given plot group
 
@@ -1419,6 +1484,9 @@ class BEHistogram():
             binning
         debug : boolean
             Turns on debug printing statements if true.  Default False.
+        cores : unsigned int
+            Number of processes used to bin the pixel chunks.  Default 1.
+            Set to None to let the number be chosen automatically.
 
         Returns
         -------
@@ -1431,6 +1499,48 @@ class BEHistogram():
         hist_index_labels : list of strings
             labels for the hist_indices array
 
+        """
+        return self.buildPlotGroupHists(h5_main, [active_spec_steps], max_response=max_response,
+                                        min_response=min_response, max_mem_mb=max_mem_mb, max_bins=max_bins,
+                                        std_mult=std_mult, debug=debug, cores=cores)[0]
+
+    def buildPlotGroupHists(self, h5_main, plot_group_spec_steps, max_response=[],
+                            min_response=[], max_mem_mb=1024, max_bins=256,
+                            std_mult=3, debug=False, cores=1):
+        """
+        Creates Histograms for several plot groups in a single pass through the dataset
+
+        Parameters
+        ----------
+        h5_main : HDF5 Dataset object
+            Dataset to be historammed
+        plot_group_spec_steps : list of numpy arrays
+            active spectral steps in each plot group
+        max_response : numpy array
+            maximum amplitude at each pixel
+        min_response : numpy array
+            minimum amplitude at each pixel
+        max_mem : Unsigned integer
+            maximum number of Mb allowed for use.  Used to calculate the
+            number of pixels to load in a chunk
+        max_bins : integer
+            maximum number of spectroscopic bins
+        std_mult : integer
+            number of standard deviations from the mean of
+            max_response and min_response to include in
+            binning
+        debug : boolean
+            Turns on debug printing statements if true.  Default False.
+        cores : unsigned int
+            Number of processes used to bin the pixel chunks.  Default 1.
+            Set to None to let the number be chosen automatically.
+
+        Returns
+        -------
+        hist_list : list of tuples
+            (hist_mat, hist_labels, hist_indices, hist_index_labels) for each plot group.
+            See buildPlotGroupHist
+
         """
         free_mem = getAvailableMem()
         if debug: print('We have {} bytes of memory available'.format(free_mem))
@@ -1440,7 +1550,7 @@ class BEHistogram():
         Check that max_response and min_response have been defined.
         Call __getminmaxresponse__ is not
         """
-        if max_response == [] or min_response == []:
+        if len(max_response) == 0 or len(min_response) == 0:
             max_response = np.amax(np.abs(h5_main),axis=0)
             min_response = np.amin(np.abs(h5_main),axis=0)
 
@@ -1451,12 +1561,12 @@ class BEHistogram():
         """
         Load auxilary datasets and extract needed parameters
         """
-        step_ind_mat = getAuxData(h5_main,auxDataName=['UDVS_Indices'])[0].value
-        spec_ind_mat = getAuxData(h5_main,auxDataName=['Spectroscopic_Indices'])[0].value
+        step_ind_mat = getAuxData(h5_main,auxDataName=['UDVS_Indices'])[0][()]
+        spec_ind_mat = getAuxData(h5_main,auxDataName=['Spectroscopic_Indices'])[0][()]
         self.N_spectral_steps = np.size(step_ind_mat)
 
-        active_udvs_steps = np.unique(step_ind_mat[active_spec_steps])
-        self.num_udvs_steps = len(active_udvs_steps)
+        group_udvs_steps = [np.unique(step_ind_mat[active_spec_steps]) for active_spec_steps in plot_group_spec_steps]
+        self.num_udvs_steps = sum([len(active_udvs_steps) for active_udvs_steps in group_udvs_steps])
 
         """
         Set up frequency axis of histogram, same for all histograms in a single dataset
@@ -1475,14 +1585,17 @@ class BEHistogram():
         self.N_y_bins = np.int(np.min( (max_bins, np.rint(2*(self.N_pixels*self.N_spectral_steps)**(1.0/3.0)))))
 
 
-        ds_hist = self.__datasetHist(h5_main, active_udvs_steps, x_hist, debug)
-        if debug: print(np.shape(ds_hist))
-        if debug: print('ds_hist max',np.max(ds_hist),
-                        'ds_hist min',np.min(ds_hist))
+        group_hists = self.__datasetHist(h5_main, group_udvs_steps, x_hist, debug, cores=cores)
 
-        hist_mat, hist_labels, hist_indices, hist_index_labels = self.__reshapeHist(ds_hist)
+        hist_list = list()
+        for ds_hist in group_hists:
+            if debug: print(np.shape(ds_hist))
+            if debug: print('ds_hist max',np.max(ds_hist),
+                            'ds_hist min',np.min(ds_hist))
 
-        return hist_mat, hist_labels, hist_indices, hist_index_labels
+            hist_list.append(self.__reshapeHist(ds_hist))
+
+        return hist_list
 
     def __reshapeHist(self,ds_hist):
         """
@@ -1522,121 +1635,133 @@ class BEHistogram():
 
         return hist_mat, hist_labels, hist_indices, hist_index_labels
 
-    def __datasetHist(self, h5_main, active_udvs_steps, x_hist, debug=False):
+    def __datasetHist(self, h5_main, group_udvs_steps, x_hist, debug=False, cores=1):
         """
-        Create the histogram for a single dataset
+        Create the histograms of one or more plot groups in a single dataset
 
         Parameters
         ----------
         h5_main : HDF5 Dataset
             Main_Dataset to be histogramed
-        active_udvs_steps : numpy array
-            the active udvs steps in the current plot group
+        group_udvs_steps : list of numpy arrays
+            the active udvs steps in each plot group
         x_hist : 1d numpy array
             the spectroscopic indices matrix, used to find the
             spectroscopic indices of each udvs step
+        cores : unsigned int, optional
+            Number of processes used to bin the pixel chunks.  Default 1.
+            Set to None to let the number be chosen automatically.
 
         Returns
         -------
-        ds_hist : numpy array
-            the 4 histogram matrices
-
-        """
-
+        group_hists : numpy array
+            the 4 histogram matrices of each plot group
+
+        """
+
+
+        """
+        Find the columns of every active UDVS step and the frequency row of the histogram that each of them feeds.
+        Within a step, a column whose frequency is offset by v from the first frequency of the step is binned
+        into the row given by the offset of the v-th column of that step.  The histograms of all plot groups are
+        stacked along the frequency rows.
+        The columns of all steps are found with a single sort of the UDVS indices
+        """
+        num_groups = len(group_udvs_steps)
+        col_order = np.argsort(x_hist[1], kind='mergesort')
+        sorted_steps = x_hist[1][col_order]
+
+        step_cols = list()
+        col_targets = list()
+        for group_ind, active_udvs_steps in enumerate(group_udvs_steps):
+            starts = np.searchsorted(sorted_steps, active_udvs_steps, side='left')
+            ends = np.searchsorted(sorted_steps, active_udvs_steps, side='right')
+            for start, end in zip(starts, ends):
+                if end == start:
+                    continue
+                udvs_bins = col_order[start:end]
+                freq_offsets = x_hist[0][udvs_bins] - x_hist[0][udvs_bins[0]]
+                targets = np.full(udvs_bins.size, -1, dtype=np.int64)
+                in_step = np.logical_and(freq_offsets >= 0, freq_offsets < udvs_bins.size)
+                targets[in_step] = freq_offsets[freq_offsets[in_step]]
+                targets[targets >= self.N_freqs] = -1
+                targets[targets >= 0] += group_ind * self.N_freqs
+                step_cols.append(udvs_bins)
+                col_targets.append(targets)
+
+        if len(step_cols) == 0:
+            return np.zeros((num_groups, 4, self.N_freqs, self.N_y_bins), dtype=np.int32)
+
+        # Plot groups may share columns. Each column is read once and handed to every group that uses it
+        step_cols = np.concatenate(step_cols)
+        col_targets = np.concatenate(col_targets)
+        cols, col_map = np.unique(step_cols, return_inverse=True)
+        if cols.size == step_cols.size:
+            col_targets = col_targets[np.argsort(step_cols)]
+            col_map = None
+
+        # h5py reads a contiguous block of columns much faster than a list of columns
+        if cols[-1] - cols[0] + 1 == cols.size:
+            col_sel = slice(int(cols[0]), int(cols[-1]) + 1)
+        else:
+            col_sel = cols
 
         """
-        Estimate maximum number of pixels to read at once
+        Estimate maximum number of pixels to read at once. Each value read needs a few temporary arrays for binning
         """
-        max_pixels = maxReadPixels(self.max_mem,self.N_pixels, self.num_udvs_steps, bytes_per_bin=h5_main.dtype.itemsize*self.N_y_bins*self.N_freqs)
+        max_pixels = int(maxReadPixels(self.max_mem, self.N_pixels, col_targets.size,
+                                       bytes_per_bin=h5_main.dtype.itemsize + 24))
 
         """
         Divide the pixels into chunks that will fit in memory
         """
-        pix_chunks = np.append(np.arange(0,self.N_pixels,max_pixels,dtype=np.int),self.N_pixels)
+        pix_chunks = np.append(np.arange(0, self.N_pixels, max_pixels, dtype=np.int64), self.N_pixels)
+        num_chunks = len(pix_chunks) - 1
+
+        bin_args = (col_map, col_targets, num_groups * self.N_freqs, self.N_y_bins,
+                    [self.min_response, -np.pi, self.min_response, self.min_response],
+                    [self.max_response, np.pi, self.max_response, self.max_response])
 
         """
         Initialize the histograms
         """
-        ds_hist = np.zeros((4,self.N_freqs,self.N_y_bins),dtype=np.int32)
+        ds_hist = np.zeros((4, num_groups * self.N_freqs, self.N_y_bins), dtype=np.int32)
+
+        cores = recommendCores(num_chunks, cores)
+        pool = None
+        if cores > 1:
+            pool = Pool(processes=cores)
 
         """
-        loop over pixels
+        loop over pixels. Chunks are read once for all UDVS steps and binned in the background while the next
+        chunk is read
         """
-        for ichunk in range(len(pix_chunks)-1):
+        pending = None
+        for ichunk in range(num_chunks):
             if debug: print('pixel chunk', ichunk)
+            print('Binning BEHistogram...{}% --pixels {}-{}'.format(np.rint(100 * pix_chunks[ichunk] / self.N_pixels),
+                                                                   pix_chunks[ichunk], pix_chunks[ichunk + 1] - 1))
 
-            chunk = range(pix_chunks[ichunk], pix_chunks[ichunk+1])
+            data_mat = h5_main[pix_chunks[ichunk]:pix_chunks[ichunk + 1], col_sel]
 
-            """
-        Loop over active UDVS steps
-            """
-            for iudvs in range(self.num_udvs_steps):
-                selected = (iudvs+chunk[0]*self.num_udvs_steps) % np.rint(self.num_udvs_steps*self.N_pixels/10) == 0
-                if selected:
-                    per_done = np.rint(100*(iudvs+chunk[0]*self.num_udvs_steps)/(self.num_udvs_steps*self.N_pixels))
-                    print('Binning BEHistogram...{}% --pixels {}-{}, step # {}'.format(per_done,chunk[0],chunk[-1],iudvs))
-                udvs_step = active_udvs_steps[iudvs]
-                if debug: print('udvs step', udvs_step)
+            if pool is None:
+                ds_hist += _bin_hist_chunk(data_mat, *bin_args)
+                continue
 
-                """
-        Get the correct Spectroscopic bins for the current UDVS step
-        Read desired pixel chunk from these bins for Main_Data into data_mat
-                """
-                udvs_bins = np.where(x_hist[1] == udvs_step)[0]
-                if debug:
-                    print(np.shape(x_hist))
-                data_mat = h5_main[pix_chunks[ichunk]:pix_chunks[ichunk+1], (udvs_bins)]
+            result = pool.apply_async(_bin_hist_chunk, (data_mat,) + bin_args)
+            if pending is not None:
+                ds_hist += pending.get()
+            pending = result
 
-                """
-        Get the frequecies that correspond to the current UDVS bins from the total x_hist
-                """
-                this_x_hist = np.take(x_hist[0], udvs_bins)
-                this_x_hist = this_x_hist-this_x_hist[0]
-                this_x_hist = np.transpose(np.tile(this_x_hist, (1, pix_chunks[ichunk+1]-pix_chunks[ichunk])))
-                this_x_hist = np.squeeze(this_x_hist)
-
-                N_x_bins = np.shape(this_x_hist)[0]
-                if debug:
-                    print('N_x_bins',N_x_bins)
-                    print(this_x_hist)
-                    print(np.shape(this_x_hist))
-                """
-        Create weighting vector.  If setting all to one value, can be a scalar.
-                """
-                weighting_vec = 1
+        if pending is not None:
+            ds_hist += pending.get()
 
-                if debug: print(np.shape(data_mat))
+        if pool is not None:
+            pool.close()
+            pool.join()
 
-                """
-        Set up the list of functions to call and their corresponding maxima and minima
-                """
-                func_list = [np.abs, np.angle, np.real, np.imag]
-                max_list = [self.max_response, np.pi, self.max_response, self.max_response]
-                min_list = [self.min_response, -np.pi, self.min_response, self.min_response]
-                """
-        Get the Histograms and store in correct place in ds_hist
-                """
-                for ifunc, func in enumerate(func_list):
-                    chunk_hist = buildHistogram(this_x_hist,
-                                                data_mat,
-                                                N_x_bins,
-                                                self.N_y_bins,
-                                                weighting_vec,
-                                                min_list[ifunc],
-                                                max_list[ifunc],
-                                                func,
-                                                debug)
-                    if debug:
-                        print('chunkhist-{}'.format(func.__name__), np.shape(chunk_hist))
-                        print(chunk_hist.dtype)
-
-                    for (i, ifreq) in enumerate(udvs_bins):
-                        ids_freq = this_x_hist[i]
-                        if debug:
-                            print(i, ifreq)
-                            print(ids_freq)
-                        ds_hist[ifunc, ids_freq, :] = np.add(ds_hist[ifunc, ids_freq, :], chunk_hist[i, :])
+        group_hists = np.reshape(ds_hist, (4, num_groups, self.N_freqs, self.N_y_bins)).transpose(1, 0, 2, 3)
 
-        return ds_hist
+        return group_hists
 
     
\ No newline at end of file
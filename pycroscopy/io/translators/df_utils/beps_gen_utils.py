@@ -43,16 +43,19 @@ def build_loop_from_mat(loop_mat, num_steps):
                       loop_mat[0, int(num_steps / 4) + 1: int(num_steps / 2)]))
 
 
-def get_noise_vec(num_pts, noise_coeff):
+def get_noise_vec(num_pts, noise_coeff, rand_gen=None):
     """
     Calculate a multiplicative noise vector from the `noise_coeff`
 
     Parameters
     ----------
-    num_pts : uint
-        number of points in the vector
-    noise_coeff : float
-        Noise coefficient that determines the variation in the noise vector
+    num_pts : uint or tuple of uint
+        number of points in the vector or shape of the noise array
+    noise_coeff : float or numpy.ndarray
+        Noise coefficient that determines the variation in the noise vector.  An array of coefficients is
+        broadcast against the noise array
+    rand_gen : numpy.random.RandomState, optional
+        Random number generator to draw the noise from.  Default - the global numpy generator
 
     Returns
     -------
@@ -60,4 +63,6 @@ def get_noise_vec(num_pts, noise_coeff):
         1d noise vector array
 
     """
-    return np.ones(num_pts) * (1 + 0.5 * noise_coeff) - np.random.random(num_pts) * noise_coeff
+    if rand_gen is None:
+        rand_gen = np.random
+    return np.ones(num_pts) * (1 + 0.5 * noise_coeff) - rand_gen.random_sample(num_pts) * noise_coeff
@@ -55,10 +55,13 @@ dm_image_dtypes = {
 def imagedatadict_to_ndarray(imdict):
     """
     Converts the ImageData dictionary, imdict, to an nd image.
+    If the data was skipped while parsing lazily, the image is memory mapped from the file.
     """
     arr = imdict['Data']
     im = None
-    if isinstance(arr, array.array):
+    if isinstance(arr, dm_array_ref):
+        im = arr.to_ndarray(mmap=True)
+    elif isinstance(arr, array.array):
         im = np.asarray(arr, dtype=arr.typecode)
     elif isinstance(arr, structarray):
         t = tuple(arr.typecodes)
@@ -10,6 +10,7 @@ from __future__ import division, print_function, absolute_import, unicode_litera
 import collections
 import struct
 import array 
+import numpy as np
 
 DM4Header = collections.namedtuple('DM4Header', ('version', 'root_length', 'little_endian')) 
 DM4TagHeader = collections.namedtuple('DM4TagHeader', ('type', 'name', 'byte_length', 'array_length', 'data_type_code', 'header_offset', 'data_offset'))
@@ -241,6 +242,24 @@ def read_tag_data_array(dmfile, tag, endian):
     data = array.array(data_type.type_format)
     data.fromfile(dmfile, array_length)
     return data
+
+def read_tag_data_array_info(dmfile, tag):
+    '''
+    Locates the data of an array tag of a simple type without reading it.
+    :return: (byte offset of the data, numpy dtype, number of elements) or None if the tag is not such an array
+    '''
+    dmfile.seek(tag.data_offset)
+
+    _read_tag_garbage_str(dmfile)
+
+    (tag_array_length,  tag_array_types) = _read_tag_data_info(dmfile)
+
+    if tag_array_types[0] != 20 or len(tag_array_types) != 3 or tag_array_types[1] not in DM4DataTypeDict:
+        return None
+
+    data_type = DM4DataTypeDict[tag_array_types[1]]
+    # read_tag_data_array reads arrays with array.array which uses the native (little endian) byte order
+    return dmfile.tell(), np.dtype('<' + data_type.type_format), tag_array_types[2]
         
       
 class DM4File:
@@ -280,6 +299,21 @@ class DM4File:
     def read_tag_data(self, tag):
         '''Read the data associated with the passed tag'''
         return _read_tag_data(self.hfile, tag, self.endian_str)
+
+    def read_tag_data_as_ndarray(self, tag, mmap=True):
+        '''
+        Read the array associated with the passed tag as a 1D numpy array.
+        :param bool mmap: Memory map the array at its offset in the file instead of reading it
+        :return: numpy array or None if the tag is not an array of a simple type
+        '''
+        info = read_tag_data_array_info(self.hfile, tag)
+        if info is None:
+            return None
+        offset, dtype, length = info
+        if mmap:
+            return np.memmap(self.hfile.name, dtype=dtype, mode='r', offset=offset, shape=(length,))
+        self.hfile.seek(offset)
+        return np.fromfile(self.hfile, dtype=dtype, count=length)
      
     
     DM4TagDir = collections.namedtuple('DM4Dir', ('name', 'dm4_tag', 'named_subdirs', 'unnamed_subdirs','named_tags', 'unnamed_tags'))
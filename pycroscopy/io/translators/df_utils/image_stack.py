@@ -0,0 +1,481 @@
+"""
+Created on Oct 18, 2026
+
+Shared engine used by the image-stack translators (Movie, Ptychography, OneView) to decode, bin and write
+large numbers of image frames into a Raw_Data dataset
+"""
+
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import json
+import os
+from importlib import import_module
+import struct
+import zipfile
+from collections import OrderedDict
+from multiprocessing import Pool
+
+import numpy as np
+from skimage.measure import block_reduce
+
+from .io_image import read_image, no_bin, crop_image
+from ...hdf_utils import get_attr
+from ...io_utils import recommendCores
+from ...microdata import MicroDataset
+
+
+class FrameReader(object):
+    """
+    Picklable callable that reads a single image frame, crops and bins it and returns the flattened frame.
+    Only simple parameters are stored so that this object can be shipped to worker processes
+    """
+
+    def __init__(self, image_path='', bin_factor=None, bin_func=np.mean, crop_ammount=None, crop_method='percent',
+                 read_kwargs=None):
+        """
+        Parameters
+        ----------
+        image_path : str, optional
+            Absolute path to the folder holding the image files. Frames are read from os.path.join(image_path, frame)
+        bin_factor : tuple of uint, optional
+            Downsampling factor for each dimension.  Default is None - no binning.
+        bin_func : callable, optional
+            Function which will be called to calculate the return value of each block.  Default is numpy.mean.
+        crop_ammount : uint or list of uints, optional
+            How much should be cropped from the original image. See `crop_image`. Default is None - no cropping
+        crop_method : str, optional
+            Which cropping method should be used - 'percent' or 'absolute'. See `crop_image`
+        read_kwargs : dict, optional
+            Keyword arguments passed on to `read_image`
+        """
+        self.image_path = image_path
+        self.bin_factor = bin_factor
+        self.bin_func = bin_func
+        self.crop_ammount = crop_ammount
+        self.crop_method = crop_method
+        self.read_kwargs = dict() if read_kwargs is None else read_kwargs
+
+    def __call__(self, frame):
+        """
+        Parameters
+        ----------
+        frame : str or numpy.ndarray
+            Name of the image file or a 2D image that has already been read
+
+        Returns
+        -------
+        image : 1D numpy.ndarray of float32
+            Flattened, cropped and binned image
+        """
+        if isinstance(frame, np.ndarray):
+            image = frame
+        else:
+            image, _ = read_image(os.path.join(self.image_path, frame), **self.read_kwargs)
+        if self.crop_ammount is not None:
+            image = crop_image(image, self.crop_ammount, self.crop_method)
+        if self.bin_factor is not None:
+            image = block_reduce(image, self.bin_factor, self.bin_func)
+        else:
+            image = no_bin(image)
+
+        return np.asarray(image, dtype=np.float32).ravel()
+
+
+def write_image_stack(frame_list, frame_reader, h5_main, h5_mean_spec, h5_ronch, frames_as_rows=True,
+                      max_mem=1024 ** 3, cores=None):
+    """
+    Reads, bins and writes all frames in `frame_list` to `h5_main`.
+
+    Frames are decoded by a pool of worker processes in blocks. Each block is written in a single call that spans
+    whole chunks of `h5_main` along the frame axis while the next block is being decoded. The Spectroscopic Mean
+    and the Mean Ronchigram are accumulated in the same pass so the data is never read back from the file.
+
+    Parameters
+    ----------
+    frame_list : list of str or numpy.ndarray
+        File names of the frames or an array of frames with the frame index as the first axis
+    frame_reader : callable
+        Picklable function that takes one element of `frame_list` and returns the flattened frame. See `FrameReader`
+    h5_main : h5py.Dataset
+        Dataset which will hold the frames
+    h5_mean_spec : h5py.Dataset
+        Dataset which will hold the mean of each frame
+    h5_ronch : h5py.Dataset
+        Dataset which will hold the mean of all frames
+    frames_as_rows : Boolean, optional
+        Whether each frame is a row (True) or a column (False) of `h5_main`. Default True
+    max_mem : unsigned int, optional
+        Maximum memory in bytes that the in-flight blocks may occupy. Default 1 GB
+    cores : unsigned int, optional
+        Number of worker processes used to decode frames. Default None - decided by `recommendCores`.
+        Set to 1 to decode in the calling process
+
+    Returns
+    -------
+    None
+    """
+    num_frames = len(frame_list)
+    frame_axis = 0 if frames_as_rows else 1
+    frame_bytes = h5_ronch.size * np.dtype(np.float32).itemsize
+
+    # Two blocks are in flight at any time - the one being written and the one being decoded
+    frames_per_block = max(1, int(max_mem / (2 * frame_bytes)))
+    if h5_main.chunks is not None:
+        frames_per_chunk = h5_main.chunks[frame_axis]
+        frames_per_block = max(1, frames_per_block // frames_per_chunk) * frames_per_chunk
+    frames_per_block = min(frames_per_block, num_frames)
+
+    cores = recommendCores(num_frames, requested_cores=cores, lengthy_computation=True)
+
+    block_starts = list(range(0, num_frames, frames_per_block))
+
+    def __block(start):
+        return frame_list[start:min(start + frames_per_block, num_frames)]
+
+    mean_ronch = np.zeros(h5_ronch.shape, dtype=np.float64)
+    mean_spec = np.zeros(num_frames, dtype=np.float32)
+
+    pool = None
+    if cores > 1:
+        pool = Pool(processes=cores)
+        pending = pool.map_async(frame_reader, __block(block_starts[0]))
+
+    try:
+        for iblock, start in enumerate(block_starts):
+            end = min(start + frames_per_block, num_frames)
+            print('Processing frames {} to {} of {}'.format(start, end, num_frames))
+
+            if pool is not None:
+                frames = pending.get()
+                if iblock + 1 < len(block_starts):
+                    pending = pool.map_async(frame_reader, __block(block_starts[iblock + 1]))
+            else:
+                frames = [frame_reader(frame) for frame in __block(start)]
+
+            block = np.vstack(frames)
+            del frames
+
+            mean_spec[start:end] = np.mean(block, axis=1)
+            mean_ronch += np.sum(block, axis=0)
+
+            if frames_as_rows:
+                h5_main[start:end, :] = block
+            else:
+                h5_main[:, start:end] = block.T
+            h5_main.file.flush()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    h5_mean_spec[:] = mean_spec
+    h5_ronch[:] = np.float32(mean_ronch / num_frames)
+    h5_main.file.flush()
+
+
+def get_npy_offset_in_zip(zip_path, member='data.npy'):
+    """
+    Finds where the array stored in an uncompressed .npy member of a zip archive (eg. ndata1 files) begins so that it
+    can be memory mapped without being extracted.
+
+    Parameters
+    ----------
+    zip_path : str
+        Absolute path to the zip archive
+    member : str, optional
+        Name of the .npy file within the archive. Default 'data.npy'
+
+    Returns
+    -------
+    offset : unsigned int or None
+        Byte offset of the array data within the archive. None if the member is compressed and cannot be mapped
+    shape : tuple of unsigned int
+        Shape of the stored array
+    dtype : numpy.dtype
+        Data type of the stored array
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_file:
+        info = zip_file.getinfo(member)
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None, None, None
+
+    with open(zip_path, 'rb') as file_handle:
+        # The local file header is 30 bytes followed by the file name and extra field
+        file_handle.seek(info.header_offset + 26)
+        name_len, extra_len = struct.unpack('<HH', file_handle.read(4))
+        file_handle.seek(info.header_offset + 30 + name_len + extra_len)
+
+        version = np.lib.format.read_magic(file_handle)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file_handle)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file_handle)
+        if fortran_order:
+            return None, None, None
+
+        offset = file_handle.tell()
+
+    return offset, shape, dtype
+
+
+def _get_func_path(func):
+    """
+    Returns the importable path of a module level function such that it can be stored in a file and loaded later
+
+    Parameters
+    ----------
+    func : callable
+        Function defined at the top level of a module, such as numpy.mean
+
+    Returns
+    -------
+    func_path : str
+        Module and name of the function, for example 'numpy.mean'
+    """
+    name = getattr(func, '__name__', None)
+    if name is not None and getattr(np, name, None) is func:
+        # numpy functions and ufuncs may be defined in private submodules
+        return 'numpy.' + name
+    module = getattr(func, '__module__', None)
+    qualname = getattr(func, '__qualname__', name)
+    if module is not None and qualname is not None:
+        func_path = '.'.join([module, qualname])
+        try:
+            if _load_func(func_path) is func:
+                return func_path
+        except (ImportError, AttributeError):
+            pass
+    raise ValueError('bin_func must be a function defined at the top level of an importable module to be stored in '
+                     'a virtual image stack. {} is not'.format(func))
+
+
+def _load_func(func_path):
+    """
+    Loads a function stored with `_get_func_path`.  Paths without a module refer to numpy functions
+
+    Parameters
+    ----------
+    func_path : str
+        Module and name of the function
+
+    Returns
+    -------
+    func : callable
+    """
+    if '.' not in func_path:
+        return getattr(np, func_path)
+    # The module is the longest importable prefix of the path
+    parts = func_path.split('.')
+    for split_ind in range(len(parts) - 1, 0, -1):
+        try:
+            obj = import_module('.'.join(parts[:split_ind]))
+        except ImportError:
+            continue
+        for attr in parts[split_ind:]:
+            obj = getattr(obj, attr)
+        return obj
+    raise ImportError('Could not import {}'.format(func_path))
+
+
+def build_frame_index(frame_list, frame_reader, frame_shape, source_shape=None, source_offset=0,
+                      source_dtype=None):
+    """
+    Builds the lightweight 'Frame_Index' dataset that replaces Raw_Data when translating image stacks virtually.
+    The index stores where each frame lives along with the crop and binning that should be applied to it such that
+    `VirtualImageStack` can materialize frames on demand.
+
+    Parameters
+    ----------
+    frame_list : list of str
+        Absolute paths of the frame files or a single path of a raw array holding all frames
+    frame_reader : FrameReader
+        Reader containing the cropping and binning parameters
+    frame_shape : tuple of unsigned int
+        Shape of each frame after cropping and binning
+    source_shape : tuple of unsigned int, optional
+        Shape of the raw array holding all the frames. Only used if `frame_list` points to a single raw array
+    source_offset : unsigned int, optional
+        Byte offset of the raw array within its file
+    source_dtype : numpy.dtype, optional
+        Data type of the raw array
+
+    Returns
+    -------
+    ds_index : MicroDataset
+        Frame_Index dataset
+    """
+    frame_list = [os.path.join(frame_reader.image_path, frame) for frame in frame_list]
+    ds_index = MicroDataset('Frame_Index', np.array(frame_list, dtype='S'))
+
+    ds_index.attrs['frame_shape'] = np.uint32(frame_shape)
+    if source_shape is None:
+        ds_index.attrs['source_type'] = 'files'
+    else:
+        ds_index.attrs['source_type'] = 'array'
+        ds_index.attrs['source_shape'] = np.uint64(source_shape)
+        ds_index.attrs['source_offset'] = np.uint64(source_offset)
+        ds_index.attrs['source_dtype'] = np.dtype(source_dtype).str
+
+    if frame_reader.bin_factor is not None:
+        ds_index.attrs['bin_factor'] = np.uint32(frame_reader.bin_factor)
+        ds_index.attrs['bin_func'] = _get_func_path(frame_reader.bin_func)
+    if frame_reader.crop_ammount is not None:
+        ds_index.attrs['crop_ammount'] = np.uint32(frame_reader.crop_ammount)
+        ds_index.attrs['crop_method'] = frame_reader.crop_method
+    ds_index.attrs['read_kwargs'] = json.dumps(frame_reader.read_kwargs)
+
+    return ds_index
+
+
+class VirtualImageStack(object):
+    """
+    Read-only, 2D view of a virtually translated image stack that behaves like the Raw_Data dataset it replaces.
+    Frames are read, cropped and binned from the original files only when they are requested and the most recently
+    used frames are kept in memory.
+
+    Examples
+    --------
+    >>> h5_virt = VirtualImageStack(h5_file['Measurement_000/Channel_000/Frame_Index'])
+    >>> ronchigram = h5_virt[1024].reshape(h5_virt.frame_shape)
+    >>> row_of_frames = h5_virt[256:512]
+    """
+
+    def __init__(self, h5_index, cache_size=256, read_kwargs=None):
+        """
+        Parameters
+        ----------
+        h5_index : h5py.Dataset
+            Frame_Index dataset written by a translator in virtual mode
+        cache_size : unsigned int, optional
+            Maximum number of binned frames kept in memory. Default 256.  No frames are kept if 0
+        read_kwargs : dict, optional
+            Keyword arguments passed on to `read_image` in addition to those stored in the index, for values that
+            cannot be stored in the file such as the tag header of DM4 images
+        """
+        self.h5_index = h5_index
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._source = None
+
+        attrs = h5_index.attrs
+        self.frame_shape = tuple(int(dim) for dim in attrs['frame_shape'])
+        self.source_type = get_attr(h5_index, 'source_type')
+
+        bin_factor = None
+        bin_func = np.mean
+        if 'bin_factor' in attrs:
+            bin_factor = tuple(int(fac) for fac in attrs['bin_factor'])
+            bin_func = _load_func(get_attr(h5_index, 'bin_func'))
+        crop_ammount = None
+        crop_method = 'percent'
+        if 'crop_ammount' in attrs:
+            crop_ammount = [int(val) for val in np.atleast_1d(attrs['crop_ammount'])]
+            crop_ammount = crop_ammount[0] if len(crop_ammount) == 1 else crop_ammount
+            crop_method = get_attr(h5_index, 'crop_method')
+
+        stored_kwargs = json.loads(get_attr(h5_index, 'read_kwargs'))
+        if read_kwargs is not None:
+            stored_kwargs.update(read_kwargs)
+        self.frame_reader = FrameReader(bin_factor=bin_factor, bin_func=bin_func, crop_ammount=crop_ammount,
+                                        crop_method=crop_method, read_kwargs=stored_kwargs)
+
+        self.frame_files = [item.decode('utf-8') for item in h5_index[()]]
+        if self.source_type == 'array':
+            source_shape = tuple(int(dim) for dim in attrs['source_shape'])
+            self.num_frames = int(np.prod(source_shape[:-2]))
+        else:
+            self.num_frames = len(self.frame_files)
+
+        self.shape = (self.num_frames, int(np.prod(self.frame_shape)))
+        self.dtype = np.dtype(np.float32)
+        self.ndim = 2
+
+    def __len__(self):
+        return self.num_frames
+
+    def _get_source(self):
+        """
+        Memory maps the raw array holding all frames the first time it is needed
+        """
+        if self._source is None:
+            attrs = self.h5_index.attrs
+            source_shape = tuple(int(dim) for dim in attrs['source_shape'])
+            self._source = np.memmap(self.frame_files[0], dtype=np.dtype(get_attr(self.h5_index, 'source_dtype')),
+                                     mode='r', offset=int(attrs['source_offset']), shape=source_shape)
+            self._source = self._source.reshape((self.num_frames,) + source_shape[-2:])
+        return self._source
+
+    def get_frame(self, index):
+        """
+        Returns a single flattened, cropped and binned frame
+
+        Parameters
+        ----------
+        index : int
+            Index of the frame
+
+        Returns
+        -------
+        frame : 1D numpy.ndarray of float32
+            The requested frame
+        """
+        index = int(index)
+        if index < 0:
+            index += self.num_frames
+        if index < 0 or index >= self.num_frames:
+            raise IndexError('Frame {} is out of bounds for a stack of {} frames'.format(index, self.num_frames))
+
+        frame = self._cache.pop(index, None)
+        if frame is None:
+            if self.source_type == 'array':
+                frame = self.frame_reader(np.asarray(self._get_source()[index]))
+            else:
+                frame = self.frame_reader(self.frame_files[index])
+        if self.cache_size <= 0:
+            return frame
+
+        if len(self._cache) >= self.cache_size:
+            self._cache.popitem(last=False)
+        self._cache[index] = frame
+
+        return frame
+
+    def __getitem__(self, item):
+        if not isinstance(item, tuple):
+            item = (item,)
+        frame_sel = item[0]
+        pix_sel = item[1:] if len(item) > 1 else (slice(None),)
+
+        if isinstance(frame_sel, (int, np.integer)):
+            # Copy so that callers cannot modify the cached frame
+            return np.array(self.get_frame(frame_sel)[pix_sel])
+
+        frame_inds = np.arange(self.num_frames)[frame_sel]
+        if len(frame_inds) == 0:
+            return np.zeros((0, self.shape[1]), dtype=self.dtype)[(slice(None),) + pix_sel]
+
+        return np.vstack([self.get_frame(ind) for ind in frame_inds])[(slice(None),) + pix_sel]
+
+    def materialize(self, h5_main, h5_mean_spec, h5_ronch, cores=None, max_mem=1024 ** 3):
+        """
+        Writes all frames into a real Raw_Data dataset, for example once the first look at the data is complete
+
+        Parameters
+        ----------
+        h5_main : h5py.Dataset
+            Dataset of shape `self.shape` which will hold the frames
+        h5_mean_spec : h5py.Dataset
+            Dataset which will hold the mean of each frame
+        h5_ronch : h5py.Dataset
+            Dataset which will hold the mean of all frames
+        cores : unsigned int, optional
+            Number of worker processes used to decode frames
+        max_mem : unsigned int, optional
+            Maximum memory in bytes that the in-flight blocks may occupy. Default 1 GB
+        """
+        if self.source_type == 'array':
+            write_image_stack(self._get_source(), self.frame_reader, h5_main, h5_mean_spec, h5_ronch,
+                              max_mem=max_mem, cores=1)
+        else:
+            write_image_stack(self.frame_files, self.frame_reader, h5_main, h5_mean_spec, h5_ronch,
+                              max_mem=max_mem, cores=cores)
@@ -8,12 +8,15 @@ from __future__ import division, print_function, absolute_import, unicode_litera
 
 import array
 import os
+from warnings import warn
 
 import numpy as np
 from skimage.io import imread
+from skimage.util import crop
 
 from . import dm4reader
 from .dm3_image_utils import parse_dm_header, imagedatadict_to_ndarray
+from .parse_dm3 import dm_array_ref
 
 
 def read_image(image_path, *args, **kwargs):
@@ -49,7 +52,7 @@ def read_image(image_path, *args, **kwargs):
         return imread(image_path, *args, **kwargs), dict()
 
 
-def read_dm3(image_path, get_parms=True):
+def read_dm3(image_path, get_parms=True, lazy=True):
     """
     Read an image from a dm3 file into a numpy array
 
@@ -58,15 +61,18 @@ def read_dm3(image_path, get_parms=True):
     get_parms : Boolean, optional
         Should the parameters from the dm3 file be returned
         Default True
+    lazy : Boolean, optional
+        Should the image data be memory mapped from the file instead of being read.
+        The tags are parsed without reading any large arrays. Default True
 
     Returns
     -------
-    image : numpy.ndarray
+    image : numpy.ndarray or numpy.memmap
         Array containing the image from the file `image_path`
 
     """
-    image_file = open(image_path, 'rb')
-    dmtag = parse_dm_header(image_file)
+    with open(image_path, 'rb') as image_file:
+        dmtag = parse_dm_header(image_file, lazy=lazy)
     img_index = -1
     image = imagedatadict_to_ndarray(dmtag['ImageList'][img_index]['ImageData'])
     image_parms = dmtag['ImageList'][img_index]['ImageTags']
@@ -97,7 +103,10 @@ def unnest_parm_dicts(image_parms, prefix=''):
         val = image_parms[name]
         # print 'name',name,'val',val
         name = '-'.join([prefix]+name.split()).strip('-')
-        if isinstance(val, dict):
+        if isinstance(val, dm_array_ref):
+            # Large arrays that were skipped while parsing are data, not parameters
+            continue
+        elif isinstance(val, dict):
             new_parms.update(unnest_parm_dicts(val, name))
         elif isinstance(val, list) and isinstance(val[0], dict):
             for thing in val:
@@ -118,14 +127,16 @@ def read_dm4(file_path, *args, **kwargs):
 
     Returns
     -------
-    image_array : numpy.ndarray
-        Image data from the file located at `file_path`
+    image_array : numpy.ndarray or numpy.memmap
+        Image data from the file located at `file_path`. The data is memory mapped at its offset
+        in the file unless `lazy` is False.
     file_parms : dict
         Dictionary of parameters read from the dm4 file
 
     """
     get_parms = kwargs.pop('get_parms', True)
     header = kwargs.pop('header', None)
+    lazy = kwargs.pop('lazy', True)
 
     file_parms = dict()
     dm4_file = dm4reader.DM4File.open(file_path)
@@ -141,19 +152,24 @@ def read_dm4(file_path, *args, **kwargs):
         image_data_tag = image_dir.named_subdirs['ImageData']
         image_tag = image_data_tag.named_tags['Data']
 
-        x_dim = dm4_file.read_tag_data(image_data_tag.named_subdirs['Dimensions'].unnamed_tags[0])
-        y_dim = dm4_file.read_tag_data(image_data_tag.named_subdirs['Dimensions'].unnamed_tags[1])
+        # Dimensions are stored fastest varying first
+        dims = [dm4_file.read_tag_data(dim_tag)
+                for dim_tag in image_data_tag.named_subdirs['Dimensions'].unnamed_tags]
 
-        image_array = np.array(dm4_file.read_tag_data(image_tag), dtype=np.float32)
-        image_array = np.reshape(image_array, (y_dim, x_dim))
+        image_array = dm4_file.read_tag_data_as_ndarray(image_tag, mmap=lazy)
+        if image_array is None:
+            image_array = np.array(dm4_file.read_tag_data(image_tag), dtype=np.float32)
+        image_array = np.reshape(image_array, dims[::-1])
 
     if get_parms:
         file_parms = parse_dm4_parms(dm4_file, tags, '')
         file_parms['Image_Tag'] = header
 
+    dm4_file.close()
+
     return image_array, file_parms
 
-def parse_dm4_parms(dm4_file, tag_dir, base_name=''):
+def parse_dm4_parms(dm4_file, tag_dir, base_name='', max_tag_bytes=65536):
     """
     Recursive function to trace the dictionary tree of the Image Data
     and build a single dictionary of all parameters
@@ -175,6 +191,10 @@ def parse_dm4_parms(dm4_file, tag_dir, base_name=''):
         for named tags and subdirectories.  Unnamed ones will recieve a number.
         Default ''.  'Root' is automatically prepended to the name.
 
+    max_tag_bytes : int
+        Tags larger than this many bytes hold bulk data rather than parameters and are skipped
+        without being read.  Default 65536
+
     Returns
     -------
     parm_dict : dict()
@@ -190,7 +210,7 @@ def parse_dm4_parms(dm4_file, tag_dir, base_name=''):
         '''
         Skip Data tags.  These will be handled elseware.
         '''
-        if name == 'Data':
+        if name == 'Data' or tag_dir.named_tags[name].byte_length > max_tag_bytes:
             continue
         tag_name = '_'.join([base_name, name.replace(' ', '_')])
         if base_name == '':
@@ -207,6 +227,8 @@ def parse_dm4_parms(dm4_file, tag_dir, base_name=''):
     Loop over unnamed tags
     '''
     for itag, tag in enumerate(tag_dir.unnamed_tags):
+        if tag.byte_length > max_tag_bytes:
+            continue
         tag_name = '_'.join([base_name, 'Tag_{:03d}'.format(itag)])
         if base_name == '':
             tag_name = 'Root'+tag_name
@@ -227,7 +249,7 @@ def parse_dm4_parms(dm4_file, tag_dir, base_name=''):
         sub_dir = tag_dir.named_subdirs[name]
         if base_name == '':
             dir_name = 'Root'+dir_name
-        sub_parms = parse_dm4_parms(dm4_file, sub_dir, dir_name)
+        sub_parms = parse_dm4_parms(dm4_file, sub_dir, dir_name, max_tag_bytes=max_tag_bytes)
         parm_dict.update(sub_parms)
 
     '''
@@ -237,7 +259,7 @@ def parse_dm4_parms(dm4_file, tag_dir, base_name=''):
         dir_name = '_'.join([base_name, 'SubDir_{:03d}'.format(idir)])
         if base_name == '':
             dir_name = 'Root'+dir_name
-        sub_parms = parse_dm4_parms(dm4_file, sub_dir, dir_name)
+        sub_parms = parse_dm4_parms(dm4_file, sub_dir, dir_name, max_tag_bytes=max_tag_bytes)
         parm_dict.update(sub_parms)
 
     return parm_dict
@@ -321,3 +343,52 @@ def no_bin(image, *args, **kwargs):
         The input image
     """
     return image
+
+
+def crop_image(image, crop_ammount, crop_method='percent'):
+    """
+    Crop the input image by the specified ammount using the specified method.
+
+    Parameters
+    ----------
+    image : numpy.array
+        Input image to be cropped.
+    crop_ammount : uint or list of uints
+        How much should be cropped from the original image.  Can be a single unsigned
+        integer or a list of unsigned integers.  A single integer will crop the same
+        ammount from all edges.  A list of two integers will crop the x-dimension by
+        the first integer and the y-dimension by the second integer.  A list of 4
+        integers will crop the image as [left, right, top, bottom].
+    crop_method : str, optional
+        Which cropping method should be used.  How much of the image is removed is
+        determined by the value of `crop_ammount`.
+        'percent' - A percentage of the image is removed.
+        'absolute' - The specific number of pixel is removed.
+
+    Returns
+    -------
+    cropped_image : numpy.array
+        Cropped image
+    """
+    if crop_method == 'percent':
+        crop_ammount = np.round(np.atleast_2d(crop_ammount)/100.0*image.shape)
+        crop_ammount = tuple([tuple(row) for row in crop_ammount.astype(np.uint32)])
+    elif crop_method == 'absolute':
+        if isinstance(crop_ammount, int):
+            pass
+        elif len(crop_ammount) == 2:
+            crop_ammount = ((crop_ammount[0],), (crop_ammount[1],))
+        elif len(crop_ammount) == 4:
+            crop_ammount = ((crop_ammount[0], crop_ammount[1]), (crop_ammount[2], crop_ammount[3]))
+        else:
+            raise ValueError('The crop_ammount should be an integer or list of 2 or 4 integers.')
+    else:
+        raise ValueError('Allowed values of crop_method are percent and absolute.')
+
+    cropped_image = crop(image, crop_ammount)
+
+    if any([dim == 0 for dim in cropped_image.shape]):
+        warn("Requested crop ammount is greater than the image size.  No cropping will be done.")
+        return image
+
+    return cropped_image
@@ -3,6 +3,7 @@ import struct
 import array
 import warnings
 import re
+import numpy as np
 try:
     import StringIO.StringIO
 except ImportError:
@@ -29,6 +30,9 @@ verbose = False
 # if we find data which matches this regex we return a
 # string instead of an array
 treat_as_string_names = ['.*Name']
+treat_as_string_regexes = [re.compile(regex) for regex in treat_as_string_names]
+# arrays larger than this many bytes are not read when parsing lazily. See dm_array_ref
+lazy_array_bytes = 65536
 
 def get_from_file(f, stype):
     # print("reading", stype, "size", struct.calcsize(stype))
@@ -52,6 +56,40 @@ read_array = lambda f, a, l: a.fromstring(f.read(l*struct.calcsize(a.typecode)))
 write_array = lambda f, a: f.write(a.tostring()) if isinstance(f, StringIO) else a.tofile(f)
 
 
+class dm_array_ref(object):
+    """
+    Stands in for a large array of a simple type that was skipped over while parsing lazily.
+    Only the location of the array in the file is stored. The data can be read or memory mapped when needed
+    """
+    def __init__(self, file_path, offset, typecode, length):
+        self.file_path = file_path
+        self.offset = offset
+        self.typecode = typecode
+        self.length = length
+
+    def __repr__(self):
+        return "dm_array_ref({}, {}, {}, {})".format(self.file_path, self.offset, self.typecode, self.length)
+
+    def __len__(self):
+        return self.length
+
+    def to_ndarray(self, mmap=True):
+        """
+        Returns the array as a numpy array. DM3 data is always little endian
+
+        Parameters
+        ----------
+        mmap : Boolean, optional
+            Whether to memory map (True) the array or read it into memory (False). Default True
+        """
+        dtype = np.dtype('<' + self.typecode)
+        if mmap:
+            return np.memmap(self.file_path, dtype=dtype, mode='r', offset=self.offset, shape=(self.length,))
+        with open(self.file_path, 'rb') as file_handle:
+            file_handle.seek(self.offset)
+            return np.fromfile(file_handle, dtype=dtype, count=self.length)
+
+
 class structarray(object):
     """
     A class to represent struct arrays. We store the data as a list of
@@ -83,13 +121,16 @@ class structarray(object):
         f.write(self.raw_data)
 
 
-def parse_dm_header(f, outdata=None):
+def parse_dm_header(f, outdata=None, lazy=False):
     """
     This is the start of the DM file. We check for some
     magic values and then treat the next entry as a tag_root
 
     If outdata is supplied, we write instead of read using the dictionary outdata as a source
     Hopefully parse_dm_header(newf, outdata=parse_dm_header(f)) copies f to newf
+
+    If lazy is True, arrays of simple types larger than lazy_array_bytes are skipped over
+    and returned as dm_array_ref objects instead. Only works for real files on disk.
     """
     # filesize is sizeondisk - 16. But we have 8 bytes of zero at the end of
     # the file.
@@ -112,7 +153,7 @@ def parse_dm_header(f, outdata=None):
         assert(version == 3)
         assert(endianness == 1)
         start = f.tell()
-        ret = parse_dm_tag_root(f, outdata)
+        ret = parse_dm_tag_root(f, outdata, lazy=lazy and hasattr(f, 'name'))
         end = f.tell()
         # print("fs", file_size, end - start, (end-start)%8)
         # mfm 2013-07-11 the file_size value is not always
@@ -124,7 +165,7 @@ def parse_dm_header(f, outdata=None):
         return ret
 
 
-def parse_dm_tag_root(f, outdata=None):
+def parse_dm_tag_root(f, outdata=None, lazy=False):
     if outdata is not None:
         is_dict = 0 if isinstance(outdata, list) else 1
         _open, num_tags = 0, len(outdata)
@@ -149,7 +190,7 @@ def parse_dm_tag_root(f, outdata=None):
         if is_dict:
             new_obj = {}
             for i in range(num_tags):
-                name, data = parse_dm_tag_entry(f)
+                name, data = parse_dm_tag_entry(f, lazy=lazy)
                 assert(name is not None)
                 if verbose:
                     print("Read name", name, "at", f.tell())
@@ -157,7 +198,7 @@ def parse_dm_tag_root(f, outdata=None):
         else:
             new_obj = []
             for i in range(num_tags):
-                name, data = parse_dm_tag_entry(f)
+                name, data = parse_dm_tag_entry(f, lazy=lazy)
                 assert(name is None)
                 if verbose:
                     print("appending...", i, "at", f.tell())
@@ -166,7 +207,7 @@ def parse_dm_tag_root(f, outdata=None):
         return new_obj
 
 
-def parse_dm_tag_entry(f, outdata=None, outname=None):
+def parse_dm_tag_entry(f, outdata=None, outname=None, lazy=False):
     if outdata is not None:
         dtype = 20 if isinstance(outdata, (dict, list)) else 21
         name_len = len(outname) if outname else 0
@@ -186,10 +227,10 @@ def parse_dm_tag_entry(f, outdata=None, outname=None):
         else:
             name = None
         if dtype == 21:
-            arr = parse_dm_tag_data(f)
-            if name and hasattr(arr, "__len__") and len(arr) > 0:
-                for regex in treat_as_string_names:
-                    if re.match(regex, name):
+            arr = parse_dm_tag_data(f, lazy=lazy)
+            if name and hasattr(arr, "__len__") and len(arr) > 0 and not isinstance(arr, dm_array_ref):
+                for regex in treat_as_string_regexes:
+                    if regex.match(name):
                         if isinstance(arr[0], int):
                             arr = ''.join(chr(x) for x in arr)
                         elif isinstance(arr[0], str):
@@ -197,12 +238,12 @@ def parse_dm_tag_entry(f, outdata=None, outname=None):
 
             return name, arr
         elif dtype == 20:
-            return name, parse_dm_tag_root(f)
+            return name, parse_dm_tag_root(f, lazy=lazy)
         else:
             raise Exception("Unknown data type=" + str(dtype))
 
 
-def parse_dm_tag_data(f, outdata=None):
+def parse_dm_tag_data(f, outdata=None, lazy=False):
     # todo what is id??
     # it is normally one of 1,3,7,11,19
     # we can parse lists of numbers with them all 1
@@ -230,7 +271,10 @@ def parse_dm_tag_data(f, outdata=None):
     else:
         _delim, header_len, data_type = get_from_file(f, "> 4s l l")
         assert(_delim == "%%%%")
-        ret, header = dm_types[data_type](f)
+        if lazy and data_type == get_dmtype_for_name('array'):
+            ret, header = dm_read_array(f, lazy=True)
+        else:
+            ret, header = dm_types[data_type](f)
         assert(header + 1 == header_len)
         return ret
 
@@ -423,7 +467,7 @@ dm_types[get_dmtype_for_name('struct')] = dm_read_struct
 
 
 # array is 20
-def dm_read_array(f, outdata=None):
+def dm_read_array(f, outdata=None, lazy=False):
     array_header = 2  # type, length
     if outdata is not None:
         if isinstance(outdata, structarray):
@@ -475,8 +519,13 @@ def dm_read_array(f, outdata=None):
             # Can we get around this by adding '>' to out structchar?
             # nope, array only takes a sinlge char. Trying i, I instead
             struct_char = get_structchar_for_dmtype(dtype)
-            ret = array.array(struct_char)
             alen = get_from_file(f, "> L")
+            if lazy and alen * struct.calcsize(struct_char) > lazy_array_bytes:
+                # Skip over the data and only remember where it is
+                ret = dm_array_ref(f.name, f.tell(), struct_char, alen)
+                f.seek(alen * struct.calcsize(struct_char), 1)
+                return ret, array_header
+            ret = array.array(struct_char)
             if verbose:
                 print("Array type %d len %d struct %c size %d" % (
                     dtype, alen, struct_char, struct.calcsize(struct_char)), "at", f.tell())
@@ -25,7 +25,7 @@ class GLineTranslator(Translator):
     Translated G-mode line (bigtimedata.dat) files from actual BE line experiments to HDF5
     """
     
-    def translate(self, file_path):
+    def translate(self, file_path, keep_float32=False):
         """
         The main function that translates the provided file into a .h5 file
         
@@ -33,6 +33,9 @@ class GLineTranslator(Translator):
         ----------
         file_path : String / unicode
             Absolute path of any file in the directory
+        keep_float32 : Boolean (Optional. Default = False)
+            Whether or not to store the raw data at the native 32 bit precision of the data files.
+            By default, the data is down-cast to 16 bit floats to halve the size of the h5 file
 
         Returns
         -------
@@ -129,7 +132,8 @@ class GLineTranslator(Translator):
         only one excitation waveform is used"""
         ds_main_data = MicroDataset('Raw_Data', data=[], 
                                     maxshape=(self.num_rows, self.points_per_pixel * num_cols),
-                                    chunking=(1, self.points_per_pixel), dtype=np.float16)
+                                    chunking=(1, self.points_per_pixel),
+                                    dtype=np.float32 if keep_float32 else np.float16)
         ds_main_data.attrs['quantity'] = ['Deflection']
         ds_main_data.attrs['units'] = ['V']
 
@@ -223,18 +227,23 @@ class GLineTranslator(Translator):
         ---------
         None
         """
-        # Create data matrix - Only need 16 bit floats (time) 
-                
-        # Read line by line and write to h5                 
-        with open(filepath, 'rb') as file_handl:
-            for row_indx in range(self.num_rows):
-                
-                if row_indx % 10 == 0:
-                    print('Reading line {} of {}'.format(row_indx, self.num_rows))
-                
-                file_handl.seek(row_indx*self.__bytes_per_row__, 0)
-                data_vec = np.fromstring(file_handl.read(self.__bytes_per_row__), dtype='f')
-                h5_dset[row_indx] = np.float16(data_vec)
-                h5_dset.file.flush()
-        
+        # Memory map the file instead of seeking and reading row by row
+        raw_data = np.memmap(filepath, dtype=np.float32, mode='r',
+                             shape=(self.num_rows, self.__bytes_per_row__ // 4))
+
+        # Read as many rows at a time as the memory budget allows while only ever writing whole chunks.
+        # Each row costs its bytes in the file + the (possibly down-cast) copy written to the h5 file
+        rows_per_chunk = h5_dset.chunks[0] if h5_dset.chunks is not None else 1
+        bytes_per_row = self.__bytes_per_row__ * (1 + h5_dset.dtype.itemsize / 4)
+        rows_per_block = max(1, int(self.max_ram / (2 * bytes_per_row)) // rows_per_chunk) * rows_per_chunk
+        rows_per_block = min(rows_per_block, self.num_rows)
+
+        for start_row in range(0, self.num_rows, rows_per_block):
+            end_row = min(start_row + rows_per_block, self.num_rows)
+            print('Reading lines {} to {} of {}'.format(start_row, end_row, self.num_rows))
+            h5_dset[start_row:end_row] = raw_data[start_row:end_row].astype(h5_dset.dtype)
+            h5_dset.file.flush()
+
+        del raw_data
+
         print('Finished reading file: {}!'.format(filepath))
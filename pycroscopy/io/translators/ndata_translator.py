@@ -15,7 +15,8 @@ import numpy as np
 from skimage.measure import block_reduce
 from skimage.util import crop
 
-from .df_utils.io_image import unnest_parm_dicts, read_dm3
+from .df_utils.image_stack import FrameReader, VirtualImageStack, build_frame_index, get_npy_offset_in_zip
+from .df_utils.io_image import unnest_parm_dicts, read_dm3, crop_image
 from .translator import Translator
 from .utils import generate_dummy_main_parms, make_position_mat, get_spectral_slicing, \
     get_position_slicing, build_ind_val_dsets
@@ -44,7 +45,7 @@ class NDataTranslator(Translator):
         self.image_list_tag = None
 
     def translate(self, h5_path, image_path, bin_factor=None, bin_func=np.mean, start_image=0, scan_size_x=None,
-                  scan_size_y=None, crop_ammount=None, crop_method='percent'):
+                  scan_size_y=None, crop_ammount=None, crop_method='percent', virtual=False):
         """
         Basic method that adds Ptychography data to existing hdf5 thisfile
         You must have already done the basic translation with BEodfTranslator
@@ -82,6 +83,11 @@ class NDataTranslator(Translator):
             determined by the value of `crop_ammount`.
             'percent' - A percentage of the image is removed.
             'absolute' - The specific number of pixel is removed.
+        virtual : Boolean, optional
+            If True, Raw_Data, Mean_Ronchigram and Spectroscopic_Mean are not written. Only the ancillary datasets
+            and a Frame_Index dataset pointing at the data within the original ndata1 files are written and the h5
+            file is left open so that the frames can be read on demand with `VirtualImageStack`.  Only possible for
+            ndata1 files whose data is stored uncompressed.  Default False
         Returns
         ----------
         h5_main : h5py.Dataset
@@ -130,7 +136,11 @@ class NDataTranslator(Translator):
 
         h5_channels = self._setupH5(image_parm_list)
 
-        self._read_data(ziplist, h5_channels)
+        h5_main_list = self._read_data(ziplist, h5_channels, virtual=virtual)
+
+        if virtual:
+            return [VirtualImageStack(h5_main) if h5_main.name.endswith('Frame_Index') else h5_main
+                    for h5_main in h5_main_list]
 
         self.hdf.close()
 
@@ -218,7 +228,7 @@ class NDataTranslator(Translator):
 
         self.root_image_list.append(h5_image)
 
-    def _read_data(self, zip_list, h5_channels):
+    def _read_data(self, zip_list, h5_channels, virtual=False):
         """
         Iterates over the images in `file_list`, reading each image and downsampling if
         reqeusted, and writes the flattened image to file.  Also builds the Mean_Ronchigram
@@ -236,10 +246,13 @@ class NDataTranslator(Translator):
             Dataset which will hold the Mean Ronchigram
         image_path : str
             Absolute file path to the directory which hold the images
+        virtual : Boolean, optional
+            Whether or not to only write a Frame_Index pointing at the data in the ndata1 files. Default False
 
         Returns
         -------
-        None
+        h5_main_list : list of h5py.Dataset
+            Raw_Data (or Frame_Index) dataset for each file
         """
         h5_main_list = list()
         '''
@@ -247,6 +260,14 @@ class NDataTranslator(Translator):
         write it all to file
         '''
         for ifile, (this_file, this_channel) in enumerate(zip(zip_list, h5_channels)):
+            if virtual:
+                h5_index = self._write_frame_index(this_file.filename, this_channel)
+                if h5_index is not None:
+                    h5_main_list.append(h5_index)
+                    continue
+                warn('Data in {} is compressed and cannot be read virtually. '
+                     'It will be copied instead.'.format(this_file.filename))
+
             '''
             Extract the data file from the zip archive and read it into an array
             '''
@@ -332,6 +353,72 @@ class NDataTranslator(Translator):
 
         self.hdf.flush()
 
+        return h5_main_list
+
+    def _write_frame_index(self, zip_path, h5_channel):
+        """
+        Writes the ancillary datasets and a Frame_Index dataset pointing at the uncompressed data.npy within
+        an ndata1 file instead of copying the data.
+
+        Parameters
+        ----------
+        zip_path : str
+            Absolute path to the ndata1 file
+        h5_channel : h5py.Group
+            Channel group that the datasets will be written to
+
+        Returns
+        -------
+        h5_index : h5py.Dataset or None
+            Frame_Index dataset. None if the data is compressed and cannot be memory mapped
+        """
+        offset, source_shape, source_dtype = get_npy_offset_in_zip(zip_path)
+        if offset is None:
+            return None
+
+        source_shape = (1,) * (4 - len(source_shape)) + tuple(source_shape)
+        scan_size_x, scan_size_y, usize, vsize = source_shape
+
+        frame_reader = FrameReader(bin_factor=self.bin_factor[-2:] if self.rebin else None, bin_func=self.bin_func,
+                                   crop_ammount=self.crop_ammount, crop_method=self.crop_method)
+        # Crop and bin an empty frame to find the final size of each frame
+        if self.rebin or self.crop_ammount is not None:
+            frame = np.zeros(source_shape[-2:], dtype=np.float32)
+            if self.crop_ammount is not None:
+                frame = crop_image(frame, self.crop_ammount, self.crop_method)
+            if self.rebin:
+                frame = block_reduce(frame, self.bin_factor[-2:], self.bin_func)
+            usize, vsize = frame.shape
+        else:
+            usize, vsize = source_shape[-2:]
+
+        h5_channel.parent.attrs.update({'image_size_u': usize,
+                                        'image_size_v': vsize,
+                                        'scan_size_x': scan_size_x,
+                                        'scan_size_y': scan_size_y})
+
+        ds_spec_ind, ds_spec_vals = build_ind_val_dsets((usize, vsize), is_spectral=True,
+                                                        labels=['U', 'V'], units=['pixel', 'pixel'])
+        ds_pos_ind, ds_pos_val = build_ind_val_dsets([scan_size_x, scan_size_y], is_spectral=False,
+                                                     labels=['X', 'Y'], units=['pixel', 'pixel'])
+        ds_index = build_frame_index([zip_path], frame_reader, (usize, vsize), source_shape=source_shape,
+                                     source_offset=offset, source_dtype=source_dtype)
+
+        ds_channel = MicroDataGroup(h5_channel.name)
+        ds_channel.addChildren([ds_index, ds_spec_ind, ds_spec_vals, ds_pos_ind, ds_pos_val])
+
+        h5_refs = self.hdf.writeData(ds_channel)
+        h5_index = getH5DsetRefs(['Frame_Index'], h5_refs)[0]
+
+        aux_ds_names = ['Position_Indices',
+                        'Position_Values',
+                        'Spectroscopic_Indices',
+                        'Spectroscopic_Values']
+
+        link_as_main(h5_index, *getH5DsetRefs(aux_ds_names, h5_refs))
+
+        return h5_index
+
     def crop_ronc(self, ronc):
         """
         Crop the input Ronchigram by the specified ammount using the specified method.
@@ -7,14 +7,13 @@ Created on Feb 9, 2016
 from __future__ import division, print_function, absolute_import, unicode_literals
 
 import os
-from warnings import warn
 
 import numpy as np
 from skimage.measure import block_reduce
-from skimage.util import crop
 
 from .df_utils import dm4reader
-from .df_utils.io_image import read_image, read_dm3, parse_dm4_parms
+from .df_utils.image_stack import FrameReader, VirtualImageStack, build_frame_index, write_image_stack
+from .df_utils.io_image import read_image, read_dm3, parse_dm4_parms, crop_image
 from .translator import Translator
 from .utils import generate_dummy_main_parms, make_position_mat, get_spectral_slicing, \
     get_position_slicing, build_ind_val_dsets
@@ -43,7 +42,7 @@ class OneViewTranslator(Translator):
         self.image_list_tag = None
 
     def translate(self, h5_path, image_path, bin_factor=None, bin_func=np.mean, start_image=0, scan_size_x=None,
-                  scan_size_y=None, crop_ammount=None, crop_method='percent'):
+                  scan_size_y=None, crop_ammount=None, crop_method='percent', virtual=False):
         """
         Basic method that adds Ptychography data to existing hdf5 thisfile
         You must have already done the basic translation with BEodfTranslator
@@ -81,6 +80,11 @@ class OneViewTranslator(Translator):
             determined by the value of `crop_ammount`.
             'percent' - A percentage of the image is removed.
             'absolute' - The specific number of pixel is removed.
+        virtual : Boolean, optional
+            If True, Raw_Data, Mean_Ronchigram and Spectroscopic_Mean are not written. Only the ancillary datasets
+            and a Frame_Index dataset pointing at the original image files are written and a `VirtualImageStack`
+            that reads and bins frames on demand is returned instead.  Default False
+
         Returns
         ----------
         h5_main : h5py.Dataset
@@ -141,17 +145,25 @@ class OneViewTranslator(Translator):
             self.bin_func = bin_func
 
         num_files = scan_size_x * scan_size_y
+        file_list = file_list[start_image:start_image + num_files]
+
+        ds_index = None
+        if virtual:
+            ds_index = build_frame_index(file_list, self._get_frame_reader(image_path), (usize, vsize))
 
         h5_main, h5_mean_spec, h5_ronch = self._setupH5(usize, vsize, np.float32,
                                                         scan_size_x, scan_size_y,
-                                                        image_parms)
+                                                        image_parms, frame_index=ds_index)
 
         for root_file in root_file_list:
             print('Saving the root image located at {}.'.format(root_file))
             self._create_root_image(root_file)
 
-        self._read_data(file_list[start_image:start_image + num_files],
-                        h5_main, h5_mean_spec, h5_ronch, image_path)
+        if virtual:
+            # The file must stay open for the frames to be read on demand
+            return VirtualImageStack(h5_main, read_kwargs={'header': self.image_list_tag})
+
+        self._read_data(file_list, h5_main, h5_mean_spec, h5_ronch, image_path)
 
         self.hdf.close()
 
@@ -263,31 +275,28 @@ class OneViewTranslator(Translator):
         None
         """
 
-        mean_ronch = np.zeros(h5_ronch.shape, dtype=np.float32)
-
-        num_files = len(file_list)
-
-        for ifile, thisfile in enumerate(file_list):
-
-            selected = (ifile + 1) % int(round(num_files / 16)) == 0
-            if selected:
-                print('Processing file...{}% - reading: {}'.format(round(100 * ifile / num_files), thisfile))
+        frame_reader = self._get_frame_reader(image_path)
+        frame_reader.read_kwargs['header'] = self.image_list_tag
 
-            image, _ = read_image(os.path.join(image_path, thisfile), get_parms=False, header=self.image_list_tag)
-            # image, _ = read_image(os.path.join(image_path, thisfile), get_parms=False)
-            image = self.crop_ronc(image)
-            image = self.binning_func(image, self.bin_factor, self.bin_func)
-            image = image.flatten()
-            h5_main[ifile, :] = image
+        write_image_stack(file_list, frame_reader, h5_main, h5_mean_spec, h5_ronch, frames_as_rows=True,
+                          max_mem=self.max_ram)
 
-            h5_mean_spec[ifile] = np.mean(image)
-
-            mean_ronch += image
+    def _get_frame_reader(self, image_path):
+        """
+        Returns the picklable object that reads, crops and bins single images with the current settings
 
-            self.hdf.flush()
+        Parameters
+        ----------
+        image_path : str
+            Absolute file path to the directory which hold the images
 
-        h5_ronch[:] = mean_ronch / num_files
-        self.hdf.flush()
+        Returns
+        -------
+        frame_reader : FrameReader
+        """
+        return FrameReader(image_path, bin_factor=self.bin_factor if self.rebin else None,
+                           bin_func=self.bin_func, crop_ammount=self.crop_ammount,
+                           crop_method=self.crop_method, read_kwargs={'get_parms': False})
 
     def crop_ronc(self, ronc):
         """
@@ -307,31 +316,7 @@ class OneViewTranslator(Translator):
         if self.crop_ammount is None:
             return ronc
 
-        crop_ammount = self.crop_ammount
-        crop_method = self.crop_method
-
-        if crop_method == 'percent':
-            crop_ammount = np.round(np.atleast_2d(crop_ammount)/100.0*ronc.shape)
-            crop_ammount = tuple([tuple(row) for row in crop_ammount.astype(np.uint32)])
-        elif crop_method == 'absolute':
-            if isinstance(crop_ammount, int):
-                pass
-            elif len(crop_ammount) == 2:
-                crop_ammount = ((crop_ammount[0],), (crop_ammount[1],))
-            elif len(crop_ammount) == 4:
-                crop_ammount = ((crop_ammount[0], crop_ammount[1]), (crop_ammount[2], crop_ammount[3]))
-            else:
-                raise ValueError('The crop_ammount should be an integer or list of 2 or 4 integers.')
-        else:
-            raise ValueError('Allowed values of crop_method are percent and absolute.')
-
-        cropped_ronc = crop(ronc, crop_ammount)
-
-        if any([dim == 0 for dim in cropped_ronc.shape]):
-            warn("Requested crop ammount is greater than the image size.  No cropping will be done.")
-            return ronc
-
-        return cropped_ronc
+        return crop_image(ronc, self.crop_ammount, self.crop_method)
 
     def downSampRoncVec(self, ronch_vec, binning_factor):
         """
@@ -415,7 +400,7 @@ class OneViewTranslator(Translator):
 
         return size, parms
 
-    def _setupH5(self, usize, vsize, data_type, scan_size_x, scan_size_y, image_parms):
+    def _setupH5(self, usize, vsize, data_type, scan_size_x, scan_size_y, image_parms, frame_index=None):
         """
         Setup the HDF5 file in which to store the data including creating
         the Position and Spectroscopic datasets
@@ -434,11 +419,15 @@ class OneViewTranslator(Translator):
             Number of images in the y dimension
         image_parms : dict
             Dictionary of parameters
+        frame_index : MicroDataset, optional
+            Frame_Index dataset that is written in place of the Raw_Data, Mean_Ronchigram and
+            Spectroscopic_Mean datasets for virtual translation.  Default None
 
         Returns
         -------
         h5_main : h5py.Dataset
-            HDF5 Dataset that the images will be written into
+            HDF5 Dataset that the images will be written into.
+            The Frame_Index dataset if `frame_index` was provided, in which case the other two are None
         h5_mean_spec : h5py.Dataset
             HDF5 Dataset that the mean over all positions will be written
             into
@@ -473,22 +462,25 @@ class OneViewTranslator(Translator):
         ds_pos_ind, ds_pos_val = build_ind_val_dsets([scan_size_x, scan_size_y], is_spectral=False,
                                                      labels=['X', 'Y'], units=['pixel', 'pixel'])
 
-        ds_chunking = calc_chunks([num_files, num_pixels],
-                                  data_type(0).itemsize,
-                                  unit_chunks=(1, num_pixels))
-
-        # Allocate space for Main_Data and Pixel averaged Data
-        ds_main_data = MicroDataset('Raw_Data', data=[], maxshape=(num_files, num_pixels),
-                                    chunking=ds_chunking, dtype=data_type, compression='gzip')
-        ds_mean_ronch_data = MicroDataset('Mean_Ronchigram',
-                                          data=np.zeros(num_pixels, dtype=np.float32),
-                                          dtype=np.float32)
-        ds_mean_spec_data = MicroDataset('Spectroscopic_Mean',
-                                         data=np.zeros(num_files, dtype=np.float32),
-                                         dtype=np.float32)
-        # Add datasets as children of Measurement_000 data group
-        chan_grp.addChildren([ds_main_data, ds_spec_ind, ds_spec_vals, ds_pos_ind,
-                              ds_pos_val, ds_mean_ronch_data, ds_mean_spec_data])
+        if frame_index is None:
+            ds_chunking = calc_chunks([num_files, num_pixels],
+                                      data_type(0).itemsize,
+                                      unit_chunks=(1, num_pixels))
+
+            # Allocate space for Main_Data and Pixel averaged Data
+            ds_main_data = MicroDataset('Raw_Data', data=[], maxshape=(num_files, num_pixels),
+                                        chunking=ds_chunking, dtype=data_type, compression='gzip')
+            ds_mean_ronch_data = MicroDataset('Mean_Ronchigram',
+                                              data=np.zeros(num_pixels, dtype=np.float32),
+                                              dtype=np.float32)
+            ds_mean_spec_data = MicroDataset('Spectroscopic_Mean',
+                                             data=np.zeros(num_files, dtype=np.float32),
+                                             dtype=np.float32)
+            # Add datasets as children of Measurement_000 data group
+            chan_grp.addChildren([ds_main_data, ds_mean_ronch_data, ds_mean_spec_data])
+        else:
+            chan_grp.addChildren([frame_index])
+        chan_grp.addChildren([ds_spec_ind, ds_spec_vals, ds_pos_ind, ds_pos_val])
         meas_grp.addChildren([chan_grp])
 
         root_grp.addChildren([meas_grp])
@@ -496,14 +488,20 @@ class OneViewTranslator(Translator):
         # root_grp.showTree()
 
         h5_refs = self.hdf.writeData(root_grp)
-        h5_main = getH5DsetRefs(['Raw_Data'], h5_refs)[0]
-        h5_ronch = getH5DsetRefs(['Mean_Ronchigram'], h5_refs)[0]
-        h5_mean_spec = getH5DsetRefs(['Spectroscopic_Mean'], h5_refs)[0]
         aux_ds_names = ['Position_Indices',
                         'Position_Values',
                         'Spectroscopic_Indices',
                         'Spectroscopic_Values']
 
+        if frame_index is None:
+            h5_main = getH5DsetRefs(['Raw_Data'], h5_refs)[0]
+            h5_ronch = getH5DsetRefs(['Mean_Ronchigram'], h5_refs)[0]
+            h5_mean_spec = getH5DsetRefs(['Spectroscopic_Mean'], h5_refs)[0]
+        else:
+            h5_main = getH5DsetRefs([frame_index.name], h5_refs)[0]
+            h5_ronch = None
+            h5_mean_spec = None
+
         link_as_main(h5_main, *getH5DsetRefs(aux_ds_names, h5_refs))
 
         self.hdf.flush()
@@ -7,12 +7,14 @@ Created on Feb 9, 2016
 from __future__ import division, print_function, absolute_import, unicode_literals
 
 import os
+from warnings import warn
 
 import numpy as np
 from skimage.data import imread
 from skimage.measure import block_reduce
 
-from .df_utils.io_image import read_image, read_dm3, no_bin
+from .df_utils.image_stack import FrameReader, VirtualImageStack, build_frame_index, write_image_stack
+from .df_utils.io_image import read_dm3, no_bin
 from .translator import Translator
 from .utils import generate_dummy_main_parms, build_ind_val_dsets
 from ..hdf_utils import getH5DsetRefs, calc_chunks, link_as_main
@@ -35,7 +37,7 @@ class PtychographyTranslator(Translator):
         self.image_ext = None
 
     def translate(self, h5_path, image_path, bin_factor=None, bin_func=np.mean, start_image=0, scan_size_x=None,
-                  scan_size_y=None, image_type='.tif'):
+                  scan_size_y=None, image_type='.tif', virtual=False):
         """
         Basic method that adds Ptychography data to existing hdf5 thisfile
         You must have already done the basic translation with BEodfTranslator
@@ -64,10 +66,14 @@ class PtychographyTranslator(Translator):
             from the number of images and `scan_size_x` if it is given.
         image_type : str
             File extension of images to be read.  Default '.tif'
+        virtual : Boolean, optional
+            If True, Raw_Data, Mean_Ronchigram and Spectroscopic_Mean are not written. Only the ancillary datasets
+            and a Frame_Index dataset pointing at the original image files are written and a `VirtualImageStack`
+            that reads and bins frames on demand is returned instead.  Default False
 
         Returns
         ----------
-        h5_main : h5py.Dataset
+        h5_main : h5py.Dataset or VirtualImageStack
             HDF5 Dataset object that contains the flattened images
 
         """
@@ -120,11 +126,20 @@ class PtychographyTranslator(Translator):
             scan_size_y = int(np.floor(len(file_list) / scan_size_x))
 
         num_files = scan_size_x*scan_size_y
+        file_list = file_list[start_image:start_image+num_files]
+
+        if virtual and image_type == '.dm3':
+            warn('Virtual translation is only supported for folders of images. The frames will be copied instead.')
+            virtual = False
+
+        if virtual:
+            ds_index = build_frame_index(file_list, self._get_frame_reader(image_path), (usize, vsize))
+            h5_index, _, _ = self._setupH5(usize, vsize, np.float32, scan_size_x, scan_size_y, frame_index=ds_index)
+            return VirtualImageStack(h5_index)
 
         h5_main, h5_mean_spec, h5_ronch = self._setupH5(usize, vsize, np.float32, scan_size_x, scan_size_y)
 
-        self._read_data(file_list[start_image:start_image+num_files],
-                        h5_main, h5_mean_spec, h5_ronch, image_path)
+        self._read_data(file_list, h5_main, h5_mean_spec, h5_ronch, image_path)
 
         return h5_main
 
@@ -152,29 +167,24 @@ class PtychographyTranslator(Translator):
         None
         """
 
-        mean_ronch = np.zeros(h5_ronch.shape, dtype=np.float32)
-
-        num_files = len(file_list)
-
-        for ifile, thisfile in enumerate(file_list):
+        write_image_stack(file_list, self._get_frame_reader(image_path), h5_main, h5_mean_spec, h5_ronch, frames_as_rows=True,
+                          max_mem=self.max_ram)
 
-            selected = (ifile + 1) % round(num_files / 16) == 0
-            if selected:
-                print('Processing file...{}% - reading: {}'.format(round(100 * ifile / num_files), thisfile))
-
-            image, _ = read_image(os.path.join(image_path, thisfile), as_grey=True)
-            image = self.binning_func(image, self.bin_factor, self.bin_func)
-            image = image.flatten()
-            h5_main[ifile, :] = image
-
-            h5_mean_spec[ifile] = np.mean(image)
-
-            mean_ronch += image
+    def _get_frame_reader(self, image_path):
+        """
+        Returns the picklable object that reads and bins single images with the current settings
 
-            self.hdf.flush()
+        Parameters
+        ----------
+        image_path : str
+            Absolute file path to the directory which hold the images
 
-        h5_ronch[:] = mean_ronch / num_files
-        self.hdf.flush()
+        Returns
+        -------
+        frame_reader : FrameReader
+        """
+        return FrameReader(image_path, bin_factor=self.bin_factor if self.rebin else None,
+                           bin_func=self.bin_func, read_kwargs={'as_grey': True})
 
     # def downSampRoncVec(self, ronch_vec, binning_factor):
     #     """
@@ -265,7 +275,7 @@ class PtychographyTranslator(Translator):
         
         return size, tmp.dtype
 
-    def _setupH5(self, usize, vsize, data_type, scan_size_x, scan_size_y):
+    def _setupH5(self, usize, vsize, data_type, scan_size_x, scan_size_y, frame_index=None):
         """
         Setup the HDF5 file in which to store the data including creating
         the Position and Spectroscopic datasets
@@ -282,11 +292,15 @@ class PtychographyTranslator(Translator):
             Number of images in the x dimension
         scan_size_y : int
             Number of images in the y dimension
+        frame_index : MicroDataset, optional
+            Frame_Index dataset that is written in place of the Raw_Data, Mean_Ronchigram and
+            Spectroscopic_Mean datasets for virtual translation.  Default None
 
         Returns
         -------
         h5_main : h5py.Dataset
-            HDF5 Dataset that the images will be written into
+            HDF5 Dataset that the images will be written into.
+            The Frame_Index dataset if `frame_index` was provided, in which case the other two are None
         h5_mean_spec : h5py.Dataset
             HDF5 Dataset that the mean over all positions will be written
             into
@@ -324,22 +338,25 @@ class PtychographyTranslator(Translator):
                                                      labels=['X', 'Y'],
                                                      units=['pixel', 'pixel'])
 
-        ds_chunking = calc_chunks([num_files, num_pixels],
-                                  data_type(0).itemsize,
-                                  unit_chunks=(1, num_pixels))
-
-    # Allocate space for Main_Data and Pixel averaged Data
-        ds_main_data = MicroDataset('Raw_Data', data=[], maxshape=(num_files, num_pixels),
-                                    chunking=ds_chunking, dtype=data_type, compression='gzip')
-        ds_mean_ronch_data = MicroDataset('Mean_Ronchigram',
-                                          data=np.zeros(num_pixels, dtype=np.float32),
-                                          dtype=np.float32)
-        ds_mean_spec_data = MicroDataset('Spectroscopic_Mean',
-                                         data=np.zeros(num_files, dtype=np.float32),
-                                         dtype=np.float32)
-    # Add datasets as children of Measurement_000 data group
-        chan_grp.addChildren([ds_main_data, ds_spec_ind, ds_spec_vals, ds_pos_ind,
-                              ds_pos_val, ds_mean_ronch_data, ds_mean_spec_data])
+        if frame_index is None:
+            ds_chunking = calc_chunks([num_files, num_pixels],
+                                      data_type(0).itemsize,
+                                      unit_chunks=(1, num_pixels))
+
+            # Allocate space for Main_Data and Pixel averaged Data
+            ds_main_data = MicroDataset('Raw_Data', data=[], maxshape=(num_files, num_pixels),
+                                        chunking=ds_chunking, dtype=data_type, compression='gzip')
+            ds_mean_ronch_data = MicroDataset('Mean_Ronchigram',
+                                              data=np.zeros(num_pixels, dtype=np.float32),
+                                              dtype=np.float32)
+            ds_mean_spec_data = MicroDataset('Spectroscopic_Mean',
+                                             data=np.zeros(num_files, dtype=np.float32),
+                                             dtype=np.float32)
+            # Add datasets as children of Measurement_000 data group
+            chan_grp.addChildren([ds_main_data, ds_mean_ronch_data, ds_mean_spec_data])
+        else:
+            chan_grp.addChildren([frame_index])
+        chan_grp.addChildren([ds_spec_ind, ds_spec_vals, ds_pos_ind, ds_pos_val])
         meas_grp.addChildren([chan_grp])
 
         root_grp.addChildren([meas_grp])
@@ -347,14 +364,20 @@ class PtychographyTranslator(Translator):
         # root_grp.showTree()
 
         h5_refs = self.hdf.writeData(root_grp)
-        h5_main = getH5DsetRefs(['Raw_Data'], h5_refs)[0]
-        h5_ronch = getH5DsetRefs(['Mean_Ronchigram'], h5_refs)[0]
-        h5_mean_spec = getH5DsetRefs(['Spectroscopic_Mean'], h5_refs)[0]
         aux_ds_names = ['Position_Indices',
                         'Position_Values',
                         'Spectroscopic_Indices',
                         'Spectroscopic_Values']
 
+        if frame_index is None:
+            h5_main = getH5DsetRefs(['Raw_Data'], h5_refs)[0]
+            h5_ronch = getH5DsetRefs(['Mean_Ronchigram'], h5_refs)[0]
+            h5_mean_spec = getH5DsetRefs(['Spectroscopic_Mean'], h5_refs)[0]
+        else:
+            h5_main = getH5DsetRefs([frame_index.name], h5_refs)[0]
+            h5_ronch = None
+            h5_mean_spec = None
+
         link_as_main(h5_main, *getH5DsetRefs(aux_ds_names, h5_refs))
 
         self.hdf.flush()
@@ -11,6 +11,7 @@ import os
 import numpy as np
 from skimage.measure import block_reduce
 
+from .df_utils.image_stack import FrameReader, write_image_stack
 from .df_utils.io_image import read_image, read_dm3
 from .translator import Translator
 from .utils import generate_dummy_main_parms, build_ind_val_dsets
@@ -138,75 +139,17 @@ class MovieTranslator(Translator):
         None
         """
 
-        mean_ronch = np.zeros(h5_ronch.shape, dtype=np.float32)
-
-        num_files = len(image_stack)
-
         if os.path.isfile(image_path):
-            self.__save_dm3_frames(image_stack, h5_main, h5_mean_spec, h5_ronch, mean_ronch, num_files)
+            # Frames were already read from the dm3 stack. No point in shipping them to other processes
+            frame_reader = FrameReader(bin_factor=self.bin_factor if self.rebin else None, bin_func=self.bin_func)
+            cores = 1
         else:
-            self.__read_image_files(image_stack, h5_main, h5_mean_spec, h5_ronch, image_path, mean_ronch, num_files)
-
-    def __save_dm3_frames(self, image_stack, h5_main, h5_mean_spec, h5_ronch, mean_ronch, num_frames):
-        """
-
-        :param image_stack:
-        :param h5_main:
-        :param h5_mean_spec:
-        :param h5_ronch:
-        :param mean_ronch:
-        :param num_frames:
-        :return:
-        """
-        for iframe, thisframe in enumerate(image_stack):
-            selected = (iframe + 1) % round(num_frames / 16) == 0
-            if selected:
-                print('Processing file...{}% - reading: {}'.format(round(100 * iframe / num_frames), iframe))
-            image = self.binning_func(thisframe, self.bin_factor, self.bin_func).flatten()
-            h5_main[:, iframe] = image
-
-            h5_mean_spec[iframe] = np.mean(image)
-
-            mean_ronch += image
-
-            self.hdf.flush()
-
-        h5_ronch[:] = mean_ronch / num_frames
-        self.hdf.flush()
+            frame_reader = FrameReader(image_path, bin_factor=self.bin_factor if self.rebin else None,
+                                       bin_func=self.bin_func, read_kwargs={'as_grey': True})
+            cores = None
 
-    def __read_image_files(self, image_stack, h5_main, h5_mean_spec, h5_ronch, image_path, mean_ronch, num_files):
-        """
-        Read each image from `file_list` and save it in `h5_main`.
-
-        Parameters
-        ----------
-        image_stack:
-        :param h5_main:
-        :param h5_mean_spec:
-        :param h5_ronch:
-        :param image_path:
-        :param mean_ronch:
-        :param num_files:
-        :return:
-        """
-        for ifile, thisfile in enumerate(image_stack):
-
-            selected = (ifile + 1) % round(num_files / 16) == 0
-            if selected:
-                print('Processing file...{}% - reading: {}'.format(round(100 * ifile / num_files), thisfile))
-
-            image = read_image(os.path.join(image_path, thisfile), greyscale=True)
-            image = self.binning_func(image, self.bin_factor, self.bin_func)
-            image = image.flatten()
-            h5_main[:, ifile] = image
-
-            h5_mean_spec[ifile] = np.mean(image)
-
-            mean_ronch += image
-
-            self.hdf.flush()
-        h5_ronch[:] = mean_ronch / num_files
-        self.hdf.flush()
+        write_image_stack(image_stack, frame_reader, h5_main, h5_mean_spec, h5_ronch, frames_as_rows=False,
+                          max_mem=self.max_ram, cores=cores)
 
     def downSampRoncVec(self, ronch_vec, binning_factor):
         """
@@ -42,44 +42,37 @@ class TRKPFMTranslator(Translator):
 
     def _parse_spectrogram_size(self, file_handle):
         """
+        Determines the size of each record (spectrogram + header) and the number of records from the file size
         
         Parameters
         ----------
-        file_handle
+        file_handle : file object
+            Handle to one of the .dat files
 
         Returns
         -------
         data_length: int, size of the spectrogram
         count: int, number of pixels in dataset +1
 
-        """"""
         """
 
         f = file_handle
 
-        cont_cond = True
-        count = 0
+        f.seek(0, 0)
+        data_length = int(np.fromfile(f, dtype=np.float32, count=1)[0])
 
-        data_lengths = []
+        records = self.read_file(data_length, f.name, field='header')
+        count = records.shape[0] + 1
 
-        while cont_cond:
-            print(count, f.tell())
-            count += 1
-
-            data_length = np.fromfile(f, dtype=np.float32, count=1)
-
-            if data_length > 0:
-                data_lengths.append(int(data_length))
-                f.seek(int(data_length-1)*4, 1)
-            else:
-                cont_cond = False
-
-        if len(np.unique(np.array(data_lengths)))>1:
+        # The first value of every header is the record length
+        if np.any(records[:, 0] != data_length):
             print("Unequal data lengths! Cannot continue")
         else:
             print("Equal data lengths")
 
-        return data_lengths[0], count
+        del records
+
+        return data_length, count
 
 
     def translate(self, parm_path):
@@ -102,8 +95,8 @@ class TRKPFMTranslator(Translator):
 
         num_dat_files = len(self.file_list)
 
-        f = open(self.file_list[0], 'rb')
-        spectrogram_size, count_vals = self._parse_spectrogram_size(f)
+        with open(self.file_list[0], 'rb') as f:
+            spectrogram_size, count_vals = self._parse_spectrogram_size(f)
         print("spectrogram size:", spectrogram_size)
         num_pixels = parm_dict['grid_num_rows']*parm_dict['grid_num_cols']
         print('Number of pixels: ', num_pixels)
@@ -199,55 +192,73 @@ class TRKPFMTranslator(Translator):
 
         #Scan through all the .dat files available
         for ifile, file_path in enumerate(self.file_list):
-            f = open(file_path, 'rb')
-            results_p = self.read_file(data_length, f)
-            spectrogram_matrix = np.array(results_p[:])
-            b_axis = spectrogram_matrix.shape[2]
-            c_axis = spectrogram_matrix.shape[1]
-            dall = np.transpose(spectrogram_matrix, (0, 2, 1)).reshape(num_pixels * c_axis, b_axis)
+            headers = self.read_file(data_length, file_path, field='header')
+            payload = self.read_file(data_length, file_path)
+
+            # Each record holds an s1 x s2 spectrogram. Duplicates are searched for over consecutive runs of s2
+            # values of the flattened records
+            s1 = int(headers[0, 3])
+            s2 = int(headers[0, 4])
+            num_records = min(payload.shape[0], num_pixels)
+            if payload.shape[0] != num_pixels:
+                warn('Found {} records in {} but expected {}'.format(payload.shape[0], file_path, num_pixels))
+
+            # Mark repeated lines. np.unique sorts a copy of the lines but never holds the python objects
+            # or transposed copies that the previous reader did
+            dall = payload[:num_records].reshape(num_records * s1, s2)
             _, ia, ic = np.unique(dall, axis=0, return_index=True, return_inverse=True)
             reprowind = np.setdiff1d(ic, ia)
-
-            if len(reprowind>0):
-                dall[reprowind, :] = np.nan
+            rep_mask = np.zeros(dall.shape[0], dtype=bool)
+            rep_mask[reprowind] = True
+            del dall, ia, ic
 
             #Write to the datasets
             h5_main = self.raw_datasets[ifile]
 
-            if real_cond[ifile]:
-                h5_main[:, :] = dall.reshape(h5_main.shape) + 1j*0
-            else:
-                h5_main[:, :] += 0 + 1j*dall.reshape(h5_main.shape)
+            # Each record costs its float32 bytes + complex64 copy (twice for the imaginary read-modify-write)
+            bytes_per_record = payload.shape[1] * (4 + 2 * h5_main.dtype.itemsize)
+            recs_per_block = max(1, int(self.max_ram // (2 * bytes_per_record)))
 
-            h5_main.file.flush()
+            for start in range(0, num_records, recs_per_block):
+                end = min(start + recs_per_block, num_records)
+                block = np.array(payload[start:end])
+                block_lines = block.reshape(-1, s2)
+                block_lines[rep_mask[start * s1:end * s1]] = np.nan
 
-    def read_file(self, data_length, f):
-        start_point = 0
-        count=0
-        count_vals=[]
-        f.seek(start_point * 4, 0)
-        cont_cond=True
-        results_p=[]
-        while cont_cond:
-            count_vals.append(count)
-            count += 1
+                if real_cond[ifile]:
+                    h5_main[start:end] = block + 1j*0
+                else:
+                    h5_main[start:end] = h5_main[start:end] + 1j*block
 
-            data_vec = np.fromfile(f, dtype=np.float32, count=int(data_length))
-            data_vec1 = data_vec[5:int(data_length)]
+                h5_main.file.flush()
 
-            if len(data_vec) > 1:
+            del headers, payload
 
-                s1 = data_vec[3]
-                s2 = data_vec[4]
-                #print('Data_mat and s1,s2:', data_vec1.shape, s1, s2)
-                data_mat1 = data_vec1.reshape(int(s2), int(s1)).T
-                results_p.append(data_mat1)
+    @staticmethod
+    def read_file(data_length, file_path, field='payload'):
+        """
+        Memory maps a .dat file as an array of records. Each record contains a 5 value header followed by the
+        flattened spectrogram
 
-            else:
-                cont_cond = False
+        Parameters
+        ----------
+        data_length : unsigned int
+            Number of float32 values in each record including the header
+        file_path : string / unicode
+            Absolute path of the .dat file
+        field : string / unicode, Optional. Default = 'payload'
+            'payload' to get the spectrograms or 'header' to get the headers
 
-        f.close()
-        return results_p
+        Returns
+        -------
+        records : 2D numpy.memmap
+            Records (rows) by header or spectrogram values (columns). Trailing partial records are ignored
+        """
+        record_dtype = np.dtype([('header', np.float32, (5,)),
+                                 ('payload', np.float32, (int(data_length) - 5,))])
+        num_records = path.getsize(file_path) // record_dtype.itemsize
+        records = np.memmap(file_path, dtype=record_dtype, mode='r', shape=(num_records,))
+        return records[field]
 
     @staticmethod
     def _read_parms(parm_path):
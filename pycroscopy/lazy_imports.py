@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Oct 18, 2026
+
+Deferred loading of the submodules of pycroscopy and the objects they export.
+"""
+
+from __future__ import division, print_function, absolute_import
+import sys
+from importlib import import_module
+
+
+def attach_lazy(package_name, submodules=None, exports=None):
+    """
+    Builds the module level __getattr__ and __dir__ functions (PEP 562) of a package such that its submodules and
+    the objects they export are only imported when they are first accessed.  This keeps heavy dependencies such as
+    matplotlib, sklearn and skimage out of processes that never use them.
+
+    Python versions before 3.7 do not support module level __getattr__, so everything is imported immediately
+    there, just as a package with ordinary imports would.
+
+    Parameters
+    ----------
+    package_name : str
+        Name of the package, typically __name__ of its __init__
+    submodules : list of str, optional
+        Names of the submodules (and subpackages) that can be accessed as attributes of the package
+    exports : dict, optional
+        Maps the name of each exported object to the submodule (relative to the package) that provides it.
+        Use 'submodule:attribute' if the object is named differently in the submodule
+
+    Returns
+    -------
+    __getattr__ : function
+        Imports and returns the requested submodule or object
+    __dir__ : function
+        Lists the names available in the package, whether loaded or not
+
+    Examples
+    --------
+    >>> __getattr__, __dir__ = attach_lazy(__name__, ['plot_utils'], {'plot_map': 'plot_utils'})
+    """
+    submodules = set() if submodules is None else set(submodules)
+    exports = dict() if exports is None else dict(exports)
+
+    def __getattr__(name):
+        if name in submodules:
+            value = import_module('.' + name, package_name)
+        elif name in exports:
+            module_name, _, attr_name = exports[name].partition(':')
+            module = import_module('.' + module_name, package_name)
+            attr_name = attr_name or name
+            try:
+                value = getattr(module, attr_name)
+            except AttributeError:
+                # The object is itself a submodule of the submodule that has not been imported yet
+                value = import_module('.' + attr_name, module.__name__)
+        else:
+            raise AttributeError("module '{}' has no attribute '{}'".format(package_name, name))
+
+        # Subsequent lookups are served by the module dictionary directly
+        setattr(sys.modules[package_name], name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package_name])) | submodules | set(exports))
+
+    if sys.version_info < (3, 7):
+        for name in sorted(submodules) + sorted(exports):
+            __getattr__(name)
+
+    return __getattr__, __dir__
@@ -1,35 +1,40 @@
+"""
+The processing tools, and sklearn / skimage / matplotlib which they rely upon, are only imported when first accessed
+"""
+from ..lazy_imports import attach_lazy
 
-from . import fft
-from . import gmode_utils
-from . import proc_utils
-from . import svd_utils
-from .svd_utils import doSVD, rebuild_svd
-from . import decomposition
-from .decomposition import Decomposition
-from . import cluster
-from .cluster import Cluster
-from . import image_processing
-from .image_processing import ImageWindow
-from . import giv_utils
 
 def no_impl(*args,**kwargs):
     raise NotImplementedError("You need to install Multiprocess package (pip,github) to do a parallel Computation.\n"
                               "Switching to the serial version. ")
 
-from .feature_extraction import FeatureExtractorParallel, FeatureExtractorSerial
-from .image_transformation import geoTransformerParallel, geoTransformerSerial
 
-FeatureExtractor = FeatureExtractorSerial
-geoTransformer = geoTransformerSerial
+_exports = {'doSVD': 'svd_utils',
+            'rebuild_svd': 'svd_utils',
+            'Decomposition': 'decomposition',
+            'Cluster': 'cluster',
+            'ImageWindow': 'image_processing',
+            'FeatureExtractorSerial': 'feature_extraction',
+            'geoTransformerSerial': 'image_transformation'}
 
 try:
     import multiprocessing
 except ImportError:
     FeatureExtractorParallel = no_impl
     geoTransformerParallel = no_impl
+    _exports['FeatureExtractor'] = 'feature_extraction:FeatureExtractorSerial'
+    _exports['geoTransformer'] = 'image_transformation:geoTransformerSerial'
 else:
-    FeatureExtractor = FeatureExtractorParallel
-    geoTransformer = geoTransformerParallel
+    _exports['FeatureExtractorParallel'] = 'feature_extraction'
+    _exports['geoTransformerParallel'] = 'image_transformation'
+    _exports['FeatureExtractor'] = 'feature_extraction:FeatureExtractorParallel'
+    _exports['geoTransformer'] = 'image_transformation:geoTransformerParallel'
+
+__getattr__, __dir__ = attach_lazy(__name__,
+                                   ['fft', 'gmode_utils', 'proc_utils', 'svd_utils', 'decomposition', 'cluster',
+                                    'image_processing', 'giv_utils', 'feature_extraction', 'image_transformation',
+                                    'process', 'atom_finding'],
+                                   _exports)
 
 __all__ = ['Cluster', 'Decomposition', 'ImageWindow', 'doSVD', 'fft', 'gmode_utils', 'proc_utils', 'svd_utils',
            'giv_utils', 'rebuild_svd']
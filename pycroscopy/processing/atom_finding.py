@@ -123,37 +123,31 @@ def apply_wiener_filter(file_in_h5,img_num,filter_num):
     s=1.1 # constant for now change latter 
     
     size=img.shape 
-    h = np.empty(size)
     width=size[0]
     height=size[1]
-    for x in range(0,width):
-        for y in range(0,height):
-            h[x,y]=(s/2*3.141592)**(-s*np.sqrt(x**2+y**2))
+    # point spread function evaluated over the whole grid at once
+    x=np.arange(0,width)[:,None]
+    y=np.arange(0,height)[None,:]
+    h=(s/2*3.141592)**(-s*np.sqrt(x**2+y**2))
     h = h/ np.sum(np.sum(h))    
-    H = np.fft.fft2(h)
+    # The image and the point spread function are real, so only half of their spectra need to be computed
+    H = np.fft.rfft2(h)
     K = np.linspace(.001,1,100)
-    G = np.fft.fft2(img)
-    errorV=np.empty([1,100]) 
-    errorV=errorV[0]
+    G = np.fft.rfft2(img)
+    # parts of the filtered spectrum that do not depend on the regularization constant
+    HG = np.conj(H)*G
+    H2 = np.abs(H)**2
+    errorV=np.empty(100)
     for k1 in range(0,100):
-        W = np.conj(H)/(np.abs(H)**2 + K[k1])
-        F = W*G
-        R = np.abs(np.fft.ifft2(F))
-        errorV[k1]=np.std(np.reshape(R,[1,width*height]))
+        R = np.abs(np.fft.irfft2(HG/(H2 + K[k1]), s=size))
+        errorV[k1]=np.std(R)
         
         
     # use best option 
-    minv=np.min(errorV)
-    minl=np.where(errorV==minv)
-    minl=minl[0]
-    minl=minl[0]
-    W = np.conj(H)/(np.abs(H)**2 + K[minl])
-    F = W*G
-    img= np.fft.ifft2(F)
+    minl=np.argmin(errorV)
+    img=np.abs(np.fft.irfft2(HG/(H2 + K[minl]), s=size))
     
     img=img.reshape(len(img2),1)
-    img=abs(img);
-    img=np.real(img);
     
     image_path="/Frame_%04i/Channel_Current" % (img_num)
     for x in range(0,filter_num+2): 
@@ -714,84 +708,78 @@ def cluster_into_atomic_columns(file_in_h5,img_num,filter_num,dist_val):
     main_h5_handle.close()
         
     
+def _cluster_labels(mat_in,dist_val):
+    """
+    Groups the nonzero elements of mat_in into clusters of elements that can be reached from one another through
+    steps of at most dist_val (city block distance). Neighbors are found with a KD-tree and the clusters are the
+    connected components of the resulting graph.
+
+    Parameters
+    ----------
+    mat_in : 2D numpy array
+        Image whose nonzero elements are to be clustered
+    dist_val : float
+        Largest distance between neighboring elements of a cluster
+
+    Returns
+    -------
+    points : 2D numpy array
+        Positions of the nonzero elements, in the order of np.argwhere
+    labels : 1D numpy array
+        Cluster of each element. Clusters are numbered in the order of their first element
+    num_clusters : int
+        Number of clusters
+    """
+
+    import numpy as np
+    from scipy.spatial import cKDTree
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    points=np.argwhere(mat_in)
+    num_points=len(points)
+    if num_points==0:
+        return points, np.zeros(0,dtype=int), 0
+
+    pairs=cKDTree(points).query_pairs(dist_val,p=1,output_type='ndarray')
+    graph=coo_matrix((np.ones(len(pairs),dtype=bool),(pairs[:,0],pairs[:,1])),shape=(num_points,num_points))
+    num_clusters,labels=connected_components(graph,directed=False)
+
+    # renumber the clusters in the order of their first element
+    first_points=np.unique(labels,return_index=True)[1]
+    new_labels=np.empty(num_clusters,dtype=int)
+    new_labels[np.argsort(first_points)]=np.arange(num_clusters)
+
+    return points, new_labels[labels], num_clusters
+
+
 def cluster_2d_oleg(mat_in,dist_val):
 
     import numpy as np
-    
-    tt=[0,0]
-    clusters=[];
-    to_cluster=np.argwhere(mat_in);
-    to_cluster=to_cluster.tolist()
 
-    while (len(to_cluster)>0):
-        clust=[];
-        final_clust=[];
-        clust.append(to_cluster[0]);
-        to_cluster.remove(to_cluster[0])
-        while ((len(clust)>0) & (len(to_cluster)>0)):
-            tt[0]=5000.0 * dist_val;
-            tt[1]=len(to_cluster);
-            t1=min(tt);
-            t1=int(t1);
-            to_cluster_t=to_cluster[0:t1];
-            dem_diff=abs(to_cluster_t- np.tile(clust[0],[t1,1]));
-            diff_vec=np.argwhere(sum(dem_diff,1)<=dist_val);
-            for px in range(len(diff_vec),0,-1):
-                pt=diff_vec[px-1];
-                clust.append(to_cluster[pt]);
-                to_cluster.remove(to_cluster[pt])
-            final_clust.append(clust[0]);
-            clust.remove(clust[0]);
-    
-        if (len(clust)>0):
-            while (len(clust)<0):
-                final_clust.append(clust[0]);
-                clust.remove(clust[0]);
-            
-        clusters.append(final_clust);
-        
-        
+    points,labels,num_clusters=_cluster_labels(mat_in,dist_val)
+
+    # elements of each cluster in the order of np.argwhere
+    order=np.argsort(labels,kind='mergesort')
+    splits=np.cumsum(np.bincount(labels,minlength=num_clusters))[:-1]
+    clusters=[clust.tolist() for clust in np.split(points[order],splits)] if num_clusters>0 else []
+
     return clusters
 
 def cluster_2d_oleg_return_geo_center(mat_in,dist_val):
     
     import numpy as np
     
-    tt=[0,0]
-    clusters=[];
-    to_cluster=np.argwhere(mat_in);
-    to_cluster=to_cluster.tolist()
+    points,labels,num_clusters=_cluster_labels(mat_in,dist_val)
 
-    while (len(to_cluster)>0):
-        clust=[];
-        final_clust=[];
-        clust.append(to_cluster[0]);
-        to_cluster.remove(to_cluster[0])
-        while ((len(clust)>0) & (len(to_cluster)>0)):
-            tt[0]=5000.0 * dist_val;
-            tt[1]=len(to_cluster);
-            t1=min(tt);
-            t1=int(t1);
-            to_cluster_t=to_cluster[0:t1];
-            dem_diff=abs(to_cluster_t- np.tile(clust[0],[t1,1]));         
-            diff_vec=np.argwhere(np.sum(dem_diff,axis=1)<=dist_val); 
-            for px in range(len(diff_vec),0,-1):
-                pt=diff_vec[px-1];
-                clust.append(to_cluster[pt]);
-                to_cluster.remove(to_cluster[pt])
-            final_clust.append(clust[0]);
-            clust.remove(clust[0]);
-    
-        if (len(clust)>0):
-            while (len(clust)<0):
-                final_clust.append(clust[0]);
-                clust.remove(clust[0]);
+    counts=np.bincount(labels,minlength=num_clusters)
+    clusters=np.zeros([num_clusters,2])
+    for dim in range(2):
+        clusters[:,dim]=np.bincount(labels,weights=points[:,dim],minlength=num_clusters)
+    clusters=clusters/np.maximum(counts,1)[:,None]
 
-        if (len(final_clust)>2):
-            clusters.append(np.mean(final_clust,0));
-        
-        
-    clusters=np.array(clusters)  
+    # only clusters of more than two elements are kept
+    clusters=clusters[counts>2]
     clusters=clusters.tolist();
     
     return clusters
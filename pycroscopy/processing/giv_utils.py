@@ -6,18 +6,16 @@ Created on Thu Jan 12 15:31:55 2017
 """
 
 from __future__ import division, print_function, absolute_import
-from multiprocessing import Pool
 from _warnings import warn
-import itertools
 import time as tm
 import numpy as np
 import matplotlib.pyplot as plt
 from scipy.linalg import sqrtm
 
 from ..io.io_hdf5 import ioHDF5
-from ..io.io_utils import recommendCores
 from ..io.microdata import MicroDataGroup, MicroDataset
 from ..io.hdf_utils import getH5DsetRefs, getAuxData, link_as_main, copyAttributes, linkRefAsAlias
+from .process import Process
 
 
 def do_bayesian_inference(V, IV_point, freq, num_x_steps=251, gam=0.03, e=10.0, sigma=10., sigmaC=1.,
@@ -372,36 +370,6 @@ def bayesian_inference_dataset(h5_main, ex_freq, gain, split_directions=False, n
         Reference to the group containing all the results of the Bayesian Inference
     """
 
-    def __process_chunk(data, parms_chunk, num_cores_chunk, amp_gain):
-        """
-        Processes the provided chunk of data using the parameters in parallel
-
-        Parameters
-        ----------
-        data : 2D numpy array
-            data to be processed arranged as [instances, features]
-        parms_chunk : dictionary
-            Dictionary of parameters to be passed to the processing function
-        num_cores_chunk : unsigned int
-            Number of cores to use for parallel computation
-        amp_gain : unsigned int
-            Amplifier gain such as 8 or 9, not 10^8 or 10^9
-
-        Returns
-        -------
-        results : list
-            List of dictionaries containing results from the bayesian inference
-        """
-        mult_to_nA = 10**(9-amp_gain)
-        sing_parm = itertools.izip(data*mult_to_nA, itertools.repeat(parms_chunk))
-        # Start parallel processing:
-        print('Starting a pool of {} cores'.format(num_cores_chunk))
-        pool = Pool(processes=current_num_cores)
-        jobs = pool.imap(bayesian_inference_unit, sing_parm)  # , chunksize=num_chunks)
-        results = [j for j in jobs]
-        pool.close()
-        return results
-
     num_samples = int(num_samples)
     num_x_steps = int(num_x_steps)
     if num_x_steps % 2 == 0:
@@ -534,90 +502,91 @@ def bayesian_inference_dataset(h5_main, ex_freq, gain, split_directions=False, n
         parm_dict_rev = parm_dict.copy()
         parm_dict_rev['volt_vec'] = rolled_bias[half_v_steps:]
 
-    max_pos_per_chunk = 1000  # Need a better way of figuring out a more appropriate estimate
-
-    start_pix = 0
-    time_per_pix = 0
-    x_vec = None
-
-    while start_pix < num_pos:
-
-        last_pix = min(start_pix + max_pos_per_chunk, num_pos)
-        print('Working on pixels {} to {} of {}'.format(start_pix, last_pix, num_pos))
-
-        current_num_cores = recommendCores(last_pix - start_pix, requested_cores=num_cores, lengthy_computation=True)
-
-        t_start = tm.time()
-        if split_directions:
-            # first load the results to memory and then roll them
-            rolled_raw_data = np.roll(h5_main[start_pix: last_pix], int(single_ao.size * roll_cyc_fract), axis=1)
-
-            forward_results = __process_chunk(rolled_raw_data[:, :half_v_steps], parm_dict_forw, current_num_cores,
-                                              gain)
-            if verbose:
-                print('Finished processing forward loops')
-            reverse_results = __process_chunk(rolled_raw_data[:, half_v_steps:], parm_dict_rev, current_num_cores, gain)
-            if verbose:
-                print('Finished processing reverse loops')
-        else:
-            bayes_results = __process_chunk(h5_main[start_pix:last_pix], parm_dict, current_num_cores, gain)
-
-        tot_time = np.round(tm.time() - t_start)
-
-        if verbose:
-            print('Done parallel computing in {} sec or {} sec per pixel'.format(tot_time, tot_time/max_pos_per_chunk))
-
-        if start_pix == 0:
-            time_per_pix = tot_time/last_pix  # in seconds
-        else:
-            print('Time remaining: {} hours'.format(np.round((num_pos - last_pix) * time_per_pix / 3600, 2)))
-
-        if verbose:
-            print('Started accumulating all results')
-
-        chunk_pos = last_pix - start_pix
-        cap_vec = np.zeros(shape=(chunk_pos, 2), dtype=np.float32)
-        vr_mat = np.zeros(shape=(chunk_pos, num_actual_x_steps), dtype=np.float32)
-        mr_mat = np.zeros(shape=(chunk_pos, num_actual_x_steps), dtype=np.float32)
-        irec_mat = np.zeros(shape=(chunk_pos, single_ao.size), dtype=np.float32)
-
-        # filling in all the results:
-        if split_directions:
-            x_vec = np.hstack((forward_results[0]['x'], reverse_results[0]['x']))
-            for pix_ind, forw_results, rev_results in zip(range(chunk_pos), forward_results, reverse_results):
-                vr_mat[pix_ind] = np.hstack((forw_results['vR'], rev_results['vR']))
-                mr_mat[pix_ind] = np.hstack((forw_results['mR'], rev_results['mR']))
-                irec_mat[pix_ind] = np.hstack((forw_results['Irec'], rev_results['Irec']))
-                cap_vec[pix_ind] = np.hstack((forw_results['cValue'], rev_results['cValue']))
-        else:
-            x_vec = bayes_results[0]['x']
-            for pix_ind, pix_results in enumerate(bayes_results):
-                cap_vec[pix_ind] = pix_results['cValue']
-                vr_mat[pix_ind] = pix_results['vR']
-                mr_mat[pix_ind] = pix_results['mR']
-                irec_mat[pix_ind] = pix_results['Irec']
+    print('Performing Bayesian inference now. Be patient, this could take a while')
 
-        t_accum_end = tm.time()
+    t_start = tm.time()
+    bayesian = GIVBayesian(h5_main, parm_dict, gain, h5_cap, h5_vr, h5_mr, h5_irec, parm_dict_forw=parm_dict_forw,
+                           parm_dict_rev=parm_dict_rev, roll_pts=int(single_ao.size * roll_cyc_fract),
+                           cores=num_cores)
+    bayesian.compute()
 
-        if verbose:
-            print('Finished accumulating results')
-            print('Writing to h5')
+    h5_new_spec_vals[0, :] = bayesian.x_vec
+    hdf.flush()
 
-        h5_cap[start_pix: last_pix] = cap_vec
-        h5_vr[start_pix: last_pix] = vr_mat
-        h5_mr[start_pix: last_pix] = mr_mat
-        h5_irec[start_pix: last_pix] = irec_mat
-
-        if verbose:
-            print('Finished writing to file in {} sec'.format(np.round(tm.time() - t_accum_end)))
+    if verbose:
+        print('Finished processing the dataset completely in {} sec'.format(np.round(tm.time() - t_start)))
 
-        hdf.flush()
+    return h5_cap.parent
 
-        start_pix = last_pix
 
-    h5_new_spec_vals[0, :] = x_vec  # Technically this needs to only be done once
+class GIVBayesian(Process):
+    """
+    Infers the resistance and capacitance of each position of a G-mode IV dataset and writes them into datasets that
+    have already been created.  Used by bayesian_inference_dataset
 
-    if verbose:
-        print('Finished processing the dataset completely')
+    Parameters
+    ----------
+    h5_main : h5py.Dataset
+        Dataset containing the IV spectroscopy data
+    parm_dict : dict
+        Parameters of the Bayesian inference. See bayesian_inference_unit
+    gain : unsigned int
+        Amplifier gain such as 8 or 9, not 10^8 or 10^9
+    h5_cap : h5py.Dataset
+        Dataset for the capacitance of each position
+    h5_vr : h5py.Dataset
+        Dataset for the variance of the resistance of each position
+    h5_mr : h5py.Dataset
+        Dataset for the resistance of each position
+    h5_irec : h5py.Dataset
+        Dataset for the reconstructed current of each position
+    parm_dict_forw : dict, optional
+        Parameters for the forward portion of the loop. The loops are only split into directions if provided
+    parm_dict_rev : dict, optional
+        Parameters for the reverse portion of the loop
+    roll_pts : int, optional
+        Number of points by which the loops are rolled before being split into directions
+    cores : unsigned int, optional
+        Number of cores to use for computation
+    """
 
-    return h5_cap.parent
+    def __init__(self, h5_main, parm_dict, gain, h5_cap, h5_vr, h5_mr, h5_irec, parm_dict_forw=None,
+                 parm_dict_rev=None, roll_pts=0, cores=None):
+        super(GIVBayesian, self).__init__(h5_main, cores=cores)
+        self._unit_kwargs = {'parm_dict': parm_dict, 'mult_to_nA': 10 ** (9 - gain), 'parm_dict_forw': parm_dict_forw,
+                             'parm_dict_rev': parm_dict_rev, 'roll_pts': roll_pts}
+        self.h5_cap = h5_cap
+        self.h5_vr = h5_vr
+        self.h5_mr = h5_mr
+        self.h5_irec = h5_irec
+        self.h5_results = h5_irec
+        # Interpolated voltage vector, common to all positions
+        self.x_vec = None
+
+    def _create_results_datasets(self):
+        """
+        The results datasets are created and linked by bayesian_inference_dataset
+        """
+        pass
+
+    @staticmethod
+    def _unit_function(unit, parm_dict=None, mult_to_nA=1, parm_dict_forw=None, parm_dict_rev=None, roll_pts=0):
+        iv_point = unit * mult_to_nA
+        if parm_dict_forw is None:
+            return bayesian_inference_unit((iv_point, parm_dict))
+
+        # Compute the forward and reverse portions of the loop separately
+        rolled_iv = np.roll(iv_point, roll_pts)
+        half_v_steps = len(parm_dict_forw['volt_vec'])
+        forw_results = bayesian_inference_unit((rolled_iv[:half_v_steps], parm_dict_forw))
+        rev_results = bayesian_inference_unit((rolled_iv[half_v_steps:], parm_dict_rev))
+        return {key: np.hstack((forw_results[key], rev_results[key])) for key in forw_results.keys()}
+
+    def _write_results(self, pos_slice, results):
+        if self.x_vec is None:
+            self.x_vec = results[0]['x']
+        self.h5_cap[pos_slice] = np.array([pix_results['cValue'] for pix_results in results],
+                                          dtype=np.float32).reshape(-1, self.h5_cap.shape[1])
+        self.h5_vr[pos_slice] = np.array([pix_results['vR'] for pix_results in results], dtype=np.float32)
+        self.h5_mr[pos_slice] = np.array([pix_results['mR'] for pix_results in results], dtype=np.float32)
+        self.h5_irec[pos_slice] = np.array([pix_results['Irec'] for pix_results in results], dtype=np.float32)
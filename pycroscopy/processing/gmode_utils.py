@@ -9,7 +9,7 @@ from __future__ import division, print_function, absolute_import
 import sys
 import itertools
 from collections import Iterable
-from multiprocessing import Pool, cpu_count
+from multiprocessing import Pool
 from warnings import warn
 import matplotlib.pyplot as plt
 import numpy as np
@@ -21,6 +21,7 @@ from ..io.io_utils import getTimeStamp
 from ..io.microdata import MicroDataGroup, MicroDataset
 from ..viz.plot_utils import rainbow_plot
 from ..io.translators.utils import build_ind_val_dsets
+from .process import Process
 
 # TODO: Use filter_parms as a kwargs instead of a required input
 # TODO: Phase rotation not implemented correctly. Find and use excitation frequency
@@ -203,93 +204,6 @@ def fft_filter_dataset(h5_main, filter_parms, write_filtered=True, write_condens
     HDF5 group reference containing filtered dataset
     """ 
     
-    def __max_pixel_read(h5_raw, num_cores, store_filt=True, hot_bins=None, bytes_per_bin=2, max_RAM_gb=16):
-        """
-        Returns the maximum number of pixels that can be stored in memory considering the output data and the
-        number of cores
-        
-        Parameters
-        ----------
-        h5_raw : HDF5 Dataset reference
-            Dataset containing the raw data
-        num_cores : unsigned int
-            Number of cores to use for processing data in parallel
-        store_filt : boolean (optional)
-            Write filtered data back to h5
-        hot_bins : 1D numpy array (optional)
-            Bins in the frequency domain to be saved to h5
-        bytes_per_bin : unsigned int (optional)
-            bytes per unit in the raw data - typically 2 bytes
-        max_RAM_gb : unsigned int (optional)
-            Maximum system memory that can be used. This is NOT respected well. Please fix this.            
-        """
-        
-        # double the memory requirement if storing filtered data
-        if store_filt:
-            bytes_per_bin *= 2   
-        bytes_per_pix = h5_raw.shape[1] * bytes_per_bin
-        # account for the hot bins separately
-        if hot_bins is not None:
-            bytes_per_pix += len(hot_bins) * 8  # complex64
-        
-        # Multiply this memory requirement per pixel by the number of cores
-        bytes_per_pix *= num_cores
-        
-        max_pix = int(np.rint(max_RAM_gb*1024**3 / bytes_per_pix))
-        max_pix = max(1, min(h5_raw.shape[0], max_pix))
-        print('Allowed to read', max_pix, 'of', h5_raw.shape[0], 'pixels')
-
-        return np.uint(max_pix)
-        
-    def __filter_chunk(raw_mat, parm_dict, recom_cores):
-        """
-        This function delegates the actual fitting responsibility to the
-        appropriate function. Decides whether or not serial / parallel processing
-        is appropriate, number of cores, number of chunks, etc.
-        
-        Parameters
-        ----------
-        raw_mat : 2D numpy array
-            Raw data arranged as [repetition, points per measurement]
-        parm_dict : Dictionary
-            Parameters necessary for filtering
-        recom_cores : unsigned int
-            Number of cores to use for processing data in parallel
-        
-        Returns
-        -------
-        (noise_floors, filt_data, cond_data)
-        
-        noise_floors : 1D numpy array
-            Contains the noise floors per set of measurements
-        filt_data : 2D numpy array or None
-            filtered data arranged as [repetition, points per measurement]
-        cond_data : 2D complex numpy array
-            [set of measurements, frequency bins containing data]
-
-        """
-        max_cores = max(1, cpu_count()-2)
-            
-        recom_chunks = int(raw_mat.shape[0]/recom_cores)
-
-        print('recom cores:', recom_cores, 'Total pixels:', raw_mat.shape[0], ', Recom chunks:', recom_chunks)
-
-        if recom_cores > 1 and recom_chunks < 10:
-            min_jobs = 20
-            reduced_cores = int(raw_mat.shape[0]/min_jobs)
-            # intelligently set the cores now. 
-            recom_cores = min(max_cores, reduced_cores)
-            print('Not enough jobs per core. Reducing cores to', recom_cores)
-
-        if recom_cores > 1:
-            return filter_chunk_parallel(raw_mat, parm_dict, recom_cores)
-        else:
-            return filter_chunk_serial(raw_mat, parm_dict)
-
-    max_cores = max(1, cpu_count() - 2)
-    if not num_cores:
-        num_cores = max_cores
-    
     if write_filtered is False and write_condensed is False:
         warn('You need to write the filtered and/or the condensed dataset to the file')
         return
@@ -426,40 +340,16 @@ def fft_filter_dataset(h5_main, filter_parms, write_filtered=True, write_condens
                   
     print('Filtering data now. Be patient, this could take a few minutes') 
 
-    max_pix = __max_pixel_read(h5_main, max(1, cpu_count() - 2), store_filt=write_filtered, hot_bins=hot_inds,
-                               bytes_per_bin=2, max_RAM_gb=16)
-    # Ensure that whole sets of pixels can be read.
-    max_pix = np.uint(filter_parms['num_pix']*np.floor(max_pix / filter_parms['num_pix']))
-    
     parm_dict = {'filter_parms': filter_parms, 'composite_filter': composite_filter,
                  'rot_pts': rot_pts, 'hot_inds': hot_inds}
 
     t_start = time()
-    st_pix = 0
-    line_count = 0
-    while st_pix < h5_main.shape[0]:
-        en_pix = int(min(h5_main.shape[0], st_pix + max_pix))
-        print('Reading pixels:', st_pix, 'to', en_pix, 'of', h5_main.shape[0])
-        raw_mat = h5_main[st_pix:en_pix, :]
-        # reshape to (set of pix, data in each set of pix)
-        # print 'raw mat originally of shape:', raw_mat.shape
-        raw_mat = raw_mat.reshape(-1, filter_parms['num_pix'] * raw_mat.shape[1])
-        num_lines = raw_mat.shape[0]
-        # print 'After collapsing pixels, raw mat now of shape:', raw_mat.shape
-        (nse_flrs, filt_data, cond_data) = __filter_chunk(raw_mat, parm_dict, num_cores)
-        # Insert things into appropriate HDF datasets
-        print('Writing filtered data to h5')
-        # print 'Noise floors of shape:', nse_flrs.shape
-        if doing_noise_floor_filter:
-            h5_noise_floors[line_count: line_count + num_lines] = nse_flrs
-        if write_condensed:
-            # print('Condensed data of shape:', cond_data.shape)
-            h5_cond_data[line_count: line_count + num_lines, :] = cond_data
-        if write_filtered:
-            # print('Filtered data of shape:', filt_data.shape)
-            h5_filt_data[st_pix:en_pix, :] = filt_data
-        hdf.flush()
-        st_pix = en_pix
+    fft_filter = FFTFilter(h5_main, parm_dict,
+                           h5_noise_floors=h5_noise_floors if doing_noise_floor_filter else None,
+                           h5_filt_data=h5_filt_data if write_filtered else None,
+                           h5_cond_data=h5_cond_data if write_condensed else None,
+                           cores=num_cores)
+    fft_filter.compute()
 
     print('FFT filtering took {} seconds'.format(time() - t_start))
 
@@ -471,6 +361,79 @@ def fft_filter_dataset(h5_main, filter_parms, write_filtered=True, write_condens
 # #############################################################################
 
 
+class FFTFilter(Process):
+    """
+    Filters sets of `num_pix` positions of a G-mode dataset in the frequency domain and writes the noise floors, the
+    filtered data and the condensed data into datasets that have already been created.  Used by fft_filter_dataset
+
+    Parameters
+    ----------
+    h5_main : HDF5 dataset object
+        Dataset containing the raw data
+    parm_dict : dict
+        Parameters necessary for filtering. See unit_filter
+    h5_noise_floors : HDF5 dataset object, optional
+        Dataset for the noise floor of each set of positions. Not written if None
+    h5_filt_data : HDF5 dataset object, optional
+        Dataset for the filtered data, shaped like h5_main. Not written if None
+    h5_cond_data : HDF5 dataset object, optional
+        Dataset for the condensed data of each set of positions. Not written if None
+    cores : unsigned int, optional
+        Number of cores to use for processing data in parallel
+    """
+
+    def __init__(self, h5_main, parm_dict, h5_noise_floors=None, h5_filt_data=None, h5_cond_data=None, cores=None):
+        # Needed to plan the chunks in the constructor of Process
+        self._parm_dict = parm_dict
+        self.h5_noise_floors = h5_noise_floors
+        self.h5_filt_data = h5_filt_data
+        self.h5_cond_data = h5_cond_data
+        super(FFTFilter, self).__init__(h5_main, cores=cores, pos_per_unit=parm_dict['filter_parms']['num_pix'])
+        self._unit_kwargs = {'parm_dict': parm_dict}
+        self.h5_results = h5_filt_data
+
+    def _create_results_datasets(self):
+        """
+        The results datasets are created and linked by fft_filter_dataset
+        """
+        pass
+
+    def _get_results_group(self):
+        """
+        The group holding the noise floors, filtered data and condensed data, whichever are written
+        """
+        for h5_dset in [self.h5_noise_floors, self.h5_filt_data, self.h5_cond_data]:
+            if h5_dset is not None:
+                return h5_dset.parent
+        return None
+
+    def _get_bytes_per_pos(self):
+        """
+        The raw data as read, sent to and received by a worker, its complex spectrum, the filtered data and the
+        condensed spectrum
+        """
+        pts = self.h5_main.shape[1]
+        bytes_per_pos = 3 * self.h5_main.dtype.itemsize * pts + 2 * np.complex128(0).itemsize * pts
+        if self.h5_filt_data is not None:
+            bytes_per_pos += self.h5_filt_data.dtype.itemsize * pts
+        if self._parm_dict['hot_inds'] is not None:
+            bytes_per_pos += np.complex128(0).itemsize * len(self._parm_dict['hot_inds']) // self._pos_per_unit
+        return bytes_per_pos
+
+    @staticmethod
+    def _unit_function(unit, parm_dict=None):
+        return unit_filter((unit, parm_dict))
+
+    def _write_results(self, pos_slice, results):
+        unit_slice = slice(pos_slice.start // self._pos_per_unit, pos_slice.stop // self._pos_per_unit)
+        if self.h5_noise_floors is not None:
+            self.h5_noise_floors[unit_slice] = np.array([res[0] for res in results])
+        if self.h5_cond_data is not None:
+            self.h5_cond_data[unit_slice, :] = np.array([res[2] for res in results])
+        if self.h5_filt_data is not None:
+            self.h5_filt_data[pos_slice, :] = np.vstack([res[1] for res in results])
+
+
 def filter_chunk_parallel(raw_data, parm_dict, num_cores):
     # TODO: Need to check to ensure that all cores are indeed being utilized
     """
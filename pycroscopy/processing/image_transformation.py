@@ -14,6 +14,8 @@ import h5py
 import numpy as np
 import skimage.feature
 import multiprocessing as mp
+from scipy.ndimage import map_coordinates
+from ..io.io_utils import getAvailableMem
 
 
 class ImageTransformation(object):
@@ -716,6 +718,181 @@ class RigidTransform(object):
 
 
 
+# Shared buffers of the workers that warp frames. See _init_warp_worker
+_warp_state = dict()
+
+
+def _init_warp_worker(in_buf, out_buf, frame_shape, output_shape):
+    """
+    Wraps the buffers shared by the process applying the transformations and its workers as arrays of frames
+    """
+    _warp_state['input'] = np.frombuffer(in_buf).reshape((-1,) + tuple(frame_shape))
+    _warp_state['output'] = np.frombuffer(out_buf).reshape((-1,) + tuple(output_shape))
+    _warp_state['output_shape'] = tuple(output_shape)
+
+
+def _warp_frame(task):
+    """
+    Transforms one frame of the shared input buffer into the shared output buffer
+
+    Parameters
+    ----------
+    task : tuple
+        Index of the frame in the buffers and the transformation (used as the inverse map)
+    """
+    itm, transform = task
+    _warp_state['output'][itm] = warp(_warp_state['input'][itm], inverse_map=transform,
+                                      output_shape=_warp_state['output_shape'], cval=0, preserve_range=True)
+    return itm
+
+
+def _upsampled_cross_corr(data, num_cols, region_size, upsample_factor, offsets):
+    """
+    Cross-correlation of pairs of real images from the half spectra of their cross-power, upsampled and evaluated only
+    within a small region by matrix multiplication. This is the batched equivalent of the refinement in
+    skimage.feature.register_translation
+
+    Parameters
+    ----------
+    data : 3D complex numpy.ndarray
+        Half cross-power spectra (as from numpy.fft.rfft2) arranged as [pair, row, column]
+    num_cols : int
+        Number of columns of the images
+    region_size : int
+        Number of upsampled pixels along each side of the region
+    upsample_factor : int
+        Upsampling factor
+    offsets : 2D numpy.ndarray
+        (row, column) offset of the region of each pair in upsampled pixels
+
+    Returns
+    -------
+    region : 3D numpy.ndarray
+        Upsampled cross-correlation arranged as [pair, row, column]
+    """
+    num_rows = data.shape[1]
+    region = np.arange(region_size)
+    row_freqs = np.fft.fftfreq(num_rows, 1.0 / num_rows)
+    col_freqs = np.arange(data.shape[2])
+
+    # Every column of the half spectrum but the first and the Nyquist one stands for its conjugate as well
+    col_weights = np.full(data.shape[2], 2.0)
+    col_weights[0] = 1.0
+    if num_cols % 2 == 0:
+        col_weights[-1] = 1.0
+
+    row_kernel = np.exp((2j * np.pi / (num_rows * upsample_factor)) *
+                        (region[None, :, None] - offsets[:, 0, None, None]) * row_freqs[None, None, :])
+    col_kernel = col_weights[None, :, None] * \
+        np.exp((2j * np.pi / (num_cols * upsample_factor)) *
+               col_freqs[None, :, None] * (region[None, None, :] - offsets[:, 1, None, None]))
+
+    return np.matmul(np.matmul(row_kernel, data), col_kernel).real
+
+
+def _phase_correlation_shifts(spectra_1, spectra_2, shape, upsample_factor=1, normalize=True):
+    """
+    Finds the shift between pairs of images from their spectra by phase correlation
+
+    Parameters
+    ----------
+    spectra_1 : 3D complex numpy.ndarray
+        Half spectra (as from numpy.fft.rfft2) of the first image of each pair arranged as [pair, row, column]
+    spectra_2 : 3D complex numpy.ndarray
+        Half spectra of the second image of each pair
+    shape : tuple
+        (rows, columns) of the images
+    upsample_factor : int, optional
+        The shifts are refined to 1 / upsample_factor of a pixel. Default 1 - whole pixels
+    normalize : bool, optional
+        Whether to normalize the cross-power spectrum (phase correlation) or not (cross-correlation). Default True
+
+    Returns
+    -------
+    shifts : 2D numpy.ndarray
+        (row, column) displacement of the content of the second image relative to the first, per pair
+    """
+    num_pairs = spectra_1.shape[0]
+    shape = np.array(shape)
+
+    # The inverse of the cross-power spectrum peaks at the displacement
+    image_product = spectra_2 * spectra_1.conj()
+    if normalize:
+        image_product /= np.maximum(np.abs(image_product), np.finfo(float).tiny)
+    cross_corr = np.fft.irfft2(image_product, s=tuple(shape)).reshape(num_pairs, -1)
+
+    maxima = np.array(np.unravel_index(np.argmax(cross_corr, axis=1), shape)).T
+    shifts = np.where(maxima > np.fix(shape / 2), maxima - shape, maxima).astype(float)
+
+    if upsample_factor > 1:
+        # Refine within 1.5 pixels of the peak on a grid upsampled by the DFT
+        shifts = np.round(shifts * upsample_factor) / upsample_factor
+        region_size = int(np.ceil(upsample_factor * 1.5))
+        dftshift = np.fix(region_size / 2.0)
+        offsets = dftshift - shifts * upsample_factor
+        cross_corr = _upsampled_cross_corr(image_product, shape[1], region_size, upsample_factor, offsets)
+        maxima = np.array(np.unravel_index(np.argmax(cross_corr.reshape(num_pairs, -1), axis=1),
+                                           (region_size, region_size))).T
+        shifts += (maxima - dftshift) / upsample_factor
+
+    return shifts
+
+
+def _log_polar_magnitudes(spectra, num_angles, num_radii):
+    """
+    High-pass filtered magnitudes of spectra resampled onto a log-polar grid, on which a rotation and a scaling of
+    the images become shifts along the angle and log-radius
+
+    Parameters
+    ----------
+    spectra : 3D complex numpy.ndarray
+        Half spectra (as from numpy.fft.rfft2) of the images arranged as [frame, row, column]
+    num_angles : int
+        Number of angles sampled over 180 degrees
+    num_radii : int
+        Number of radii sampled logarithmically
+
+    Returns
+    -------
+    log_polar : 3D numpy.ndarray
+        Magnitudes arranged as [frame, angle, log-radius]
+    log_base : float
+        Natural logarithm of the ratio of consecutive radii
+    """
+    num_rows, num_half_cols = spectra.shape[1:]
+    row_freqs = np.fft.fftshift(np.fft.fftfreq(num_rows))[:, None]
+    col_freqs = np.arange(num_half_cols)[None, :] / (2.0 * (num_half_cols - 1))
+    cosines = np.cos(np.pi * row_freqs) * np.cos(np.pi * col_freqs)
+    high_pass = (1.0 - cosines) * (2.0 - cosines)
+
+    # The magnitudes are symmetric, so the half plane of non-negative column frequencies spans all 180 degrees
+    center_row = num_rows // 2
+    log_base = np.log(min(center_row, num_half_cols - 1)) / num_radii
+    radii = np.exp(np.arange(num_radii) * log_base)
+    angles = np.arange(num_angles) * np.pi / num_angles - np.pi / 2
+    coords = [center_row + np.sin(angles)[:, None] * radii[None, :],
+              np.cos(angles)[:, None] * radii[None, :]]
+
+    log_polar = np.empty((spectra.shape[0], num_angles, num_radii))
+    for itm, spectrum in enumerate(spectra):
+        magnitude = np.abs(np.fft.fftshift(spectrum, axes=0)) * high_pass
+        log_polar[itm] = map_coordinates(magnitude, coords, order=1)
+
+    return log_polar, log_base
+
+
+def _undo_rotation_scale(image, rotation, scale):
+    """
+    Undoes a rotation (radians, counter-clockwise as in skimage.transform.rotate) and a magnification of an image
+    about its center
+    """
+    center = (np.array(image.shape[::-1]) - 1) / 2.0
+    transform = (SimilarityTransform(translation=-center) +
+                 SimilarityTransform(scale=scale, rotation=-rotation) +
+                 SimilarityTransform(translation=center))
+    return warp(image, inverse_map=transform, cval=0, preserve_range=True)
+
+
 # Class to do geometric transformations. This is a wrapper on scikit-image functionality.
 # TODO: io operations for features and optical geometric transformations.
 
@@ -752,9 +929,36 @@ class geoTransformerParallel(object):
         if not isinstance(dataset, h5py.Dataset):
             warnings.warn( 'Error: Data must be an h5 Dataset object'   )
         else:
+            # Kept in the file. Frames are read (and reshaped) a block at a time. See _read_frames
             self.data = dataset
-            dim = int(np.sqrt(self.data.shape[-1]))
-            self.data = self.data.reshape(-1,dim,dim)
+
+    def _get_frame_shape(self):
+        """
+        Shape of each frame of the data, which is either arranged as [frame, row, column] or as [frame, pixel] with
+        square frames
+        """
+        if len(self.data.shape) == 3:
+            return tuple(self.data.shape[1:])
+        dim = int(np.sqrt(self.data.shape[-1]))
+        return dim, dim
+
+    def _read_frames(self, start, stop):
+        """
+        Reads a block of frames from the data
+
+        Parameters
+        ----------
+        start : int
+            Index of the first frame
+        stop : int
+            Index after the last frame
+
+        Returns
+        -------
+        frames : 3D numpy.ndarray
+            Frames arranged as [frame, row, column]
+        """
+        return np.reshape(self.data[start:stop], (-1,) + self._get_frame_shape())
 
     def loadFeatures(self, features):
         """
@@ -881,7 +1085,6 @@ class geoTransformerParallel(object):
 
         return transforms, trueMatches
 
-    #TODO: Need parallel version for transforming stack of images.
     def applyTransformation(self, transforms, **kwargs):
         """
         This is the method that takes the list of transformation found by findTransformation
@@ -900,14 +1103,19 @@ class geoTransformerParallel(object):
              default, center image in the stack.
         processors : int, optional
             Number of processors to use, default = 1.
-            Currently,only one processor is used.
+        h5_output : h5py.Dataset, optional
+            Dataset with one entry per frame that the transformed images are written to.
+            default, None - the transformed images are returned in memory.
+        block_size : int, optional
+            Number of frames read, transformed and written at a time.
+            default, as many as fit in a quarter of the available memory.
 
         Returns
         -------
-        Transformed images, transformations
+        Transformed images (or h5_output), transformations
 
         """
-        dic = ['processors','origin','transformation']
+        dic = ['processors','origin','transformation','h5_output','block_size']
         for key in kwargs.keys():
             if key not in dic:
                 print('%s is not a parameter of this function' %(str(key)))
@@ -973,34 +1181,63 @@ class geoTransformerParallel(object):
                 chainTransforms.append(T)
 
         # Use the chain transformations to transform the dataset
-        output_shape = dset[0].shape
-#        output_shape = (2048, 2048)
-        def warping(datum):
-            imp, transform  = datum[0], datum[1]
-            transimp = warp(imp, inverse_map= transform, output_shape = output_shape,
-                            cval = 0, preserve_range = True)
-            return transimp
+        num_frames = dset.shape[0]
+        frame_shape = self._get_frame_shape()
+        output_shape = frame_shape
+        h5_output = kwargs.get('h5_output', None)
+
+        # input and output frames of a block are held in buffers shared with the workers
+        bytes_per_frame = 2 * 8 * int(np.prod(frame_shape))
+        block_size = kwargs.get('block_size', int(getAvailableMem() / 4 / bytes_per_frame))
+        block_size = int(max(1, min(num_frames, block_size)))
+        in_buf = mp.RawArray('d', block_size * int(np.prod(frame_shape)))
+        out_buf = mp.RawArray('d', block_size * int(np.prod(output_shape)))
+        in_frames = np.frombuffer(in_buf).reshape((block_size,) + frame_shape)
+        out_frames = np.frombuffer(out_buf).reshape((block_size,) + output_shape)
+
+        if h5_output is None:
+            transImages = np.empty((num_frames,) + output_shape, dtype=dset.dtype)
+
+        processes = max(1, min(processes, block_size))
+        if processes > 1:
+            pool = mp.Pool(processes, initializer=_init_warp_worker,
+                           initargs=(in_buf, out_buf, frame_shape, output_shape))
+            print('launching %i kernels...'%(processes))
+        else:
+            pool = None
+            _init_warp_worker(in_buf, out_buf, frame_shape, output_shape)
 
-#          #start pool of workers
-#         #somehow wrap function crashes when run in parallel! run sequentially for now.
-#        pool = mp.Pool(processes)
-#        print('launching %i kernels...'%(processes))
-#        tasks = [ (imp, transform) for imp, transform in zip(dset, chainTransforms) ]
-#        chunk = int(dset.shape[0]/processes)
-#        jobs = pool.imap(warping, tasks, chunksize = 1)
-#        #close the pool
-#        pool.close()
-#        print('Closing down the kernels... \n')
-#
-        # get transformed images and pack into 3d np.ndarray
         print('Transforming Images...')
-        transImages = np.copy(dset[:])
-
-        for imp, transform, itm in zip( transImages, chainTransforms, range(0,transImages.shape[0])):
-            transimp = warping([imp, transform])
-            transImages[itm] = transimp
-            print('Image #%i'%(itm))
+        try:
+            for start in range(0, num_frames, block_size):
+                stop = min(num_frames, start + block_size)
+                in_frames[:stop - start] = self._read_frames(start, stop)
+
+                tasks = [(itm, transform) for itm, transform in enumerate(chainTransforms[start:stop])]
+                if pool is None:
+                    for task in tasks:
+                        _warp_frame(task)
+                else:
+                    for _ in pool.imap_unordered(_warp_frame, tasks, chunksize=max(1, int(len(tasks)/processes))):
+                        pass
 
+                if h5_output is None:
+                    transImages[start:stop] = out_frames[:stop - start]
+                else:
+                    h5_output[start:stop] = np.reshape(out_frames[:stop - start],
+                                                       (stop - start,) + h5_output.shape[1:])
+                print('Images #%i to #%i'%(start, stop - 1))
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            else:
+                # Release the block buffers held by the state set up in this process
+                _warp_state.clear()
+
+        if h5_output is not None:
+            h5_output.file.flush()
+            return h5_output, chainTransforms
 
         return transImages, chainTransforms
 
@@ -1050,6 +1287,123 @@ class geoTransformerParallel(object):
 
         return results
 
+    def phaseCorrelationTransformation(self, **kwargs):
+        """
+        Uses FFT phase correlation to find the translation between each pair of consecutive images.
+        Every image is read and Fourier transformed once and the shifts of a whole block of pairs are found together,
+        which makes this far faster than feature matching for drift correction of long stacks.
+
+        Parameters
+        ----------
+        upsample_factor : int, optional
+            The translations are refined to 1 / upsample_factor of a pixel.
+            default, 10.
+        normalization : string or None, optional
+            'phase' to correlate the phases of the images only, which gives the sharpest peak and is insensitive to
+            changes in contrast. None to use the plain cross-correlation, which is more accurate for noisy images.
+            default, 'phase'.
+        window : boolean, optional
+            Whether to apply a Hann window to the images to suppress the edges.
+            default, True.
+        rotation : boolean, optional
+            Whether to also find the rotation and scaling between images by phase correlation of their
+            log-polar magnitude spectra. Rotations are found modulo 180 degrees.
+            default, False.
+        block_size : int, optional
+            Number of images read and Fourier transformed at a time.
+            default, as many as fit in a quarter of the available memory.
+
+        Returns
+        -------
+        Transformations (TranslationTransform objects) that can be passed to applyTransformation.
+        The translation of each is the (row, column) shift of an image relative to the previous one.
+        If rotation, the translations are found after undoing the rotation and scaling about the center of the image
+        and the rotations (in degrees, counter-clockwise as in skimage.transform.rotate) and magnifications of each
+        image relative to the previous one are returned as well.
+
+        """
+        dic = ['upsample_factor','normalization','window','rotation','block_size']
+        for key in kwargs.keys():
+            if key not in dic:
+                print('%s is not a parameter of this function' %(str(key)))
+
+        upsample_factor = int(kwargs.get('upsample_factor', 10))
+        normalize = kwargs.get('normalization', 'phase') == 'phase'
+        use_window = kwargs.get('window', True)
+        find_rotation = kwargs.get('rotation', False)
+
+        num_frames = self.data.shape[0]
+        frame_shape = self._get_frame_shape()
+        num_angles, num_radii = frame_shape
+
+        if use_window:
+            window = np.outer(np.hanning(frame_shape[0]), np.hanning(frame_shape[1]))
+        else:
+            window = np.ones(frame_shape)
+
+        # The frames, their spectra and the intermediate products of a block are held at once
+        bytes_per_frame = 6 * 16 * int(np.prod(frame_shape))
+        block_size = kwargs.get('block_size', int(getAvailableMem() / 4 / bytes_per_frame))
+        block_size = int(max(1, min(num_frames, block_size)))
+
+        shifts = np.zeros((max(0, num_frames - 1), 2))
+        rotations = np.zeros(max(0, num_frames - 1))
+        scales = np.ones(max(0, num_frames - 1))
+
+        print('Extracting Translations')
+        prev_spectrum = None
+        prev_log_polar = None
+        for start in range(0, num_frames, block_size):
+            stop = min(num_frames, start + block_size)
+            frames = self._read_frames(start, stop).astype(float)
+            spectra = np.fft.rfft2(frames * window)
+
+            # The last image of the previous block is paired with the first of this one
+            if prev_spectrum is None:
+                first_spectra, pair_start = spectra[:-1], start
+            else:
+                first_spectra, pair_start = np.concatenate((prev_spectrum, spectra[:-1])), start - 1
+            num_pairs = stop - 1 - pair_start
+            second = slice(stop - start - num_pairs, None)
+            prev_spectrum = spectra[-1:]
+
+            if find_rotation:
+                log_polar, log_base = _log_polar_magnitudes(spectra, num_angles, num_radii)
+                log_polar = np.fft.rfft2(log_polar)
+                first_log_polar = log_polar[:-1] if prev_log_polar is None else \
+                    np.concatenate((prev_log_polar, log_polar[:-1]))
+                prev_log_polar = log_polar[-1:]
+
+            if num_pairs == 0:
+                continue
+
+            if find_rotation:
+                log_polar_shifts = _phase_correlation_shifts(first_log_polar, log_polar[second],
+                                                             (num_angles, num_radii), upsample_factor, normalize)
+                block_rotations = -log_polar_shifts[:, 0] * np.pi / num_angles
+                block_scales = np.exp(-log_polar_shifts[:, 1] * log_base)
+                rotations[pair_start:stop - 1] = np.rad2deg(block_rotations)
+                scales[pair_start:stop - 1] = block_scales
+
+                # Translations of the second image of each pair once its rotation and scaling are undone
+                second_frames = frames[second]
+                for itm, (rot, scale) in enumerate(zip(block_rotations, block_scales)):
+                    second_frames[itm] = _undo_rotation_scale(second_frames[itm], rot, scale)
+                second_spectra = np.fft.rfft2(second_frames * window)
+            else:
+                second_spectra = spectra[second]
+
+            shifts[pair_start:stop - 1] = _phase_correlation_shifts(first_spectra, second_spectra, frame_shape,
+                                                                      upsample_factor, normalize)
+            print('Images #%i to #%i'%(pair_start, stop - 1))
+
+        transforms = [TranslationTransform(translation=tuple(shift)) for shift in shifts]
+
+        if find_rotation:
+            return transforms, rotations, scales
+
+        return transforms
+
 
 class geoTransformerSerial(object):
     """
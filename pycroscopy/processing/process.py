@@ -4,30 +4,106 @@ Created on 7/17/16 10:08 AM
 """
 
 from __future__ import division, print_function, absolute_import
+from time import time
 from warnings import warn
 
 import numpy as np
-import psutil
-import scipy
+import multiprocessing as mp
 
 from ..io.hdf_utils import checkIfMain
 from ..io.io_hdf5 import ioHDF5
-import multiprocessing as mp
+from ..io.io_utils import getAvailableMem, recommendCores
+from ..io.telemetry import Telemetry, telemetry_stage
+
+'''
+State of each worker of the pool, set once when the worker starts so that the function and its parameters are not
+sent along with every block of data
+'''
+_worker_state = dict()
+
+
+def _init_worker(func, func_kwargs, is_chunk_func):
+    """
+    Stores the function applied by this worker and its keyword arguments
+    """
+    _worker_state['func'] = func
+    _worker_state['kwargs'] = func_kwargs
+    _worker_state['is_chunk_func'] = is_chunk_func
+
+
+def _apply_func(func, func_kwargs, is_chunk_func, block):
+    """
+    Applies the chunk function to a block of units or the unit function to each unit in the block
+
+    Returns
+    -------
+    results : object
+        Value returned by the chunk function or list of the values returned by the unit function
+    """
+    if is_chunk_func:
+        return func(block, **func_kwargs)
+    return [func(unit, **func_kwargs) for unit in block]
+
+
+def _process_block(task):
+    """
+    Processes a block of units in a worker of the pool
+
+    Parameters
+    ----------
+    task : tuple
+        Positions in the block (slice) and the block of units arranged as [unit, data]
+
+    Returns
+    -------
+    pos_slice : slice
+        Positions in the block
+    results : object
+        Results of the block
+    elapsed : float
+        Time in seconds spent computing
+    """
+    pos_slice, block = task
+    t_start = time()
+    results = _apply_func(_worker_state['func'], _worker_state['kwargs'], _worker_state['is_chunk_func'], block)
+    return pos_slice, results, time() - t_start
 
 
 class Process(object):
     """
     Encapsulates the typical steps performed when applying a processing function to  a dataset.
 
+    The dataset is processed in chunks of positions planned to fit in the memory budget. Each chunk is split into
+    blocks that are handed to a pool of workers which lives for the whole computation. The results of each block are
+    written into the preallocated results datasets as soon as they arrive, while the next chunk is being read.
+
+    A new process only needs to implement:
+
+    * `_create_results_datasets` - creates the empty results datasets
+    * `_unit_function` - computes the result of a single unit of positions
+
+    and may also override:
+
+    * `_chunk_function` - computes the results of a whole block of units at once, for vectorized computations
+    * `_write_results` - writes the results of a block of positions into the results datasets
+    * `_get_results_group` - group holding the results, where the telemetry is written
+    * `_get_bytes_per_pos` - memory needed to process a single position, used to plan the chunks
+
     Parameters
     ----------
     h5_main : h5py.Dataset instance
         The dataset over which the analysis will be performed. This dataset should be linked to the spectroscopic
         indices and values, and position indices and values datasets.
+    cores : uint, optional
+        Number of cores to use. Default None - all but two of the cores, fewer if there are few units to process
+    max_mem_mb : uint, optional
+        Memory in MB that the computation may use. Default None - the available memory is used
+    pos_per_unit : uint, optional
+        Number of consecutive positions that make up a single unit of computation. Default 1
 
     """
 
-    def __init__(self, h5_main):
+    def __init__(self, h5_main, cores=None, max_mem_mb=None, pos_per_unit=1):
         # Checking if dataset is "Main"
         if checkIfMain(h5_main):
             self.h5_main = h5_main
@@ -36,135 +112,374 @@ class Process(object):
             warn('Provided dataset is not a "Main" dataset with necessary ancillary datasets')
             return
 
+        if self.h5_main.shape[0] % pos_per_unit != 0:
+            raise ValueError('The {} positions cannot be split into units of {} positions'
+                             ''.format(self.h5_main.shape[0], pos_per_unit))
+        self._pos_per_unit = int(pos_per_unit)
+
+        # Keyword arguments of the unit or chunk function
+        self._unit_kwargs = dict()
+        # Main results dataset, written to by the default _write_results
+        self.h5_results = None
+
+        self.telemetry = None
+
         # Determining the max size of the data that can be put into memory
-        self._setMemoryAndCPUs()
+        self._set_memory_and_cores(cores=cores, max_mem_mb=max_mem_mb)
+
+    def enable_telemetry(self, enabled=True):
+        """
+        Turns the recording of the time spent reading, computing, communicating with workers and writing for each
+        chunk of positions on or off.  When on, the summary of the computation is printed at the end of `compute` and
+        written as attributes of the results group along with a dataset of the per-chunk timings.
+        See pycroscopy.io.telemetry.Telemetry
 
-        self._start_pos = 0
-        self._end_pos = self.h5_main.shape[0]
+        Parameters
+        ----------
+        enabled : Boolean (Optional)
+            Whether or not to record the telemetry. Default True
+        """
+        self.telemetry = Telemetry('Process') if enabled else None
 
-    def _setMemoryAndCPUs(self):
+    def _set_memory_and_cores(self, cores=None, max_mem_mb=None, verbose=False):
         """
-        Checks hardware limitations such as memory, # cpus and sets the recommended datachunk sizes and the
-        number of cores to be used by analysis methods.
+        Checks hardware limitations such as memory, # cpus and sets the recommended number of cores and datachunk
+        sizes to be used by the computation.
+
+        Parameters
+        ----------
+        cores : uint, optional
+            Number of cores requested. Default None - left to recommendCores
+        max_mem_mb : uint, optional
+            Memory in MB that the computation may use. Default None - the available memory is used
+        verbose : Boolean (Optional)
+            Whether or not to print log statements
 
         Returns
         -------
         None
-        
+
+        """
+        num_units = self.h5_main.shape[0] // self._pos_per_unit
+        self._cores = max(1, recommendCores(num_units, requested_cores=cores))
+
+        self._max_mem_bytes = getAvailableMem()
+        if max_mem_mb is not None:
+            self._max_mem_bytes = min(self._max_mem_bytes, int(max_mem_mb * 1024 ** 2))
+
+        self._max_pos_per_read = self._plan_pos_per_read()
+        if verbose:
+            print('Allowed to read {} pixels per chunk using {} cores'.format(self._max_pos_per_read, self._cores))
+
+    def _get_bytes_per_pos(self):
+        """
+        Memory in bytes needed to process a single position: the data as read, the copy sent to a worker, the worker's
+        copy and the results, assumed to be as large as the data.  Override if the results or the intermediates of the
+        computation are larger.
+
+        Returns
+        -------
+        bytes_per_pos : uint
+        """
+        return 4 * self.h5_main.dtype.itemsize * self.h5_main.shape[1]
+
+    def _get_pos_alignment(self):
+        """
+        Number of positions that the chunks and blocks are aligned to: whole units of computation and, if possible,
+        whole chunks of the HDF5 dataset so that each chunk is only read (or decompressed) once
+        """
+        alignment = self._pos_per_unit
+        if self.h5_main.chunks is not None:
+            chunk_rows = self.h5_main.chunks[0]
+            aligned = chunk_rows * alignment // _gcd(chunk_rows, alignment)
+            if aligned <= self.h5_main.shape[0]:
+                alignment = aligned
+        return alignment
+
+    def _plan_pos_per_read(self):
+        """
+        Number of positions read per chunk.  While one chunk is being computed the next one is read, so the memory
+        budget is shared by the chunk being processed and the raw data of the next chunk.
+
+        Returns
+        -------
+        pos_per_read : uint
         """
+        row_bytes = self.h5_main.dtype.itemsize * self.h5_main.shape[1]
+        pos_per_read = int(self._max_mem_bytes // (self._get_bytes_per_pos() + row_bytes))
 
-        if self._parallel:
-            self._maxCpus = psutil.cpu_count() - 2
+        alignment = self._get_pos_alignment()
+        if pos_per_read >= alignment:
+            pos_per_read -= pos_per_read % alignment
         else:
-            self._maxCpus = 1
-        self._maxMemoryMB = psutil.virtual_memory().available / 1e6 # in MB
+            # Cannot afford to honor the chunking of the dataset. Fall back to whole units
+            pos_per_read = max(self._pos_per_unit, pos_per_read - pos_per_read % self._pos_per_unit)
 
-        self._maxDataChunk = self._maxMemoryMB / self._maxCpus
+        return int(min(pos_per_read, self.h5_main.shape[0]))
+
+    def _plan_chunks(self):
+        """
+        Splits the positions into the chunks that will be read one at a time
 
-        # Now calculate the number of positions that can be stored in memory in one go.
-        mb_per_position = self.h5_main.dtype.itemsize * self.h5_main.shape[1]/1e6
-        self._max_pos_per_read = int(np.floor(self._maxDataChunk / mb_per_position))
-        print('Allowed to read {} pixels per chunk'.format(self._max_pos_per_read))
+        Returns
+        -------
+        chunks : list of slices
+            Positions in each chunk
+        """
+        num_pos = self.h5_main.shape[0]
+        return [slice(start, min(num_pos, start + self._max_pos_per_read))
+                for start in range(0, num_pos, self._max_pos_per_read)]
 
-    def _get_data_chunk(self):
+    def _plan_blocks(self, pos_slice):
         """
-        Returns a chunk of data for the guess or the fit
+        Splits a chunk of positions into the blocks that are handed to the workers.  Every worker gets a few blocks
+        so that the load stays balanced even if some units take longer than others.
 
         Parameters
         ----------
-        None
+        pos_slice : slice
+            Positions in the chunk
 
         Returns
         -------
+        blocks : list of slices
+            Positions in each block
         """
-        if self._start_pos < self.h5_main.shape[0]:
-            self._end_pos = int(min(self.h5_main.shape[0], self._start_pos + self._max_pos_per_read))
-            self.data = self.h5_main[self._start_pos:self._end_pos, :]
-            print('Reading pixels {} to {} of {}'.format(self._start_pos, self._end_pos, self.h5_main.shape[0]))
+        num_pos = pos_slice.stop - pos_slice.start
+        if self._cores == 1:
+            return [pos_slice]
+
+        alignment = self._get_pos_alignment()
+        block_size = int(np.ceil(num_pos / (4 * self._cores)))
+        if block_size >= alignment:
+            block_size += -block_size % alignment
         else:
-            print('Finished reading all data!')
-            self.data = None
+            block_size += -block_size % self._pos_per_unit
+
+        return [slice(start, min(pos_slice.stop, start + block_size))
+                for start in range(pos_slice.start, pos_slice.stop, block_size)]
 
-    def _set_results(self):
+    def _read_data_chunk(self, pos_slice):
         """
-        Writes the provided guess or fit results into appropriate datasets.
-        Given that the guess and fit datasets are relatively small, we should be able to hold them in memory just fine
+        Reads a chunk of positions
+
+        Parameters
+        ----------
+        pos_slice : slice
+            Positions to read
 
+        Returns
+        -------
+        data : 2D numpy array
+            Data arranged as [position, spectroscopic]
         """
-        # Now update the start position
-        self._start_pos = self._end_pos
-        warn('Please override the _set_results specific to your model')
-        pass
+        return self.h5_main[pos_slice, :]
+
+    def _to_units(self, data):
+        """
+        Rearranges a block of positions as [unit, data of all positions in the unit]
+        """
+        if self._pos_per_unit == 1:
+            return data
+        return data.reshape(-1, self._pos_per_unit * data.shape[1])
 
     def _create_results_datasets(self):
         """
-        Model specific call that will write the h5 group, guess dataset, corresponding spectroscopic datasets and also
-        link the guess dataset to the spectroscopic datasets. It is recommended that the ancillary datasets be populated
-        within this function.
+        Process specific call that will write the h5 group, results datasets, corresponding spectroscopic and position
+        datasets and link them to the results datasets. The results datasets must be created with their final shape
+        so that the results can be written as they are computed.
         """
-        warn('Please override the _create_results_datasets specific to your model')
+        warn('Please override the _create_results_datasets specific to your process')
         pass
 
-    def compute(self, func, **kwargs):
+    def _get_results_group(self):
+        """
+        Group holding the results datasets, where the telemetry is written.  The default implementation returns the
+        group of `self.h5_results`
+
+        Returns
+        -------
+        h5_group : h5py.Group or None
+            Group holding the results. None if there are no results datasets
+        """
+        if self.h5_results is None:
+            return None
+        return self.h5_results.parent
+
+    @staticmethod
+    def _unit_function(unit, **kwargs):
         """
+        Computes the result of a single unit of positions. Implemented by each process as a static method so that it
+        can be sent to the workers.
 
         Parameters
         ----------
-        func
-        strategy: string
-            Default is 'Wavelet_Peaks'.
-            Can be one of ['wavelet_peaks', 'relative_maximum', 'gaussian_processes']. For updated list, run GuessMethods.methods
-        options: dict
-            Default {"peaks_widths": np.array([10,200])}}.
-            Dictionary of options passed to strategy. For more info see GuessMethods documentation.
-
-        kwargs:
-            processors: int
-                number of processors to use. Default all processors on the system except for 1.
+        unit : 1D numpy array
+            Data of all the positions in the unit
+        kwargs : dict
+            The keyword arguments in `self._unit_kwargs`
 
         Returns
         -------
+        result : object
+            Result of the unit
+        """
+        warn('Please override the _unit_function specific to your process')
+        return None
 
+    # Optional static method that computes the results of a block of units at once, for computations that can be
+    # vectorized.  It is passed the block arranged as [unit, data] and the keyword arguments in `self._unit_kwargs`.
+    # When set, it is used instead of `_unit_function`
+    _chunk_function = None
+
+    def _write_results(self, pos_slice, results):
+        """
+        Writes the results of a block of positions into the results datasets.  The default implementation writes
+        the results, one per unit, into `self.h5_results`
+
+        Parameters
+        ----------
+        pos_slice : slice
+            Positions in the block
+        results : list or numpy array
+            Results of the block as returned by `_chunk_function` or the list of results of `_unit_function`
+        """
+        unit_slice = slice(pos_slice.start // self._pos_per_unit, pos_slice.stop // self._pos_per_unit)
+        self.h5_results[unit_slice] = np.array(results)
+
+    def compute(self, processors=None, ordered=False):
         """
+        Creates the results datasets, applies the unit (or chunk) function to every unit of positions and writes
+        the results to the file.
+
+        Parameters
+        ----------
+        processors : uint, optional
+            Number of cores to use. Default None - the number of cores determined when the process was set up
+        ordered : Boolean, optional
+            Whether the results of the blocks should be written in the order of the positions.  Unordered writing
+            avoids waiting on slow blocks. Default False
+
+        Returns
+        -------
+        h5_results : h5py.Dataset or None
+            Main results dataset
+        """
+        if self._chunk_function is None and type(self)._unit_function is Process._unit_function:
+            # Warn once instead of once per unit
+            warn('Please override the _unit_function or provide a _chunk_function specific to your process')
+            return None
+
+        if processors is not None:
+            self._set_memory_and_cores(cores=processors, max_mem_mb=self._max_mem_bytes / 1024 ** 2)
 
         self._create_results_datasets()
-        self._start_pos = 0
-
-        processors = kwargs.get("processors", self._maxCpus)
-        results = list()
-        if self._parallel:
-            # start pool of workers
-            print('Computing in parallel ... launching %i kernels...' % processors)
-            pool = mp.Pool(processors)
-            self._get_data_chunk()
-            while self.data is not None:  # as long as we have not reached the end of this data set:
-                # apply guess to this data chunk:
-                tasks = [vector for vector in self.data]
-                chunk = int(self.data.shape[0] / processors)
-                jobs = pool.imap(func, tasks, chunksize=chunk)
-                # get Results from different processes
-                print('Extracting Results...')
-                temp = [j for j in jobs]
-                # Reformat the data to the appropriate type and or do additional computation now
-
-                # Write to file
-                self._set_results(is_guess=True)
-                # read the next chunk
-                self._get_data_chunk()
-
-            # Finished reading the entire data set
-            print('closing %i kernels...' % processors)
-            pool.close()
+
+        if self._chunk_function is not None:
+            func = self._chunk_function
+        else:
+            func = self._unit_function
+        is_chunk_func = self._chunk_function is not None
+
+        chunks = self._plan_chunks()
+        num_pos = self.h5_main.shape[0]
+
+        if self.telemetry is not None:
+            self.telemetry.start()
+
+        pool = None
+        if self._cores > 1:
+            print('Computing in parallel ... launching {} kernels...'.format(self._cores))
+            pool = mp.Pool(self._cores, initializer=_init_worker, initargs=(func, self._unit_kwargs, is_chunk_func))
         else:
-            print("Computing Guesses In Serial ...")
-            self._get_data_chunk()
-            while self.data is not None:  # as long as we have not reached the end of this data set:
-                temp = [func(vector) for vector in self.data]
-                results.append(self._reformatResults(temp))
-                # read the next chunk
-                self._get_data_chunk()
-
-        # reorder to get one numpy array out
-        self.guess = np.hstack(tuple(results))
-        print('Completed computing guess. Writing to file.')
+            print('Computing in serial ...')
+
+        try:
+            if self.telemetry is not None:
+                self.telemetry.start_chunk()
+            with telemetry_stage(self.telemetry, 'read'):
+                data = self._read_data_chunk(chunks[0])
+
+            for chunk_ind, pos_slice in enumerate(chunks):
+                print('Processing positions {} to {} of {}'.format(pos_slice.start, pos_slice.stop, num_pos))
+                t_chunk = time()
+                tasks = [(block, self._to_units(data[block.start - pos_slice.start:block.stop - pos_slice.start]))
+                         for block in self._plan_blocks(pos_slice)]
+
+                if pool is None:
+                    results = (_process_block_serial(task, func, self._unit_kwargs, is_chunk_func)
+                               for task in tasks)
+                elif ordered:
+                    results = pool.imap(_process_block, tasks)
+                else:
+                    results = pool.imap_unordered(_process_block, tasks)
+
+                # The workers keep computing while the next chunk is being read
+                t_read = time()
+                next_data = None
+                if pool is not None and chunk_ind + 1 < len(chunks):
+                    next_data = self._read_data_chunk(chunks[chunk_ind + 1])
+                t_read = time() - t_read
+
+                t_write = 0
+                busy_times = list()
+                for block, block_results, elapsed in results:
+                    t_start = time()
+                    self._write_results(block, block_results)
+                    t_write += time() - t_start
+                    busy_times.append(elapsed)
+                self.hdf.flush()
+
+                if pool is None and chunk_ind + 1 < len(chunks):
+                    t_start = time()
+                    next_data = self._read_data_chunk(chunks[chunk_ind + 1])
+                    t_read += time() - t_start
+
+                if self.telemetry is not None:
+                    self.telemetry.add_pixels(pos_slice.stop - pos_slice.start)
+                    self.telemetry.add('write', t_write)
+                    wall_time = time() - t_chunk - t_read - t_write
+                    if pool is None:
+                        self.telemetry.add_serial(wall_time)
+                    else:
+                        self.telemetry.add_parallel(wall_time, busy_times, self._cores)
+                    self.telemetry.start_chunk()
+                    self.telemetry.add('read', t_read)
+
+                data = next_data
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry.report()
+            h5_group = self._get_results_group()
+            if h5_group is not None:
+                self.telemetry.write(h5_group)
+            else:
+                warn('The telemetry could not be written since there is no results group')
+
+        print('Finished processing the dataset')
+
+        return self.h5_results
+
+
+def _process_block_serial(task, func, func_kwargs, is_chunk_func):
+    """
+    Processes a block of units in this process. See `_process_block`
+    """
+    pos_slice, block = task
+    t_start = time()
+    results = _apply_func(func, func_kwargs, is_chunk_func, block)
+    return pos_slice, results, time() - t_start
 
+
+def _gcd(a, b):
+    """
+    Greatest common divisor of two positive integers
+    """
+    while b:
+        a, b = b, a % b
+    return a
@@ -8,16 +8,15 @@ Created on Mon Mar 28 09:45:08 2016
 from __future__ import division, print_function, absolute_import
 import time
 from warnings import warn
-from multiprocessing import cpu_count
 import numpy as np
-from sklearn.utils import gen_batches
 from sklearn.utils.extmath import randomized_svd
 
 from ..io.hdf_utils import getH5DsetRefs, checkAndLinkAncillary, findH5group, create_empty_dataset, \
     getH5RegRefIndices, createRefFromIndices, checkIfMain, calc_chunks, copy_main_attributes, copyAttributes
 from ..io.io_hdf5 import ioHDF5
-from ..io.io_utils import check_dtype, transformToTargetType, getAvailableMem
+from ..io.io_utils import check_dtype, transformToTargetType
 from ..io.microdata import MicroDataset, MicroDataGroup
+from .process import Process
 
 def doSVD(h5_main, num_comps=None):
     """
@@ -218,6 +217,9 @@ def rebuild_svd(h5_main, components=None, cores=None, max_RAM_mb=1024):
     Rebuild the Image from the SVD results on the windows
     Optionally, only use components less than n_comp.
 
+    The positions are rebuilt one chunk at a time by SVDRebuild and written into the preallocated results dataset, so
+    the rebuilt data never needs to fit in memory at once.
+
     Parameters
     ----------
     h5_main : hdf5 Dataset
@@ -248,18 +250,6 @@ def rebuild_svd(h5_main, components=None, cores=None, max_RAM_mb=1024):
     comp_slice = _get_component_slice(components)
     dset_name = h5_main.name.split('/')[-1]
 
-    # Ensuring that at least one core is available for use / 2 cores are available for other use
-    max_cores = max(1, cpu_count() - 2)
-    #         print('max_cores',max_cores)
-    if cores is not None:
-        cores = min(round(abs(cores)), max_cores)
-    else:
-        cores = max_cores
-
-    max_memory = min(max_RAM_mb*1024**2, 0.75*getAvailableMem())
-    if cores != 1:
-        max_memory = int(max_memory/2)
-
     '''
     Get the handles for the SVD results
     '''
@@ -279,41 +269,14 @@ def rebuild_svd(h5_main, components=None, cores=None, max_RAM_mb=1024):
 
     func, is_complex, is_compound, n_features, n_samples, type_mult = check_dtype(h5_V)
 
-    '''
-    Calculate the size of a single batch that will fit in the available memory
-    '''
-    n_comps = h5_S[comp_slice].size
-    mem_per_pix = (h5_U.dtype.itemsize+h5_V.dtype.itemsize*h5_V.shape[1])*n_comps
-    fixed_mem = h5_main.size * h5_main.dtype.itemsize
-
-    if cores is None:
-        free_mem = max_memory - fixed_mem
-    else:
-        free_mem = max_memory * 2 - fixed_mem
-
-    batch_size = int(round(float(free_mem) / mem_per_pix))
-    batch_slices = gen_batches(h5_U.shape[0], batch_size)
-
-    print('Reconstructing in batches of {} positions.'.format(batch_size))
-    print('Batchs should be {} Mb each.'.format(mem_per_pix*batch_size/1024.0**2))
-
-    '''
-    Loop over all batches.
-    '''
     ds_V = np.dot(np.diag(h5_S[comp_slice]), func(h5_V[comp_slice, :]))
-    rebuild = np.zeros((h5_main.shape[0], ds_V.shape[1]))
-    for ibatch, batch in enumerate(batch_slices):
-        rebuild[batch, :] += np.dot(h5_U[batch, comp_slice], ds_V)
 
-    rebuild = transformToTargetType(rebuild, h5_V.dtype)
-
-    print('Completed reconstruction of data from SVD results.  Writing to file.')
     '''
     Create the Group and dataset to hold the rebuild data
     '''
     rebuilt_grp = MicroDataGroup('Rebuilt_Data_', h5_svd.name[1:])
 
-    ds_rebuilt = MicroDataset('Rebuilt_Data', rebuild,
+    ds_rebuilt = MicroDataset('Rebuilt_Data', data=[], maxshape=(h5_U.shape[0], h5_V.shape[1]), dtype=h5_V.dtype,
                               chunking=h5_main.chunks,
                               compression=h5_main.compression)
     rebuilt_grp.addChildren([ds_rebuilt])
@@ -328,6 +291,12 @@ def rebuild_svd(h5_main, components=None, cores=None, max_RAM_mb=1024):
     h5_rebuilt = getH5DsetRefs(['Rebuilt_Data'], h5_refs)[0]
     copyAttributes(h5_main, h5_rebuilt, skip_refs=False)
 
+    '''
+    Rebuild the data one chunk of positions at a time
+    '''
+    rebuilder = SVDRebuild(h5_main, h5_U, ds_V, comp_slice, h5_rebuilt, cores=cores, max_mem_mb=max_RAM_mb)
+    rebuilder.compute()
+
     hdf.flush()
 
     print('Done writing reconstructed data to file.')
@@ -335,6 +304,63 @@ def rebuild_svd(h5_main, components=None, cores=None, max_RAM_mb=1024):
     return h5_rebuilt
 
 
+class SVDRebuild(Process):
+    """
+    Rebuilds a dataset from the selected components of its SVD and writes it into a dataset that has already been
+    created.  Used by rebuild_svd
+
+    Parameters
+    ----------
+    h5_main : h5py.Dataset
+        Dataset which SVD was performed on
+    h5_U : h5py.Dataset
+        Abundance of each component at each position
+    ds_V : 2D numpy array
+        Selected eigenvectors, scaled by their eigenvalues and arranged as [component, real spectroscopic]
+    comp_slice : slice or numpy array of uints
+        Selected components
+    h5_rebuilt : h5py.Dataset
+        Dataset for the rebuilt data, shaped like h5_main
+    cores : unsigned int, optional
+        Number of cores to use for computation
+    max_mem_mb : unsigned int, optional
+        Memory in MB that the computation may use
+    """
+
+    def __init__(self, h5_main, h5_U, ds_V, comp_slice, h5_rebuilt, cores=None, max_mem_mb=None):
+        # Needed to plan the chunks in the constructor of Process
+        self.h5_U = h5_U
+        self._ds_V = ds_V
+        self._comp_slice = comp_slice
+        super(SVDRebuild, self).__init__(h5_main, cores=cores, max_mem_mb=max_mem_mb)
+        self._unit_kwargs = {'ds_V': ds_V}
+        self.h5_results = h5_rebuilt
+
+    def _create_results_datasets(self):
+        """
+        The results dataset is created by rebuild_svd
+        """
+        pass
+
+    def _get_bytes_per_pos(self):
+        """
+        The abundances of the position as read, sent to and received by a worker along with the rebuilt position as
+        computed, sent back and converted to the data type of the results
+        """
+        comp_bytes = 3 * self.h5_U.dtype.itemsize * self._ds_V.shape[0]
+        return comp_bytes + 3 * self._ds_V.dtype.itemsize * self._ds_V.shape[1]
+
+    def _read_data_chunk(self, pos_slice):
+        return self.h5_U[pos_slice, self._comp_slice]
+
+    @staticmethod
+    def _chunk_function(block, ds_V=None):
+        return np.dot(block, ds_V)
+
+    def _write_results(self, pos_slice, results):
+        self.h5_results[pos_slice] = transformToTargetType(results, self.h5_results.dtype)
+
+
 def _get_component_slice(components):
     """
     Check the components object to determine how to use it to slice the dataset
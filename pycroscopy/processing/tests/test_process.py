@@ -0,0 +1,88 @@
+from __future__ import division, print_function, absolute_import
+import os
+import shutil
+import tempfile
+import warnings
+from unittest import TestCase
+
+import h5py
+import numpy as np
+
+from pycroscopy.io.hdf_utils import getDataSet
+from pycroscopy.io.translators import NumpyTranslator
+from pycroscopy.processing.process import Process
+
+
+class RowMean(Process):
+
+    def _create_results_datasets(self):
+        self.h5_results = self.h5_main.parent.create_dataset('Row_Mean', shape=(self.h5_main.shape[0],),
+                                                             dtype=np.float32)
+
+    @staticmethod
+    def _unit_function(unit):
+        return unit.mean()
+
+
+class RowMeanInMemory(RowMean):
+
+    def _create_results_datasets(self):
+        self.row_means = np.zeros(self.h5_main.shape[0])
+
+    def _write_results(self, pos_slice, results):
+        self.row_means[pos_slice] = results
+
+
+class TestProcessCompute(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        h5_path = os.path.join(self.folder, 'process.h5')
+        self.data = np.float32(np.random.RandomState(0).rand(12, 8))
+        NumpyTranslator().translate(h5_path, self.data, 12, 1, qty_name='Current', data_unit='A', spec_name='Bias',
+                                    spec_val=np.float32(np.arange(8)), spec_unit='V', data_type='Test')
+        self.h5_file = h5py.File(h5_path, 'r+')
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_telemetry(self):
+        process = RowMean(getDataSet(self.h5_file, 'Raw_Data')[0], cores=1)
+        process.enable_telemetry()
+        # Read the positions in several chunks
+        process._max_pos_per_read = 5
+        h5_results = process.compute()
+
+        self.assertTrue(np.allclose(h5_results[()], self.data.mean(axis=1)))
+
+        h5_group = h5_results.parent
+        self.assertEqual(h5_group.attrs['Process_telemetry_num_pixels'], 12)
+        self.assertEqual(h5_group.attrs['Process_telemetry_num_chunks'], 3)
+        self.assertEqual(h5_group['Process_Telemetry'][:, 0].tolist(), [5, 5, 2])
+
+    def test_parallel(self):
+        serial = RowMean(getDataSet(self.h5_file, 'Raw_Data')[0], cores=1)
+        serial._max_pos_per_read = 5
+        expected = serial.compute()[()]
+        del self.h5_file[serial.h5_results.name]
+
+        process = RowMean(getDataSet(self.h5_file, 'Raw_Data')[0], cores=1)
+        # Use a pool even on machines with a single core
+        process._cores = 2
+        process._max_pos_per_read = 5
+        self.assertGreater(len(process._plan_blocks(slice(0, 5))), 1)
+        h5_results = process.compute(ordered=False)
+
+        self.assertTrue(np.allclose(h5_results[()], expected))
+        self.assertTrue(np.allclose(h5_results[()], self.data.mean(axis=1)))
+
+    def test_telemetry_without_results_dataset(self):
+        process = RowMeanInMemory(getDataSet(self.h5_file, 'Raw_Data')[0], cores=1)
+        process.enable_telemetry()
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertIsNone(process.compute())
+
+        self.assertTrue(np.allclose(process.row_means, self.data.mean(axis=1)))
+        self.assertTrue(any(['telemetry' in str(warning.message) for warning in caught]))
@@ -0,0 +1,42 @@
+from __future__ import division, print_function, absolute_import
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import h5py
+import numpy as np
+
+from pycroscopy.io.hdf_utils import getDataSet
+from pycroscopy.io.translators import NumpyTranslator
+from pycroscopy.processing.svd_utils import doSVD, rebuild_svd
+
+
+class TestRebuildSVD(TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        h5_path = os.path.join(self.folder, 'svd.h5')
+        self.data = np.float32(np.random.RandomState(0).rand(24, 16))
+        NumpyTranslator().translate(h5_path, self.data, 24, 1, qty_name='Current', data_unit='A', spec_name='Bias',
+                                    spec_val=np.float32(np.arange(16)), spec_unit='V', data_type='Test')
+        self.h5_file = h5py.File(h5_path, 'r+')
+        self.h5_main = getDataSet(self.h5_file, 'Raw_Data')[0]
+        self.h5_svd = doSVD(self.h5_main, num_comps=16)
+
+    def tearDown(self):
+        self.h5_file.close()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_all_components(self):
+        h5_rebuilt = rebuild_svd(self.h5_main, cores=1)
+
+        self.assertEqual(h5_rebuilt.dtype, self.h5_main.dtype)
+        self.assertTrue(np.allclose(h5_rebuilt[()], self.data, atol=1E-5))
+
+    def test_several_chunks(self):
+        h5_rebuilt = rebuild_svd(self.h5_main, components=4, cores=1, max_RAM_mb=0.001)
+
+        expected = np.dot(self.h5_svd['U'][:, :4] * self.h5_svd['S'][:4], self.h5_svd['V'][:4])
+        self.assertTrue(np.allclose(h5_rebuilt[()], expected, atol=1E-5))
+        self.assertEqual(h5_rebuilt.parent.attrs['components_used'], b'0-4')
@@ -1,5 +1,8 @@
-from . import tests
-from . import plot_utils
-from . import be_viz_utils
+"""
+The plotting utilities, and matplotlib / ipywidgets which they rely upon, are only imported when first accessed
+"""
+from ..lazy_imports import attach_lazy
+
+__getattr__, __dir__ = attach_lazy(__name__, ['tests', 'plot_utils', 'be_viz_utils'])
 
 __all__ = ['plot_utils', 'be_viz_utils']